@@ -0,0 +1,392 @@
+"""
+Creates compressed backups of a card that only contain the used blocks.
+
+A plain backup reads the whole card, e.g. 64 GB for a card with an image
+of 3 GB. The backup reads the partition table and the allocation maps of
+the file systems instead, i.e. the allocation table of the FAT boot
+partition and the block bitmaps of the ext4 root partition, and only reads
+the ranges that are in use. Partitions with other file systems are read
+completely. The ranges are read in chunks that are compressed in parallel
+with zlib by a pool of threads and written into a single file:
+
+    CMBURNBK <version>
+    <compressed chunk> ...
+    <index>
+    <position of the index> CMBURNIX
+
+The index is a JSON document with the size of the card and for each chunk
+its offset on the card, its size, its position in the file, its
+compressed size and its crc32. As the index is found from the end of the
+file, a backup is restored by writing each chunk at its offset without
+reading the rest of the file. Blocks that are not in the backup are not
+written, so they keep the content of the card they are restored to.
+
+Example:
+
+    Backup.create("/dev/sdb", "~/red01.cmburn")
+    Backup.restore("~/red01.cmburn", "/dev/sdb")
+"""
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from cloudmesh.burn.blockdevice import BlockDevice
+from cloudmesh.burn.expand import Expand
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.fat32 import Fat32
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+
+MAGIC = b"CMBURNBK"
+TRAILER = b"CMBURNIX"
+VERSION = 1
+
+FAT32_TYPES = [0x0B, 0x0C]
+LINUX_TYPE = 0x83
+
+# the size of the chunks that are compressed
+CHUNK = 4 * 1024 ** 2
+# ranges with smaller gaps are read as one
+GAP = 256 * 1024
+# the amount of data that is written to the card before it is flushed
+FLUSH = 64 * 1024 ** 2
+
+
+def _compress(data, level):
+    return zlib.compress(data, level), zlib.crc32(data)
+
+
+class Backup(object):
+
+    @staticmethod
+    def _merge(ranges, size, gap=0):
+        """
+        Sorts the ranges, limits them to the size and merges ranges that
+        overlap or are less than gap bytes apart
+
+        :param ranges: the list of offset and size
+        :type ranges: list
+        :param size: the size of the card
+        :type size: int
+        :param gap: the largest gap that is merged
+        :type gap: int
+        :return: the list of offset and size
+        :rtype: list
+        """
+        merged = []
+        for offset, length in sorted(ranges):
+            end = min(offset + length, size)
+            if end <= offset:
+                continue
+            if merged and offset <= merged[-1][1] + gap:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([offset, end])
+        return [(start, end - start) for start, end in merged]
+
+    @staticmethod
+    def partitions(device):
+        """
+        Returns the partitions of the card that are recorded in a backup
+
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :return: the partitions, see MBR.read, empty if the card has no
+                 partition table
+        :rtype: list
+        """
+        try:
+            return MBR.read(device)
+        except ValueError:
+            return []
+
+    @staticmethod
+    def ranges(device, size=None):
+        """
+        Returns the ranges of the card that are in use
+
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :param size: the size of the card in bytes, by default it is
+                     determined from the device
+        :type size: int
+        :return: the list of offset and size in bytes
+        :rtype: list
+        """
+        size = size or Expand.size(device)
+        if not size:
+            raise OSError(f"could not determine the size of {device}")
+        try:
+            partitions = MBR.read(device)
+        except ValueError as e:
+            Console.warning(f"{e}, the whole card is read")
+            return [(0, size)]
+
+        # the partition table and the boot loader before the first partition
+        ranges = [(0, min([partition["offset"] for partition in partitions] or [size]))]
+        for partition in partitions:
+            whole = [(partition["offset"], partition["size"])]
+            try:
+                if partition["type"] in FAT32_TYPES:
+                    with Fat32(BlockDevice(device, writable=False), offset=partition["offset"]) as boot:
+                        used = boot.allocated()
+                elif partition["type"] == LINUX_TYPE:
+                    with Ext4(device, offset=partition["offset"]) as root:
+                        used = root.allocated()
+                else:
+                    used = whole
+            except ValueError as e:
+                Console.warning(f"partition {partition['number']}: {e}, the whole partition is read")
+                used = whole
+            end = partition["offset"] + partition["size"]
+            ranges += [(offset, min(offset + length, end) - offset) for offset, length in used]
+        return Backup._merge(ranges, size)
+
+    @staticmethod
+    def create(device, filename, level=6, workers=None, progress=None):
+        """
+        Creates the backup of the card
+
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :param filename: the backup file
+        :type filename: str
+        :param level: the zlib compression level
+        :type level: int
+        :param workers: the number of compression threads, by default the
+                        number of CPUs
+        :type workers: int
+        :param progress: a function called with the number of read bytes
+                         and the number of bytes that are read
+        :type progress: function(int, int)
+        :return: the index of the backup
+        :rtype: dict
+        """
+        filename = path_expand(filename)
+        size = Expand.size(device)
+        ranges = Backup.ranges(device, size=size)
+        chunks = [(start, min(CHUNK, offset + length - start))
+                  for offset, length in Backup._merge(ranges, size, gap=GAP)
+                  for start in range(offset, offset + length, CHUNK)]
+        total = sum(length for _, length in chunks)
+        Console.info(f"Reading {total // 1024 ** 2} MiB of {size // 1024 ** 2} MiB from {device}")
+
+        index = {
+            "version": VERSION,
+            "size": size,
+            "chunk": CHUNK,
+            "compression": "zlib",
+            "partitions": Backup.partitions(device),
+            "chunks": []
+        }
+        partial = f"{filename}.partial"
+        try:
+            with open(partial, "wb") as out:
+                out.write(MAGIC + struct.pack("<I", VERSION))
+
+                def store(offset, length, result):
+                    data, crc = result
+                    index["chunks"].append([offset, length, out.tell(), len(data), crc])
+                    out.write(data)
+
+                Backup.read(device, chunks, lambda data: _compress(data, level), store,
+                            workers=workers, progress=progress)
+                position = out.tell()
+                out.write(json.dumps(index).encode("utf-8"))
+                out.write(struct.pack("<Q8s", position, TRAILER))
+            os.replace(partial, filename)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        Console.ok(f"Backed up {device} to {filename} ({os.path.getsize(filename) // 1024 ** 2} MiB)")
+        return index
+
+    @staticmethod
+    def read(device, chunks, function, consume, workers=None, progress=None):
+        """
+        Reads the chunks of the card in order and calls the function with
+        the data of each chunk in a pool of threads. The results are passed
+        to consume in the order of the chunks.
+
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :param chunks: the list of offset and size of the chunks
+        :type chunks: list
+        :param function: the function called with the data of a chunk,
+                         e.g. to compress it
+        :type function: function(bytes)
+        :param consume: the function called with the offset, the size and
+                        the result of each chunk
+        :type consume: function(int, int, object)
+        :param workers: the number of threads, by default the number of
+                        CPUs
+        :type workers: int
+        :param progress: a function called with the number of read bytes
+                         and the number of bytes that are read
+        :type progress: function(int, int)
+        """
+        total = sum(length for _, length in chunks)
+        bar = None
+        if progress is None:
+            bar = tqdm(total=total, unit="B", unit_scale=True, ncols=80)
+
+            def progress(read, total):
+                bar.update(read - bar.n)
+
+        workers = workers or os.cpu_count() or 1
+        read = 0
+        try:
+            with BlockDevice(device, writable=False) as disk, \
+                    ThreadPoolExecutor(max_workers=workers) as pool:
+                # a bounded window of chunks, so reading, processing and
+                # writing overlap without keeping the card in memory
+                pending = deque()
+                for offset, length in chunks:
+                    data = disk.read(offset, length)
+                    if len(data) != length:
+                        raise OSError(f"could not read {length} bytes at {offset} from {device}")
+                    pending.append((offset, length, pool.submit(function, data)))
+                    read += length
+                    progress(read, total)
+                    if len(pending) >= 2 * workers:
+                        offset, length, future = pending.popleft()
+                        consume(offset, length, future.result())
+                while pending:
+                    offset, length, future = pending.popleft()
+                    consume(offset, length, future.result())
+        finally:
+            if bar is not None:
+                bar.close()
+
+    @staticmethod
+    def is_backup(filename):
+        """
+        Checks if the file is a backup created with Backup.create
+
+        :param filename: the file
+        :type filename: str
+        :rtype: bool
+        """
+        filename = path_expand(filename)
+        if not os.path.isfile(filename):
+            return False
+        with open(filename, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    @staticmethod
+    def index(filename):
+        """
+        Reads the index of the backup
+
+        :param filename: the backup file
+        :type filename: str
+        :return: the index
+        :rtype: dict
+        """
+        filename = path_expand(filename)
+        trailer = struct.calcsize("<Q8s")
+        with open(filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{filename} is not a backup")
+            version, = struct.unpack("<I", f.read(4))
+            if version > VERSION:
+                raise ValueError(f"the backup version {version} of {filename} is not supported")
+            f.seek(-trailer, os.SEEK_END)
+            end = f.tell()
+            position, magic = struct.unpack("<Q8s", f.read(trailer))
+            if magic != TRAILER:
+                raise ValueError(f"{filename} is incomplete")
+            f.seek(position)
+            return json.loads(f.read(end - position))
+
+    @staticmethod
+    def restore(filename, device, progress=None):
+        """
+        Writes the backup to the card. If the device is an image file, it
+        is replaced with a sparse image of the size of the backed up card.
+
+        :param filename: the backup file
+        :type filename: str
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :param progress: a function called with the number of written
+                         bytes and the number of bytes that are written
+        :type progress: function(int, int)
+        """
+        filename = path_expand(filename)
+        index = Backup.index(filename)
+
+        def blocks(f):
+            for offset, length, position, stored, crc in index["chunks"]:
+                f.seek(position)
+                data = zlib.decompress(f.read(stored))
+                if len(data) != length or zlib.crc32(data) != crc:
+                    raise ValueError(f"the chunk at {offset} of {filename} is corrupted")
+                yield offset, data
+
+        with open(filename, "rb") as f:
+            Backup.write(device, index["size"], [chunk[:2] for chunk in index["chunks"]],
+                         blocks(f), progress=progress)
+        Console.ok(f"Restored {filename} to {device}")
+
+    @staticmethod
+    def write(device, size, chunks, blocks, progress=None):
+        """
+        Writes the blocks to the card. If the device is an image file, it
+        is replaced with a sparse image of the given size.
+
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :param size: the size of the backed up card
+        :type size: int
+        :param chunks: the list of offset and size of the blocks
+        :type chunks: list
+        :param blocks: the offset and the data of each block
+        :type blocks: iterator
+        :param progress: a function called with the number of written
+                         bytes and the number of bytes that are written
+        :type progress: function(int, int)
+        """
+        total = sum(length for _, length in chunks)
+        end = max([offset + length for offset, length in chunks] or [0])
+
+        if not os.path.exists(device):
+            if device.startswith("/dev/"):
+                raise ValueError(f"the device {device} does not exist")
+            with open(device, "wb") as f:
+                f.truncate(size)
+        elif os.path.isfile(device):
+            with open(device, "wb") as f:
+                f.truncate(size)
+        available = Expand.size(device)
+        if available and available < end:
+            raise ValueError(f"the backup needs {end} bytes, but {device} has only {available}")
+
+        bar = None
+        if progress is None:
+            bar = tqdm(total=total, unit="B", unit_scale=True, ncols=80)
+
+            def progress(written, total):
+                bar.update(written - bar.n)
+
+        written = 0
+        try:
+            with BlockDevice(device) as disk:
+                pending = 0
+                for offset, data in blocks:
+                    disk.write(offset, data)
+                    pending += len(data)
+                    if pending >= FLUSH:
+                        disk.flush()
+                        pending = 0
+                    written += len(data)
+                    progress(written, total)
+        finally:
+            if bar is not None:
+                bar.close()
@@ -0,0 +1,138 @@
+"""
+Byte level access to a block device or an image file.
+
+If the file can be opened by the user, e.g. an image file, it is accessed
+directly. Otherwise, e.g. for /dev/sdb, the reads and writes are done by the
+privileged helper. Writes are collected and written with a single batch on
+flush(), followed by one fsync.
+"""
+import os
+
+from cloudmesh.burn.helper import Helper
+
+
+class BlockDevice(object):
+
+    def __init__(self, path, writable=True):
+        """
+        Opens the block device or image
+
+        :param path: the device or the image file, e.g. /dev/sdb
+        :type path: str
+        :param writable: if false the device is only opened for reading
+        :type writable: bool
+        """
+        self.path = path
+        self.pending = []
+        self.file = None
+        if writable and os.access(path, os.R_OK | os.W_OK):
+            self.file = open(path, "r+b")
+        elif not writable and os.access(path, os.R_OK):
+            self.file = open(path, "rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    def read(self, offset, size):
+        """
+        Reads size bytes at the offset. Writes that are not yet flushed are
+        included in the result.
+
+        :param offset: the offset in bytes
+        :type offset: int
+        :param size: the number of bytes
+        :type size: int
+        :return: the data
+        :rtype: bytes
+        """
+        if self.file is not None:
+            self.file.seek(offset)
+            data = self.file.read(size)
+        else:
+            data = Helper.execute({"op": "pread", "path": self.path,
+                                   "offset": offset, "length": size})
+        if not self.pending:
+            return data
+        data = bytearray(data)
+        end = offset + size
+        for position, chunk in self.pending:
+            if position < end and position + len(chunk) > offset:
+                start = max(position, offset)
+                stop = min(position + len(chunk), end)
+                data[start - offset:stop - offset] = chunk[start - position:stop - position]
+        return bytes(data)
+
+    def write(self, offset, data):
+        """
+        Schedules a write of the data at the offset
+
+        :param offset: the offset in bytes
+        :type offset: int
+        :param data: the data
+        :type data: bytes
+        """
+        self.pending.append((offset, bytes(data)))
+
+    def flush(self):
+        """
+        Writes all scheduled writes and flushes them to the device
+        """
+        if not self.pending:
+            return
+        if self.file is not None:
+            for offset, data in self.pending:
+                self.file.seek(offset)
+                self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        else:
+            ops = [{"op": "pwrite", "path": self.path, "offset": offset, "data": data}
+                   for offset, data in self.pending]
+            ops[-1]["fsync"] = True
+            Helper.batch(ops)
+        self.pending = []
+
+    def close(self):
+        """
+        Closes the device. Writes that are not flushed are discarded.
+        """
+        self.pending = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class MemoryDevice(BlockDevice):
+    """
+    A block device that is kept in memory. It is used to modify a partition
+    of an image before it is written to the card.
+    """
+
+    def __init__(self, data):
+        """
+        Creates the device from the data
+
+        :param data: the content of the device
+        :type data: bytes or bytearray
+        """
+        self.path = None
+        self.pending = []
+        self.file = None
+        self.data = bytearray(data)
+
+    def read(self, offset, size):
+        return bytes(self.data[offset:offset + size])
+
+    def write(self, offset, data):
+        self.data[offset:offset + len(data)] = data
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
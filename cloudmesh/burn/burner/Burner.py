@@ -1,7 +1,8 @@
-import os
+import shutil
 import sys
 
 from cloudmesh.burn.burner.raspberryos import Burner as RaspberryOsBurner
+from cloudmesh.burn.shrink import Shrink
 from cloudmesh.burn.usb import USB
 from cloudmesh.common.systeminfo import os_is_linux
 from cloudmesh.common.systeminfo import os_is_mac
@@ -44,15 +45,16 @@ class Burner:
             sys.exit()
         if image is None:
             Console.error("Image must have a value")
-        image = path_expand(image)
-        command = f"sudo /usr/local/bin/pishrink.sh {image}"
-        print(command)
-        os.system(command)
+            return
+        try:
+            Shrink.image(path_expand(image))
+        except (ValueError, OSError) as e:
+            Console.error(f"Could not shrink {image}: {e}")
 
     def install(self):
         """
-        Installs /usr/local/bin/pishrink.sh
-        Installs parted
+        Installs e2fsprogs, which provides resize2fs and e2fsck that are
+        used to shrink images
         :return:
         :rtype:
         """
@@ -63,30 +65,21 @@ class Burner:
         elif os_is_windows():
             Console.error("This command is not supported on MacOS")
             return ""
-        else:
-            banner("Installing pishrink.sh into /usr/local/bin")
+        elif os_is_linux() or os_is_pi():
+            if all(shutil.which(program) or shutil.which(f"/sbin/{program}")
+                   for program in ["resize2fs", "e2fsck", "debugfs"]):
+                Console.ok("e2fsprogs is already installed")
+                return ""
+            banner("Installing e2fsprogs")
             script = \
                 """
-                wget https://raw.githubusercontent.com/Drewsif/PiShrink/master/pishrink.sh
-                chmod +x pishrink.sh
-                sudo mv pishrink.sh /usr/local/bin
+                sudo apt install e2fsprogs -y > $HOME/tmp.log
                 """
 
             result = JobScript.execute(script)
             print(Printer.write(result,
                                 order=["name", "command", "status", "stdout", "returncode"]))
 
-            if os_is_linux() or os_is_pi():
-                banner("Installing pishrink.sh into /usr/local/bin")
-                script = \
-                    """
-                    sudo apt install parted -y > $HOME/tmp.log
-                    """
-
-                result = JobScript.execute(script)
-                print(Printer.write(result,
-                                    order=["name", "command", "status", "stdout", "returncode"]))
-
     def firmware(self, action="check"):
         self.burner.firmware(action=action)
 
@@ -96,8 +89,8 @@ class Burner:
     def configure_wifi(self, ssid, psk=None, country=None, host=None):
         self.burner.configure_wifi(ssid, psk=psk, country=country, host=host)
 
-    def mac(self, hostnames=None):
-        self.burner.mac(hostnames=hostnames)
+    def mac(self, hostnames=None, inventory=None, timeout=10.0):
+        return self.burner.mac(hostnames=hostnames, inventory=inventory, timeout=timeout)
 
     def set_hostname(self, hostname):
         self.burner.set_hostname(hostname)
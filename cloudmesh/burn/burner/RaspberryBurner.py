@@ -2,12 +2,23 @@ import time
 import os
 
 from cloudmesh.burn.burner.BurnerABC import AbstractBurner
+from cloudmesh.burn.customize import Customize
+from cloudmesh.burn.expand import Expand
+from cloudmesh.burn.fat32 import Fat32
+from cloudmesh.burn.helper import Helper
+from cloudmesh.burn.hosts import Hosts
+from cloudmesh.burn.keys import Keys
 from cloudmesh.burn.raspberryos.cmdline import Cmdline
 from cloudmesh.burn.raspberryos.runfirst import Runfirst
+from cloudmesh.burn.render import Bundle
+from cloudmesh.burn.scheduler import Scheduler
 from cloudmesh.burn.sdcard import SDCard
+from cloudmesh.burn.telemetry import Telemetry
+from cloudmesh.burn.trace import Trace
 from cloudmesh.burn.usb import USB
 from cloudmesh.common.console import Console
 from cloudmesh.common.parameter import Parameter
+from cloudmesh.common.sudo import Sudo
 from cloudmesh.common.util import yn_choice
 from cloudmesh.common.util import readfile
 from cloudmesh.common.util import path_expand
@@ -15,6 +26,7 @@ from cloudmesh.common.util import banner
 from cloudmesh.inventory.inventory import Inventory
 from cloudmesh.common.systeminfo import os_is_windows
 from cloudmesh.burn.windowssdcard import Diskpart
+from cloudmesh.burn.windowssdcard import WindowsSDCard
 
 
 class Burner(AbstractBurner):
@@ -39,6 +51,8 @@ class Burner(AbstractBurner):
         configs = managers + workers
         # Create dict for them for easy lookup
         self.configs = dict((config['host'], config) for config in configs)
+        # The /etc/hosts table is the same for all cards, so it is created once
+        self.hosts = Hosts(configs)
 
     def cluster(self, arguments=None):
         raise NotImplementedError
@@ -52,9 +66,45 @@ class Burner(AbstractBurner):
              wifipasswd=None,
              country=None,
              withimage=True,
-             network="internal"):
+             network="internal",
+             shared_hosts=False,
+             yes=False,
+             progress=None,
+             files=None,
+             image=None,
+             expand=False,
+             check=True,
+             quiet=False,
+             digest=None):
         """
         Given the name of a config, burn device with RaspberryOS and configure properly
+
+        If shared_hosts is True, the cluster hosts are written as one hosts
+        file into the boot partition instead of embedding them in the
+        firstrun.sh script.
+
+        If yes is True, the user is not asked whether the card is inserted.
+        progress is called with the number of written bytes and the size of
+        the image while the image is written.
+
+        If files is given, e.g. from a rendered Bundle, these files are
+        written into the boot partition instead of rendering them.
+
+        If image is given, e.g. a customized image, it is burned instead of
+        the image with the tag of the host.
+
+        If expand is True, the root partition is expanded to the size of the
+        card after the image is written, so it is not resized at first boot.
+
+        If check is False, the readers and the device are not checked. A
+        burn in a background thread is checked before with check_devices.
+        If quiet is True, no banners are printed, e.g. over the progress
+        bars of parallel burns.
+
+        digest is the sha256 of the image for the telemetry. Parallel
+        burns compute it once before, otherwise it is computed here.
+
+        Returns True if the card was burned.
         """
         if device is None:
             Console.error('Device not specified')
@@ -69,66 +119,34 @@ class Burner(AbstractBurner):
             country = "US"
 
         config = self.configs[name]
-        sdcard = SDCard(card_os="raspberry")
+        # bind the card to the device so it gets its own mount points
+        sdcard = SDCard(card_os="raspberry", device=device)
 
-        # This block only works for Macs
-        try:
-            r = USB.check_for_readers()
-        except Exception as e:
-            print()
-            Console.error(e)
-            print()
+        if check and not self.check_devices([device], yes=yes):
             return ""
 
-        banner(txt=f"Create RUNFIRST {name}", figlet=True)
-
-        # Build the proper runfrist.sh
-        runfirst = Runfirst()
-        runfirst.set_hostname(config['host'])
-        other_hosts, other_ips = self._get_hosts_for(name=config['host'])
-        if network in ['internal']:
-            runfirst.set_hosts(names=other_hosts, ips=other_ips)
-            if config['ip']:
-                # config['router'] and config['dns'] are allowed to be empty String or None to skip its config
-                # Default column in inventory is empty string
-                runfirst.set_static_ip(ip=config['ip'], router=config['router'], dns=config['dns'])
-
-        if password:
-            runfirst.set_password(password=password)
-
-        runfirst.set_locale(timezone=config['timezone'], locale=config['locale'])
-        if ssid:
-            runfirst.set_wifi(ssid, wifipasswd, country=country)
-
-        runfirst.set_key(key=readfile(config['keyfile']).strip())
-        if 'bridge' in config['services'] and network in ['internal']:
-            runfirst.enable_bridge()
-
-        runfirst.get(verbose=verbose)
-
-        runfirst.info()
-
-        print(runfirst.script)
-
-        banner(txt=f"Burn {name}", figlet=True)
-
-        card = SDCard().info(print_os=False, print_stdout=False)
-        if device not in card:
-            label = "device"
-
-            if os_is_windows():
-                label = "disk"
-
-            SDCard().info(print_stdout=True)
-
-            error = f"The {label} {device} could not be found in the list of possible SD Card readers"
-            Console.error(error)
-
-            if not yn_choice("Would you like to continue?"):
-                raise ValueError(error)
+        if files is None:
+            if not quiet:
+                banner(txt=f"Create RUNFIRST {name}", figlet=True)
+
+            runfirst = self.runfirst(name=name,
+                                     verbose=verbose,
+                                     password=password,
+                                     ssid=ssid,
+                                     wifipasswd=wifipasswd,
+                                     country=country,
+                                     network=network,
+                                     shared_hosts=shared_hosts)
+            if not quiet:
+                runfirst.info()
+                print(runfirst.script)
+            files = runfirst.files()
+
+        if not quiet:
+            banner(txt=f"Burn {name}", figlet=True)
 
         # Confirm card is inserted into device path
-        if not yn_choice(f'Is the card to be burned for {name} inserted?'):
+        if not yes and not yn_choice(f'Is the card to be burned for {name} inserted?'):
             if not yn_choice(f"Please insert the card to be burned for {name}. "
                              "Type 'y' when done or 'n' to terminate. Continue"):
                 Console.error("Terminating: User Break")
@@ -136,6 +154,7 @@ class Burner(AbstractBurner):
 
         Console.info(f'Burning {name}')
 
+        expanded = False
         if os_is_windows():
             if withimage:
                 sdcard.format_device(device=device, unmount=True)
@@ -153,11 +172,41 @@ class Burner(AbstractBurner):
             # yn_choice("Burn completed. Continue")
 
         else:
+            # the stages of the burn are recorded for cms burn stats
+            run = Telemetry().run(name, device)
             if withimage:
-                sdcard.format_device(device=device, yes=True)
+                image = image or SDCard.image_path(config['tag'])
+                if image is None:
+                    return ""
+                run.set_image(image, digest=digest)
+                with run.stage("format"):
+                    sdcard.format_device(device=device, yes=True)
+                with run.stage("unmount"):
+                    sdcard.unmount(device=device)
+                if not quiet:
+                    banner("Burn image", color="GREEN")
+                # the boot partition is patched while the image is written
+                with run.stage("write", bytes=os.path.getsize(image)):
+                    patched = sdcard.burn_sdcard(name=name,
+                                                 image=image,
+                                                 device=device,
+                                                 yes=True,
+                                                 patch=lambda boot: self.patch_boot(boot, files, resize=not expand),
+                                                 progress=progress)
+                if patched:
+                    with run.stage("configure"):
+                        if expand and not self.expand(device=device):
+                            self.write_boot(device=device, files=files)
+                    Console.ok(f'Burned {name}')
+                    return True
+            with run.stage("unmount"):
                 sdcard.unmount(device=device)
-                banner("Burn image", color="GREEN")
-                sdcard.burn_sdcard(name=name, tag=config['tag'], device=device, yes=True)
+            with run.stage("configure") as stage:
+                expanded = withimage and expand and self.expand(device=device)
+                stage["success"] = self.write_boot(device=device, files=files, resize=not expanded)
+            if stage["success"]:
+                Console.ok(f'Burned {name}')
+                return True
             sdcard.mount(device=device, card_os="raspberry")
 
         # Read and write cmdline.txt
@@ -165,7 +214,7 @@ class Burner(AbstractBurner):
         # Reading will create the proper script in the cmdline instance
         # No extra work needed
         # This gets rid of whitespace in cmdline.txt file?
-        cmdline.update(filename=f'{sdcard.boot_volume}/cmdline.txt')
+        cmdline.update(filename=f'{sdcard.boot_volume}/cmdline.txt', resize=not expanded)
         cmdline.write(filename='tmp-cmdline.txt')
         # print("--- cmdline.txt ---")
         # print(cmdline.script)
@@ -174,8 +223,14 @@ class Burner(AbstractBurner):
         #
         # write the run first
         #
-        runfirst.write(filename=f'{sdcard.boot_volume}/{Runfirst.SCRIPT_NAME}')
-        os.system(f"chmod a+x {sdcard.boot_volume}/{Runfirst.SCRIPT_NAME}")
+        for filename, content in files.items():
+            if os_is_windows():
+                # the helper does not run on Windows, the files are written
+                # with LF newlines and synced
+                WindowsSDCard.writefile(f'{sdcard.boot_volume}/{filename}', content, sync=True)
+            else:
+                mode = 0o755 if filename == Runfirst.SCRIPT_NAME else None
+                Helper.write(f'{sdcard.boot_volume}/{filename}', content, mode=mode)
 
         if not os_is_windows():
             time.sleep(1)  # Sleep for 1 seconds to give ample time for writing to finish
@@ -185,7 +240,277 @@ class Burner(AbstractBurner):
             os.system(f"cat {sdcard.boot_volume}/{Runfirst.SCRIPT_NAME}")
         Console.ok(f'Burned {name}')
 
-        return
+        return True
+
+    @staticmethod
+    def check_devices(devices, yes=False):
+        """
+        Checks that the readers are attached and that the devices are SD
+        card readers. The devices of parallel burns are checked once
+        before the burns are started.
+
+        :param devices: the devices, e.g. ["/dev/sdb", "/dev/sdc"]
+        :type devices: list
+        :param yes: if True the user is not asked whether to continue with
+                    a device that is not a reader, it is refused
+        :type yes: bool
+        :return: True if the cards can be burned on the devices
+        :rtype: bool
+        """
+        # This block only works for Macs
+        try:
+            USB.check_for_readers()
+        except ValueError as e:
+            print()
+            Console.error(e)
+            print()
+            return False
+
+        card = SDCard().info(print_os=False, print_stdout=False)
+        missing = [device for device in devices if device not in card]
+        if missing:
+            label = "disk" if os_is_windows() else "device"
+
+            SDCard().info(print_stdout=True)
+
+            error = f"The {label} {', '.join(missing)} could not be found in the list of possible SD Card readers"
+            Console.error(error)
+
+            if yes:
+                return False
+            if not yn_choice("Would you like to continue?"):
+                raise ValueError(error)
+        return True
+
+    @staticmethod
+    @Trace.traced("expand", "device")
+    def expand(device=None):
+        """
+        Expands the root partition of the burned card to the size of the
+        card
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :return: True if the root partition fills the card, False if it is
+                 resized at first boot
+        :rtype: bool
+        """
+        try:
+            return Expand.device(device)
+        except (ValueError, OSError) as e:
+            Console.warning(f"Could not expand the root partition of {device}, "
+                            f"it is resized at first boot: {e}")
+            return False
+
+    @staticmethod
+    @Trace.traced("write boot", "device")
+    def write_boot(device=None, files=None, resize=True):
+        """
+        Writes cmdline.txt and the runfirst script directly into the boot
+        partition of the device without mounting it
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param files: the runfirst script and the other files
+        :type files: dict
+        :param resize: if False the root partition is not resized at first
+                       boot
+        :type resize: bool
+        :return: True if the files were written, False if the boot partition
+                 can not be written directly and needs to be mounted
+        :rtype: bool
+        """
+        try:
+            with Fat32(device) as boot:
+                Burner.patch_boot(boot, files, resize=resize)
+        except (ValueError, OSError) as e:
+            Console.warning(f"Could not write the boot partition of {device} directly: {e}")
+            return False
+        return True
+
+    @staticmethod
+    @Trace.traced("configure boot")
+    def patch_boot(boot, files, resize=True):
+        """
+        Writes cmdline.txt, the runfirst script and the other files into the
+        boot partition
+
+        :param boot: the boot partition
+        :type boot: Fat32
+        :param files: the file names and contents, see Runfirst.files
+        :type files: dict
+        :param resize: if False the root partition is not resized at first
+                       boot
+        :type resize: bool
+        """
+        cmdline = Cmdline()
+        cmdline.build(boot.read("cmdline.txt").decode("utf-8"), resize=resize)
+        boot.write("cmdline.txt", cmdline.script)
+        for filename, content in files.items():
+            boot.write(filename, content)
+
+    @Trace.traced("runfirst", "name")
+    def runfirst(self,
+                 name=None,
+                 verbose=False,
+                 password=None,
+                 ssid=None,
+                 wifipasswd=None,
+                 country="US",
+                 network="internal",
+                 shared_hosts=False,
+                 host_keys=None,
+                 customized=False):
+        """
+        Creates the runfirst script of the host
+
+        :return: the runfirst script
+        :rtype: Runfirst
+        """
+        config = self.configs[name]
+
+        # Build the proper runfrist.sh
+        runfirst = Runfirst()
+        runfirst.set_hostname(config['host'])
+        if network in ['internal']:
+            runfirst.set_hosts(hosts=self.hosts, shared=shared_hosts)
+            if config['ip']:
+                # config['router'] and config['dns'] are allowed to be empty String or None to skip its config
+                # Default column in inventory is empty string
+                runfirst.set_static_ip(ip=config['ip'], router=config['router'], dns=config['dns'])
+
+        if password:
+            runfirst.set_password(password=password)
+
+        runfirst.set_locale(timezone=config['timezone'], locale=config['locale'])
+        if ssid:
+            runfirst.set_wifi(ssid, wifipasswd, country=country)
+
+        runfirst.set_key(key=readfile(config['keyfile']).strip())
+        if 'bridge' in config['services'] and network in ['internal']:
+            runfirst.enable_bridge()
+        if host_keys:
+            runfirst.set_host_keys(keys=host_keys)
+        runfirst.set_customized(customized)
+
+        runfirst.get(verbose=verbose)
+        return runfirst
+
+    @Trace.traced("render")
+    def render(self,
+               names=None,
+               bundle=None,
+               password=None,
+               ssid=None,
+               wifipasswd=None,
+               country="US",
+               network="internal",
+               shared_hosts=False,
+               host_keys=False,
+               customized=False):
+        """
+        Renders the files of the hosts into the bundle. Hosts whose inputs
+        did not change since they were rendered are skipped.
+
+        If host_keys is True, the SSH host keys of the hosts are generated
+        in parallel and written by firstrun.sh. These hosts are not written
+        to the directory of the bundle.
+
+        If customized is True, the hosts are burned with images customized
+        by Customize and firstrun.sh leaves out the settings of the image.
+
+        :param names: the hosts, by default all hosts of the inventory
+        :type names: str or list
+        :param bundle: the bundle, by default a bundle in memory
+        :type bundle: Bundle
+        :return: the bundle
+        :rtype: Bundle
+        """
+        bundle = bundle or Bundle()
+        names = Parameter.expand(names) if names else list(self.configs)
+        country = country or "US"
+        pending = []
+        for name in names:
+            if name not in self.configs:
+                Console.error(f'Could not find {name} in Inventory')
+                continue
+            config = self.configs[name]
+            internal = network in ['internal']
+            inputs = {
+                "os": "raspberry",
+                "config": config,
+                "key": readfile(config['keyfile']).strip(),
+                "password": password,
+                "ssid": ssid,
+                "wifipasswd": wifipasswd,
+                "country": country,
+                "network": network,
+                "shared_hosts": shared_hosts,
+                "hosts": (self.hosts.content if shared_hosts else self.hosts.render(exclude=name))
+                if internal else None,
+                "host_keys": host_keys,
+                "customized": customized
+            }
+            digest = Bundle.digest(inputs)
+            if not bundle.current(name, digest):
+                pending.append((name, digest))
+
+        keys = {}
+        if host_keys and pending:
+            keys = Keys.host_keys([name for name, digest in pending])
+
+        for name, digest in pending:
+            runfirst = self.runfirst(name=name,
+                                     password=password,
+                                     ssid=ssid,
+                                     wifipasswd=wifipasswd,
+                                     country=country,
+                                     network=network,
+                                     shared_hosts=shared_hosts,
+                                     host_keys=keys.get(name),
+                                     customized=customized)
+            # the host keys are only kept in memory
+            bundle.store(name, digest, runfirst.files(), secret=name in keys)
+        bundle.save()
+        bundle.info()
+        return bundle
+
+    @Trace.traced("customize")
+    def customize(self, names=None, country="US"):
+        """
+        Customizes the images of the hosts. Hosts with the same image and
+        settings share one customized image.
+
+        :param names: the hosts
+        :type names: list
+        :param country: the country whose keyboard layout is used
+        :type country: str
+        :return: the customized image of each host, empty if the images
+                 can not be customized
+        :rtype: dict
+        """
+        if os_is_windows():
+            Console.warning("Customizing images is not supported on Windows")
+            return {}
+        images = {}
+        customized = {}
+        try:
+            for name in names:
+                if name not in self.configs:
+                    continue
+                config = self.configs[name]
+                key = (config['tag'], config['timezone'])
+                if key not in customized:
+                    base = SDCard.image_path(config['tag'])
+                    if base is None:
+                        return {}
+                    customize = Customize(timezone=config['timezone'], country=country)
+                    customized[key] = customize.image(base)
+                images[name] = customized[key]
+        except (ValueError, OSError) as e:
+            Console.warning(f"Could not customize the images, the settings are applied at first boot: {e}")
+            return {}
+        return images
 
     def inventory(self, arguments=None):
         raise NotImplementedError
@@ -199,10 +524,30 @@ class Burner(AbstractBurner):
                    wifipasswd=None,
                    country=None,
                    withimage=True,
-                   network="internal"
+                   network="internal",
+                   shared_hosts=False,
+                   auto=False,
+                   bundle=None,
+                   host_keys=False,
+                   customize=False,
+                   expand=False
                    ):
         """
         Given multiple names, burn them
+
+        The names are distributed across the devices with one worker per
+        device, so that several cards are burned at the same time. If auto
+        is True the insertion of a card is detected, otherwise the user is
+        asked for each card.
+
+        The files of all hosts are rendered into the bundle before the first
+        card is burned, so that burning only copies them.
+
+        If customize is True, the timezone, keyboard and ssh settings are
+        applied once to a copy of each image instead of at first boot.
+
+        If expand is True, the root partition of each card is expanded to
+        the size of the card when it is burned.
         """
         if devices is None:
             Console.error('Device not specified.')
@@ -214,22 +559,71 @@ class Burner(AbstractBurner):
         names = Parameter.expand(names)
         devices = Parameter.expand(devices)
 
-        if len(devices) > 1:
-            Console.error('We do not yet support burning on multiple devices')
+        if len(devices) > 1 and os_is_windows():
+            Console.error('We do not yet support burning on multiple devices on Windows')
             return
 
-        for name in names:
-            self.burn(
+        # the readers, the devices and the sudo password are checked before
+        # the burns run in parallel, so the workers do not prompt
+        if not self.check_devices(devices):
+            return
+        if not os_is_windows():
+            Sudo.password()
+
+        images = {}
+        if customize and withimage:
+            images = self.customize(names=names, country=country)
+
+        # the digests of the images are computed once before the workers
+        # start, instead of by each worker on its first burn
+        digests = {}
+        if withimage and not os_is_windows():
+            telemetry = Telemetry()
+            paths = {}
+            for name in names:
+                if name not in self.configs:
+                    continue
+                tag = self.configs[name]['tag']
+                if name not in images and tag not in paths:
+                    paths[tag] = SDCard.image_path(tag)
+                path = images.get(name) or paths.get(tag)
+                digests[name] = telemetry.digest(path) if path else None
+
+        bundle = self.render(names=names,
+                             bundle=bundle,
+                             password=password,
+                             ssid=ssid,
+                             wifipasswd=wifipasswd,
+                             country=country,
+                             network=network,
+                             shared_hosts=shared_hosts,
+                             host_keys=host_keys,
+                             customized=bool(images))
+
+        def burn(name, device, progress):
+            return self.burn(
                 name=name,
-                device=devices[0],
+                device=device,
                 verbose=verbose,
                 password=password,
                 ssid=ssid,
                 wifipasswd=wifipasswd,
                 country=country,
                 withimage=withimage,
-                network=network
+                network=network,
+                shared_hosts=shared_hosts,
+                yes=True,
+                progress=progress,
+                files=bundle.load(name),
+                image=images.get(name),
+                expand=expand,
+                check=False,
+                quiet=True,
+                digest=digests.get(name)
             )
+
+        results = Scheduler(devices=devices, auto=auto).run(names, burn)
+        Scheduler.print(results)
         Console.ok('Finished burning all cards')
 
     def _get_hosts_for(self, name=None):
@@ -241,11 +635,4 @@ class Burner(AbstractBurner):
         if self.configs is None:
             raise Exception('no configs supplied yet')
 
-        host_names = []
-        ips = []
-
-        for host_name in self.configs:
-            if name != host_name and self.configs[host_name]['ip']:
-                host_names += [host_name]
-                ips += [self.configs[host_name]['ip']]
-        return host_names, ips
+        return self.hosts.get(name)
@@ -6,11 +6,18 @@ import subprocess
 import sys
 import textwrap
 import time
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 
 from cloudmesh.bridge.Bridge import Bridge
+from cloudmesh.burn.blockdevice import BlockDevice
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.fat32 import Fat32
+from cloudmesh.burn.helper import Helper
 from cloudmesh.burn.image import Image
+from cloudmesh.burn.keys import Keys
 from cloudmesh.burn.sdcard import SDCard
+from cloudmesh.burn.staging import Stage
 from cloudmesh.common.systeminfo import os_is_linux
 from cloudmesh.common.systeminfo import os_is_mac
 from cloudmesh.common.systeminfo import os_is_pi
@@ -42,26 +49,116 @@ else:
 # noinspection PyPep8
 class Burner(object):
 
-    def __init__(self):
+    def __init__(self, stage=None, card=None):
         """
         Initializes the burner
+
+        :param stage: if a stage is given all writes to the card are
+                      collected in it and written with stage.commit()
+        :type stage: Stage
+        :param card: the card to configure. If it is bound to a device the
+                     volumes of that device are used. Default: the card at
+                     the default mount points
+        :type card: SDCard
         """
         self.hostname = None
         self.keypath = None
         self.hostnames = None
+        self.stage = stage
+        self.card = card
+
+    def _read(self, filename, split=False, decode=True):
+        """
+        Reads a file from the card. Staged content is returned if the file
+        has been written to the stage before.
+
+        :param filename: the filename
+        :type filename: str
+        :param split: if true the content is split into lines
+        :type split: bool
+        :param decode: if true the content is returned as str
+        :type decode: bool
+        :return: the content
+        :rtype: str, bytes or list
+        """
+        if self.stage is None:
+            return SDCard.readfile(filename, split=split, decode=decode)
+        content = self.stage.read(filename, decode=decode)
+        if split:
+            content = content.splitlines()
+        return content
+
+    def _write(self, filename, content):
+        """
+        Writes a file to the card or to the stage. Just as SDCard.writefile
+        a newline is added to the content.
+
+        :param filename: the filename
+        :type filename: str
+        :param content: the content
+        :type content: str
+        """
+        if self.stage is None:
+            SDCard.writefile(filename, content)
+        else:
+            self.stage.write(filename, content + "\n")
 
     # noinspection PyBroadException
     @windows_not_supported
-    def check(self, device="/dev/sdX"):
+    def check(self, device=None):
         """
         This method checks what configurations are placed on the PI se card
 
-        :param device:
-        :type device:
+        If a device or image is specified, e.g. /dev/sdb or red.img, the
+        partitions are read directly without mounting them. Several devices
+        can be specified with a parameter expansion, e.g. /dev/sd[b-e], and
+        are read in parallel. Otherwise the mounted card is checked.
+
+        :param device: the device or image
+        :type device: str
         :return:
         :rtype:
         """
 
+        host = get_platform()
+
+        if host == "windows":
+            Console.error("Not yet implemented for this OS")
+            return ""
+
+        devices = Parameter.expand(device) if device else [None]
+
+        with ThreadPoolExecutor(max_workers=len(devices)) as pool:
+            results = list(pool.map(self._check, devices))
+
+        for name, data in zip(devices, results):
+            banner(f"Card Check {name}" if name else "Card Check")
+            print(Printer.attribute(
+                data,
+                sort_keys=False,
+                order=[
+                    "hostname",
+                    "ip",
+                    "ssh",
+                    "auth_key",
+                    "wifi",
+                    "psk",
+                    "ssid"
+                ]
+            ))
+
+    # noinspection PyBroadException
+    def _check(self, device=None):
+        """
+        Reads the configuration from the device or image without mounting it,
+        or from the mounted card if device is None
+
+        :param device: the device or image
+        :type device: str
+        :return: the configuration
+        :rtype: dict
+        """
+
         data = {
             "ssh": None,
             "hostname": None,
@@ -72,29 +169,53 @@ class Burner(object):
             "auth_key": None
         }
 
-        host = get_platform()
+        if device is not None:
+            disk = BlockDevice(device, writable=False)
+            try:
+                boot = Fat32(disk, partition=1)
+                root = Ext4(disk, partition=2)
+            except Exception as e:
+                disk.close()
+                Console.error(f"Could not read {device}: {e}")
+                return data
 
-        if host == "windows":
-            Console.error("Not yet implemented for this OS")
-            return ""
+            def read_boot(name):
+                return boot.read(name).decode("utf-8", errors="replace")
+
+            def read_root(path):
+                return root.read(path).decode("utf-8", errors="replace")
+
+            exists_boot = boot.exists
+            exists_root = root.exists
+        else:
+            card = self.card or SDCard(host_os=get_platform())
+
+            def read_boot(name):
+                return readfile(f"{card.boot_volume}/{name}")
+
+            def read_root(path):
+                return readfile(f"{card.root_volume}{path}")
+
+            def exists_boot(name):
+                return os.path.exists(f"{card.boot_volume}/{name}")
+
+            def exists_root(path):
+                return os.path.exists(f"{card.root_volume}{path}")
 
-        card = SDCard(host_os=host)
         # ssh
 
         try:
-            data["ssh"] = \
-                os.path.exists(f'{card.boot_volume}/ssh') or \
-                os.path.exists(f'{card.root_volume}/etc/systemd/system/sshd.service')
+            data["ssh"] = exists_boot("ssh") or \
+                exists_root("/etc/systemd/system/sshd.service")
         except Exception as e:
             data["ssh"] = str(e)
 
         # auth_key
 
         try:
-            data["auth_key"] = \
-                os.path.exists(f'{card.root_volume}/home/pi/.ssh/authorized_keys')
+            data["auth_key"] = exists_root("/home/pi/.ssh/authorized_keys")
             if data["auth_key"]:
-                content = readfile(f"{card.root_volume}/home/pi/.ssh/authorized_keys")
+                content = read_root("/home/pi/.ssh/authorized_keys")
                 data["auth_key"] = content.split()[-1]
         except Exception as e:
             data["auth_key"] = str(e)
@@ -102,7 +223,7 @@ class Burner(object):
         # hostname
 
         try:
-            content = readfile(f"{card.root_volume}/etc/hostname").strip()
+            content = read_root("/etc/hostname").strip()
             data['hostname'] = content
         except Exception as e:
             data["hostname"] = str(e)
@@ -110,7 +231,7 @@ class Burner(object):
         # ip
 
         try:
-            content = readfile(f"{card.root_volume}/etc/dhcpcd.conf")
+            content = read_root("/etc/dhcpcd.conf")
             for line in content.splitlines():
                 if line.startswith('static ip_address='):
                     data['ip'] = line[18:]
@@ -122,11 +243,10 @@ class Burner(object):
         # wifi
 
         try:
-            location = f"{card.boot_volume}/wpa_supplicant.conf"
-            data["wifi"] = os.path.exists(location)
+            data["wifi"] = exists_boot("wpa_supplicant.conf")
 
             if data["wifi"]:
-                lines = readfile(location).splitlines()
+                lines = read_boot("wpa_supplicant.conf").splitlines()
                 for line in lines:
                     for tag in ["ssid", "psk"]:
                         if f'{tag}=' in line:
@@ -143,20 +263,10 @@ class Burner(object):
             data["ssid"] = None
             data["psk"] = None
 
-        banner("Card Check")
-        print(Printer.attribute(
-            data,
-            sort_keys=False,
-            order=[
-                "hostname",
-                "ip",
-                "ssh",
-                "auth_key",
-                "wifi",
-                "psk",
-                "ssid"
-            ]
-        ))
+        if device is not None:
+            disk.close()
+
+        return data
 
     @windows_not_supported
     def firmware(self, action="check"):
@@ -188,18 +298,42 @@ class Burner(object):
                 _execute("sudo rpi-eeprom-update -a")
                 os.system("sudo reboot")
 
-    def mac(self, hostnames=None):
+    def mac(self, hostnames=None, inventory=None, timeout=10.0):
         """
-        Sets the hostname for which we probe the MAC addresses
-
-        :param hostnames: the hostnames
-        :type hostnames: str
+        Collects the MAC addresses of the hosts in parallel from the ARP
+        table or with ssh and writes them into the inventory
+
+        :param hostnames: the hostnames, by default all hosts of the
+                          inventory
+        :type hostnames: list
+        :param inventory: the inventory, by default ~/.cloudmesh/inventory.yaml
+        :type inventory: str
+        :param timeout: the time in seconds after which the search for the
+                        MAC address of a host stops
+        :type timeout: float
+        :return: the results of each host
+        :rtype: dict
         """
-        self.hostnames = hostnames
-
-        print(hostnames)
-        Console.error("Not yet implemented")
-        return ""
+        from cloudmesh.burn.mac import Mac
+
+        inv = Inventory(filename=inventory) if inventory else Inventory()
+        self.hostnames = hostnames or list(inv.data or {})
+        hosts = {}
+        for name in self.hostnames:
+            if inv.has_host(name):
+                hosts[name] = inv.data[name].get("ip") or None
+            else:
+                Console.warning(f"{name} is not in the inventory {inv.filename}")
+                hosts[name] = None
+
+        mac = Mac(hosts)
+        results = mac.run(timeout=timeout)
+        print(mac.table())
+        missing = [result["host"] for result in mac.missing()]
+        if missing:
+            Console.warning(f"No MAC address found for {', '.join(missing)}")
+        mac.write(inv)
+        return results
 
     @windows_not_supported
     def set_locale(self, locale="en_US.UTF-8"):
@@ -211,14 +345,14 @@ class Burner(object):
         #
         ''').strip()
 
-        card = SDCard()
+        card = self.card or SDCard()
 
         # Write it 3 times as sometimes it does not work
         for i in range(0, 3):
-            SDCard.writefile(f"{card.root_volume}/etc/default/locale", lang)
+            self._write(f"{card.root_volume}/etc/default/locale", lang)
 
-        locale_gen = SDCard.readfile(f"{card.root_volume}/etc/locale.gen",
-                                     split=True, decode=True)
+        locale_gen = self._read(f"{card.root_volume}/etc/locale.gen",
+                                split=True, decode=True)
         for i in range(0, len(locale_gen)):
             if not locale_gen[i].startswith("#"):
                 locale_gen[i] = "# " + locale_gen[i]
@@ -227,15 +361,14 @@ class Burner(object):
         locale_gen = "\n".join(locale_gen) + "\n"
 
         for i in range(0, 3):
-            SDCard.writefile(f"{card.root_volume}/etc/locale.gen", locale_gen)
+            self._write(f"{card.root_volume}/etc/locale.gen", locale_gen)
 
     def set_cmdline(self, cmdline):
-        card = SDCard()
+        card = self.card or SDCard()
         filename = f'{card.boot_volume}/cmdline.txt'
-        content = Sudo.readfile(filename=filename, split=False, decode=True)
+        content = self._read(filename)
         content = content.rstrip() + " " + cmdline
-        SDCard.writefile(filename=f'{card.boot_volume}/cmdline.txt',
-                         content=content)
+        self._write(filename, content)
 
     @windows_not_supported
     def set_hostname(self, hostname):
@@ -254,14 +387,16 @@ class Burner(object):
         # 0000014
 
         self.hostname = hostname
-        card = SDCard()
+        card = self.card or SDCard()
 
         name = hostname.strip()
 
         # Write it 3 times as sometimes it does not work
+        # A staged write is done only once
         for i in range(0, 3):
-            time.sleep(0.5)
-            SDCard.writefile(f"{card.root_volume}/etc/hostname", name)
+            if self.stage is None:
+                time.sleep(0.5)
+            self._write(f"{card.root_volume}/etc/hostname", name)
 
         # change last line of /etc/hosts to have the new hostname
         # 127.0.1.1 raspberrypi   # default
@@ -281,7 +416,7 @@ class Burner(object):
         print(hosts)
         print()
 
-        SDCard.writefile(f'{card.root_volume}/etc/hosts', hosts)
+        self._write(f'{card.root_volume}/etc/hosts', hosts)
 
     def add_to_hosts(self, ip=None):
         hosts = SDCard.readfile('/etc/hosts', split=True, decode=True)
@@ -310,13 +445,13 @@ class Burner(object):
         SDCard.writefile('/etc/hosts', config + "\n")
 
     def write_cluster_hosts(self, cluster_hosts=None):
-        card = SDCard()
-        hosts = SDCard.readfile(f'{card.root_volume}/etc/hosts', split=False, decode=True)
+        card = self.card or SDCard()
+        hosts = self._read(f'{card.root_volume}/etc/hosts', split=False, decode=True)
         hosts = hosts + '\n'
         for ip, hostname in cluster_hosts:
             hosts = hosts + f"{ip}\t{hostname}\n"
         hosts = hosts + "#\n"
-        SDCard.writefile(f'{card.root_volume}/etc/hosts', hosts)
+        self._write(f'{card.root_volume}/etc/hosts', hosts)
 
     @windows_not_supported
     def set_static_ip(self,
@@ -346,7 +481,7 @@ class Burner(object):
         # router_ip statically set to default ip configured with cms bridge
         # create. Rewrite to consider the IP of the manager on iface
 
-        card = SDCard()
+        card = self.card or SDCard()
 
         mountpoint = card.root_volume
         if self.hostname is not None and write_local_hosts:
@@ -356,7 +491,7 @@ class Burner(object):
         static_ip = f'static ip_address={ip}/{mask}'
         static_routers = f'static routers={router_ip}'
 
-        curr_config = SDCard.readfile(f'{mountpoint}/etc/dhcpcd.conf', decode=True, split=True)
+        curr_config = self._read(f'{mountpoint}/etc/dhcpcd.conf', decode=True, split=True)
         if iface in curr_config:
             Console.warning("Found previous settings. Overwriting")
             # If setting already present, replace it and the static ip line
@@ -379,7 +514,7 @@ class Burner(object):
             curr_config.append('\n')
             # curr_config.append('nolink\n')
 
-        SDCard.writefile(f'{mountpoint}/etc/dhcpcd.conf', '\n'.join(curr_config))
+        self._write(f'{mountpoint}/etc/dhcpcd.conf', '\n'.join(curr_config))
 
     @windows_not_supported
     def keyboard(self, country="US"):
@@ -404,11 +539,11 @@ class Burner(object):
         #
         # BACKSPACE="guess"
 
-        card = SDCard()
+        card = self.card or SDCard()
 
         layout = f"{card.root_volume}/etc/default/keyboard"
 
-        content = SDCard.readfile(layout, decode=True, split=True)
+        content = self._read(layout, decode=True, split=True)
 
         country = country.lower()
         found = False
@@ -420,8 +555,7 @@ class Burner(object):
 
         content = "\n".join(content)
         print(content)
-        SDCard.writefile(layout, content)
-        Sudo.execute("sync")
+        self._write(layout, content)
         return found
 
     @windows_not_supported
@@ -435,15 +569,18 @@ class Burner(object):
         # copy file on burner computer ~/.ssh/id_rsa.pub into
         #   mountpoint/home/pi/.ssh/authorized_keys
 
-        card = SDCard()
+        card = self.card or SDCard()
 
         location = path_expand(key_file)
 
-        SDCard.execute(f'mkdir -p {card.root_volume}/home/pi/.ssh/')
-        SDCard.execute(f'cp {location} {card.root_volume}/home/pi/.ssh/authorized_keys')
+        stage = self.stage or Stage()
+        stage.mkdir(f"{card.root_volume}/home/pi/.ssh")
+        stage.write(f"{card.root_volume}/home/pi/.ssh/authorized_keys",
+                    readfile(location))
         # cleanup
-        if os.path.exists(f"{card.root_volume}/home/pi/.ssh/._authorized_keys"):
-            SDCard.execute(f"rm -f {card.root_volume}/home/pi/.ssh/._authorized_keys")
+        stage.rm(f"{card.root_volume}/home/pi/.ssh/._authorized_keys")
+        if self.stage is None:
+            stage.commit(verbose=False)
 
     def write_fix(self, locale="en_US.UTF-8"):
         """
@@ -494,19 +631,19 @@ class Burner(object):
                 #
         """)
 
-        card = SDCard()
+        card = self.card or SDCard()
         fix = "/boot/fix_permissions.py"
         fix_on_sdcard = f"{card.boot_volume}/fix_permissions.py"
-        SDCard.writefile(fix_on_sdcard, script)
+        self._write(fix_on_sdcard, script)
 
         rc_local = f"{card.root_volume}/etc/rc.local"
-        content = readfile(rc_local)
+        content = self._read(rc_local)
         if fix in content:
             return
         else:
             content = content.replace("exit 0", f"sudo python {fix}")
             content = content + "\n" + "exit 0\n"
-            SDCard.writefile(rc_local, content)
+            self._write(rc_local, content)
 
     @windows_not_supported
     def enable_ssh(self):
@@ -515,19 +652,11 @@ class Burner(object):
         """
         host = get_platform()
 
-        if host in ['raspberry', "linux"]:
-            sudo = True
+        card = self.card or SDCard(card_os="raspberry", host_os=host)
+        if self.stage is None:
+            Helper.write(f'{card.boot_volume}/ssh', "")
         else:
-            sudo = False
-
-        card = SDCard(card_os="raspberry", host_os=host)
-        if sudo:
-            Sudo.password()
-            command = f'sudo touch {card.boot_volume}/ssh'
-        else:
-            command = f'touch {card.boot_volume}/ssh'
-
-        os.system(command)
+            self.stage.write(f'{card.boot_volume}/ssh', "")
 
         return ""
 
@@ -538,7 +667,7 @@ class Burner(object):
     def disable_password_ssh(self):
 
         # sshd_config = self.filename("/etc/ssh/sshd_config")
-        card = SDCard()
+        card = self.card or SDCard()
         sshd_config = f'{card.root_volume}/etc/ssh/sshd_config'
         new_sshd_config = ""
         updated_params = False
@@ -563,7 +692,7 @@ class Burner(object):
 
         found_params = set()
         # with open(sshd_config, 'r') as f:
-        f = SDCard.readfile(sshd_config, decode=True, split=True)
+        f = self._read(sshd_config, decode=True, split=True)
 
         for line in f:
             found_a_param = False
@@ -591,7 +720,7 @@ class Burner(object):
             # with open(sshd_config, "w") as f:
             #     f.write(new_sshd_config)
 
-            SDCard.writefile(sshd_config, new_sshd_config)
+            self._write(sshd_config, new_sshd_config)
 
     @windows_not_supported
     def configure_wifi(self,
@@ -617,7 +746,7 @@ class Burner(object):
 
         country = country or 'US'
 
-        card = SDCard(card_os=card_os, host_os=host)
+        card = self.card or SDCard(card_os=card_os, host_os=host)
         path = f"{card.boot_volume}/wpa_supplicant.conf"
 
         card_os = "raspberry"  # needs to become a parameter based on tag
@@ -628,19 +757,19 @@ class Burner(object):
         if card_os == "raspberry":
             if psk:
                 if os_is_mac():
-                    WifiClass.set(ssid=ssid, password=psk, country=country, location=path)
+                    WifiClass.set(ssid=ssid, password=psk, country=country, location=path, stage=self.stage)
                 else:
-                    WifiClass.set(ssid=ssid, password=psk, country=country, location=path, sudo=True)
+                    WifiClass.set(ssid=ssid, password=psk, country=country, location=path, sudo=True, stage=self.stage)
             else:
                 if os_is_mac():
-                    WifiClass.set(ssid=ssid, psk=False, country=country, location=path)
+                    WifiClass.set(ssid=ssid, psk=False, country=country, location=path, stage=self.stage)
                 else:
-                    WifiClass.set(ssid=ssid, psk=False, country=country, location=path, sudo=True)
+                    WifiClass.set(ssid=ssid, psk=False, country=country, location=path, sudo=True, stage=self.stage)
         else:
             if os_is_mac():
-                WifiClass.set(ssid=ssid, password=psk, country=country, location=path)
+                WifiClass.set(ssid=ssid, password=psk, country=country, location=path, stage=self.stage)
             else:
-                WifiClass.set(ssid=ssid, password=psk, country=country, location=path, sudo=True)
+                WifiClass.set(ssid=ssid, password=psk, country=country, location=path, sudo=True, stage=self.stage)
 
         return ""
 
@@ -681,7 +810,7 @@ class Burner(object):
         #        with open(f'{mountpoint}/etc/passwd', 'r') as f:
         #            info = [l for l in f.readlines()]
 
-        info = SDCard.readfile(f'{mountpoint}/etc/passwd', split=True, decode=True)
+        info = self._read(f'{mountpoint}/etc/passwd', split=True, decode=True)
 
         for i in range(len(info)):
             inf = info[i].split(":")
@@ -694,13 +823,13 @@ class Burner(object):
         # with open(f'{mountpoint}/etc/passwd', 'w') as f:
         #     f.writelines(info)
 
-        SDCard.writefile(f'{mountpoint}/etc/passwd', content)
+        self._write(f'{mountpoint}/etc/passwd', content)
 
         # Add it to shadow file
         # with open(f'{mountpoint}/etc/shadow', 'r') as f:
         #     data = [l for l in f.readlines()]
 
-        data = SDCard.readfile(f'{mountpoint}/etc/shadow', decode=True, split=True)
+        data = self._read(f'{mountpoint}/etc/shadow', decode=True, split=True)
 
         content = ""
         for i in range(len(data)):
@@ -711,21 +840,31 @@ class Burner(object):
 
         content = '\n'.join(data)
 
-        SDCard.writefile(f'{mountpoint}/etc/shadow', content)
+        self._write(f'{mountpoint}/etc/shadow', content)
 
     def generate_key(self, hostname=None):
-        card = SDCard()
-        # TODO investigate what happens if not run as UID 1000 (e.g. first user)
+        """
+        Generates the key pair of the user pi in memory and writes it to
+        the card
 
-        cmd = f'mkdir -p {card.root_volume}/home/pi/.ssh/'
-        os.system(cmd)
+        :param hostname: the hostname used in the comment of the key
+        :type hostname: str
+        :return: the public key
+        :rtype: str
+        """
+        card = self.card or SDCard()
+        private, public = Keys.generate(kind="rsa", comment=f"pi@{hostname}")
 
-        cmd = f'ssh-keygen -q -N "" -C "pi@{hostname}" -f {card.root_volume}/home/pi/.ssh/id_rsa'
-        os.system(cmd)
+        # the files are owned by pi, the first user with uid and gid 1000
+        directory = f'{card.root_volume}/home/pi/.ssh'
+        Helper.mkdir(directory, mode=0o700, owner=(1000, 1000))
+        Helper.write(f'{directory}/id_rsa', private + "\n", mode=0o600, owner=(1000, 1000))
+        Helper.write(f'{directory}/id_rsa.pub', public + "\n", mode=0o644, owner=(1000, 1000))
+        return public
 
     @staticmethod
-    def store_public_key():
-        card = SDCard()
+    def store_public_key(card=None):
+        card = card or SDCard()
         cmd = f'cp {card.root_volume}/home/pi/.ssh/id_rsa.pub ~/.cloudmesh/cmburn/'
         os.system(cmd)
 
@@ -1207,9 +1346,12 @@ class MultiBurner(object):
         :type write_local_hosts:
         :return:
         :rtype:
+        :raises OSError: if the staged configuration could not be written
+                         to the card
         """
-        # TODO
-        card = SDCard()
+        # the card is bound to the device, so that its volumes are mounted on
+        # mount points specific to the device
+        card = SDCard(device=device)
         # boot_volume = card.boot_volume
         root_volume = card.root_volume
         if key is None:
@@ -1222,12 +1364,12 @@ class MultiBurner(object):
         # use a counter to check this
 
         counter = 0
-        burner = Burner()
+        stage = Stage()
+        burner = Burner(stage=stage, card=card)
 
         print("counter", counter)
         StopWatch.start(f"create {device} {hostname}")
 
-        card = SDCard()
         if formatting:
             StopWatch.start(f"format {device} {hostname}")
             success = card.format_device(device=device,
@@ -1248,11 +1390,19 @@ class MultiBurner(object):
 
         if imaging:
             StopWatch.start(f"write image {device} {hostname}")
-            card.burn_sdcard(tag=tag,
-                             device=device,
-                             blocksize=blocksize,
-                             name=hostname,
-                             yes=yes)
+            try:
+                card.burn_sdcard(tag=tag,
+                                 device=device,
+                                 blocksize=blocksize,
+                                 name=hostname,
+                                 yes=yes)
+            except (ValueError, OSError) as e:
+                Console.error(str(e))
+                Console.warning("Skipping card due to failed burn. "
+                                "Continuing with next hostname.")
+                StopWatch.stop(f"write image {device} {hostname}")
+                StopWatch.status(f"write image {device} {hostname}", False)
+                return
             StopWatch.stop(f"write image {device} {hostname}")
             StopWatch.status(f"write image {device} {hostname}", True)
 
@@ -1264,7 +1414,6 @@ class MultiBurner(object):
         Sudo.password()
         StopWatch.start(f"write host data {device} {hostname}")
         card.mount(device=device)
-        Sudo.execute("sync")
 
         burner.keyboard(country=keyboard)
         burner.set_hostname(hostname)
@@ -1272,7 +1421,7 @@ class MultiBurner(object):
         if generate_key:
             burner.generate_key(hostname)
         if store_key:
-            Burner.store_public_key()
+            Burner.store_public_key(card=card)
         burner.disable_terminal_login(root_volume, password)
         if ssid:
             Console.warning("In the future, try to interface with the workers via "
@@ -1296,11 +1445,17 @@ class MultiBurner(object):
             if not write_local_hosts:
                 burner.write_cluster_hosts(cluster_hosts)
         burner.write_fix()
+        stage.rm(f"{card.root_volume}/etc/xdg/autostart/piwiz.desktop")
         try:
-            os.system(f"sudo rm -f {card.root_volume}/etc/xdg/autostart/piwiz.desktop")
-        except:  # noqa: E722
-            Console.error("Gui wizzard not found at "
-                          f"{card.root_volume}/etc/xdg/autostart/piwiz.desktop")
+            stage.commit()
+        except OSError as e:
+            # the card is incomplete, it is unmounted so it can be removed
+            # and the burn fails
+            Console.error(f"Could not write the configuration of {hostname}: {e}")
+            card.unmount(device=device, full=True)
+            StopWatch.stop(f"write host data {device} {hostname}")
+            StopWatch.status(f"write host data {device} {hostname}", False)
+            raise
 
         card.unmount(device=device, full=True)
         StopWatch.stop(f"write host data {device} {hostname}")
@@ -0,0 +1,256 @@
+"""
+Incremental backups of a card that share the chunks of earlier backups.
+
+The used ranges of the card, see Backup.ranges, are read in chunks of
+4 MiB at fixed offsets. Each chunk is hashed with sha256 and only chunks
+that are not yet in the chunk store are compressed and written, so a
+nightly backup of a card that changed little writes only the changed
+chunks. The store is a directory with one compressed file per chunk:
+
+    <store>/<first two characters of the sha256>/<sha256>
+
+Each backup is a manifest, a JSON file with the size and the partitions of
+the card and the offset, size and sha256 of its chunks. A manifest is
+restored with
+
+    cms burn copy --device=/dev/sdb --from=MANIFEST
+
+Example:
+
+    store = ChunkStore("~/.cloudmesh/cmburn/chunks")
+    store.backup("/dev/sdb", "~/red-2021-06-01.json")
+    ChunkStore.restore("~/red-2021-06-01.json", "/dev/sdb")
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+from cloudmesh.burn.backup import Backup
+from cloudmesh.burn.backup import CHUNK
+from cloudmesh.burn.expand import Expand
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+
+FORMAT = "cmburn-manifest"
+VERSION = 1
+
+
+class ChunkStore(object):
+
+    DIRECTORY = "~/.cloudmesh/cmburn/chunks"
+
+    def __init__(self, directory=None, level=6):
+        """
+        Opens the chunk store
+
+        :param directory: the directory of the store
+        :type directory: str
+        :param level: the zlib compression level of new chunks
+        :type level: int
+        """
+        self.directory = path_expand(directory or ChunkStore.DIRECTORY)
+        self.level = level
+
+    def path(self, digest):
+        """
+        Returns the file of the chunk
+
+        :param digest: the sha256 of the chunk
+        :type digest: str
+        :rtype: str
+        """
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def __contains__(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """
+        Stores the chunk if it is not yet in the store
+
+        :param data: the chunk
+        :type data: bytes
+        :return: the sha256 of the chunk and the number of bytes written
+        :rtype: tuple
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self:
+            return digest, 0
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the same chunk may be stored by two threads at the same time
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+        compressed = zlib.compress(data, self.level)
+        with open(partial, "wb") as f:
+            f.write(compressed)
+        os.replace(partial, path)
+        return digest, len(compressed)
+
+    def get(self, digest):
+        """
+        Reads the chunk
+
+        :param digest: the sha256 of the chunk
+        :type digest: str
+        :return: the chunk
+        :rtype: bytes
+        """
+        try:
+            with open(self.path(digest), "rb") as f:
+                data = zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise ValueError(f"the chunk {digest} is missing in {self.directory}")
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"the chunk {digest} in {self.directory} is corrupted")
+        return data
+
+    @staticmethod
+    def chunks(ranges, size):
+        """
+        Returns the chunks that contain the ranges. The chunks start at
+        multiples of the chunk size, so unchanged blocks are found in the
+        same chunks in every backup.
+
+        :param ranges: the list of offset and size of the used ranges
+        :type ranges: list
+        :param size: the size of the card
+        :type size: int
+        :return: the list of offset and size of the chunks
+        :rtype: list
+        """
+        numbers = set()
+        for offset, length in ranges:
+            numbers.update(range(offset // CHUNK, (offset + length - 1) // CHUNK + 1))
+        return [(number * CHUNK, min(CHUNK, size - number * CHUNK)) for number in sorted(numbers)]
+
+    def backup(self, device, filename, workers=None, progress=None):
+        """
+        Backs up the card into the store and writes the manifest
+
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :param filename: the manifest
+        :type filename: str
+        :param workers: the number of threads that hash and compress the
+                        chunks, by default the number of CPUs
+        :type workers: int
+        :param progress: a function called with the number of read bytes
+                         and the number of bytes that are read
+        :type progress: function(int, int)
+        :return: the manifest
+        :rtype: dict
+        """
+        filename = path_expand(filename)
+        size = Expand.size(device)
+        chunks = ChunkStore.chunks(Backup.ranges(device, size=size), size)
+        Console.info(f"Reading {sum(length for _, length in chunks) // 1024 ** 2} MiB "
+                     f"of {size // 1024 ** 2} MiB from {device}")
+
+        manifest = {
+            "format": FORMAT,
+            "version": VERSION,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "device": device,
+            "size": size,
+            "chunk": CHUNK,
+            "store": self.directory,
+            "partitions": Backup.partitions(device),
+            "chunks": [],
+            "new": 0,
+            "written": 0
+        }
+
+        def consume(offset, length, result):
+            digest, written = result
+            manifest["chunks"].append([offset, length, digest])
+            if written:
+                manifest["new"] += 1
+                manifest["written"] += written
+
+        Backup.read(device, chunks, self.put, consume, workers=workers, progress=progress)
+
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        partial = f"{filename}.partial"
+        with open(partial, "w") as f:
+            json.dump(manifest, f)
+        os.replace(partial, filename)
+        Console.ok(f"Backed up {device} to {filename}, {manifest['new']} of "
+                   f"{len(chunks)} chunks were new ({manifest['written'] // 1024 ** 2} MiB)")
+        return manifest
+
+    @staticmethod
+    def manifest(filename):
+        """
+        Reads the manifest of a backup
+
+        :param filename: the manifest
+        :type filename: str
+        :return: the manifest
+        :rtype: dict
+        """
+        with open(path_expand(filename)) as f:
+            manifest = json.load(f)
+        if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+            raise ValueError(f"{filename} is not a backup manifest")
+        if manifest["version"] > VERSION:
+            raise ValueError(f"the manifest version {manifest['version']} of {filename} is not supported")
+        return manifest
+
+    @staticmethod
+    def is_manifest(filename):
+        """
+        Checks if the file is a manifest written by ChunkStore.backup
+
+        :param filename: the file
+        :type filename: str
+        :rtype: bool
+        """
+        filename = path_expand(filename)
+        if not os.path.isfile(filename):
+            return False
+        with open(filename, "rb") as f:
+            if f.read(1) != b"{":
+                return False
+        try:
+            ChunkStore.manifest(filename)
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def restore(filename, device, directory=None, progress=None):
+        """
+        Writes the backup of the manifest to the card
+
+        :param filename: the manifest
+        :type filename: str
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :param directory: the chunk store, by default the store the backup
+                          was written to
+        :type directory: str
+        :param progress: a function called with the number of written
+                         bytes and the number of bytes that are written
+        :type progress: function(int, int)
+        """
+        manifest = ChunkStore.manifest(filename)
+        store = ChunkStore(directory or manifest["store"])
+        missing = {digest for _, _, digest in manifest["chunks"] if digest not in store}
+        if missing:
+            raise ValueError(f"{len(missing)} chunks of {filename} are missing in {store.directory}")
+
+        def blocks():
+            for offset, length, digest in manifest["chunks"]:
+                data = store.get(digest)
+                if len(data) != length:
+                    raise ValueError(f"the chunk at {offset} of {filename} has the wrong size")
+                yield offset, data
+
+        Backup.write(device, manifest["size"], [chunk[:2] for chunk in manifest["chunks"]],
+                     blocks(), progress=progress)
+        Console.ok(f"Restored {filename} to {device}")
@@ -1,27 +1,14 @@
 import os
-import subprocess
 import time
-from getpass import getpass
-
-# from cloudmesh.common.debug import VERBOSE
-from cloudmesh.common.StopWatch import StopWatch
-from cloudmesh.common.Tabulate import Printer
-from cloudmesh.common.parameter import Parameter
-from cloudmesh.common.security import generate_strong_pass
-from cloudmesh.common.util import Console
-from cloudmesh.common.util import yn_choice
-from cloudmesh.common.util import banner
-from cloudmesh.inventory.inventory import Inventory
+
+from cloudmesh.common.console import Console
 from cloudmesh.shell.command import PluginCommand
 from cloudmesh.shell.command import command
 from cloudmesh.shell.command import map_parameters
-from cloudmesh.common.debug import VERBOSE
-from cloudmesh.common.Host import Host
-from cloudmesh.common.util import path_expand
-from cloudmesh.common.util import is_gitbash
-from cloudmesh.common.util import get_password
-from cloudmesh.common.Shell import Shell
-from cloudmesh.common.systeminfo import os_is_windows
+
+# cms imports every plugin when it starts. Only the modules above, which
+# the shell loads anyway, are imported with this module. Each subcommand
+# imports the modules it needs when it is run.
 
 
 class BurnCommand(PluginCommand):
@@ -42,7 +29,8 @@ class BurnCommand(PluginCommand):
                        [--no_diagram]
               burn ubuntu NAMES [--inventory=INVENTORY] [--ssid=SSID]
                                 [--wifipassword=PSK] [-v] --device=DEVICE [--country=COUNTRY]
-                                [--upgrade]
+                                [--upgrade] [--shared_hosts] [--auto]
+                                [--bundle=BUNDLE] [--host_keys]
               burn raspberry NAMES [--device=DEVICE]
                                    [--disk=DISK]
                                    [--inventory=INVENTORY]
@@ -58,6 +46,24 @@ class BurnCommand(PluginCommand):
                                    [--new]
                                    [--no_image]
                                    [--network=NETWORK]
+                                   [--shared_hosts]
+                                   [--auto]
+                                   [--bundle=BUNDLE]
+                                   [--host_keys]
+                                   [--customize]
+                                   [--expand]
+              burn render NAMES [--os=OS]
+                                [--inventory=INVENTORY]
+                                [--bundle=BUNDLE]
+                                [--ssid=SSID]
+                                [--wifipassword=PSK]
+                                [--country=COUNTRY]
+                                [--password=PASSWORD]
+                                [--network=NETWORK]
+                                [--upgrade]
+                                [--shared_hosts]
+                                [--host_keys]
+                                [--customize]
               burn firmware check
               burn firmware update
               burn install
@@ -67,14 +73,16 @@ class BurnCommand(PluginCommand):
               burn mount [--volume=VOLUME] [--device=DEVICE] [--os=OS]
               burn unmount [--device=DEVICE] [--os=OS]
               burn network list [--ip=IP] [--used]
+              burn wait [NAMES] [--inventory=INVENTORY] [--timeout=SECONDS]
               burn network
               burn info [--device=DEVICE] [--manager]
               burn image versions [--tag=TAG] [--details] [--refresh] [--yaml]
               burn image ls
               burn image delete [--image=IMAGE]
               burn image get [--url=URL] [TAG...]
-              burn backup [--device=DEVICE] [--to=DESTINATION]
-              burn copy [--device=DEVICE] [--from=DESTINATION]
+              burn backup [--device=DEVICE] [--to=DESTINATION] [--compress]
+                          [--incremental] [--store=STORE]
+              burn copy [--device=DEVICE] [--from=DESTINATION] [--expand]
               burn shrink [--image=IMAGE]
               burn cluster --device=DEVICE --hostname=HOSTNAME
                            [--burning=BURNING]
@@ -110,7 +118,8 @@ class BurnCommand(PluginCommand):
               burn enable ssh
               burn wifi --ssid=SSID [--passwd=PASSWD] [--country=COUNTRY]
               burn check [--device=DEVICE]
-              burn mac --hostname=HOSTNAME
+              burn mac [--hostname=HOSTNAME] [--inventory=INVENTORY] [--timeout=SECONDS]
+              burn stats [--by=FIELD] [--stage=STAGE]
               burn drive rm DRIVE
               burn drive assign VOLUME DRIVE
 
@@ -127,6 +136,34 @@ class BurnCommand(PluginCommand):
               --blocksize=BLOCKSIZE  The blocksise to burn [default: 4M]
               --burning=BURNING      The hosts to be burned
               --network=NETWORK      Network is connected to a mesh network [default: internal]
+              --shared_hosts         Write the cluster hosts as one hosts file into
+                                     the boot partition instead of embedding them
+                                     in the configuration of each card
+              --auto                 Detect when a card is inserted instead of asking
+                                     for each card. Several devices are burned in
+                                     parallel, e.g. --device=/dev/sd[b-e]
+              --bundle=BUNDLE        The directory into which the files of the hosts
+                                     are rendered before burning
+              --host_keys            Generate the SSH host keys of the hosts before
+                                     burning, so they are not generated at first boot
+              --customize            Apply the timezone, keyboard and ssh settings
+                                     once to a copy of the image instead of at the
+                                     first boot of each card. Requires debugfs.
+              --expand               Expand the root partition to the size of the
+                                     card when it is burned instead of at first
+                                     boot. Requires resize2fs.
+              --compress             Only back up the used blocks of the card and
+                                     store them compressed
+              --timeout=SECONDS      The time to wait for the hosts. wait: 600 seconds
+                                     for all hosts, mac: 10 seconds for each host
+              --incremental          Only store the chunks of the card that are not
+                                     in the chunk store of earlier backups
+              --store=STORE          The chunk store of incremental backups
+                                     [default: ~/.cloudmesh/cmburn/chunks]
+              --by=FIELD             The attribute by which the burn statistics are
+                                     grouped: reader, model, image, host or device
+                                     [default: reader]
+              --stage=STAGE          Only show the statistics of the stage, e.g. write
 
             Arguments:
                TAG                   Keyword tags to identify an image
@@ -157,6 +194,11 @@ class BurnCommand(PluginCommand):
 
                     Lists the ip addresses that are on the same network
 
+                    The hosts are probed in parallel with a connection to
+                    the ssh port and found in the ARP cache. The network can
+                    be given with --ip, e.g. --ip=192.168.1.0/24. The SSH
+                    column shows if ssh accepts connections.
+
                      +------------+---------------+----------+-----------+
                      | Name       | IP            | Status   | Latency   |
                      |------------+---------------+----------+-----------|
@@ -177,6 +219,45 @@ class BurnCommand(PluginCommand):
 
                        192.168.50.1,192.168.50.4,...
 
+                cms burn wait [NAMES] [--inventory=INVENTORY] [--timeout=SECONDS]
+
+                    Waits until the burned hosts have booted. The hosts
+                    of the inventory, or only NAMES, are probed in
+                    parallel with multicast DNS (name.local), a
+                    connection to the ssh port and the ssh banner. A
+                    table shows for each host the seconds until it
+                    answered and is updated while the hosts boot. The
+                    times are appended to ~/.cloudmesh/cmburn/boot.jsonl
+
+                cms burn mac [--hostname=HOSTNAME] [--inventory=INVENTORY] [--timeout=SECONDS]
+
+                    Collects the MAC addresses of the hosts of the
+                    inventory, or only HOSTNAME, in parallel, e.g. for
+                    DHCP reservations. A host on the same network is
+                    found in the ARP table after a connection to its
+                    ssh port, otherwise the address of eth0 is read with
+                    ssh as pi. The addresses are written to the mac
+                    attribute of the inventory with a single save.
+
+                cms burn stats [--by=FIELD] [--stage=STAGE]
+
+                    Shows the 50th, 90th and 99th percentile of the time
+                    and the median throughput of the stages format,
+                    write, configure and unmount of the burned cards,
+                    grouped by the reader, the card model, the image,
+                    the host or the device. Each stage of a burn is
+                    recorded in ~/.cloudmesh/cmburn/telemetry.db
+
+                CMBURN_TRACE=FILE cms burn ...
+
+                    Records the download, the write, the mounts and the
+                    configuration of the cards as spans and writes them as
+                    Chrome trace to FILE, e.g. burn.json, which shows the
+                    burn as timeline in https://ui.perfetto.dev. If
+                    CMBURN_TRACE is a URL, e.g.
+                    http://localhost:4318/v1/traces, the spans are sent to
+                    an OpenTelemetry collector with OTLP/HTTP JSON.
+
                 cms burn network address
 
                     Lists the own network address
@@ -197,10 +278,10 @@ class BurnCommand(PluginCommand):
 
                 cms burn install
 
-                    Installs a program to shrink img files. THis is
-                    useful, after you created a backup to make the
-                    backup smaller and allow faster burning in case of
-                    recovery
+                    Installs e2fsprogs, which is used to shrink img
+                    files. THis is useful, after you created a backup to
+                    make the backup smaller and allow faster burning in
+                    case of recovery
 
                     This command is not supported on MacOS
 
@@ -253,27 +334,42 @@ class BurnCommand(PluginCommand):
                     a space that must occur in the tag that you find
                     in the versions command
 
-                cms burn backup [--device=DEVICE] [--to=DESTINATION]
+                cms burn backup [--device=DEVICE] [--to=DESTINATION] [--compress]
+
+                    Backs up a SDCard to the given location. The backup
+                    can be made smaller with
 
-                    This command requires you to install pishrink previously with
+                        cms burn shrink --image=DESTINATION
 
-                        cms burn install
+                    With --compress only the blocks that are used by the
+                    file systems of the card are read and they are stored
+                    compressed. Such a backup is restored with copy.
 
-                    Backs up a SDCard to the given location.
+                    With --incremental the used blocks are split into
+                    chunks and only the chunks that are not yet in the
+                    chunk store are stored. DESTINATION is the manifest
+                    of the backup that lists the chunks of the card. A
+                    nightly backup of the same card only stores the
+                    chunks that changed.
 
-                cms burn copy [--device=DEVICE] [--from=DESTINATION]
+                cms burn copy [--device=DEVICE] [--from=DESTINATION] [--expand]
 
                     Copies the file form the destination on the SDCard
                     this is the same as the SDCard command. we will in
-                    future remove one
+                    future remove one. A backup created with --compress
+                    or --incremental is written back block by block.
+                    With --expand the root partition of an image, e.g. a
+                    shrunk backup, is expanded to the size of the card.
 
                 cms burn shrink [--image=IMAGE]
 
                     Shrinks the size of a backup or image file that
                     is on your local file system. It can only be used
-                    for .img files
-
-                   This command is not supported on MacOS.
+                    for .img files. The root file system is shrunk to
+                    its minimal size and the image is truncated and kept
+                    sparse. The root partition is not resized at first
+                    boot, it is grown again when the image is copied or
+                    burned with --expand.
 
                 cms burn create [--image=IMAGE]
                                 [--device=DEVICE]
@@ -321,10 +417,25 @@ class BurnCommand(PluginCommand):
                     https://en.wikipedia.org/wiki/ISO_3166-1 for other
                     countries.
 
+                cms burn render NAMES [--os=OS] [--bundle=BUNDLE]
+
+                    Renders the files of the hosts, e.g. firstrun.sh or
+                    user-data and network-config, into the bundle
+                    directory. The default is
+                    ~/.cloudmesh/cmburn/bundles/INVENTORY. Only hosts
+                    whose configuration changed are rendered again.
+                    Burns with --bundle=BUNDLE copy the rendered files.
+                    Hosts with private keys, i.e. with --host_keys and
+                    the Ubuntu manager, are not written to the bundle
+                    and are rendered again with new keys when burned.
+
                 cms burn check [--device=DEVICE]
 
                     Lists the parameters that were set
                     with the set or create command
+                    If a device or an image is given, e.g.
+                    /dev/sd[b-d] or red.img, the partitions
+                    are read directly without mounting them
 
             Examples: ( \\ is not shown)
 
@@ -343,27 +454,26 @@ class BurnCommand(PluginCommand):
                > cms burn image delete 2019-09-26-raspbian-buster-lite
 
         """
-        # importing burn because it impacts other cms commands at a later stage
-        # instead of on top of the file
-        from cloudmesh.burn.Imager import Imager
-        from cloudmesh.burn.burner.Burner import Burner
-        from cloudmesh.burn.burner.RaspberryBurner import Burner as RaspberryBurner
-        from cloudmesh.burn.burner.raspberryos import MultiBurner
-        from cloudmesh.burn.image import Image
-        from cloudmesh.burn.network import Network
-        from cloudmesh.burn.sdcard import SDCard
-        from cloudmesh.burn.ubuntu.configure import Configure
-        from cloudmesh.burn.usb import USB
-        # these oses need to be moved to common
+        trace = os.environ.get("CMBURN_TRACE")
+        if not trace:
+            return self._burn(arguments)
+
+        from cloudmesh.burn.trace import Trace
+
+        with Trace.session(f"burn {args}".strip(), export=trace):
+            return self._burn(arguments)
+
+    def _burn(self, arguments):
+        # only the modules used by most subcommands are imported here, the
+        # others are imported in the subcommand that uses them
+        from cloudmesh.common.StopWatch import StopWatch
+        from cloudmesh.common.Tabulate import Printer
+        from cloudmesh.common.parameter import Parameter
         from cloudmesh.common.systeminfo import os_is_linux
         from cloudmesh.common.systeminfo import os_is_mac
         from cloudmesh.common.systeminfo import os_is_pi
         from cloudmesh.common.systeminfo import os_is_windows
-        from cloudmesh.burn.wifi.ssid import get_ssid
-
-        if os_is_windows():
-            from cloudmesh.burn.windowssdcard import Diskpart
-            from cloudmesh.burn.windowssdcard import Wmic
+        from cloudmesh.common.util import banner
         # end of imports
 
         map_parameters(arguments,
@@ -398,6 +508,18 @@ class BurnCommand(PluginCommand):
                        "upgrade",
                        "no_diagram",
                        "no_image",
+                       "shared_hosts",
+                       "auto",
+                       "bundle",
+                       "host_keys",
+                       "customize",
+                       "expand",
+                       "compress",
+                       "timeout",
+                       "incremental",
+                       "store",
+                       "by",
+                       "stage",
                        "new")
 
         # arguments.MOUNTPOINT = arguments["--mount"]
@@ -419,18 +541,19 @@ class BurnCommand(PluginCommand):
             StopWatch.status(label, True)
             return result
 
-        burner = Burner()
-        sdcard = SDCard()
-
         if arguments.drive and arguments.rm:
+            from cloudmesh.burn.windowssdcard import Diskpart
             Diskpart.remove_drive(arguments["DRIVE"])
 
         if arguments.drive and arguments.assign:
 
+            from cloudmesh.burn.windowssdcard import Diskpart
             Diskpart.assign_drive(volume=arguments["VOLUME"], letter=arguments["DRIVE"])
 
         elif arguments.imager:
 
+            from cloudmesh.burn.Imager import Imager
+
             arguments.TAG = arguments.TAG or ["latest-lite"]
 
             Console.msg(f"Tags: {arguments.TAG}")
@@ -448,6 +571,7 @@ class BurnCommand(PluginCommand):
 
         elif arguments.gui:
 
+            from cloudmesh.common.debug import VERBOSE
             from cloudmesh.burn.gui import Gui
             VERBOSE(arguments)
             g = Gui(hostname=arguments.hostname,
@@ -460,6 +584,10 @@ class BurnCommand(PluginCommand):
             return ""
         elif arguments.sdcard:
 
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.burn.sdcard import SDCard
+            sdcard = SDCard()
+
             arguments.device = arguments.device or arguments["--disk"]
 
             try:
@@ -484,12 +612,57 @@ class BurnCommand(PluginCommand):
             if not os_is_windows():
                 execute("unmount", sdcard.unmount(device=arguments.device))
 
-            execute("sdcard", sdcard.burn_sdcard(tag=arguments.TAG,
-                                                 device=arguments.device,
-                                                 yes=arguments.yes))
+            try:
+                execute("sdcard", sdcard.burn_sdcard(tag=arguments.TAG,
+                                                     device=arguments.device,
+                                                     yes=arguments.yes))
+            except (ValueError, OSError) as e:
+                Console.error(str(e))
+            return ""
+
+        elif arguments.render:
+            from cloudmesh.burn.burner.RaspberryBurner import Burner as RaspberryBurner
+            from cloudmesh.burn.render import Bundle
+            from cloudmesh.burn.ubuntu.configure import Configure
+
+            names = Parameter.expand(arguments.NAMES)
+            inventory = arguments.inventory
+            name = os.path.basename(inventory or "inventory.yaml").rsplit(".", 1)[0]
+            bundle = Bundle(arguments.bundle or f"~/.cloudmesh/cmburn/bundles/{name}")
+
+            if arguments.os == "ubuntu":
+                c = Configure(inventory=inventory, debug=arguments['-v'])
+                c.render(names=names,
+                         bundle=bundle,
+                         ssid=arguments.ssid,
+                         password=arguments.wifipassword,
+                         country=arguments.country,
+                         upgrade=arguments.upgrade,
+                         shared_hosts=arguments.shared_hosts,
+                         host_keys=arguments.host_keys)
+            else:
+                burner = RaspberryBurner(inventory=inventory)
+                burner.render(names=names,
+                              bundle=bundle,
+                              password=arguments['--password'],
+                              ssid=arguments.ssid,
+                              wifipasswd=arguments.wifipassword,
+                              country=arguments.country,
+                              network=arguments['--network'],
+                              shared_hosts=arguments.shared_hosts,
+                              host_keys=arguments.host_keys,
+                              customized=arguments.customize)
+            Console.ok(f"Rendered into {bundle.directory}")
             return ""
 
         elif arguments.raspberry:
+            from cloudmesh.burn.burner.RaspberryBurner import Burner as RaspberryBurner
+            from cloudmesh.burn.render import Bundle
+            from cloudmesh.burn.wifi.ssid import get_ssid
+            from cloudmesh.common.Host import Host
+            from cloudmesh.common.util import get_password
+            from cloudmesh.common.util import path_expand
+
             banner(txt="RaspberryOS Burn", figlet=True)
 
             tag = arguments.tag or "latest-lite-64"
@@ -579,14 +752,31 @@ class BurnCommand(PluginCommand):
                 wifipasswd=wifipasswd,
                 country=arguments['--country'],
                 withimage=not arguments.no_image,
-                network=network
+                network=network,
+                shared_hosts=arguments.shared_hosts,
+                auto=arguments.auto,
+                bundle=Bundle(arguments.bundle) if arguments.bundle else None,
+                host_keys=arguments.host_keys,
+                customize=arguments.customize,
+                expand=arguments.expand
             ))
             return ""
 
         elif arguments.ubuntu:
+            from cloudmesh.burn.fat32 import Fat32
+            from cloudmesh.burn.helper import Helper
+            from cloudmesh.burn.render import Bundle
+            from cloudmesh.burn.scheduler import Scheduler
+            from cloudmesh.burn.sdcard import SDCard
+            from cloudmesh.burn.ubuntu.configure import Configure
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.common.sudo import Sudo
+            from cloudmesh.inventory.inventory import Inventory
+
             banner(txt="Ubuntu Burn with cloud-init", figlet=True)
             names = Parameter.expand(arguments.NAMES)
-            if len(Parameter.expand(arguments.device)) > 1:
+            devices = Parameter.expand(arguments.device)
+            if len(devices) > 1 and os_is_windows():
                 Console.error("Too many devices specified. Please only specify one")
                 return ""
 
@@ -607,7 +797,6 @@ class BurnCommand(PluginCommand):
             if 'ubuntu' not in tag:
                 Console.error("This command only supports burning ubuntu cards")
                 return ""
-            sdcard = SDCard(card_os="ubuntu")
 
             # Code below taken from arguments.sdcard
             try:
@@ -618,91 +807,132 @@ class BurnCommand(PluginCommand):
                 print()
                 return ""
 
-            # determine if we are burning a manager, as this needs to be done
-            # first to get the ssh public key
-            manager = False
             for name in names:
                 if not inv.has_host(name):
                     Console.error(f'Could not find {name} in inventory {inv.filename}')
                     return ""
-                service = inv.get(name=name, attribute='service')
-                if service == 'manager' and not manager:
-                    manager = name
-                    # make manager first in names
-                    names.remove(name)
-                    names.insert(0, name)
-                elif service == 'manager' and manager:
-                    raise Exception('More than one manager detected in NAMES')
 
+            # Make sure bridge is only enabled if WiFi enabled
             for name in names:
-                if not yn_choice(f'Is the card to be burned for {name} inserted?'):
-                    if not yn_choice(f"Please insert the card to be burned for {name}. "
-                                     "Type 'y' when done or 'n' to terminante. Continue"):
-                        Console.error("Terminating: User Break")
-                        return ""
-
-                service = inv.get(name=name, attribute='service')
-                # Make sure bridge is only enabled if WiFi enabled
-                if service == 'manager':
+                if inv.get(name=name, attribute='service') == 'manager':
                     services = inv.get(name=name, attribute='services')
                     if 'bridge' in services and not arguments.ssid:
                         Console.error('Service bridge can only be configured if WiFi'
                                       ' is enabled with --ssid and --wifipassword')
                         return ""
-                    else:
-                        enable_bridge = 'bridge' in services
 
-                Console.info(f'Burning {name}')
-                sdcard.format_device(device=arguments.device, yes=True)
-                if os_is_windows:
-                    sdcard.burn_sdcard(tag=tag, device=arguments.device, yes=True)
-                else:
-                    sdcard.unmount(device=arguments.device)
-                    sdcard.burn_sdcard(tag=tag, device=arguments.device, yes=True)
-                    sdcard.mount(device=arguments.device, card_os="ubuntu")
-                if service == 'manager':
-                    # Generate a private public key pair for the manager that will be persistently used
-                    priv_key, pub_key = c.generate_ssh_key(name)
-                    # Write priv_key and pub_key to /boot/id_rsa and /boot/id_rsa.pub
-                    SDCard.writefile(filename=f'{sdcard.boot_volume}/id_rsa', content=priv_key)
-                    SDCard.writefile(filename=f'{sdcard.boot_volume}/id_rsa.pub', content=pub_key)
-                    c.build_user_data(name=name,
-                                      country=arguments.country,
-                                      upgrade=arguments.upgrade,
-                                      with_bridge=enable_bridge).write(
-                        filename=sdcard.boot_volume + '/user-data')
-                    c.build_network_data(name=name, ssid=arguments.ssid, password=arguments.wifipassword) \
-                        .write(filename=sdcard.boot_volume + '/network-config')
+            # the configuration of all cards including the key of the manager
+            # is rendered before burning, so the cards can be burned in any
+            # order and in parallel
+            bundle = c.render(names=names,
+                              bundle=Bundle(arguments.bundle) if arguments.bundle else None,
+                              ssid=arguments.ssid,
+                              password=arguments.wifipassword,
+                              country=arguments.country,
+                              upgrade=arguments.upgrade,
+                              shared_hosts=arguments.shared_hosts,
+                              host_keys=arguments.host_keys)
+
+            # the image and its digest are looked up once before the burns
+            # run in parallel, instead of by each worker
+            if not os_is_windows():
+                from cloudmesh.burn.telemetry import Telemetry
+
+                image = SDCard.image_path(tag)
+                if image is None:
+                    return ""
+                telemetry = Telemetry()
+                digest = telemetry.digest(image)
+
+            def burn_ubuntu(name, device, progress):
+                Console.info(f'Burning {name} on {device}')
+                files = bundle.load(name)
+                sdcard = SDCard(card_os="ubuntu", device=device)
+
+                def patch(boot):
+                    for filename, content in files.items():
+                        boot.write(filename, content)
+
+                if os_is_windows():
+                    sdcard.format_device(device=device, yes=True)
+                    sdcard.burn_sdcard(tag=tag, device=device, yes=True)
                 else:
-                    c.build_user_data(name=name, add_manager_key=manager,
-                                      upgrade=arguments.upgrade).write(
-                        filename=sdcard.boot_volume + '/user-data')
-                    c.build_network_data(name=name).write(filename=sdcard.boot_volume + '/network-config')
-                time.sleep(1)  # Sleep for 1 seconds to give ample time for writing to finish
-                sdcard.unmount(device=arguments.device, card_os="ubuntu")
+                    # the stages of the burn are recorded for cms burn stats
+                    run = telemetry.run(name, device, image=image, digest=digest)
+                    with run.stage("format"):
+                        sdcard.format_device(device=device, yes=True)
+                    with run.stage("unmount"):
+                        sdcard.unmount(device=device)
+                    # the boot partition is patched while the image is written
+                    with run.stage("write", bytes=os.path.getsize(image)):
+                        patched = sdcard.burn_sdcard(image=image, device=device, yes=True,
+                                                     patch=patch, progress=progress)
+                    if patched:
+                        Console.info(f"Remove card from {device}")
+                        return True
+                    with run.stage("unmount"):
+                        sdcard.unmount(device=device)
+
+                # write the files directly into the boot partition, if this
+                # is not possible mount it
+                written = False
+                if not os_is_windows():
+                    with run.stage("configure") as stage:
+                        try:
+                            with Fat32(device) as boot:
+                                patch(boot)
+                            written = True
+                        except (ValueError, OSError) as e:
+                            Console.warning(f"Could not write the boot partition directly: {e}")
+                            stage["success"] = False
+                            stage["error"] = str(e)
+                if not written:
+                    if not os_is_windows():
+                        sdcard.mount(device=device, card_os="ubuntu")
+                    for filename, content in files.items():
+                        Helper.write(f'{sdcard.boot_volume}/{filename}', content)
+                    time.sleep(1)  # Sleep for 1 seconds to give ample time for writing to finish
+                    sdcard.unmount(device=device, card_os="ubuntu")
+
+                Console.info(f"Remove card from {device}")
+                return True
+
+            # the sudo password is asked before the burns run in parallel
+            if not os_is_windows():
+                Sudo.password()
 
-                Console.info("Remove card")
+            results = Scheduler(devices=devices, auto=arguments.auto).run(names, burn_ubuntu)
+            Scheduler.print(results)
 
-            Console.ok(f"Burned {len(names)} card(s)")
+            burned = len([result for result in results if result["outcome"] == "ok"])
+            Console.ok(f"Burned {burned} card(s)")
             return ""
 
         elif arguments.firmware and arguments.check:
 
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
             execute("firmware check", burner.firmware(action="check"))
             return ""
 
         elif arguments.firmware and arguments.update:
 
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
             execute("firmware update", burner.firmware(action="update"))
             return ""
 
         if arguments.check:
 
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
             execute("check", burner.check(device=arguments.device))
             return ""
 
         elif arguments.versions and arguments['image']:
 
+            from cloudmesh.burn.image import Image
+
             StopWatch.start("image versions")
 
             result = Image.create_version_cache(refresh=arguments["--refresh"])
@@ -727,11 +957,16 @@ class BurnCommand(PluginCommand):
             return ""
 
         elif arguments.load:
+            from cloudmesh.burn.sdcard import SDCard
+            sdcard = SDCard()
             execute("load", sdcard.load_device(device=arguments.device))
             return ""
 
         elif arguments["format"]:  # as format is a python word, we need to use an index
 
+            from cloudmesh.burn.sdcard import SDCard
+            sdcard = SDCard()
+
             arguments.device = arguments.device or arguments["--disk"]
 
             if arguments.drive is None:
@@ -741,15 +976,37 @@ class BurnCommand(PluginCommand):
 
             return ""
 
+        elif arguments.wait:
+
+            from cloudmesh.burn.wait import Wait
+            from cloudmesh.inventory.inventory import Inventory
+
+            inv = Inventory(filename=arguments.inventory) if arguments.inventory else Inventory()
+            names = Parameter.expand(arguments.NAMES) if arguments.NAMES else list(inv.data)
+            for name in names:
+                if not inv.has_host(name):
+                    Console.error(f'Could not find {name} in inventory {inv.filename}')
+                    return ""
+
+            wait = Wait({name: inv.data[name].get("ip") or None for name in names})
+            wait.run(timeout=float(arguments.timeout or 600))
+            wait.record()
+            stats = wait.statistics()
+            if stats["ready"]:
+                Console.info(f"{stats['ready']} of {stats['total']} hosts accept ssh after "
+                             f"{stats['min']} s (min), {stats['median']} s (median), "
+                             f"{stats['max']} s (max)")
+            return ""
+
         elif arguments.network and arguments["list"]:
 
-            if os_is_mac():
-                Console.error("Not yet implemented on MacOS")
-                return ""
+            from cloudmesh.burn.network import Network
 
-            ip = arguments.ip or Network.address()[0]['local']
+            if os_is_mac() and not arguments.ip:
+                Console.error("Please specify the network with --ip on MacOS")
+                return ""
 
-            details = Network.nmap(ip=ip)
+            details = Network.nmap(ip=arguments.ip)
 
             if arguments.used:
 
@@ -758,14 +1015,16 @@ class BurnCommand(PluginCommand):
             else:
                 print(Printer.write(
                     details,
-                    order=['name', "ip", "status", "latency", ],
-                    header=['Name', "IP", "Status", "Latency", ]
+                    order=['name', "ip", "status", "latency", "ssh", "mac"],
+                    header=['Name', "IP", "Status", "Latency", "SSH", "MAC"]
                 )
                 )
             return ""
 
         elif arguments.network:
 
+            from cloudmesh.burn.network import Network
+
             if os_is_mac():
                 Console.error("Not yet implemented on MacOS")
                 return ""
@@ -783,6 +1042,11 @@ class BurnCommand(PluginCommand):
 
         elif arguments.wifi:
 
+            from getpass import getpass
+            from cloudmesh.burn.burner.Burner import Burner
+            from cloudmesh.burn.wifi.ssid import get_ssid
+
+            burner = Burner()
             password = arguments.passwd
             ssid = arguments.ssid or get_ssid()
             country = arguments.country
@@ -807,6 +1071,9 @@ class BurnCommand(PluginCommand):
 
         elif arguments.info:
 
+            from cloudmesh.burn.sdcard import SDCard
+            from cloudmesh.burn.usb import USB
+
             output = arguments.output or "table"
             card = SDCard()
             execute("info", card.info(output=output))
@@ -820,6 +1087,7 @@ class BurnCommand(PluginCommand):
                 return ""
 
             if os_is_windows() and arguments["--manager"]:
+                from cloudmesh.burn.windowssdcard import Diskpart
                 Diskpart.manager()
             elif not os_is_windows() and arguments["--manager"]:
                 Console.error("--manager is only supported on windows")
@@ -827,6 +1095,9 @@ class BurnCommand(PluginCommand):
 
         elif arguments.install:
 
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
+
             if os_is_mac():
                 Console.error("Not yet implemented on MacOS")
                 return ""
@@ -836,14 +1107,17 @@ class BurnCommand(PluginCommand):
 
         elif arguments.shrink:
 
-            if os_is_mac():
-                Console.error("Not yet implemented on MacOS")
-                return ""
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
 
             execute("shrink", burner.shrink(image=arguments.IMAGE))
             return ""
 
         elif arguments.backup:
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.burn.sdcard import SDCard
+            sdcard = SDCard()
+
             try:
                 USB.check_for_readers()
             except Exception as e:
@@ -851,16 +1125,28 @@ class BurnCommand(PluginCommand):
                 Console.error(e)
                 print()
                 return ""
-            execute("backup", sdcard.backup(device=arguments.device, to_file=arguments.to))
+            execute("backup", sdcard.backup(device=arguments.device, to_file=arguments.to,
+                                            compress=arguments.compress,
+                                            store=arguments.store if arguments.incremental else None))
             return ""
 
         elif arguments["copy"]:  # as copy is a reserved word we need to use the index
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.burn.sdcard import SDCard
+            sdcard = SDCard()
             USB.check_for_readers()
-            execute("copy", sdcard.copy(device=arguments.device, from_file=arguments.FROM))
+            try:
+                execute("copy", sdcard.copy(device=arguments.device, from_file=arguments.FROM,
+                                                expand=arguments.expand))
+            except (ValueError, OSError) as e:
+                Console.error(str(e))
             return ""
 
         elif arguments.mount:
 
+            from cloudmesh.burn.sdcard import SDCard
+            sdcard = SDCard()
+
             if arguments.device is None:
                 card = SDCard
                 card.info()
@@ -876,19 +1162,46 @@ class BurnCommand(PluginCommand):
 
         elif arguments.unmount:
 
+            from cloudmesh.burn.sdcard import SDCard
+
             card = SDCard(card_os=arguments.os)
             execute("unmount", card.unmount(device=arguments.device, card_os=arguments.os))
             return ""
 
         elif arguments.mac:
 
-            hostnames = Parameter.expand(arguments.hostname)
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
 
-            execute("mac", burner.mac(hostnames=hostnames))
+            hostnames = Parameter.expand(arguments.hostname) if arguments.hostname else None
+
+            execute("mac", burner.mac(hostnames=hostnames,
+                                      inventory=arguments.inventory,
+                                      timeout=float(arguments.timeout or 10)))
+            return ""
+
+        elif arguments.stats:
+
+            from cloudmesh.burn.telemetry import Telemetry
+
+            try:
+                telemetry = Telemetry()
+                stats = telemetry.stats(by=arguments.by, stage=arguments.stage)
+            except ValueError as e:
+                Console.error(str(e))
+                return ""
+            if not stats:
+                Console.warning(f"No burns are recorded in {telemetry.filename}")
+                return ""
+            print(Telemetry.table(stats, by=arguments.by))
             return ""
 
         elif arguments.set:
 
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
+
             try:
                 USB.check_for_readers()
             except Exception as e:
@@ -915,6 +1228,10 @@ class BurnCommand(PluginCommand):
             return ""
 
         elif arguments.enable and arguments.ssh:
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
+
             try:
                 USB.check_for_readers()
             except Exception as e:
@@ -930,20 +1247,25 @@ class BurnCommand(PluginCommand):
         #    image = Image()
 
         elif arguments.ls and arguments['image']:
+            from cloudmesh.burn.image import Image
             execute("image ls", Image().ls())
             return ""
 
         elif arguments.delete and arguments.IMAGE:
+            from cloudmesh.burn.image import Image
             execute("image rm", Image().rm(arguments.IMAGE))
             return ""
 
         elif arguments["get"] and arguments['image'] and arguments["--url"]:
+            from cloudmesh.burn.image import Image
             image = Image()
             execute("image fetch", image.fetch(url=arguments.url))
             return ""
 
         elif arguments["get"] and arguments['image'] and arguments["TAG"]:
 
+            from cloudmesh.burn.image import Image
+
             tag = arguments["TAG"]
             if "latest" in tag and ("full" in tag or "lite" in tag):
                 result = Image.create_version_cache(refresh=arguments["--refresh"])
@@ -953,12 +1275,17 @@ class BurnCommand(PluginCommand):
             return ""
 
         elif arguments["get"] and arguments['image']:
+            from cloudmesh.burn.image import Image
             image = Image()
             execute("image fetch", image.fetch(tag="latest"))
             return ""
 
         elif arguments.cluster:
 
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.burn.burner.Burner import Burner
+            burner = Burner()
+
             # is true when
             #
             # cms burn cluster --hostname=red,red00[1-2]
@@ -979,6 +1306,10 @@ class BurnCommand(PluginCommand):
             return ""
 
         elif arguments.create and arguments.inventory:
+            from cloudmesh.burn.burner.raspberryos import MultiBurner
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.common.util import yn_choice
+
             try:
                 USB.check_for_readers()
             except Exception as e:
@@ -1021,6 +1352,11 @@ class BurnCommand(PluginCommand):
 
         elif arguments.create:
 
+            from cloudmesh.burn.burner.raspberryos import MultiBurner
+            from cloudmesh.burn.usb import USB
+            from cloudmesh.common.debug import VERBOSE
+            from cloudmesh.common.security import generate_strong_pass
+
             try:
                 USB.check_for_readers()
             except Exception as e:
@@ -1140,6 +1476,9 @@ def _build_default_inventory(filename,
     # cms inventory add "red0[1-3]" --service=worker --ip="10.1.1.[2-4]"
     # --router=10.1.1.1 --tag=latest-lite  --timezone="America/Indiana/Indianapolis" --locale="us"
     # cms inventory set "red0[1-3]" dns to "8.8.8.8,8.8.4.4" --listvalue
+    from cloudmesh.common.Shell import Shell
+    from cloudmesh.inventory.inventory import Inventory
+
     Console.info("No inventory found or forced rebuild. Building inventory "
                  "with defaults.")
     try:
@@ -0,0 +1,243 @@
+"""
+Applies the settings that are the same for many cards to a copy of an
+image before it is burned.
+
+The firstrun.sh script of Raspberry OS sets the timezone and the keyboard,
+disables the ssh password login and enables ssh on the first boot of every
+card. With a customized image these settings are already in the root file
+system, so the first boot only sets the hostname, the ip and the keys.
+
+The customized image is created once for each base image and set of
+settings and kept in ~/.cloudmesh/cmburn/images/custom. The root file system
+is modified offline with debugfs from e2fsprogs, so the image is neither
+mounted nor booted.
+
+Example:
+
+    customize = Customize(timezone="America/Indiana/Indianapolis", country="US")
+    image = customize.image("~/.cloudmesh/cmburn/images/2021-05-07-raspios-buster-armhf-lite.img")
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.render import Bundle
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+
+SSH_SERVICE = "/lib/systemd/system/ssh.service"
+WANTS = "/etc/systemd/system/multi-user.target.wants"
+
+
+class Customize(object):
+
+    DIRECTORY = "~/.cloudmesh/cmburn/images/custom"
+
+    def __init__(self, timezone=None, country="US", directory=None):
+        """
+        Creates the customization
+
+        :param timezone: the timezone, e.g. America/Indiana/Indianapolis
+        :type timezone: str
+        :param country: the country whose keyboard layout is used
+        :type country: str
+        :param directory: the directory of the customized images
+        :type directory: str
+        """
+        self.timezone = timezone or "America/Indiana/Indianapolis"
+        self.country = (country or "US").lower()
+        self.directory = path_expand(directory or Customize.DIRECTORY)
+
+    def settings(self):
+        """
+        Returns the settings that are applied to the image
+
+        :rtype: dict
+        """
+        return {
+            "timezone": self.timezone,
+            "keyboard": self.country,
+            "ssh": True
+        }
+
+    def path(self, base):
+        """
+        Returns the location of the customized image
+
+        :param base: the base image
+        :type base: str
+        :return: the customized image, named after the base image and the
+                 digest of the base image and the settings
+        :rtype: str
+        """
+        base = path_expand(base)
+        digest = Bundle.digest({
+            "image": os.path.basename(base),
+            "size": os.path.getsize(base),
+            "mtime": int(os.path.getmtime(base)),
+            "settings": self.settings()
+        })
+        name = os.path.basename(base).rsplit(".img", 1)[0]
+        return os.path.join(self.directory, f"{name}-{digest[:12]}.img")
+
+    def files(self, root):
+        """
+        Returns the files that are written and the commands that are run
+        on the root file system
+
+        :param root: the root file system of the base image
+        :type root: Ext4
+        :return: the files with path and content, and the debugfs commands
+                 that are run after the files are written
+        :rtype: tuple of dict and list
+        """
+        files = {}
+        commands = []
+
+        sshd_config = root.read("/etc/ssh/sshd_config").decode("utf-8")
+        if "\nPasswordAuthentication no\n" not in f"\n{sshd_config}":
+            files["/etc/ssh/sshd_config.orig"] = sshd_config
+            files["/etc/ssh/sshd_config"] = sshd_config + "PasswordAuthentication no\n"
+
+        # systemctl enable ssh
+        if root.exists(SSH_SERVICE):
+            if not root.exists(WANTS):
+                commands.append(f"mkdir {WANTS}")
+            for link in [f"{WANTS}/ssh.service", "/etc/systemd/system/sshd.service"]:
+                if not root.exists(link, follow=False):
+                    commands.append(f"symlink {link} {SSH_SERVICE}")
+        else:
+            Console.warning(f"{SSH_SERVICE} not found, ssh is enabled at first boot")
+
+        if root.exists("/etc/xdg/autostart/piwiz.desktop", follow=False):
+            commands.append("rm /etc/xdg/autostart/piwiz.desktop")
+
+        files["/etc/timezone"] = f"{self.timezone}\n"
+        if root.exists("/etc/localtime", follow=False):
+            commands.append("rm /etc/localtime")
+        commands.append(f"symlink /etc/localtime /usr/share/zoneinfo/{self.timezone}")
+
+        files["/etc/default/keyboard"] = "\n".join([
+            'XKBMODEL="pc105"',
+            f'XKBLAYOUT="{self.country}"',
+            'XKBVARIANT=""',
+            'XKBOPTIONS=""'
+        ]) + "\n"
+        return files, commands
+
+    def apply(self, image):
+        """
+        Applies the settings to the root file system of the image
+
+        :param image: the image, it is modified in place
+        :type image: str
+        """
+        offset = MBR.partition(image, 2)["offset"]
+
+        with Ext4(image, offset=offset) as root:
+            files, commands = self.files(root)
+            exists = [path for path in files if root.exists(path, follow=False)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            script = [f"rm {path}" for path in exists]
+            for i, (path, content) in enumerate(files.items()):
+                local = os.path.join(directory, str(i))
+                with open(local, "w") as f:
+                    f.write(content)
+                script += [
+                    f"write {local} {path}",
+                    f"sif {path} mode 0100644",
+                    f"sif {path} uid 0",
+                    f"sif {path} gid 0"
+                ]
+            script += commands
+
+            Customize.debugfs(image, offset, script)
+
+    @staticmethod
+    def debugfs(image, offset, script):
+        """
+        Runs the debugfs commands on the ext4 file system. If the image,
+        e.g. a device, can not be written by the user, debugfs is run with
+        sudo.
+
+        :param image: the image or device
+        :type image: str
+        :param offset: the offset of the file system in bytes
+        :type offset: int
+        :param script: the debugfs commands, e.g. ["rm /etc/timezone"]
+        :type script: list
+        """
+        debugfs = shutil.which("debugfs") or shutil.which("/sbin/debugfs")
+        if debugfs is None:
+            raise OSError("debugfs not found, please install e2fsprogs")
+        sudo = [] if os.access(image, os.W_OK) else ["sudo"]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "commands")
+            with open(filename, "w") as f:
+                f.write("\n".join(script) + "\n")
+            result = subprocess.run(sudo + [debugfs, "-w", "-f", filename, f"{image}?offset={offset}"],
+                                    capture_output=True, text=True)
+
+        # debugfs reports failed commands only on stderr
+        errors = [line for line in result.stderr.splitlines()
+                  if line.strip() and not line.startswith("debugfs ")]
+        if result.returncode != 0 or errors:
+            raise OSError(f"modifying {image} with debugfs failed: {' '.join(errors)}")
+
+    @staticmethod
+    def copy(source, destination, blocksize=4 * 1024 ** 2):
+        """
+        Copies the image and keeps blocks of zeros as holes, so the copy
+        only uses the space of the data
+
+        :param source: the image
+        :type source: str
+        :param destination: the copy
+        :type destination: str
+        :param blocksize: the size of the blocks that are compared
+        :type blocksize: int
+        """
+        zeros = bytes(blocksize)
+        with open(source, "rb") as f, open(destination, "wb") as out:
+            while True:
+                block = f.read(blocksize)
+                if not block:
+                    break
+                if block == zeros[:len(block)]:
+                    out.seek(len(block), os.SEEK_CUR)
+                else:
+                    out.write(block)
+            out.truncate()
+
+    def image(self, base):
+        """
+        Returns the customized image of the base image and creates it if it
+        does not exist yet
+
+        :param base: the base image
+        :type base: str
+        :return: the customized image
+        :rtype: str
+        """
+        base = path_expand(base)
+        path = self.path(base)
+        if os.path.exists(path):
+            Console.info(f"Using the customized image {path}")
+            return path
+
+        Console.info(f"Customizing {base}")
+        os.makedirs(self.directory, exist_ok=True)
+        partial = f"{path}.partial"
+        try:
+            Customize.copy(base, partial)
+            self.apply(partial)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        Console.ok(f"Customized image {path}")
+        return path
@@ -0,0 +1,201 @@
+"""
+The rack and network diagrams of a cluster, rendered in the background and
+cached.
+
+Rendering a diagram runs rackdiag or nwdiag and takes about a second, for
+a large cluster much longer. The PNG of a diagram is stored in
+~/.cloudmesh/gui/cache under the hash of its source, which contains the
+hosts and their colors. A diagram with the same topology and colors, e.g.
+of an earlier start of the GUI or after a host changed back to its color,
+is not rendered again.
+
+The colors are changed in memory. A background thread renders the
+diagrams that are not cached and posts the PNG of each diagram as the
+event ("diagram", kind). If several colors change while the diagrams are
+rendered, only the last state is rendered.
+
+Example:
+
+    diagrams = Diagrams(["red", "red01", "red02"], post=window.write_event_value)
+    diagrams.update()
+    diagrams.set("red01", "blue")
+"""
+import copy
+import glob
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+from cloudmesh.diagram.diagram import Diagram
+
+
+class Diagrams(object):
+
+    DIRECTORY = "~/.cloudmesh/gui/cache"
+
+    # the method of Diagram that renders the source of each kind
+    KINDS = {"rack": "render_rack", "net": "render_bridge_net"}
+
+    # the number of diagrams that are kept in the cache
+    LIMIT = 256
+
+    def __init__(self, names, name=None, directory=None, post=None):
+        """
+        Creates the diagrams of the hosts with white color
+
+        :param names: the hosts, the first is the manager
+        :type names: list
+        :param name: the name of the cluster, by default the manager
+        :type name: str
+        :param directory: the cache, by default ~/.cloudmesh/gui/cache
+        :type directory: str
+        :param post: the function that posts an event and its value, e.g.
+                     window.write_event_value
+        :type post: function
+        """
+        self.diagram = Diagram(names=list(names), name=name)
+        self.directory = path_expand(directory or Diagrams.DIRECTORY)
+        os.makedirs(self.directory, exist_ok=True)
+        self.post = post
+        self.lock = threading.Lock()
+        self.thread = None
+        self.dirty = False
+        self.posted = {}
+
+    def source(self, kind, data=None):
+        """
+        Returns the source of the diagram
+
+        :param kind: rack or net
+        :type kind: str
+        :param data: the attributes of the hosts, by default the current
+        :type data: dict
+        :rtype: str
+        """
+        diagram = Diagram(names=self.diagram.names,
+                          name=self.diagram.name,
+                          data=copy.deepcopy(data or self.diagram.data))
+        return getattr(diagram, Diagrams.KINDS[kind])()
+
+    def path(self, kind, data=None):
+        """
+        Returns the file of the PNG of the diagram in the cache
+
+        :param kind: rack or net
+        :type kind: str
+        :param data: the attributes of the hosts, by default the current
+        :type data: dict
+        :rtype: str
+        """
+        digest = hashlib.sha256(f"{kind}\n{self.source(kind, data)}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.png")
+
+    def cached(self, kind):
+        """
+        Returns the PNG of the current diagram if it is in the cache
+
+        :param kind: rack or net
+        :type kind: str
+        :return: the file, None if it is not cached
+        :rtype: str
+        """
+        path = self.path(kind)
+        return path if os.path.exists(path) else None
+
+    def render(self, kind, data=None):
+        """
+        Renders the diagram unless it is cached
+
+        :param kind: rack or net
+        :type kind: str
+        :param data: the attributes of the hosts, by default the current
+        :type data: dict
+        :return: the file of the PNG, None if it could not be rendered
+        :rtype: str
+        """
+        path = self.path(kind, data)
+        if os.path.exists(path):
+            # keep the recently used diagrams in the cache
+            os.utime(path)
+            return path
+        diagram = Diagram(names=self.diagram.names,
+                          name=self.diagram.name,
+                          data=copy.deepcopy(data or self.diagram.data))
+        getattr(diagram, Diagrams.KINDS[kind])()
+        base = f"{path[:-4]}-{os.getpid()}-{threading.get_ident()}"
+        try:
+            diagram.saveas(base, kind=kind, output="png")
+            os.replace(f"{base}.png", path)
+        except OSError as e:
+            Console.warning(f"Could not render the {kind} diagram: {e}")
+            return None
+        finally:
+            if os.path.exists(f"{base}.diag"):
+                os.remove(f"{base}.diag")
+        self.prune()
+        return path
+
+    def prune(self):
+        """
+        Removes the least recently used diagrams from the cache
+        """
+        files = sorted(glob.glob(os.path.join(self.directory, "*.png")), key=os.path.getmtime)
+        for filename in files[:-Diagrams.LIMIT]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def set(self, host, color):
+        """
+        Sets the color of the host in both diagrams and renders them in
+        the background
+
+        :param host: the host
+        :type host: str
+        :param color: the color, e.g. green
+        :type color: str
+        """
+        with self.lock:
+            self.diagram.data[host]["rack.color"] = color
+            self.diagram.data[host]["net.color"] = color
+        self.update()
+
+    def update(self):
+        """
+        Renders the current diagrams in a background thread, if it is not
+        already running
+        """
+        with self.lock:
+            self.dirty = True
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._update, name="diagrams", daemon=True)
+            self.thread.start()
+
+    def _update(self):
+        with ThreadPoolExecutor(len(Diagrams.KINDS)) as pool:
+            while True:
+                with self.lock:
+                    if not self.dirty:
+                        self.thread = None
+                        return
+                    self.dirty = False
+                    data = copy.deepcopy(self.diagram.data)
+                paths = pool.map(lambda kind: (kind, self.render(kind, data)), Diagrams.KINDS)
+                for kind, path in paths:
+                    if path is not None and self.posted.get(kind) != path:
+                        self.posted[kind] = path
+                        if self.post is not None:
+                            self.post(("diagram", kind), path)
+
+    def wait(self):
+        """
+        Waits until the diagrams are rendered
+        """
+        thread = self.thread
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,156 @@
+"""
+Expands the root partition of a burned card to the size of the card.
+
+Raspberry OS grows the root partition and its file system at the first
+boot with init_resize.sh and the resize2fs_once service, which costs a
+reboot and writes the metadata of the whole card. As the size of the card
+is known when it is burned, the partition table is changed and the ext4
+file system is grown right after the image is written with resize2fs, so
+the first boot skips the resize.
+
+Example:
+
+    Expand.device("/dev/sdb")
+"""
+import os
+import shutil
+import struct
+import subprocess
+
+from cloudmesh.burn.blockdevice import BlockDevice
+from cloudmesh.burn.customize import Customize
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.mbr import SECTOR_SIZE
+from cloudmesh.burn.scheduler import Scheduler
+from cloudmesh.common.console import Console
+
+# the scripts that resize the root file system at first boot
+RESIZE_ONCE = ["/etc/rc3.d/S01resize2fs_once", "/etc/init.d/resize2fs_once"]
+
+
+class Expand(object):
+
+    @staticmethod
+    def size(device):
+        """
+        Returns the size of the card or image in bytes
+
+        :param device: the device, e.g. /dev/sdb, or an image file
+        :type device: str
+        :return: the size, 0 if it can not be determined
+        :rtype: int
+        """
+        if os.path.isfile(device):
+            return os.path.getsize(device)
+        return Scheduler.size(device)
+
+    @staticmethod
+    def layout(device, size=None):
+        """
+        Changes the partition table so the root partition fills the card
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param size: the size of the card in bytes, by default it is
+                     determined from the device
+        :type size: int
+        :return: the root partition with the new size, None if the root
+                 partition already fills the card
+        :rtype: dict
+        :raises ValueError: if the root partition is not the last partition
+                            or not an ext4 file system
+        """
+        size = size or Expand.size(device)
+        if not size:
+            raise OSError(f"could not determine the size of {device}")
+        partitions = MBR.read(device)
+        partition = MBR.partition(device, 2)
+        if any(entry["start"] > partition["start"] for entry in partitions):
+            raise ValueError("the root partition is not the last partition")
+        # the partition table is only changed if the file system can be grown
+        with Ext4(device, offset=partition["offset"]):
+            pass
+        sectors = min(size // SECTOR_SIZE, 0xFFFFFFFF) - partition["start"]
+        # the file system grows in blocks of 4 KiB
+        sectors -= sectors % 8
+        if sectors <= partition["sectors"]:
+            return None
+
+        with BlockDevice(device) as disk:
+            mbr = bytearray(disk.read(0, SECTOR_SIZE))
+            entry = 446 + 16 * (partition["number"] - 1)
+            # the end is only given as logical block address
+            mbr[entry + 5:entry + 8] = b"\xfe\xff\xff"
+            struct.pack_into("<I", mbr, entry + 12, sectors)
+            disk.write(0, mbr)
+        partition["sectors"] = sectors
+        partition["size"] = sectors * SECTOR_SIZE
+        return partition
+
+    @staticmethod
+    def resize(device, partition):
+        """
+        Grows the ext4 file system of the partition to the size of the
+        partition
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param partition: the partition, see MBR.partition
+        :type partition: dict
+        """
+        resize2fs = shutil.which("resize2fs") or shutil.which("/sbin/resize2fs")
+        if resize2fs is None:
+            raise OSError("resize2fs not found, please install e2fsprogs")
+        sudo = [] if os.access(device, os.W_OK) else ["sudo"]
+        result = subprocess.run(sudo + [resize2fs, "-f",
+                                        f"{device}?offset={partition['offset']}",
+                                        f"{partition['sectors']}s"],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise OSError(f"resizing the root file system of {device} failed: {result.stderr.strip()}")
+
+    @staticmethod
+    def disable_resize_once(device, partition):
+        """
+        Removes the service that resizes the root file system at first boot
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param partition: the partition, see MBR.partition
+        :type partition: dict
+        """
+        with Ext4(device, offset=partition["offset"]) as root:
+            script = [f"rm {path}" for path in RESIZE_ONCE if root.exists(path, follow=False)]
+        if script:
+            Customize.debugfs(device, partition["offset"], script)
+
+    @staticmethod
+    def device(device, size=None):
+        """
+        Expands the root partition and its file system to fill the card
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param size: the size of the card in bytes, by default it is
+                     determined from the device
+        :type size: int
+        :return: True if the root partition fills the card
+        :rtype: bool
+        """
+        with BlockDevice(device, writable=False) as disk:
+            mbr = disk.read(0, SECTOR_SIZE)
+        partition = Expand.layout(device, size=size)
+        if partition is None:
+            Console.info(f"The root partition of {device} already fills the card")
+        else:
+            try:
+                Expand.resize(device, partition)
+            except OSError:
+                # the partition keeps the size of its file system
+                with BlockDevice(device) as disk:
+                    disk.write(0, mbr)
+                raise
+            Console.ok(f"Expanded the root partition of {device} to {partition['size'] // 1024 ** 2} MiB")
+        Expand.disable_resize_once(device, MBR.partition(device, 2))
+        return True
@@ -0,0 +1,422 @@
+"""
+Reads files from an ext4 (or ext2/ext3) file system without mounting it.
+
+The reader only needs read access to the device or image and works on all
+platforms, including macOS which can not mount ext4. It supports extents,
+the classic block maps, inline data, symbolic links and the 64 bit group
+descriptors. Hashed directories are read linearly.
+
+Example:
+
+    with Ext4("/dev/sdb") as root:
+        print(root.read("/etc/hostname").decode())
+"""
+import re
+import stat
+import struct
+
+from cloudmesh.burn.blockdevice import BlockDevice
+from cloudmesh.burn.mbr import MBR
+
+MAGIC = 0xEF53
+EXTENT_MAGIC = 0xF30A
+
+INCOMPAT_META_BG = 0x10
+INCOMPAT_64BIT = 0x80
+COMPAT_SPARSE_SUPER2 = 0x200
+RO_COMPAT_SPARSE_SUPER = 0x1
+
+BG_BLOCK_UNINIT = 0x2
+
+FLAG_EXTENTS = 0x80000
+FLAG_INLINE_DATA = 0x10000000
+
+ROOT_INODE = 2
+
+
+class Ext4(object):
+
+    def __init__(self, device, offset=None, partition=2):
+        """
+        Opens the ext4 file system
+
+        :param device: the device or image, e.g. /dev/sdb
+        :type device: str or BlockDevice
+        :param offset: the offset of the file system in bytes. If None, the
+                       offset is read from the partition table.
+        :type offset: int
+        :param partition: the partition used if no offset is given
+        :type partition: int
+        """
+        if isinstance(device, BlockDevice):
+            self.device = device
+        else:
+            self.device = BlockDevice(device, writable=False)
+        try:
+            if offset is None:
+                offset = MBR.partition(self.device, partition)["offset"]
+            self.offset = offset
+            self._read_superblock()
+        except Exception:
+            self.device.close()
+            raise
+        self.descriptors = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the device
+        """
+        self.device.close()
+
+    def _read_superblock(self):
+        sb = self.device.read(self.offset + 1024, 1024)
+        if len(sb) < 1024 or struct.unpack_from("<H", sb, 56)[0] != MAGIC:
+            raise ValueError("the file system is not ext2, ext3 or ext4")
+        (self.inodes_count,
+         self.blocks_count,
+         _, _, _,
+         self.first_data_block,
+         log_block_size) = struct.unpack_from("<IIIIIII", sb, 0)
+        self.block_size = 1024 << log_block_size
+        self.blocks_per_group, = struct.unpack_from("<I", sb, 32)
+        self.inodes_per_group, = struct.unpack_from("<I", sb, 40)
+        revision, = struct.unpack_from("<I", sb, 76)
+        self.inode_size = struct.unpack_from("<H", sb, 88)[0] if revision >= 1 else 128
+        self.compat, self.incompat, self.ro_compat = struct.unpack_from("<III", sb, 92)
+        self.reserved_gdt_blocks, = struct.unpack_from("<H", sb, 206)
+        self.backup_groups = struct.unpack_from("<II", sb, 0x24C)
+        self.desc_size = 32
+        if self.incompat & INCOMPAT_64BIT:
+            self.desc_size = struct.unpack_from("<H", sb, 254)[0] or 64
+            self.blocks_count |= struct.unpack_from("<I", sb, 0x150)[0] << 32
+        self.volume_name = sb[120:136].split(b"\0")[0].decode("utf-8", errors="replace")
+
+    def _block(self, block, count=1):
+        return self.device.read(self.offset + block * self.block_size, count * self.block_size)
+
+    def _descriptor(self, group):
+        """
+        Returns the block bitmap, the inode bitmap, the first block of the
+        inode table and the flags of the group
+        """
+        if group not in self.descriptors:
+            position = (self.first_data_block + 1) * self.block_size + group * self.desc_size
+            desc = self.device.read(self.offset + position, self.desc_size)
+            block_bitmap, inode_bitmap, table = struct.unpack_from("<III", desc, 0)
+            flags, = struct.unpack_from("<H", desc, 0x12)
+            if self.desc_size >= 64:
+                hi = struct.unpack_from("<III", desc, 0x20)
+                block_bitmap |= hi[0] << 32
+                inode_bitmap |= hi[1] << 32
+                table |= hi[2] << 32
+            self.descriptors[group] = {
+                "block_bitmap": block_bitmap,
+                "inode_bitmap": inode_bitmap,
+                "inode_table": table,
+                "flags": flags
+            }
+        return self.descriptors[group]
+
+    def _inode_table(self, group):
+        """
+        Returns the first block of the inode table of the group
+        """
+        return self._descriptor(group)["inode_table"]
+
+    def _has_super(self, group):
+        """
+        Checks if the group contains a copy of the superblock and the group
+        descriptors
+        """
+        if group == 0:
+            return True
+        if self.compat & COMPAT_SPARSE_SUPER2:
+            return group in self.backup_groups
+        if not self.ro_compat & RO_COMPAT_SPARSE_SUPER or group == 1:
+            return True
+        for base in [3, 5, 7]:
+            power = base
+            while power < group:
+                power *= base
+            if power == group:
+                return True
+        return False
+
+    def allocated(self):
+        """
+        Returns the byte ranges of the device that are used by the file
+        system. The ranges are read from the block bitmaps with a
+        granularity of 8 blocks, so they may include a few free blocks.
+
+        :return: the list of offset and size in bytes, sorted by offset
+        :rtype: list
+        """
+        if self.incompat & INCOMPAT_META_BG:
+            # the descriptors are spread over the file system
+            return [(self.offset, self.blocks_count * self.block_size)]
+        groups = (self.blocks_count - self.first_data_block + self.blocks_per_group - 1) \
+            // self.blocks_per_group
+        descriptor_blocks = (groups * self.desc_size + self.block_size - 1) // self.block_size
+        table_blocks = (self.inodes_per_group * self.inode_size + self.block_size - 1) \
+            // self.block_size
+
+        runs = [(0, self.first_data_block)] if self.first_data_block else []
+        for group in range(groups):
+            first = self.first_data_block + group * self.blocks_per_group
+            count = min(self.blocks_per_group, self.blocks_count - first)
+            desc = self._descriptor(group)
+            # the metadata is marked in the bitmaps, but uninitialized
+            # groups have no bitmap
+            if self._has_super(group):
+                runs.append((first, 1 + descriptor_blocks + self.reserved_gdt_blocks))
+            runs += [(desc["block_bitmap"], 1),
+                     (desc["inode_bitmap"], 1),
+                     (desc["inode_table"], table_blocks)]
+            if desc["flags"] & BG_BLOCK_UNINIT:
+                continue
+            bitmap = self._block(desc["block_bitmap"])[:(count + 7) // 8]
+            for used in re.finditer(rb"[^\x00]+", bitmap):
+                start = first + used.start() * 8
+                end = min(first + used.end() * 8, first + count)
+                runs.append((start, end - start))
+
+        ranges = []
+        for block, count in sorted(runs):
+            count = min(block + count, self.blocks_count) - block
+            if count <= 0:
+                continue
+            if ranges and block <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], block + count)
+            else:
+                ranges.append([block, block + count])
+        return [(self.offset + start * self.block_size, (end - start) * self.block_size)
+                for start, end in ranges]
+
+    def inode(self, number):
+        """
+        Reads the inode
+
+        :param number: the number of the inode
+        :type number: int
+        :return: the mode, size, flags and the 60 bytes of i_block
+        :rtype: dict
+        """
+        if number < 1 or number > self.inodes_count:
+            raise ValueError(f"invalid inode {number}")
+        group, index = divmod(number - 1, self.inodes_per_group)
+        position = self._inode_table(group) * self.block_size + index * self.inode_size
+        data = self.device.read(self.offset + position, 128)
+        mode, _, size_lo = struct.unpack_from("<HHI", data, 0)
+        flags, = struct.unpack_from("<I", data, 32)
+        size_hi, = struct.unpack_from("<I", data, 108)
+        return {
+            "number": number,
+            "mode": mode,
+            "size": size_lo | (size_hi << 32),
+            "flags": flags,
+            "block": data[40:100]
+        }
+
+    def _extents(self, node):
+        """
+        Returns the list of (logical block, physical block, length) of the
+        extent tree. Uninitialized extents are returned with physical None.
+        """
+        magic, entries, _, depth = struct.unpack_from("<HHHH", node, 0)
+        if magic != EXTENT_MAGIC:
+            raise ValueError("invalid extent header")
+        result = []
+        for i in range(entries):
+            entry = node[12 + 12 * i:24 + 12 * i]
+            if depth == 0:
+                logical, length, start_hi, start_lo = struct.unpack_from("<IHHI", entry, 0)
+                physical = (start_hi << 32) | start_lo
+                if length > 32768:
+                    result.append((logical, None, length - 32768))
+                else:
+                    result.append((logical, physical, length))
+            else:
+                logical, leaf_lo, leaf_hi = struct.unpack_from("<IIH", entry, 0)
+                result.extend(self._extents(self._block((leaf_hi << 32) | leaf_lo)))
+        return result
+
+    def _block_map(self, block, count):
+        """
+        Returns the list of (logical block, physical block, 1) of the
+        classic ext2/ext3 block map
+        """
+        per_block = self.block_size // 4
+        pointers = struct.unpack("<15I", block)
+        result = []
+
+        def walk(pointer, level, logical):
+            if logical >= count:
+                return
+            if level == 0:
+                if pointer:
+                    result.append((logical, pointer, 1))
+                return
+            span = per_block ** (level - 1)
+            if not pointer:
+                return
+            children = struct.unpack(f"<{per_block}I", self._block(pointer))
+            for i, child in enumerate(children):
+                walk(child, level - 1, logical + i * span)
+
+        for i in range(12):
+            walk(pointers[i], 0, i)
+        walk(pointers[12], 1, 12)
+        walk(pointers[13], 2, 12 + per_block)
+        walk(pointers[14], 3, 12 + per_block + per_block ** 2)
+        return result
+
+    def _data(self, inode):
+        """
+        Returns the content of the inode
+        """
+        size = inode["size"]
+        if inode["flags"] & FLAG_INLINE_DATA:
+            return inode["block"][:size]
+        count = (size + self.block_size - 1) // self.block_size
+        if inode["flags"] & FLAG_EXTENTS:
+            extents = self._extents(inode["block"])
+        else:
+            extents = self._block_map(inode["block"], count)
+        data = bytearray(count * self.block_size)
+        for logical, physical, length in extents:
+            length = min(length, count - logical)
+            if physical is None or length <= 0:
+                continue
+            start = logical * self.block_size
+            data[start:start + length * self.block_size] = self._block(physical, length)
+        return bytes(data[:size])
+
+    def _entries(self, inode):
+        """
+        Returns the entries of the directory as dict of name and inode number
+        """
+        data = self._data(inode)
+        if inode["flags"] & FLAG_INLINE_DATA:
+            # the first 4 bytes of inline directories are the parent inode
+            data = data[4:]
+        entries = {}
+        position = 0
+        while position + 8 <= len(data):
+            number, length, name_length = struct.unpack_from("<IHB", data, position)
+            if length < 8:
+                break
+            if number:
+                name = data[position + 8:position + 8 + name_length].decode("utf-8", errors="replace")
+                entries[name] = number
+            position += length
+        return entries
+
+    def lookup(self, path, follow=True):
+        """
+        Returns the inode of the path
+
+        :param path: the absolute path, e.g. /etc/hostname
+        :type path: str
+        :param follow: if true a symbolic link in the last component is followed
+        :type follow: bool
+        :return: the inode
+        :rtype: dict
+        """
+        parts = [part for part in path.split("/") if part]
+        inode = self.inode(ROOT_INODE)
+        stack = [inode]
+        links = 0
+        while parts:
+            part = parts.pop(0)
+            if part == ".":
+                continue
+            if part == "..":
+                if len(stack) > 1:
+                    stack.pop()
+                inode = stack[-1]
+                continue
+            if not stat.S_ISDIR(inode["mode"]):
+                raise NotADirectoryError(path)
+            entries = self._entries(inode)
+            if part not in entries:
+                raise FileNotFoundError(path)
+            inode = self.inode(entries[part])
+            if stat.S_ISLNK(inode["mode"]) and (parts or follow):
+                links += 1
+                if links > 40:
+                    raise OSError(f"too many levels of symbolic links in {path}")
+                target = self.readlink_inode(inode)
+                if target.startswith("/"):
+                    stack = [self.inode(ROOT_INODE)]
+                parts = [p for p in target.split("/") if p] + parts
+                inode = stack[-1]
+                continue
+            stack.append(inode)
+        return inode
+
+    def readlink_inode(self, inode):
+        if inode["size"] < 60 and not inode["flags"] & (FLAG_EXTENTS | FLAG_INLINE_DATA):
+            return inode["block"][:inode["size"]].decode("utf-8", errors="replace")
+        return self._data(inode).decode("utf-8", errors="replace")
+
+    def readlink(self, path):
+        """
+        Returns the target of the symbolic link
+
+        :param path: the absolute path
+        :type path: str
+        :rtype: str
+        """
+        inode = self.lookup(path, follow=False)
+        if not stat.S_ISLNK(inode["mode"]):
+            raise OSError(f"{path} is not a symbolic link")
+        return self.readlink_inode(inode)
+
+    def exists(self, path, follow=True):
+        """
+        Checks if the path exists
+
+        :param path: the absolute path
+        :type path: str
+        :param follow: if false a dangling symbolic link exists
+        :type follow: bool
+        :rtype: bool
+        """
+        try:
+            self.lookup(path, follow=follow)
+            return True
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+
+    def listdir(self, path="/"):
+        """
+        Lists the names in the directory
+
+        :param path: the absolute path
+        :type path: str
+        :rtype: list
+        """
+        inode = self.lookup(path)
+        if not stat.S_ISDIR(inode["mode"]):
+            raise NotADirectoryError(path)
+        return [name for name in self._entries(inode) if name not in [".", ".."]]
+
+    def read(self, path):
+        """
+        Reads the file
+
+        :param path: the absolute path, e.g. /etc/hostname
+        :type path: str
+        :return: the content
+        :rtype: bytes
+        """
+        inode = self.lookup(path)
+        if stat.S_ISDIR(inode["mode"]):
+            raise IsADirectoryError(path)
+        return self._data(inode)
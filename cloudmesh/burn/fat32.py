@@ -0,0 +1,592 @@
+"""
+Reads and writes files on a FAT32 file system without mounting it.
+
+The per host configuration of a card (firstrun.sh, cmdline.txt, user-data,
+network-config, ...) is located on the FAT boot partition. Instead of
+mounting the partition, the files are written directly into the partition
+on the block device or image. The file allocation table is kept in memory,
+only the modified sectors are written back, and all writes are flushed with
+a single fsync on close.
+
+Long file names (VFAT) are supported. Files can only be written into
+existing directories.
+
+Example:
+
+    with Fat32("/dev/sdb") as boot:
+        cmdline = boot.read("cmdline.txt").decode()
+        boot.write("firstrun.sh", script)
+        boot.write("ssh", "")
+"""
+import array
+import datetime
+import struct
+import sys
+
+from cloudmesh.burn.blockdevice import BlockDevice
+from cloudmesh.burn.mbr import MBR
+
+END_OF_CHAIN = 0x0FFFFFFF
+BAD_CLUSTER = 0x0FFFFFF7
+
+ATTR_READ_ONLY = 0x01
+ATTR_HIDDEN = 0x02
+ATTR_SYSTEM = 0x04
+ATTR_VOLUME_ID = 0x08
+ATTR_DIRECTORY = 0x10
+ATTR_ARCHIVE = 0x20
+ATTR_LONG_NAME = 0x0F
+
+DELETED = 0xE5
+
+# characters allowed in a short name besides letters and digits
+SHORT_NAME_CHARACTERS = set("!#$%&'()-@^_`{}~")
+
+
+def _checksum(short_name):
+    """
+    The checksum of the short name that is stored in the long name entries
+    """
+    checksum = 0
+    for c in short_name:
+        checksum = (((checksum & 1) << 7) + (checksum >> 1) + c) & 0xFF
+    return checksum
+
+
+def _timestamp(now=None):
+    """
+    Returns the time and date in the FAT format
+    """
+    now = now or datetime.datetime.now()
+    time = (now.hour << 11) | (now.minute << 5) | (now.second // 2)
+    date = ((max(now.year, 1980) - 1980) << 9) | (now.month << 5) | now.day
+    return time, date
+
+
+def _valid_short(text, length):
+    return 0 < len(text) <= length and \
+        all(c.isascii() and (c.isalnum() or c in SHORT_NAME_CHARACTERS) for c in text)
+
+
+class Fat32(object):
+
+    def __init__(self, device, offset=None, partition=1):
+        """
+        Opens the FAT32 file system
+
+        :param device: the device or image, e.g. /dev/sdb
+        :type device: str or BlockDevice
+        :param offset: the offset of the file system in bytes. If None, the
+                       offset is read from the partition table.
+        :type offset: int
+        :param partition: the partition used if no offset is given
+        :type partition: int
+        """
+        if isinstance(device, BlockDevice):
+            self.device = device
+        else:
+            self.device = BlockDevice(device)
+        if offset is None:
+            offset = MBR.partition(self.device, partition)["offset"]
+        self.offset = offset
+        self.dirty = set()
+        self.free_delta = 0
+        try:
+            self._read_boot_sector()
+            self._read_fat()
+        except Exception:
+            self.device.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        self.device.close()
+
+    def _read_boot_sector(self):
+        sector = self.device.read(self.offset, 512)
+        if len(sector) < 512 or sector[510:512] != b"\x55\xaa":
+            raise ValueError("no FAT boot sector found")
+        (self.sector_size,
+         self.sectors_per_cluster,
+         reserved,
+         self.fats,
+         root_entries,
+         total16) = struct.unpack_from("<HBHBHH", sector, 11)
+        fat_size16, = struct.unpack_from("<H", sector, 22)
+        total32, fat_size32, _, _, self.root_cluster, self.fsinfo = \
+            struct.unpack_from("<IIHHIH", sector, 32)
+        if root_entries != 0 or fat_size16 != 0 or fat_size32 == 0 or \
+                self.sector_size == 0 or self.sectors_per_cluster == 0:
+            raise ValueError("the file system is not FAT32")
+        total = total16 or total32
+        self.cluster_size = self.sector_size * self.sectors_per_cluster
+        self.fat_offset = self.offset + reserved * self.sector_size
+        self.fat_size = fat_size32 * self.sector_size
+        data_sector = reserved + self.fats * fat_size32
+        self.data_offset = self.offset + data_sector * self.sector_size
+        self.clusters = (total - data_sector) // self.sectors_per_cluster
+        self.next_free = 2
+
+    def _read_fat(self):
+        self.fat = array.array("I")
+        entries = min(self.fat_size // 4, self.clusters + 2)
+        self.fat.frombytes(self.device.read(self.fat_offset, entries * 4))
+        if sys.byteorder != "little":
+            self.fat.byteswap()
+
+    #
+    # clusters
+    #
+
+    def _get(self, cluster):
+        return self.fat[cluster] & 0x0FFFFFFF
+
+    def _set(self, cluster, value):
+        self.fat[cluster] = (self.fat[cluster] & 0xF0000000) | value
+        self.dirty.add(cluster * 4 // self.sector_size)
+
+    def _chain(self, cluster):
+        """
+        Returns the list of clusters that start with the given cluster
+        """
+        chain = []
+        while 2 <= cluster < BAD_CLUSTER:
+            chain.append(cluster)
+            if len(chain) > self.clusters:
+                raise ValueError("the cluster chain contains a loop")
+            cluster = self._get(cluster)
+        return chain
+
+    def _allocate(self, count):
+        """
+        Allocates count free clusters. The clusters are not yet linked.
+        """
+        clusters = []
+        last = self.clusters + 2
+        cluster = self.next_free
+        for cluster in list(range(self.next_free, last)) + list(range(2, self.next_free)):
+            if self._get(cluster) == 0:
+                clusters.append(cluster)
+                if len(clusters) == count:
+                    break
+        if len(clusters) < count:
+            raise OSError("no space left on the FAT file system")
+        self.next_free = cluster + 1 if cluster + 1 < last else 2
+        self.free_delta -= count
+        return clusters
+
+    def _resize(self, chain, count):
+        """
+        Shortens or extends the chain so that it has count clusters and
+        returns the new chain
+        """
+        if count < len(chain):
+            for cluster in chain[count:]:
+                self._set(cluster, 0)
+            self.free_delta += len(chain) - count
+            chain = chain[:count]
+        elif count > len(chain):
+            chain = chain + self._allocate(count - len(chain))
+        for current, following in zip(chain, chain[1:]):
+            self._set(current, following)
+        if chain:
+            self._set(chain[-1], END_OF_CHAIN)
+        return chain
+
+    def _cluster_offset(self, cluster):
+        return self.data_offset + (cluster - 2) * self.cluster_size
+
+    def _runs(self, chain):
+        """
+        Groups the chain into runs of consecutive clusters, so that they
+        can be read and written with a single operation
+        """
+        runs = []
+        for cluster in chain:
+            if runs and runs[-1][0] + runs[-1][1] == cluster:
+                runs[-1][1] += 1
+            else:
+                runs.append([cluster, 1])
+        return runs
+
+    def _read_chain(self, chain):
+        return b"".join(self.device.read(self._cluster_offset(cluster), count * self.cluster_size)
+                        for cluster, count in self._runs(chain))
+
+    def _write_chain(self, chain, data):
+        data = bytes(data).ljust(len(chain) * self.cluster_size, b"\0")
+        position = 0
+        for cluster, count in self._runs(chain):
+            size = count * self.cluster_size
+            self.device.write(self._cluster_offset(cluster), data[position:position + size])
+            position += size
+
+    def allocated(self):
+        """
+        Returns the byte ranges of the device that are used by the file
+        system, i.e. the reserved sectors, the allocation tables and the
+        allocated clusters
+
+        :return: the list of offset and size in bytes, sorted by offset
+        :rtype: list
+        """
+        ranges = [(self.offset, self.data_offset - self.offset)]
+        used = [cluster for cluster in range(2, len(self.fat)) if self._get(cluster)]
+        for cluster, count in self._runs(used):
+            ranges.append((self._cluster_offset(cluster), count * self.cluster_size))
+        return ranges
+
+    #
+    # directories
+    #
+
+    def _entries(self, data):
+        """
+        Parses the directory entries. Deleted entries, volume labels and the
+        entries . and .. are skipped.
+        """
+        entries = []
+        parts = []
+        start = None
+        for index in range(len(data) // 32):
+            entry = data[index * 32:(index + 1) * 32]
+            first = entry[0]
+            if first == 0:
+                break
+            if first == DELETED:
+                parts = []
+                start = None
+                continue
+            attr = entry[11]
+            if attr == ATTR_LONG_NAME:
+                if first & 0x40:
+                    parts = []
+                    start = index
+                parts.append(entry)
+                continue
+            if attr & ATTR_VOLUME_ID:
+                parts = []
+                start = None
+                continue
+            short = bytes(entry[0:11])
+            if short[0] == 0x05:
+                short = b"\xe5" + short[1:]
+            base = short[0:8].decode("latin-1").rstrip()
+            ext = short[8:11].decode("latin-1").rstrip()
+            if entry[12] & 0x08:
+                base = base.lower()
+            if entry[12] & 0x10:
+                ext = ext.lower()
+            name = f"{base}.{ext}" if ext else base
+            if name in [".", ".."]:
+                parts = []
+                start = None
+                continue
+            if parts and all(part[13] == _checksum(short) for part in parts):
+                text = b"".join(part[1:11] + part[14:26] + part[28:32] for part in reversed(parts))
+                name = text.decode("utf-16-le", errors="replace").split("\0")[0]
+            else:
+                start = index
+            high, = struct.unpack_from("<H", entry, 20)
+            low, size = struct.unpack_from("<HI", entry, 26)
+            entries.append({
+                "name": name,
+                "short": short,
+                "attr": attr,
+                "cluster": (high << 16) | low,
+                "size": size,
+                "index": index,
+                "start": start
+            })
+            parts = []
+            start = None
+        return entries
+
+    def _directory(self, cluster):
+        chain = self._chain(cluster)
+        data = self._read_chain(chain)
+        return chain, data, self._entries(data)
+
+    def _write_entries(self, chain, index, data):
+        """
+        Writes directory entries starting with the entry index
+        """
+        per_cluster = self.cluster_size // 32
+        for i in range(len(data) // 32):
+            cluster = chain[(index + i) // per_cluster]
+            position = self._cluster_offset(cluster) + ((index + i) % per_cluster) * 32
+            self.device.write(position, data[i * 32:(i + 1) * 32])
+
+    @staticmethod
+    def _find(entries, name):
+        name = name.casefold()
+        for entry in entries:
+            if entry["name"].casefold() == name:
+                return entry
+        for entry in entries:
+            short = entry["short"]
+            base = short[0:8].decode("latin-1").rstrip()
+            ext = short[8:11].decode("latin-1").rstrip()
+            if (f"{base}.{ext}" if ext else base).casefold() == name:
+                return entry
+        return None
+
+    def _split(self, path):
+        return [part for part in path.replace("\\", "/").split("/") if part]
+
+    def _lookup(self, path):
+        """
+        Returns the directory cluster and the entry of the path. The entry is
+        None if the file does not exist.
+        """
+        parts = self._split(path)
+        if not parts:
+            raise ValueError("the path is empty")
+        cluster = self.root_cluster
+        for part in parts[:-1]:
+            chain, data, entries = self._directory(cluster)
+            entry = self._find(entries, part)
+            if entry is None or not entry["attr"] & ATTR_DIRECTORY:
+                raise FileNotFoundError(f"directory {part} not found in {path}")
+            cluster = entry["cluster"] or self.root_cluster
+        chain, data, entries = self._directory(cluster)
+        return cluster, self._find(entries, parts[-1])
+
+    def _short_name(self, name, entries):
+        """
+        Returns the short name and whether a long name is needed. As on Linux
+        a long name is stored for all names that are not upper case 8.3 names.
+        """
+        existing = set(entry["short"] for entry in entries)
+        base, dot, ext = name.rpartition(".")
+        if not dot or not base:
+            base, ext = name, ""
+        if _valid_short(base, 8) and (ext == "" or _valid_short(ext, 3)):
+            short = base.upper().ljust(8).encode("ascii") + ext.upper().ljust(3).encode("ascii")
+            if short not in existing:
+                return short, name != name.upper()
+
+        def clean(text):
+            return "".join(c if c.isascii() and (c.isalnum() or c in SHORT_NAME_CHARACTERS) else "_"
+                           for c in text.replace(" ", "").replace(".", "")).upper()
+
+        base = clean(base) or "_"
+        ext = clean(ext)[:3]
+        for n in range(1, 1000000):
+            tail = f"~{n}"
+            short = (base[:8 - len(tail)] + tail).ljust(8).encode("ascii") + ext.ljust(3).encode("ascii")
+            if short not in existing:
+                return short, True
+        raise OSError(f"could not create a short name for {name}")
+
+    def _new_entries(self, name, entries, attr, cluster, size):
+        """
+        Creates the long name entries and the short entry for the name
+        """
+        short, long_name = self._short_name(name, entries)
+        time, date = _timestamp()
+        entry = struct.pack("<11sBBBHHHHHHHI",
+                            short, attr, 0, 0, time, date, date,
+                            cluster >> 16, time, date, cluster & 0xFFFF, size)
+        if not long_name:
+            return entry
+        text = name.encode("utf-16-le") + b"\0\0"
+        count = (len(text) + 25) // 26
+        text = text.ljust(count * 26, b"\xff")
+        checksum = _checksum(short)
+        parts = []
+        for i in range(count):
+            chunk = text[i * 26:(i + 1) * 26]
+            order = i + 1
+            if i == count - 1:
+                order |= 0x40
+            parts.append(struct.pack("<B10sBBB12sH4s",
+                                     order, chunk[0:10], ATTR_LONG_NAME, 0, checksum,
+                                     chunk[10:22], 0, chunk[22:26]))
+        return b"".join(reversed(parts)) + entry
+
+    def _free_slots(self, data, count):
+        """
+        Returns the index of count consecutive free entries in the directory
+        or None
+        """
+        run = 0
+        for index in range(len(data) // 32):
+            first = data[index * 32]
+            if first == 0:
+                if run + len(data) // 32 - index >= count:
+                    return index - run
+                return None
+            if first == DELETED:
+                run += 1
+                if run == count:
+                    return index - run + 1
+            else:
+                run = 0
+        return None
+
+    #
+    # files
+    #
+
+    def listdir(self, path="/"):
+        """
+        Lists the names in the directory
+
+        :param path: the directory
+        :type path: str
+        :return: the names
+        :rtype: list
+        """
+        cluster = self.root_cluster
+        if self._split(path):
+            parent, entry = self._lookup(path)
+            if entry is None or not entry["attr"] & ATTR_DIRECTORY:
+                raise FileNotFoundError(path)
+            cluster = entry["cluster"] or self.root_cluster
+        chain, data, entries = self._directory(cluster)
+        return [entry["name"] for entry in entries]
+
+    def exists(self, path):
+        """
+        Checks if the file or directory exists
+
+        :param path: the path, e.g. cmdline.txt
+        :type path: str
+        :rtype: bool
+        """
+        try:
+            return self._lookup(path)[1] is not None
+        except FileNotFoundError:
+            return False
+
+    def read(self, path):
+        """
+        Reads the file
+
+        :param path: the path, e.g. cmdline.txt
+        :type path: str
+        :return: the content
+        :rtype: bytes
+        """
+        parent, entry = self._lookup(path)
+        if entry is None or entry["attr"] & ATTR_DIRECTORY:
+            raise FileNotFoundError(path)
+        return self._read_chain(self._chain(entry["cluster"]))[:entry["size"]]
+
+    def write(self, path, content):
+        """
+        Writes the file. An existing file is overwritten.
+
+        :param path: the path, e.g. firstrun.sh
+        :type path: str
+        :param content: the content
+        :type content: str or bytes
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        parent, entry = self._lookup(path)
+        count = (len(content) + self.cluster_size - 1) // self.cluster_size
+
+        if entry is not None:
+            if entry["attr"] & ATTR_DIRECTORY:
+                raise IsADirectoryError(path)
+            chain = self._resize(self._chain(entry["cluster"]), count)
+        else:
+            chain = self._resize([], count)
+        self._write_chain(chain, content)
+        cluster = chain[0] if chain else 0
+
+        dir_chain, data, entries = self._directory(parent)
+        if entry is not None:
+            time, date = _timestamp()
+            record = bytearray(data[entry["index"] * 32:(entry["index"] + 1) * 32])
+            record[11] |= ATTR_ARCHIVE
+            struct.pack_into("<HHHHI", record, 20, cluster >> 16, time, date, cluster & 0xFFFF, len(content))
+            self._write_entries(dir_chain, entry["index"], record)
+            return
+
+        name = self._split(path)[-1]
+        records = self._new_entries(name, entries, ATTR_ARCHIVE, cluster, len(content))
+        needed = len(records) // 32
+        index = self._free_slots(data, needed)
+        if index is None:
+            # extend the directory by the clusters needed for the new entries
+            used = len(data) // 32
+            for e in range(len(data) // 32):
+                if data[e * 32] == 0:
+                    used = e
+                    break
+            extra = (needed - (len(data) // 32 - used) + self.cluster_size // 32 - 1) // (self.cluster_size // 32)
+            old = len(dir_chain)
+            dir_chain = self._resize(dir_chain, old + extra)
+            self._write_chain(dir_chain[old:], b"")
+            index = used
+        self._write_entries(dir_chain, index, records)
+
+    def rm(self, path):
+        """
+        Removes the file. Nothing is done if the file does not exist.
+
+        :param path: the path, e.g. ssh
+        :type path: str
+        """
+        parent, entry = self._lookup(path)
+        if entry is None:
+            return
+        if entry["attr"] & ATTR_DIRECTORY:
+            raise IsADirectoryError(path)
+        self._resize(self._chain(entry["cluster"]), 0)
+        dir_chain, data, entries = self._directory(parent)
+        for index in range(entry["start"], entry["index"] + 1):
+            self._write_entries(dir_chain, index, bytes([DELETED]) + data[index * 32 + 1:(index + 1) * 32])
+
+    #
+    # writing
+    #
+
+    def _write_fsinfo(self):
+        position = self.offset + self.fsinfo * self.sector_size
+        sector = bytearray(self.device.read(position, 512))
+        lead, = struct.unpack_from("<I", sector, 0)
+        signature, free, _ = struct.unpack_from("<III", sector, 484)
+        if lead != 0x41615252 or signature != 0x61417272:
+            return
+        if free != 0xFFFFFFFF:
+            free = max(0, free + self.free_delta)
+        struct.pack_into("<II", sector, 488, free, self.next_free)
+        self.device.write(position, sector)
+        self.free_delta = 0
+
+    def flush(self):
+        """
+        Writes the modified sectors of the allocation table to all copies of
+        the table and flushes all writes to the device
+        """
+        if self.dirty:
+            table = array.array("I", self.fat)
+            if sys.byteorder != "little":
+                table.byteswap()
+            table = table.tobytes()
+            per_sector = self.sector_size
+            runs = self._runs(sorted(self.dirty))
+            for copy in range(self.fats):
+                base = self.fat_offset + copy * self.fat_size
+                for sector, count in runs:
+                    data = table[sector * per_sector:(sector + count) * per_sector]
+                    self.device.write(base + sector * per_sector, data)
+            if 1 <= self.fsinfo < 0xFFFF:
+                self._write_fsinfo()
+            self.dirty = set()
+        self.device.flush()
+
+    def close(self):
+        """
+        Flushes all writes and closes the device
+        """
+        self.flush()
+        self.device.close()
@@ -1,21 +1,22 @@
+import functools
 import inspect
 import os.path
 import time
 
 import PySimpleGUI as sg  # noqa
 import oyaml as yaml
+from cloudmesh.burn.diagrams import Diagrams
+from cloudmesh.burn.progress import Worker
 from cloudmesh.burn.usb import USB
 from cloudmesh.common.systeminfo import os_is_linux
 from cloudmesh.common.systeminfo import os_is_mac
 from cloudmesh.common.Host import Host
-from cloudmesh.common.Shell import Shell
 from cloudmesh.common.Tabulate import Printer
 # import PySimpleGUIWx as sg
 from cloudmesh.common.parameter import Parameter
 from cloudmesh.common.sudo import Sudo
 from cloudmesh.common.util import banner
 from cloudmesh.common.util import path_expand
-from cloudmesh.diagram.diagram import Diagram
 from cloudmesh.burn.wifi.ssid import get_ssid
 from cloudmesh.burn.command.burn import _build_default_inventory
 
@@ -33,6 +34,8 @@ def image(name):
 window_size = (800, 800)
 log_size = (600, 600)
 status_width = (10, 1)
+progress_width = (20, 20)
+rate_width = (30, 1)
 name_width = (10, 1)
 tag_width = (15, 1)
 entry_width = (10, 1)
@@ -70,6 +73,8 @@ class Gui:
         self.imaged = ""
         self.wifipassword = ""
         self.no_diagram = no_diagram
+        # the host that is burned on each device
+        self.burning = {}
 
         hostnames = Parameter.expand(hostnames)
         manager, workers = Host.get_hostnames(hostnames)
@@ -103,28 +108,77 @@ class Gui:
 
         self.load_data()
 
+        # the diagrams are rendered in the background, cached diagrams are
+        # shown right away
+        self.diagrams = None
         if not self.no_diagram:
-            self.create_diag(self.manager)
+            hostnames = Parameter.expand(self.hostnames)
+            self.diagrams = Diagrams(hostnames, name=hostnames[0])
         self.create_layout()
         # sg.change_look_and_feel('SystemDefault')
-        self.window = sg.Window('Cloudmesh Pi Burn', self.layout, resizable=True, size=window_size)
+        self.window = sg.Window('Cloudmesh Pi Burn', self.layout, resizable=True, size=window_size,
+                                finalize=True)
+        if self.diagrams is not None:
+            self.diagrams.post = self.window.write_event_value
+            self.diagrams.update()
 
-    def burn(self, kind, hostname):
+    def burn(self, host, device, progress, inventory=None, ssid=None, wifipassword=None):
         """
-        if hostname == 'red':
-            ip = self.ips[0]
-            print("in red")
-            print(ip)
-        else:
-            ip_location = int(hostname.replace('red', ""))
-            print("in red00x")
-            print(ip_location)
-            ip = self.ips[ip_location]
-            print("in red")
-            print(ip)
+        Burns the card of the host. It is called in the thread of a
+        Worker, so it must not access the window.
+
+        :param host: the host
+        :type host: str
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param progress: the function that is called with the number of
+                         written bytes and the size of the image
+        :type progress: function(int, int)
+        :param inventory: the inventory of the cluster
+        :type inventory: str
+        :param ssid: the SSID of the manager
+        :type ssid: str
+        :param wifipassword: the wifi password of the manager
+        :type wifipassword: str
+        :return: True if the card was burned
+        :rtype: bool
+        """
+        if self.dryrun:
+            total = 100 * 1000 ** 2
+            for written in range(0, total + 1, total // 20):
+                time.sleep(0.1)
+                progress(written, total)
+            return True
+
+        from cloudmesh.burn.burner.RaspberryBurner import Burner as RaspberryBurner
+
+        # the device is checked in the event loop before the worker starts
+        burner = RaspberryBurner(inventory=inventory)
+        return burner.burn(name=host,
+                           device=device,
+                           ssid=ssid,
+                           wifipasswd=wifipassword,
+                           yes=True,
+                           progress=progress,
+                           check=False,
+                           quiet=True)
+
+    def check(self, device):
+        """
+        Checks that the device is an SD card reader. It is called in the
+        event loop, so the worker never asks the user.
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :return: True if the card can be burned on the device
+        :rtype: bool
         """
+        if self.dryrun:
+            return True
 
-        return
+        from cloudmesh.burn.burner.RaspberryBurner import Burner as RaspberryBurner
+
+        return RaspberryBurner.check_devices([device], yes=True)
 
     def load_data(self):
 
@@ -172,20 +226,22 @@ class Gui:
 
         cm_logo = f'{location}/images/cm-logo-100.png'
         pi_logo = f'{location}/images/raspberry-logo-white-100.png'
-        rack_file = f"~/.cloudmesh/gui/{self.manager}-rack.png"
-        net_file = f"~/.cloudmesh/gui/{self.manager}-net.png"
 
         burn_layout = [
             [sg.T('')]
         ]
 
         if not self.no_diagram:
+            rack_file = self.diagrams.cached("rack")
+            net_file = self.diagrams.cached("net")
             net_layout = [
-                [sg.Image(data=image(net_file), key='net-image', background_color='white')]
+                [sg.Image(data=image(net_file) if net_file else None, key='net-image',
+                          background_color='white')]
 
             ]
             rack_layout = [
-                [sg.Image(data=image(rack_file), key='rack-image', background_color='white')]
+                [sg.Image(data=image(rack_file) if rack_file else None, key='rack-image',
+                          background_color='white')]
             ]
         else:
             net_layout = []
@@ -220,15 +276,17 @@ class Gui:
         for device in devices:
             default = count == 0
             if os_is_linux():
-                burn_layout.append(
-                    [sg.Radio(device, group_id="DEVICE",
-                              default=default,
-                              key=f"device-{device['name']}")]
-                )
+                name = device['name']
             else:
-                burn_layout.append(
-                    [sg.Radio(device, group_id="DEVICE", default=default, key=f"device-{device}")]
-                )
+                name = device
+            burn_layout.append(
+                [
+                    sg.Radio(device, group_id="DEVICE", default=default, key=f"device-{name}"),
+                    sg.ProgressBar(100, orientation='h', size=progress_width,
+                                   key=f"progress-/dev/{name}"),
+                    sg.Text('', size=rate_width, key=f"rate-/dev/{name}")
+                ]
+            )
             count = count + 1
 
         #
@@ -337,28 +395,6 @@ class Gui:
         ]
         return self.layout
 
-    def create_diag(self, name, _new=True):
-
-        self.logger("Creating Diagrams")
-
-        directory = path_expand("~/.cloudmesh/gui")
-        Shell.mkdir(directory)
-        location = f"{directory}/{name}"
-
-        hostnames = Parameter.expand(self.hostnames)
-        if _new:
-            rack = Diagram(names=hostnames, name=hostnames[0])
-            rack.save(location)
-
-        diagram = Diagram()
-        diagram.load(location)
-
-        diagram.render_rack()
-        diagram.saveas(f"{location}-rack", kind="rack", output="png")
-
-        diagram.render_bridge_net()
-        diagram.saveas(f"{location}-net", kind="net", output="png")
-
     def logger(self, msg, end="\n\n"):
         try:
             text = self.window['log']
@@ -367,29 +403,25 @@ class Gui:
         except:  # noqa
             print(msg)
 
-    def set_diagram_value(self, name, entry, attribute, value):
-        directory = path_expand("~/.cloudmesh/gui")
-        Shell.mkdir(directory)
-        location = f"{directory}/{name}"
-        diagram = Diagram()
-        diagram.load(location)
-        data = {
-            attribute: value
-        }
-        diagram.set(entry, **data)
-        diagram.save(location)
-
     def update_diagram_colors(self, cluster, host, color):
+        """
+        Sets the color of the host in the diagrams of the cluster. The
+        diagrams are rendered in the background and shown with the event
+        ("diagram", kind).
+        """
+        if self.diagrams is not None and host in self.diagrams.diagram.data:
+            self.diagrams.set(host, color)
 
-        self.set_diagram_value(cluster, host, "rack.color", color)
-        self.set_diagram_value(cluster, host, "net.color", color)
-        self.create_diag(cluster, _new=False)
-
-        rack_file = f"~/.cloudmesh/gui/{cluster}-rack.png"
-        net_file = f"~/.cloudmesh/gui/{cluster}-net.png"
+    def show_diagram(self, kind, filename):
+        """
+        Shows the rendered diagram
 
-        self.window['net-image'].update(data=image(net_file))
-        self.window['rack-image'].update(data=image(rack_file))
+        :param kind: rack or net
+        :type kind: str
+        :param filename: the PNG of the diagram
+        :type filename: str
+        """
+        self.window[f'{kind}-image'].update(data=image(filename))
         self.window.Refresh()
 
     def set_button_color(self, host, color):
@@ -400,6 +432,42 @@ class Gui:
         except:   # noqa
             pass
 
+    def update_progress(self, kind, device, details):
+        """
+        Shows the progress of the burn on the device or its outcome. It is
+        called in the event loop with the events of the workers.
+
+        :param kind: progress or done
+        :type kind: str
+        :param device: the device
+        :type device: str
+        :param details: the progress or the outcome
+        :type details: dict
+        """
+        host = details["host"]
+        # the device may not be in the list of devices of the window
+        bar = self.window.key_dict.get(f"progress-{device}")
+        rate = self.window.key_dict.get(f"rate-{device}")
+        if kind == "progress":
+            if bar is not None:
+                bar.update(details["percent"])
+                rate.update(f"{host} {details['text']}")
+            return
+
+        self.burning.pop(device, None)
+        if details["success"]:
+            self.logger(f"Burned {host} on {device} in {details['time']} s")
+            status = "Completed"
+        else:
+            self.logger(f"Burning {host} on {device} failed {details['error']}")
+            status = "Failed"
+        self.window[f'status-{host}'].update(f' {status} ')
+        if rate is not None:
+            rate.update(f"{host} {status.lower()} in {details['time']} s")
+        if not self.no_diagram:
+            self.update_diagram_colors(self.manager, host, "green" if details["success"] else "orange")
+        self.set_button_color(host, "green" if details["success"] else "red")
+
     def run(self):
 
         Sudo.password()
@@ -417,12 +485,18 @@ class Gui:
 
             event, values = self.window.read()
 
+            if isinstance(event, tuple):
+                if event[0] == "diagram":
+                    self.show_diagram(event[1], values[event])
+                else:
+                    self.update_progress(*event, values[event])
+                continue
+
+            if event in ("Cancel", 'cancel') and self.burning:
+                self.logger(f"Waiting for the burns on {', '.join(self.burning)} to finish")
+                continue
+
             if event in ("Cancel", 'cancel', None):
-                if not self.no_diagram:
-                    rack_file = f"~/.cloudmesh/gui/{self.manager}-rack.png"
-                    net_file = f"~/.cloudmesh/gui/{self.manager}-net.png"
-                    os.remove(path_expand(rack_file))
-                    os.remove(path_expand(net_file))
                 break
 
             #
@@ -478,6 +552,15 @@ class Gui:
                 self.wifipassword = values['wifi']
 
                 host = event.replace("button-", "")
+                if device in self.burning:
+                    self.logger(f"{device} is busy burning {self.burning[device]}")
+                    continue
+                if host in self.burning.values():
+                    self.logger(f"{host} is already burning")
+                    continue
+                if not self.check(device):
+                    self.logger(f"{device} is not an SD card reader")
+                    continue
                 self.set_button_color(host, 'grey')
                 if host == self.manager:
                     kind = "manager"
@@ -524,34 +607,17 @@ class Gui:
                                          ips=ips,
                                          images=tags)
                 if host == manager:
-                    command = f"cms burn raspberry {host}" \
-                              f" --device={device}" \
-                              f" --ssid={self.ssid}" \
-                              f" --wifipassword={self.wifipassword}"
+                    ssid = self.ssid
+                    wifipassword = self.wifipassword
                 else:
-                    command = f"cms burn raspberry {host}" \
-                              f" --device={device}"
-                    print(command)
-
-                try:
-                    self.logger(f"Executing: {command}")
-                    if self.dryrun:
-                        time.sleep(0.5)
-                    else:
-                        os.system(command)
-                    self.window[f'status-{host}'].update(' Completed ')
-                    if not self.no_diagram:
-                        self.update_diagram_colors(self.manager, host, "green")
-                    self.set_button_color(host, 'green')
-
-                except Exception as e:
-                    print(e)
-                    self.logger("Command failed")
-                    if not self.no_diagram:
-                        self.update_diagram_colors(self.manager, host, "orange")
-                    self.set_button_color(host, 'red')
-
-                self.window.FindElement(f'button-{host}').Update(button_color=('white', 'green'))
+                    ssid = None
+                    wifipassword = None
+
+                # burn in the background, so the window stays responsive and
+                # several devices can be burned at the same time
+                self.burning[device] = host
+                burn = functools.partial(self.burn, inventory=filename, ssid=ssid, wifipassword=wifipassword)
+                Worker(host, device, burn, self.window.write_event_value).start()
 
                 self.window.Refresh()
 
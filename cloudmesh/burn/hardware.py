@@ -1,7 +1,7 @@
-import os
-import socket
 import platform
 
+from cloudmesh.burn.interfaces import Interfaces
+
 
 class Hardware(object):
 
@@ -26,12 +26,7 @@ class Hardware(object):
         :return: mac address
         :rtype: str
         """
-        # noinspection PyBroadException
-        try:
-            address = open(f'/sys/class/net/{interface}/address').read()
-        except Exception as e:  # noqa: F841
-            address = "00:00:00:00:00:00"
-        return address[0:17]
+        return Interfaces.mac(interface)
 
     @staticmethod
     def get_ethernet():
@@ -42,14 +37,9 @@ class Hardware(object):
         :rtype:
         """
         interface = None
-        # noinspection PyBroadException
-        try:
-            for root, dirs, files in os.walk('/sys/class/net'):
-                for directory in dirs:
-                    if directory[:3] == 'enx' or directory[:3] == 'eth':
-                        interface = directory
-        except Exception as e:  # noqa: F841
-            interface = "None"
+        for name in Interfaces.names():
+            if name[:3] == 'enx' or name[:3] == 'eth':
+                interface = name
         return interface
 
     @staticmethod
@@ -76,7 +66,7 @@ class Hardware(object):
         :return: the hostname
         :rtype: str
         """
-        return socket.gethostname()
+        return Interfaces.host("hostname")["hostname"]
 
     @staticmethod
     def fqdn():
@@ -86,7 +76,7 @@ class Hardware(object):
         :return:
         :rtype:
         """
-        return socket.getfqdn()
+        return Interfaces.host("fqdn")["fqdn"]
 
 
 """
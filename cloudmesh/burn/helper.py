@@ -0,0 +1,541 @@
+"""
+A long lived privileged helper that executes file operations on the SD Card.
+
+Configuring a single card used to spawn dozens of separate sudo processes
+(sudo tee, sudo rm, sudo sync, sudo mount, ...). The helper is started once
+per session with sudo and receives the operations over a pipe. Several
+operations can be send as a single batch.
+
+The protocol is line based. Each request is a JSON line followed by an
+optional binary payload of the length given in the attribute "size". The
+response uses the same format.
+
+    {"op": "write", "path": "/media/pi/boot/ssh", "mode": 420, "size": 0}
+
+Supported operations are write, read, chmod, rm, mkdir, exists, sync, mount,
+umount, pread, pwrite and batch. pread and pwrite read and write a range of
+bytes at an offset of a file or block device.
+
+Usage:
+
+    Helper.write("/media/pi/boot/ssh", "")
+    Helper.chmod("/media/pi/boot/firstrun.sh", 0o755)
+    Helper.sync()
+
+    Helper.batch([
+        {"op": "write", "path": "/media/pi/boot/ssh", "data": b""},
+        {"op": "sync"}
+    ])
+
+If the helper can not be started, for example on Windows, the operations
+fall back to the individual sudo commands.
+"""
+import atexit
+import ctypes
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+
+from cloudmesh.common.console import Console
+from cloudmesh.common.sudo import Sudo
+from cloudmesh.common.systeminfo import os_is_windows
+
+
+def _syncfs(path=None):
+    """
+    Flushes the file system that contains the path. If no path is given
+    or syncfs is not available all file systems are flushed
+
+    :param path: a file or directory on the file system
+    :type path: str
+    """
+    if path is not None and sys.platform.startswith("linux"):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                if libc.syncfs(fd) == 0:
+                    return
+            finally:
+                os.close(fd)
+        except (OSError, AttributeError):
+            # no libc or no syncfs, all file systems are flushed
+            pass
+    os.sync()
+
+
+def _execute(op, data=b""):
+    """
+    Executes a single operation. This function is run inside the
+    privileged helper process.
+
+    :param op: the operation
+    :type op: dict
+    :param data: the payload of the operation
+    :type data: bytes
+    :return: the payload of the result
+    :rtype: bytes
+    """
+    kind = op["op"]
+    path = op.get("path")
+    if kind == "write":
+        directory = os.path.dirname(path)
+        if op.get("parents") and directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "ab" if op.get("append") else "wb") as f:
+            f.write(data)
+            if op.get("fsync"):
+                f.flush()
+                os.fsync(f.fileno())
+        if op.get("mode") is not None:
+            os.chmod(path, op["mode"])
+        if op.get("owner") is not None:
+            os.chown(path, *op["owner"])
+    elif kind == "read":
+        with open(path, "rb") as f:
+            return f.read()
+    elif kind == "pread":
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.lseek(fd, op["offset"], os.SEEK_SET)
+            chunks = []
+            remaining = op["length"]
+            while remaining > 0:
+                chunk = os.read(fd, remaining)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                remaining -= len(chunk)
+            return b"".join(chunks)
+        finally:
+            os.close(fd)
+    elif kind == "pwrite":
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            os.lseek(fd, op["offset"], os.SEEK_SET)
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            if op.get("fsync"):
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+    elif kind == "chmod":
+        os.chmod(path, op["mode"])
+    elif kind == "rm":
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    elif kind == "mkdir":
+        os.makedirs(path, exist_ok=True)
+        if op.get("mode") is not None:
+            os.chmod(path, op["mode"])
+        if op.get("owner") is not None:
+            os.chown(path, *op["owner"])
+    elif kind == "exists":
+        return b"1" if os.path.exists(path) else b"0"
+    elif kind == "sync":
+        _syncfs(path)
+    elif kind == "mount":
+        os.makedirs(path, exist_ok=True)
+        command = ["mount"]
+        if op.get("fstype"):
+            command += ["-t", op["fstype"]]
+        if op.get("options"):
+            command += ["-o", op["options"]]
+        command += [op["device"], path]
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode != 0:
+            raise OSError(result.stderr.decode().strip())
+    elif kind == "umount":
+        result = subprocess.run(["umount", path], capture_output=True)
+        if result.returncode != 0:
+            raise OSError(result.stderr.decode().strip())
+    else:
+        raise ValueError(f"unknown operation {kind}")
+    return b""
+
+
+def serve(stdin=None, stdout=None):
+    """
+    The loop of the helper process. It reads the requests from stdin and
+    writes the responses to stdout until stdin is closed or the exit
+    operation is received.
+
+    :param stdin: the binary input stream
+    :param stdout: the binary output stream
+    """
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+
+    def respond(response, data=b""):
+        response["size"] = len(data)
+        stdout.write(json.dumps(response).encode() + b"\n")
+        stdout.write(data)
+        stdout.flush()
+
+    while True:
+        line = stdin.readline()
+        if not line:
+            break
+        request = json.loads(line)
+        data = stdin.read(request.get("size", 0))
+        if request["op"] == "exit":
+            respond({"ok": True})
+            break
+        if request["op"] == "batch":
+            ops = request["ops"]
+        else:
+            ops = [request]
+        results = []
+        output = b""
+        position = 0
+        for op in ops:
+            size = op.get("size", 0) if request["op"] == "batch" else len(data)
+            payload = data[position:position + size]
+            position += size
+            try:
+                result = _execute(op, payload)
+                results.append({"ok": True, "size": len(result)})
+                output += result
+            except Exception as e:
+                results.append({"ok": False, "error": str(e), "size": 0})
+                break
+        respond({"ok": all(r["ok"] for r in results), "results": results}, output)
+
+
+class Helper:
+    """
+    Client of the privileged helper. The helper process is started lazily
+    with the first operation and is reused for the rest of the session.
+    """
+
+    process = None
+    # start, stop and each round trip hold the lock, so the workers of
+    # parallel burns start a single helper. start calls stop, so the lock
+    # is reentrant.
+    lock = threading.RLock()
+    available = None
+    sudo = True
+
+    @classmethod
+    def start(cls, sudo=None):
+        """
+        Starts the helper process if it is not already running
+
+        :param sudo: if True the helper is started with sudo
+        :type sudo: bool
+        :return: True if the helper is running
+        :rtype: bool
+        """
+        with cls.lock:
+            if sudo is not None and sudo != cls.sudo:
+                cls.stop()
+                cls.sudo = sudo
+                cls.available = None
+            if cls.process is not None and cls.process.poll() is None:
+                return True
+            if cls.available is False or os_is_windows():
+                cls.available = False
+                return False
+            command = [sys.executable, "-m", "cloudmesh.burn.helper"]
+            env = None
+            if cls.sudo and os.geteuid() != 0:
+                Sudo.password()
+                # sudo resets the environment, so we pass the search path along
+                path = os.pathsep.join(p for p in sys.path if p)
+                command = ["sudo", "env", f"PYTHONPATH={path}"] + command
+            else:
+                env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+            try:
+                cls.process = subprocess.Popen(command,
+                                               stdin=subprocess.PIPE,
+                                               stdout=subprocess.PIPE,
+                                               env=env)
+                cls.available = True
+                atexit.register(cls.stop)
+            except (OSError, ValueError) as e:
+                Console.warning(f"Could not start the privileged helper: {e}")
+                cls.available = False
+            return cls.available
+
+    @classmethod
+    def stop(cls):
+        """
+        Stops the helper process
+        """
+        with cls.lock:
+            process = cls.process
+            if process is not None:
+                try:
+                    cls._send({"op": "exit"})
+                except (OSError, ValueError):
+                    # the helper already terminated
+                    pass
+                process.wait()
+                cls.process = None
+
+    @classmethod
+    def _send(cls, request, data=b""):
+        request = dict(request)
+        request["size"] = len(data)
+        cls.process.stdin.write(json.dumps(request).encode() + b"\n")
+        cls.process.stdin.write(data)
+        cls.process.stdin.flush()
+        line = cls.process.stdout.readline()
+        if not line:
+            cls.process = None
+            cls.available = False
+            raise OSError("the privileged helper terminated")
+        response = json.loads(line)
+        return response, cls.process.stdout.read(response["size"])
+
+    @classmethod
+    def batch(cls, operations):
+        """
+        Executes a list of operations with a single round trip. Each
+        operation is a dict with the key "op" and the arguments of the
+        operation. Binary or string content is passed with the key "data".
+
+        :param operations: the operations
+        :type operations: list
+        :return: the payloads returned by the operations
+        :rtype: list
+        """
+        ops = []
+        data = b""
+        for op in operations:
+            op = dict(op)
+            payload = op.pop("data", b"") or b""
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            op["size"] = len(payload)
+            ops.append(op)
+            data += payload
+        with cls.lock:
+            if not cls.start():
+                response = None
+            else:
+                response, output = cls._send({"op": "batch", "ops": ops}, data)
+        if response is None:
+            return [cls._fallback(dict(op)) for op in operations]
+        results = []
+        position = 0
+        for op, result in zip(ops, response["results"]):
+            if not result["ok"]:
+                raise OSError(f"{op['op']} {op.get('path', '')} failed: {result['error']}")
+            results.append(output[position:position + result["size"]])
+            position += result["size"]
+        return results
+
+    @classmethod
+    def execute(cls, op, data=b""):
+        """
+        Executes a single operation
+
+        :param op: the operation
+        :type op: dict
+        :param data: the payload
+        :type data: bytes or str
+        :return: the payload returned by the operation
+        :rtype: bytes
+        """
+        op = dict(op)
+        op["data"] = data
+        return cls.batch([op])[0]
+
+    @staticmethod
+    def _fallback(op):
+        """
+        Executes the operation with individual sudo commands. This is used
+        if the helper could not be started.
+
+        :param op: the operation
+        :type op: dict
+        :return: the payload returned by the operation
+        :rtype: bytes
+        """
+        kind = op["op"]
+        path = shlex.quote(op.get("path") or "")
+        data = op.get("data", b"") or b""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        # Windows has no sudo, chmod and chown, the files are written directly
+        windows = os_is_windows()
+        sudo = [] if windows else ["sudo"]
+        if kind == "write" and windows:
+            if op.get("parents"):
+                os.makedirs(os.path.dirname(op["path"]), exist_ok=True)
+            with open(op["path"], "ab" if op.get("append") else "wb") as f:
+                f.write(data)
+        elif kind == "write":
+            if op.get("parents"):
+                os.system(f"sudo mkdir -p {shlex.quote(os.path.dirname(op['path']))}")
+            tee = sudo + ["tee"] + (["-a"] if op.get("append") else []) + [op["path"]]
+            subprocess.run(tee, input=data, stdout=subprocess.DEVNULL)
+            if op.get("mode") is not None:
+                os.system(f"sudo chmod {op['mode']:o} {path}")
+            if op.get("owner") is not None:
+                os.system(f"sudo chown {op['owner'][0]}:{op['owner'][1]} {path}")
+        elif kind == "read":
+            return subprocess.run(sudo + ["cat", op["path"]], capture_output=True).stdout
+        elif kind == "pread":
+            return subprocess.run(sudo + ["dd", f"if={op['path']}",
+                                          f"skip={op['offset']}", f"count={op['length']}",
+                                          "iflag=skip_bytes,count_bytes", "status=none"],
+                                  capture_output=True).stdout
+        elif kind == "pwrite":
+            subprocess.run(sudo + ["dd", f"of={op['path']}", f"seek={op['offset']}",
+                                   "oflag=seek_bytes", "conv=notrunc,fsync", "status=none"],
+                           input=data)
+        elif kind == "chmod":
+            if not windows:
+                os.system(f"sudo chmod {op['mode']:o} {path}")
+        elif kind == "rm":
+            if windows:
+                if os.path.exists(op["path"]):
+                    os.remove(op["path"])
+            else:
+                os.system(f"sudo rm -f {path}")
+        elif kind == "mkdir":
+            if windows:
+                os.makedirs(op["path"], exist_ok=True)
+            else:
+                os.system(f"sudo mkdir -p {path}")
+                if op.get("mode") is not None:
+                    os.system(f"sudo chmod {op['mode']:o} {path}")
+                if op.get("owner") is not None:
+                    os.system(f"sudo chown {op['owner'][0]}:{op['owner'][1]} {path}")
+        elif kind == "exists":
+            return b"1" if os.path.exists(op["path"]) else b"0"
+        elif kind == "sync":
+            os.system("sudo sync")
+        elif kind == "mount":
+            fstype = f"-t {op['fstype']} " if op.get("fstype") else ""
+            options = f"-o {op['options']} " if op.get("options") else ""
+            os.system(f"sudo mkdir -p {path}")
+            os.system(f"sudo mount {fstype}{options}{op['device']} {path}")
+        elif kind == "umount":
+            os.system(f"sudo umount {path}")
+        return b""
+
+    @classmethod
+    def write(cls, path, content, mode=None, append=False, parents=False, owner=None):
+        """
+        Writes the content into the file
+
+        :param path: the filename
+        :type path: str
+        :param content: the content
+        :type content: str or bytes
+        :param mode: the permissions of the file, e.g. 0o755
+        :type mode: int
+        :param append: if True the content is appended
+        :type append: bool
+        :param parents: if True missing directories are created
+        :type parents: bool
+        :param owner: the uid and gid of the file, e.g. (1000, 1000)
+        :type owner: tuple
+        """
+        cls.execute({"op": "write", "path": path, "mode": mode,
+                     "append": append, "parents": parents, "owner": owner}, content)
+
+    @classmethod
+    def read(cls, path, decode=True):
+        """
+        Reads the content of the file
+
+        :param path: the filename
+        :type path: str
+        :param decode: if True a str is returned
+        :type decode: bool
+        :return: the content
+        :rtype: str or bytes
+        """
+        content = cls.execute({"op": "read", "path": path})
+        if decode:
+            content = content.decode("utf-8", errors="replace")
+        return content
+
+    @classmethod
+    def exists(cls, path):
+        """
+        Checks if the path exists
+
+        :param path: the path
+        :type path: str
+        :rtype: bool
+        """
+        return cls.execute({"op": "exists", "path": path}) == b"1"
+
+    @classmethod
+    def chmod(cls, path, mode):
+        cls.execute({"op": "chmod", "path": path, "mode": mode})
+
+    @classmethod
+    def rm(cls, path):
+        cls.execute({"op": "rm", "path": path})
+
+    @classmethod
+    def mkdir(cls, path, mode=None, owner=None):
+        cls.execute({"op": "mkdir", "path": path, "mode": mode, "owner": owner})
+
+    @classmethod
+    def sync(cls, path=None):
+        """
+        Flushes the file system that contains path, or all file systems
+
+        :param path: a path on the file system
+        :type path: str
+        """
+        cls.execute({"op": "sync", "path": path})
+
+    @classmethod
+    def mount(cls, device, path, fstype=None, options=None):
+        """
+        Mounts the device on the path. Missing mount points are created.
+
+        :param device: the partition, e.g. /dev/sdb1
+        :type device: str
+        :param path: the mount point
+        :type path: str
+        :param fstype: the file system type, e.g. vfat or ext4
+        :type fstype: str
+        :param options: the mount options
+        :type options: str
+        :return: True if the mount succeeded
+        :rtype: bool
+        """
+        try:
+            cls.execute({"op": "mount", "device": device, "path": path,
+                         "fstype": fstype, "options": options})
+        except OSError as e:
+            Console.error(str(e))
+            return False
+        return True
+
+    @classmethod
+    def umount(cls, path):
+        """
+        Unmounts the file system mounted on path
+
+        :param path: the mount point
+        :type path: str
+        :return: True if the unmount succeeded
+        :rtype: bool
+        """
+        try:
+            cls.execute({"op": "umount", "path": path})
+        except OSError as e:
+            Console.error(str(e))
+            return False
+        return True
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,96 @@
+"""
+The table of the cluster hosts that is added to /etc/hosts on each card.
+
+The table is created once per burn session from the inventory. Each card
+gets the entries of all other hosts, either embedded in its configuration,
+or by a single shared hosts file on the boot partition from which the
+entries of the other hosts are added at first boot.
+
+Example:
+
+    hosts = Hosts(inventory.find(service="worker"))
+    names, ips = hosts.get("red01")
+    print(hosts.render(exclude="red01"))
+"""
+
+
+class Hosts(object):
+
+    FILENAME = "hosts"
+
+    def __init__(self, nodes=None):
+        """
+        Creates the table
+
+        :param nodes: the inventory entries with the attributes host and ip.
+                      Entries without an ip are skipped.
+        :type nodes: list of dict
+        """
+        self.names = []
+        self.ips = []
+        self.index = {}
+        for node in nodes or []:
+            host = node["host"]
+            ip = node["ip"]
+            if ip and host not in self.index:
+                self.index[host] = len(self.names)
+                self.names.append(host)
+                self.ips.append(ip)
+
+        lines = [f"{ip}\t{host}\n" for host, ip in zip(self.names, self.ips)]
+        self.content = "".join(lines)
+
+        # the position of each line in the content, so a line can be
+        # removed without rendering the table again
+        self.offsets = [0]
+        for line in lines:
+            self.offsets.append(self.offsets[-1] + len(line))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get(self, name=None):
+        """
+        Returns the names and ips of all hosts except the named one
+
+        :param name: the host that is excluded
+        :type name: str
+        :return: the names and the ips
+        :rtype: tuple of list
+        """
+        i = self.index.get(name)
+        if i is None:
+            return list(self.names), list(self.ips)
+        return self.names[:i] + self.names[i + 1:], self.ips[:i] + self.ips[i + 1:]
+
+    def render(self, exclude=None):
+        """
+        Returns the table in /etc/hosts format
+
+        :param exclude: the host whose line is not included
+        :type exclude: str
+        :return: the lines of the form "ip\\thost"
+        :rtype: str
+        """
+        i = self.index.get(exclude)
+        if i is None:
+            return self.content
+        return self.content[:self.offsets[i]] + self.content[self.offsets[i + 1]:]
+
+    @staticmethod
+    def command(name, filename):
+        """
+        Returns the shell command that appends the entries of the shared
+        hosts file to /etc/hosts, except the entry of the host itself
+
+        :param name: the name of the host
+        :type name: str
+        :param filename: the location of the shared hosts file on the host
+        :type filename: str
+        :return: the command
+        :rtype: str
+        """
+        return f"awk -v host={name} '$2 != host' {filename} >> /etc/hosts"
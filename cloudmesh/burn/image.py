@@ -9,6 +9,7 @@ import requests
 import urllib3
 from cloudmesh.burn.util import sha1sum
 from cloudmesh.burn.util import sha256sum
+from cloudmesh.burn.trace import Trace
 from cloudmesh.common.Tabulate import Printer
 from cloudmesh.common.console import Console
 from cloudmesh.common.util import banner
@@ -291,6 +292,7 @@ class Image(object):
     def get_name(url):
         return os.path.basename(url).replace('.zip', '').replace('.xz', '')
 
+    @Trace.traced("download", "url")
     def download_file(self, url=None, filename=None):
         if os_is_windows:
             os.system(f"curl -L -o {filename} {url}")
@@ -298,6 +300,7 @@ class Image(object):
             os.system(f'wget -O {filename} {url}')
 
     # noinspection PyBroadException
+    @Trace.traced("fetch", "tag")
     def fetch(self, url=None, tag=None, verify=True):
         """
         Download the image from the URL in self.image_name
@@ -423,6 +426,7 @@ class Image(object):
                 pass
             return img_filename
 
+    @Trace.traced("extract", "zip_filename")
     def unzip_image(self, zip_filename=None):
         """
         Unzip image.zip to image.img
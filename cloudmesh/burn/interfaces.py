@@ -0,0 +1,301 @@
+"""
+The network interfaces and addresses of the local machine.
+
+On Linux the IPv4 addresses are read with a single netlink request instead
+of running ip -json a, the MAC addresses are read from /sys/class/net. The
+hostname, its fully qualified name and its address are each resolved once
+when they are needed. The results are cached until the kernel reports a
+change of an address or a link on a netlink socket that is subscribed to
+these events. Without netlink, e.g. on macOS, ip -json a is used if it
+exists and the cache expires after a few seconds.
+
+Network and Hardware use this cache, so the interfaces are only probed
+once.
+
+Example:
+
+    for address in Interfaces.addresses():
+        print(address["ifname"], address["local"], address["prefixlen"])
+    print(Interfaces.host()["ip"])
+"""
+import json
+import os
+import select
+import shutil
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+NETLINK_ROUTE = 0
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+
+# the multicast groups of link and address changes
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+SCOPES = {0: "global", 200: "site", 253: "link", 254: "host", 255: "nowhere"}
+
+# the time after which the cache expires if changes can not be detected
+EXPIRE = 5
+
+SYS_NET = "/sys/class/net"
+
+
+class Interfaces(object):
+
+    lock = threading.Lock()
+    cache = None
+    loaded = 0
+    monitor = None
+
+    @staticmethod
+    def parse(data, names=None):
+        """
+        Parses the RTM_NEWADDR messages of a netlink response
+
+        :param data: the response
+        :type data: bytes
+        :param names: the name of each interface index, by default the
+                      names are looked up
+        :type names: dict
+        :return: the addresses with the attributes ifindex, ifname,
+                 family, local, prefixlen, broadcast, scope and label as
+                 in ip -json a, and if the response is complete
+        :rtype: tuple
+        """
+        addresses = []
+        done = False
+        position = 0
+        while position + 16 <= len(data):
+            length, kind, _, _, _ = struct.unpack_from("=IHHII", data, position)
+            if length < 16:
+                break
+            if kind == NLMSG_DONE:
+                done = True
+            elif kind == NLMSG_ERROR:
+                error, = struct.unpack_from("=i", data, position + 16)
+                if error:
+                    raise OSError(-error, os.strerror(-error))
+            elif kind == RTM_NEWADDR:
+                family, prefixlen, _, scope, index = struct.unpack_from("=BBBBI", data, position + 16)
+                attributes = {}
+                attribute = position + 24
+                while attribute + 4 <= position + length:
+                    size, kind = struct.unpack_from("=HH", data, attribute)
+                    if size < 4:
+                        break
+                    attributes[kind] = data[attribute + 4:attribute + size]
+                    attribute += (size + 3) & ~3
+                if family == socket.AF_INET:
+                    if names is not None and index in names:
+                        name = names[index]
+                    else:
+                        try:
+                            name = socket.if_indextoname(index)
+                        except OSError:
+                            name = str(index)
+                    address = {
+                        "ifindex": index,
+                        "ifname": name,
+                        "family": "inet",
+                        "local": socket.inet_ntoa(attributes.get(IFA_LOCAL) or attributes[IFA_ADDRESS]),
+                        "prefixlen": prefixlen,
+                        "scope": SCOPES.get(scope, str(scope))
+                    }
+                    if IFA_BROADCAST in attributes:
+                        address["broadcast"] = socket.inet_ntoa(attributes[IFA_BROADCAST])
+                    if IFA_LABEL in attributes:
+                        address["label"] = attributes[IFA_LABEL].rstrip(b"\0").decode("utf-8")
+                    addresses.append(address)
+            position += (length + 3) & ~3
+        return addresses, done
+
+    @staticmethod
+    def netlink():
+        """
+        Reads the IPv4 addresses with a netlink request
+
+        :return: the addresses, see parse
+        :rtype: list
+        """
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+            sock.bind((0, 0))
+            request = struct.pack("=IHHII", 24, RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + \
+                struct.pack("=BBBBI", socket.AF_INET, 0, 0, 0, 0)
+            sock.send(request)
+            addresses = []
+            while True:
+                found, done = Interfaces.parse(sock.recv(65536))
+                addresses += found
+                if done:
+                    return addresses
+
+    @staticmethod
+    def ip():
+        """
+        Reads the IPv4 addresses with ip -json a
+
+        :return: the addresses, see parse
+        :rtype: list
+        """
+        if shutil.which("ip") is None:
+            return []
+        try:
+            details = json.loads(subprocess.run(["ip", "-json", "a"], capture_output=True,
+                                                text=True).stdout)
+        except ValueError:
+            return []
+        addresses = []
+        for entry in details:
+            for info in entry.get("addr_info", []):
+                if info.get("family") == "inet":
+                    addresses.append(dict(info, ifindex=entry.get("ifindex"),
+                                          ifname=entry.get("ifname")))
+        return addresses
+
+    @classmethod
+    def _changed(cls):
+        """
+        Checks if the kernel reported a change since the cache was filled
+        """
+        if cls.monitor is None:
+            return time.monotonic() - cls.loaded > EXPIRE
+        changed = False
+        while select.select([cls.monitor], [], [], 0)[0]:
+            try:
+                if not cls.monitor.recv(65536):
+                    break
+            except BlockingIOError:
+                break
+            except OSError:
+                # e.g. the buffer overflowed, changes may be lost
+                pass
+            changed = True
+        return changed
+
+    @classmethod
+    def _subscribe(cls):
+        if cls.monitor is not None or not hasattr(socket, "AF_NETLINK"):
+            return
+        try:
+            monitor = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            monitor.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            monitor.setblocking(False)
+            cls.monitor = monitor
+        except OSError:
+            pass
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Clears the cache
+        """
+        with cls.lock:
+            cls.cache = None
+
+    @classmethod
+    def _load(cls):
+        """
+        Returns the cached data and reads it again if it changed
+        """
+        with cls.lock:
+            if cls.cache is not None and not cls._changed():
+                return cls.cache
+            # subscribe before reading, so no change is missed
+            cls._subscribe()
+            addresses = None
+            if cls.monitor is not None:
+                cls._changed()
+                try:
+                    addresses = Interfaces.netlink()
+                except OSError:
+                    pass
+            if addresses is None:
+                addresses = Interfaces.ip()
+            cls.cache = {"addresses": addresses, "host": {}}
+            cls.loaded = time.monotonic()
+            return cls.cache
+
+    @classmethod
+    def addresses(cls):
+        """
+        Returns the IPv4 addresses of all interfaces
+
+        :return: the addresses with the attributes ifindex, ifname,
+                 family, local, prefixlen, broadcast, scope and label
+        :rtype: list
+        """
+        return [dict(address) for address in cls._load()["addresses"]]
+
+    @staticmethod
+    def _resolve(field):
+        if field == "hostname":
+            return socket.gethostname()
+        if field == "fqdn":
+            return socket.getfqdn()
+        try:
+            return socket.gethostbyname(socket.gethostname())
+        except OSError:
+            return None
+
+    @classmethod
+    def host(cls, *fields):
+        """
+        Returns the hostname, the fully qualified name and the address of
+        the hostname. Each field is resolved when it is first asked for and
+        kept for the state of the interfaces, so the hostname alone never
+        queries the DNS.
+
+        :param fields: the fields hostname, fqdn and ip, by default all
+        :type fields: str
+        :rtype: dict
+        """
+        host = cls._load()["host"]
+        fields = fields or ("hostname", "fqdn", "ip")
+        for field in fields:
+            if field not in host:
+                host[field] = Interfaces._resolve(field)
+        return {field: host[field] for field in fields}
+
+    @staticmethod
+    def names():
+        """
+        Returns the names of the interfaces
+
+        :rtype: list
+        """
+        if os.path.isdir(SYS_NET):
+            return sorted(os.listdir(SYS_NET))
+        try:
+            return [name for _, name in socket.if_nameindex()]
+        except OSError:
+            return []
+
+    @staticmethod
+    def mac(interface="eth0"):
+        """
+        Returns the MAC address of the interface
+
+        :param interface: the interface, e.g. eth0
+        :type interface: str
+        :return: the MAC address, 00:00:00:00:00:00 if it is not known
+        :rtype: str
+        """
+        try:
+            with open(os.path.join(SYS_NET, interface, "address")) as f:
+                return f.read().strip()[0:17]
+        except OSError:
+            return "00:00:00:00:00:00"
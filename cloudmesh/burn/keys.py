@@ -0,0 +1,106 @@
+"""
+Generates SSH user and host keys in memory.
+
+The keys are created with the cryptography library in the Python process,
+so private keys are never written to a local file. The keys of many hosts
+are generated in parallel with a process pool, as the generation of RSA
+keys is CPU bound.
+
+Example:
+
+    private, public = Keys.generate(kind="ed25519", comment="pi@red")
+    keys = Keys.host_keys(["red", "red01", "red02"])
+    private, public = keys["red01"]["ed25519"]
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+KINDS = ["ed25519", "rsa"]
+
+
+def _generate(arguments):
+    return Keys.generate(*arguments)
+
+
+class Keys(object):
+
+    @staticmethod
+    def generate(kind="ed25519", comment="", bits=3072):
+        """
+        Generates a key pair
+
+        :param kind: the type of the key, ed25519 or rsa
+        :type kind: str
+        :param comment: the comment of the public key, e.g. pi@red
+        :type comment: str
+        :param bits: the size of rsa keys
+        :type bits: int
+        :return: the private key in OpenSSH format and the public key
+        :rtype: tuple of str
+        """
+        if kind == "ed25519":
+            key = ed25519.Ed25519PrivateKey.generate()
+        elif kind == "rsa":
+            key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+        else:
+            raise ValueError(f"key type {kind} is not supported")
+        private = key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.OpenSSH,
+            encryption_algorithm=serialization.NoEncryption()
+        ).decode("utf-8").strip()
+        public = key.public_key().public_bytes(
+            encoding=serialization.Encoding.OpenSSH,
+            format=serialization.PublicFormat.OpenSSH
+        ).decode("utf-8")
+        if comment:
+            public = f"{public} {comment}"
+        return private, public
+
+    @staticmethod
+    def generate_all(requests, workers=None):
+        """
+        Generates many key pairs in parallel
+
+        :param requests: the name of each key pair with the type and the
+                         comment, e.g. {"red": ("rsa", "pi@red")}
+        :type requests: dict
+        :param workers: the number of processes, by default the number of
+                        CPUs
+        :type workers: int
+        :return: the private and public key of each name
+        :rtype: dict
+        """
+        names = list(requests)
+        arguments = [requests[name] for name in names]
+        if len(names) <= 1:
+            return {name: _generate(argument) for name, argument in zip(names, arguments)}
+        workers = min(workers or os.cpu_count() or 1, len(names))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(names, pool.map(_generate, arguments)))
+
+    @staticmethod
+    def host_keys(names, kinds=None, workers=None):
+        """
+        Generates the SSH host keys of the hosts
+
+        :param names: the hosts
+        :type names: list
+        :param kinds: the types of the keys, by default ed25519 and rsa
+        :type kinds: list
+        :param workers: the number of processes
+        :type workers: int
+        :return: for each host the private and public key of each type
+        :rtype: dict
+        """
+        kinds = kinds or KINDS
+        requests = {(name, kind): (kind, f"root@{name}") for name in names for kind in kinds}
+        keys = Keys.generate_all(requests, workers=workers)
+        result = {name: {} for name in names}
+        for (name, kind), pair in keys.items():
+            result[name][kind] = pair
+        return result
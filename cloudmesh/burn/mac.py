@@ -0,0 +1,240 @@
+"""
+Collects the MAC addresses of the hosts of a cluster, e.g. for DHCP
+reservations and netboot.
+
+All hosts are queried concurrently with asyncio. For each host
+
+* the address is taken from the inventory or resolved with multicast DNS
+  (name.local),
+* a connection to the ssh port fills the ARP or neighbor table of the
+  local machine, if the host is on the same network its MAC address is
+  read from it,
+* otherwise the address of the interface is read with ssh from
+  /sys/class/net/eth0/address.
+
+Each host has its own timeout and the time to find its MAC address is
+recorded. The addresses are written back to the inventory with a single
+save.
+
+Example:
+
+    mac = Mac({"red": "10.1.1.1", "red01": None})
+    results = mac.run(timeout=10)
+    mac.write(Inventory())
+"""
+import asyncio
+import re
+import time
+
+from cloudmesh.burn.network import Network
+from cloudmesh.burn.wait import MulticastDNS
+from cloudmesh.common.Tabulate import Printer
+from cloudmesh.common.console import Console
+
+MAC = re.compile(r"^[0-9a-f]{1,2}(:[0-9a-f]{1,2}){5}$")
+
+
+class Mac(object):
+
+    def __init__(self, hosts, user="pi", interface="eth0", port=22, mdns=True):
+        """
+        Creates the collector
+
+        :param hosts: the ip of each host, None if it is not known
+        :type hosts: dict
+        :param user: the user that logs in with ssh
+        :type user: str
+        :param interface: the interface of which the MAC address is read
+                          with ssh
+        :type interface: str
+        :param port: the ssh port
+        :type port: int
+        :param mdns: if True the hosts without ip are resolved with
+                     multicast DNS
+        :type mdns: bool
+        """
+        self.user = user
+        self.interface = interface
+        self.port = port
+        self.mdns = mdns
+        self.results = {name: {
+            "host": name,
+            "ip": ip,
+            "mac": None,
+            "method": None,
+            "time": None,
+            "error": ""
+        } for name, ip in hosts.items()}
+
+    @staticmethod
+    def normalize(mac):
+        """
+        Returns the MAC address in lower case with two digits for each byte
+
+        :param mac: the MAC address, e.g. DC:A6:32:0:0:1
+        :type mac: str
+        :return: the address, e.g. dc:a6:32:00:00:01, None if it is not a
+                 valid MAC address
+        :rtype: str
+        """
+        mac = (mac or "").strip().lower()
+        if not MAC.match(mac) or mac == "00:00:00:00:00:00":
+            return None
+        return ":".join(part.zfill(2) for part in mac.split(":"))
+
+    async def neighbor(self, ip, timeout):
+        """
+        Connects to the ssh port of the host, so the local machine learns
+        its MAC address, and reads it from the ARP table
+
+        :param ip: the address of the host
+        :type ip: str
+        :param timeout: the time in seconds to wait for the connection
+        :type timeout: float
+        :return: the MAC address, None if the host is not a neighbor
+        :rtype: str
+        """
+        mac = Network.arp().get(ip)
+        if mac is None:
+            await Network.probe(ip, port=self.port, timeout=timeout)
+            mac = Network.arp().get(ip)
+        return Mac.normalize(mac)
+
+    async def ssh(self, ip, timeout):
+        """
+        Reads the MAC address of the interface on the host with ssh
+
+        :param ip: the address of the host
+        :type ip: str
+        :param timeout: the time in seconds to wait for the answer
+        :type timeout: float
+        :return: the MAC address, None if it could not be read
+        :rtype: str
+        """
+        destination = f"{self.user}@{ip}" if self.user else ip
+        process = await asyncio.create_subprocess_exec(
+            "ssh",
+            "-o", "BatchMode=yes",
+            "-o", f"ConnectTimeout={max(1, int(timeout))}",
+            "-o", "StrictHostKeyChecking=accept-new",
+            "-p", str(self.port),
+            destination,
+            f"cat /sys/class/net/{self.interface}/address",
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL)
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        return Mac.normalize(stdout.decode("utf-8", errors="replace"))
+
+    async def _collect(self, result, timeout):
+        """
+        Finds the MAC address of the host and records how it was found
+        """
+        start = time.monotonic()
+        try:
+            if not result["ip"] and self.mdns:
+                result["ip"] = await MulticastDNS.resolve(f"{result['host']}.local",
+                                                          timeout=timeout)
+            if not result["ip"]:
+                result["error"] = "unknown address"
+                return
+            mac = await self.neighbor(result["ip"], timeout)
+            method = "arp"
+            if mac is None:
+                remaining = timeout - (time.monotonic() - start)
+                mac = await self.ssh(result["ip"], remaining)
+                method = "ssh"
+            if mac is None:
+                result["error"] = "not found"
+                return
+            result["mac"] = mac
+            result["method"] = method
+        except asyncio.TimeoutError:
+            result["error"] = "timeout"
+        except OSError as e:
+            result["error"] = str(e)
+        finally:
+            result["time"] = round(time.monotonic() - start, 2)
+
+    async def _run(self, timeout, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def collect(result):
+            async with semaphore:
+                try:
+                    await asyncio.wait_for(self._collect(result, timeout), timeout)
+                except asyncio.TimeoutError:
+                    result["error"] = "timeout"
+
+        await asyncio.gather(*[collect(result) for result in self.results.values()])
+
+    def run(self, timeout=10.0, concurrency=64):
+        """
+        Collects the MAC addresses of all hosts
+
+        :param timeout: the time in seconds after which the search for the
+                        MAC address of a host stops
+        :type timeout: float
+        :param concurrency: the maximal number of hosts that are queried at
+                            the same time
+        :type concurrency: int
+        :return: the ip, MAC address, method, time in seconds and error of
+                 each host
+        :rtype: dict
+        """
+        asyncio.run(self._run(timeout, concurrency))
+        return self.results
+
+    def missing(self):
+        """
+        Returns the hosts for which no MAC address was found
+
+        :rtype: list
+        """
+        return [result for result in self.results.values() if result["mac"] is None]
+
+    def table(self):
+        """
+        Returns the table of the results
+
+        :rtype: str
+        """
+        rows = {name: {
+            "host": name,
+            "ip": result["ip"] or "",
+            "mac": result["mac"] or "",
+            "method": result["method"] or "",
+            "time": "" if result["time"] is None else f"{result['time']} s",
+            "error": result["error"]
+        } for name, result in self.results.items()}
+        return Printer.write(rows,
+                             order=["host", "ip", "mac", "method", "time", "error"],
+                             header=["Host", "IP", "MAC", "Method", "Time", "Error"])
+
+    def write(self, inventory):
+        """
+        Writes the MAC addresses that were found into the inventory and
+        saves it once
+
+        :param inventory: the inventory
+        :type inventory: Inventory
+        :return: the number of hosts that were updated
+        :rtype: int
+        """
+        updated = 0
+        for name, result in self.results.items():
+            if result["mac"] is None or name not in inventory.data:
+                continue
+            inventory.set(name, "mac", result["mac"])
+            if result["ip"] and not inventory.data[name].get("ip"):
+                inventory.set(name, "ip", result["ip"])
+            updated += 1
+        if updated:
+            inventory.save()
+            Console.ok(f"Wrote {updated} MAC addresses to {inventory.filename}")
+        return updated
@@ -0,0 +1,103 @@
+"""
+Reads the MBR partition table of an SD Card or an image.
+
+The Raspberry OS and Ubuntu images use an MBR (DOS) partition table with a
+FAT boot partition as first and an ext4 root partition as second partition.
+
+Example:
+
+    partitions = MBR.read("/dev/sdb")
+    boot = partitions[0]
+    print(boot["offset"], boot["size"])
+"""
+import struct
+
+from cloudmesh.burn.blockdevice import BlockDevice
+
+SECTOR_SIZE = 512
+
+
+class MBR(object):
+
+    @staticmethod
+    def _open(device):
+        if isinstance(device, BlockDevice):
+            return device, False
+        return BlockDevice(device), True
+
+    @staticmethod
+    def read(device):
+        """
+        Reads the primary partitions from the partition table
+
+        :param device: the device or image, e.g. /dev/sdb
+        :type device: str or BlockDevice
+        :return: the partitions with the attributes number, type, bootable,
+                 start and sectors in sectors and offset and size in bytes.
+                 Unused entries are not included.
+        :rtype: list
+        """
+        device, close = MBR._open(device)
+        try:
+            sector = device.read(0, SECTOR_SIZE)
+        finally:
+            if close:
+                device.close()
+
+        if len(sector) < SECTOR_SIZE or sector[510:512] != b"\x55\xaa":
+            raise ValueError("no MBR partition table found")
+
+        partitions = []
+        for i in range(4):
+            entry = sector[446 + 16 * i:446 + 16 * (i + 1)]
+            kind = entry[4]
+            start, sectors = struct.unpack_from("<II", entry, 8)
+            if kind == 0 or sectors == 0:
+                continue
+            if kind == 0xEE:
+                raise ValueError("GPT partition tables are not supported")
+            partitions.append({
+                "number": i + 1,
+                "type": kind,
+                "bootable": entry[0] == 0x80,
+                "start": start,
+                "sectors": sectors,
+                "offset": start * SECTOR_SIZE,
+                "size": sectors * SECTOR_SIZE
+            })
+        return partitions
+
+    @staticmethod
+    def partition(device, number=1):
+        """
+        Returns the partition with the given number
+
+        :param device: the device or image, e.g. /dev/sdb
+        :type device: str or BlockDevice
+        :param number: the number of the partition starting with 1
+        :type number: int
+        :return: the partition
+        :rtype: dict
+        """
+        for entry in MBR.read(device):
+            if entry["number"] == number:
+                return entry
+        raise ValueError(f"partition {number} not found")
+
+    @staticmethod
+    def disk_id(device):
+        """
+        Returns the disk identifier that is used in PARTUUID, e.g. 9730496b
+
+        :param device: the device or image, e.g. /dev/sdb
+        :type device: str or BlockDevice
+        :return: the disk identifier as hex string
+        :rtype: str
+        """
+        device, close = MBR._open(device)
+        try:
+            sector = device.read(0, SECTOR_SIZE)
+        finally:
+            if close:
+                device.close()
+        return f"{struct.unpack_from('<I', sector, 440)[0]:08x}"
@@ -1,82 +1,248 @@
-import json
+"""
+Finds the hosts on the local network.
+
+The hosts are probed concurrently with asyncio. A host is up if it accepts
+or refuses a TCP connection to the ssh port. Hosts that do not answer,
+e.g. because of a firewall, are found in the ARP cache of the local
+machine, which is filled by the connection attempts. A /24 network is
+scanned in about the time of the timeout, nmap is not needed.
+
+Example:
+
+    details = Network.nmap(ip="192.168.1.0/24")
+    print([host["ip"] for host in details])
+"""
+import asyncio
+import ipaddress
+import os
+import re
+import shutil
 import socket
 import subprocess
+import threading
+import time
+
+from cloudmesh.burn.interfaces import Interfaces
+
+ARP_CACHE = "/proc/net/arp"
 
 
-# TODO: there seems to be some overlap with hardware.py and some functions in
-#       hardware introduced that are not used here such as getfqdn and hostname.
-#       Should it be removed form hardware, or should this be changed here to
-#       use the methods from hardware?
-#
 # TODO: get method is not implemented
 
 class Network:
 
-    # noinspection PyBroadException,PyBroadException
     @staticmethod
     def address():
-        hostname = socket.gethostname()
-        full = socket.getfqdn()
+        """
+        Returns the IPv4 addresses of the interfaces that have a broadcast
+        address, i.e. without the loopback interface
 
-        # ipv4
+        :return: the addresses with the attributes of ip -json a, e.g.
+                 ifname, local, prefixlen and broadcast, and the hostname,
+                 the fullname and the ip of the hostname
+        :rtype: list
+        """
+        host = Interfaces.host()
         result = []
+        for address in Interfaces.addresses():
+            if address['ifname'] in ['lo'] or 'broadcast' not in address:
+                continue
+            element = {
+                'ip': host['ip'],
+                'hostname': host['hostname'],
+                'ifname': address['ifname'],
+                'fullname': host['fqdn'],
+                'ipbyname': host['ip'],
+            }
+            element.update(address)
+            result.append(element)
+        return result
+
+    @staticmethod
+    def hosts(ip=None):
+        """
+        Returns the addresses of the network of the ip
+
+        :param ip: an address with an optional prefix length, e.g.
+                   192.168.1.12 or 10.1.0.0/22. Without a prefix length
+                   the /24 of the address is used. By default the /24 of
+                   the first local interface, even if its network is
+                   larger, as each address is probed.
+        :type ip: str
+        :return: the addresses without the network and broadcast address
+        :rtype: list
+        """
+        if ip is None:
+            addresses = Network.address()
+            if not addresses:
+                raise ValueError("no network interface with an IPv4 address found")
+            ip = addresses[0]['local']
+        if "/" not in ip:
+            ip = f"{ip}/24"
+        network = ipaddress.ip_network(ip, strict=False)
+        return [str(host) for host in network.hosts()]
+
+    @staticmethod
+    def arp(content=None):
+        """
+        Returns the complete entries of the ARP cache of the local machine
+
+        :param content: the content of /proc/net/arp or the output of
+                        arp -an, by default it is read from the system
+        :type content: str
+        :return: the MAC address of each ip
+        :rtype: dict
+        """
+        if content is None:
+            if os.path.exists(ARP_CACHE):
+                with open(ARP_CACHE) as f:
+                    content = f.read()
+            elif shutil.which("arp"):
+                content = subprocess.run(["arp", "-an"], capture_output=True, text=True).stdout
+            else:
+                return {}
+        cache = {}
+        for line in content.splitlines():
+            # Linux: IP address, HW type, Flags, HW address, Mask, Device
+            fields = line.split()
+            if len(fields) >= 4 and fields[2].startswith("0x"):
+                if int(fields[2], 16) & 0x2:
+                    cache[fields[0]] = fields[3].lower()
+                continue
+            # BSD and macOS: ? (192.168.1.1) at 0:11:22:33:44:55 on en0
+            found = re.search(r"\((\d+\.\d+\.\d+\.\d+)\) at ([0-9a-fA-F:]+)", line)
+            if found:
+                cache[found.group(1)] = found.group(2).lower()
+        return cache
+
+    @staticmethod
+    async def probe(ip, port=22, timeout=1.0):
+        """
+        Connects to the port of the host
+
+        :param ip: the address of the host
+        :type ip: str
+        :param port: the port
+        :type port: int
+        :param timeout: the time in seconds after which the host is down
+        :type timeout: float
+        :return: the status "open", "closed" if the host refused the
+                 connection or "down", and the latency in seconds
+        :rtype: tuple
+        """
+        start = time.perf_counter()
         try:
-            details = json.loads(subprocess.getoutput("ip -json a"))
-        except Exception as e:  # noqa: F841
-            details = None
-        for entry in details:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except ConnectionRefusedError:
+            return "closed", time.perf_counter() - start
+        except (OSError, asyncio.TimeoutError):
+            return "down", None
+        latency = time.perf_counter() - start
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return "open", latency
+
+    @staticmethod
+    async def _names(addresses, timeout):
+        """
+        Looks up the names of the addresses. The lookups run in daemon
+        threads, so lookups that do not finish in time are not waited for,
+        not even when the program exits.
+        """
+        loop = asyncio.get_running_loop()
+
+        def resolve(ip, future):
+            try:
+                name = socket.getnameinfo((ip, 0), socket.NI_NAMEREQD)[0]
+            except OSError:
+                name = "unknown"
             try:
-                addresses = entry['addr_info']
-                for n in addresses:
-                    if entry['ifname'] not in ['lo']:
-                        element = {
-                            'ip': socket.gethostbyname(hostname),
-                            'hostname': hostname,
-                            'ifname': entry['ifname'],
-                            'fullname': full,
-                            'ipbyname': socket.gethostbyname(hostname),
-
-                        }
-                        # print ("nnn", n)
-                        element.update(n)
-                        if 'broadcast' in n.keys():
-                            result.append(element)
-            except Exception as e:  # noqa: F841
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(name))
+            except RuntimeError:
+                # the loop is already closed
                 pass
-        return result
+
+        async def lookup(ip):
+            future = loop.create_future()
+            threading.Thread(target=resolve, args=(ip, future), daemon=True).start()
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return "unknown"
+
+        return await asyncio.gather(*[lookup(ip) for ip in addresses])
 
     @staticmethod
-    def nmap(ip=None):
-        if ip is None:
-            ip = Network.address()['ip']
-        mask = ip.rsplit(".", 1)[0]
-        command = f"nmap -sP {mask}.*"
-        print(command)
-        result = subprocess.getoutput(command)
-        result = result.replace("Nmap scan report for ", "")
-        result = result.replace("Host is ", "")
-        result = result.replace(" latency.", "")
-
-        result = result.splitlines()[1:]
+    async def _scan(hosts, port, timeout, concurrency, names):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def probe(ip):
+            async with semaphore:
+                return await Network.probe(ip, port=port, timeout=timeout)
+
+        results = await asyncio.gather(*[probe(ip) for ip in hosts])
+        cache = Network.arp()
         details = []
-        for i in range(0, int(len(result) / 2)):
-            position = 2 * i
-            a = result[position]
-            b = result[position + 1]
-            line = f"{a} {b}"
-            if "(" not in a:
-                line = f"unkown {a} {b}"
-
-            line = line.replace("(", "")
-            line = line.replace(")", "")
-
-            attributes = line.split()
+        for ip, (status, latency) in zip(hosts, results):
+            if status == "down" and ip not in cache:
+                continue
             details.append({
-                'name': attributes[0],
-                'ip': attributes[1],
-                'status': attributes[2],
-                'latency': attributes[3],
-                'line': line
+                'name': "unknown",
+                'ip': ip,
+                'status': "up",
+                'ssh': status == "open",
+                'latency': round(latency, 4) if latency is not None else None,
+                'mac': cache.get(ip, ""),
+                'method': "arp" if status == "down" else "tcp"
             })
-
+        if names and details:
+            found = await Network._names([entry['ip'] for entry in details], timeout)
+            for entry, name in zip(details, found):
+                entry['name'] = name
         return details
+
+    @staticmethod
+    def scan(hosts, port=22, timeout=1.0, concurrency=256, names=True):
+        """
+        Probes the hosts concurrently
+
+        :param hosts: the addresses of the hosts
+        :type hosts: list
+        :param port: the port that is probed
+        :type port: int
+        :param timeout: the time in seconds after which a host is down
+        :type timeout: float
+        :param concurrency: the number of hosts that are probed at the
+                            same time
+        :type concurrency: int
+        :param names: if True the names of the hosts are looked up
+        :type names: bool
+        :return: the hosts that are up with name, ip, status, ssh,
+                 latency in seconds, mac and the method, tcp or arp, that
+                 found the host
+        :rtype: list
+        """
+        return asyncio.run(Network._scan(list(hosts), port, timeout, concurrency, names))
+
+    @staticmethod
+    def nmap(ip=None, port=22, timeout=1.0, concurrency=256):
+        """
+        Finds the hosts that are up in the network of the ip. The name is
+        kept from the implementation that called nmap.
+
+        :param ip: an address with an optional prefix length, see hosts
+        :type ip: str
+        :param port: the port that is probed
+        :type port: int
+        :param timeout: the time in seconds after which a host is down
+        :type timeout: float
+        :param concurrency: the number of hosts that are probed at the
+                            same time
+        :type concurrency: int
+        :return: the hosts that are up, see scan
+        :rtype: list
+        """
+        return Network.scan(Network.hosts(ip), port=port, timeout=timeout, concurrency=concurrency)
@@ -0,0 +1,190 @@
+"""
+Burns a card in a background thread and reports its progress.
+
+A Worker runs the burn of one host on one device in a daemon thread. The
+progress of the burn is posted as events, at most a few times a second,
+so a GUI can show it without blocking its event loop. Several workers run
+at the same time on different devices. Progress measures the throughput
+over the last seconds and estimates the remaining time.
+
+Example:
+
+    def burn(name, device, progress):
+        ...
+        progress(written, total)
+        return True
+
+    Worker("red01", "/dev/sdb", burn, window.write_event_value).start()
+
+The events are the tuples ("progress", device) and ("done", device) with
+a dict as value.
+"""
+import threading
+import time
+
+from cloudmesh.burn.trace import Trace
+
+
+class Progress(object):
+
+    def __init__(self, total=0, window=5.0, clock=time.monotonic):
+        """
+        Creates the progress of a burn
+
+        :param total: the number of bytes to write
+        :type total: int
+        :param window: the time in seconds over which the throughput is
+                       measured
+        :type window: float
+        :param clock: the clock, e.g. for tests
+        :type clock: function
+        """
+        self.total = total
+        self.written = 0
+        self.window = window
+        self.clock = clock
+        self.start = clock()
+        self.samples = [(self.start, 0)]
+
+    def update(self, written, total=None):
+        """
+        Records the number of written bytes
+
+        :param written: the number of bytes written so far
+        :type written: int
+        :param total: the number of bytes to write if it changed
+        :type total: int
+        """
+        now = self.clock()
+        if total is not None:
+            self.total = total
+        self.written = written
+        self.samples.append((now, written))
+        # keep one sample older than the window as the start of the window
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.pop(0)
+
+    @property
+    def rate(self):
+        """
+        The throughput in bytes per second over the window
+
+        :rtype: float
+        """
+        (start, first), (end, last) = self.samples[0], self.samples[-1]
+        if end <= start:
+            return 0.0
+        return (last - first) / (end - start)
+
+    @property
+    def eta(self):
+        """
+        The estimated time in seconds until the burn is finished, None if
+        it is not known
+
+        :rtype: float
+        """
+        rate = self.rate
+        if not self.total or rate <= 0:
+            return None
+        return max(0.0, (self.total - self.written) / rate)
+
+    @property
+    def percent(self):
+        """
+        The written part of the total in percent
+
+        :rtype: int
+        """
+        if not self.total:
+            return 0
+        return min(100, int(100 * self.written / self.total))
+
+    def text(self):
+        """
+        Returns the throughput and the remaining time, e.g.
+        23.4 MB/s ETA 2:05
+
+        :rtype: str
+        """
+        text = f"{self.rate / 1000 ** 2:.1f} MB/s"
+        eta = self.eta
+        if eta is not None:
+            minutes, seconds = divmod(int(eta + 0.5), 60)
+            text += f" ETA {minutes}:{seconds:02d}"
+        return text
+
+    def details(self):
+        """
+        Returns the progress as dict with the written bytes, the total,
+        the size in MB, the percent, the rate, the eta and the text
+
+        :rtype: dict
+        """
+        return {
+            "written": self.written,
+            "total": self.total,
+            "size": f"{self.written / 1000 ** 2:.0f} of {self.total / 1000 ** 2:.0f} MB",
+            "percent": self.percent,
+            "rate": self.rate,
+            "eta": self.eta,
+            "text": self.text()
+        }
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, host, device, burn, post, interval=0.25):
+        """
+        Creates the worker that burns the card of the host
+
+        :param host: the host
+        :type host: str
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param burn: the function that burns the card. It is called with
+                     the host, the device and a progress function and
+                     returns True on success.
+        :type burn: function(str, str, function(int, int))
+        :param post: the function that posts an event and its value, e.g.
+                     window.write_event_value
+        :type post: function
+        :param interval: the minimal time in seconds between two progress
+                         events
+        :type interval: float
+        """
+        super().__init__(name=f"burn-{host}", daemon=True)
+        self.host = host
+        self.device = device
+        self.burn = burn
+        self.post = post
+        self.interval = interval
+        self.progress = Progress()
+
+    def run(self):
+        self.progress = Progress()
+        posted = 0.0
+
+        def progress(written, total):
+            nonlocal posted
+            self.progress.update(written, total)
+            now = time.monotonic()
+            if now - posted >= self.interval or written >= total:
+                posted = now
+                self.post(("progress", self.device),
+                          dict(self.progress.details(), host=self.host, device=self.device))
+
+        error = ""
+        try:
+            with Trace.span(f"burn {self.host}", host=self.host, device=self.device):
+                success = bool(self.burn(self.host, self.device, progress))
+        except Exception as e:
+            success = False
+            error = str(e)
+        self.post(("done", self.device), {
+            "host": self.host,
+            "device": self.device,
+            "success": success,
+            "error": error,
+            "time": round(time.monotonic() - self.progress.start, 1)
+        })
@@ -2,6 +2,7 @@ import textwrap
 import io
 import os
 
+from cloudmesh.burn.helper import Helper
 from cloudmesh.common.Shell import Shell
 from cloudmesh.common.util import readfile
 from cloudmesh.common.systeminfo import os_is_windows
@@ -62,7 +63,7 @@ class Cmdline:
         # """).splitlines()).strip()
         self.script = None
 
-    def update(self, filename, version="lite"):
+    def update(self, filename, version="lite", resize=True):
         """
         NEW:
         * [ ] TODO: test on windows
@@ -72,15 +73,35 @@ class Cmdline:
         filename: the filename to be changed on the sdkard reade.
             On windows you need the driveletter + "cmdline.txt"
         """
-        self.cmdline = readfile(filename).split(" ")
+        self.build(readfile(filename), version=version, resize=resize)
+
+        self.writefile(filename, self.script)
+
+    def build(self, content, version="lite", resize=True):
+        """
+        Creates the cmdline from the template for the root partition that is
+        used in the content of an existing cmdline.txt
+
+        :param content: the content of the existing cmdline.txt
+        :type content: str
+        :param version: the template, e.g. lite or full
+        :type version: str
+        :param resize: if False the root partition is not resized at first
+                       boot, as it already fills the card
+        :type resize: bool
+        :return: the new cmdline
+        :rtype: str
+        """
+        self.cmdline = content.split(" ")
 
         for partuuid in self.cmdline:
             if partuuid.startswith("root=PARTUUID="):
                 partuuid = partuuid.split("root=PARTUUID=")[1].strip()
                 break
         self.script = self.template[version].format(partuuid=partuuid)
-
-        self.writefile(filename, self.script)
+        if not resize:
+            self.script = self.script.replace("init=/usr/lib/raspi-config/init_resize.sh ", "")
+        return self.script
 
     def writefile(self, filename, content):
         """
@@ -120,7 +141,7 @@ class Cmdline:
         if os_is_windows():
             Shell.run(f'echo "{self.cmdline} {self.script}" | tee {filename}')
         else:
-            Shell.run(f'echo "{self.cmdline} {self.script}" | sudo tee {filename}')
+            Helper.write(filename, f"{self.cmdline} {self.script}\n")
 
     def get(self):
         """
@@ -1,9 +1,11 @@
+import functools
 import textwrap
 import os
 
-from cloudmesh.common.util import path_expand, readfile, writefile
+from cloudmesh.burn.helper import Helper
+from cloudmesh.burn.hosts import Hosts
+from cloudmesh.common.util import path_expand, readfile
 from cloudmesh.common.console import Console
-from cloudmesh.common.Shell import Shell
 from passlib.hash import sha256_crypt
 from cloudmesh.common.systeminfo import os_is_windows
 from passlib.hash import sha256_crypt
@@ -25,6 +27,7 @@ class Runfirst:
     """
 
     SCRIPT_NAME = 'firstrun.sh'
+    HOSTS_MARKER = '#ETC_HOSTS#'
 
     def __init__(self):
         self.key = None
@@ -36,6 +39,10 @@ class Runfirst:
         self.country = None
         self.script = None
         self.etc_hosts = None
+        self.hosts = None
+        self.shared_hosts = False
+        self.host_keys = None
+        self.customized = False
         self.static_ip_info = None
         self.password = None
         self.bridge = None
@@ -74,7 +81,7 @@ class Runfirst:
         #
         self.hostname = name
 
-    def set_hosts(self, names, ips):
+    def set_hosts(self, names=None, ips=None, hosts=None, shared=False):
         """
         Sets the /etc/hosts file information
 
@@ -82,10 +89,61 @@ class Runfirst:
         :type names: list
         :param ips: list of ips
         :type ips: list
+        :param hosts: the precomputed table of the cluster. If given, names
+                      and ips are ignored and the entry of this host is
+                      left out.
+        :type hosts: Hosts
+        :param shared: if true the table is not embedded in the script, but
+                       written as hosts file into the boot partition
+        :type shared: bool
         """
-        self.etc_hosts = dict(zip(names, ips))
+        if hosts is not None:
+            self.hosts = hosts
+            self.shared_hosts = shared
+        else:
+            self.etc_hosts = dict(zip(names, ips))
+
+    def set_customized(self, customized=True):
+        """
+        Marks the image as customized with Customize. The timezone,
+        keyboard and ssh settings are then already applied to the image
+        and are not applied at first boot.
+
+        :param customized: True if the image is customized
+        :type customized: bool
+        """
+        self.customized = customized
+
+    def set_host_keys(self, keys=None):
+        """
+        Sets the SSH host keys, so they are not generated at first boot
+
+        :param keys: the private and public key of each key type, e.g.
+                     {"ed25519": (private, public)}
+        :type keys: dict
+        """
+        self.host_keys = keys
 
-    def psk_encrypt(self, ssid, password):
+    def files(self):
+        """
+        Returns the files that need to be written into the boot partition,
+        the script and, if the hosts are shared, the hosts file. get() must
+        be called first.
+
+        :return: the file names and contents
+        :rtype: dict
+        """
+        if self.script is None:
+            raise Exception("no script found. Did you run .get() first?")
+        files = {Runfirst.SCRIPT_NAME: self.script}
+        if self.hosts is not None and self.shared_hosts:
+            files[Hosts.FILENAME] = self.hosts.content
+        return files
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def psk_encrypt(ssid, password):
+        # the derivation is slow and the same for all hosts, so it is cached
         value = pbkdf2.pbkdf2(str.encode(password), str.encode(ssid), 4096, 32)
         return binascii.hexlify(value).decode("utf-8")
 
@@ -241,12 +299,77 @@ class Runfirst:
         If self.etc_hosts is not None, then we must append the known hosts
         to /etc/hosts
         """
+        if self.hosts is not None:
+            if not len(self.hosts):
+                return ""
+            if self.shared_hosts:
+                return Hosts.command(self.hostname, f"/boot/{Hosts.FILENAME}")
+            content = self.hosts.render(exclude=self.hostname)
+            return f"cat >>/etc/hosts <<'HOSTSEOF'\n{content}HOSTSEOF"
         script = []
         if self.etc_hosts:
             for hostname, ip in self.etc_hosts.items():
                 script.append(f"echo {ip}\t{hostname} >> /etc/hosts")
         return '\n'.join(script)
 
+    def _get_host_keys_script(self):
+        """
+        If self.host_keys is not None, the host keys are written and the
+        service that generates them at first boot is disabled
+        """
+        if not self.host_keys:
+            return ""
+        script = ["rm -f /etc/ssh/ssh_host_*"]
+        for kind, (private, public) in self.host_keys.items():
+            filename = f"/etc/ssh/ssh_host_{kind}_key"
+            script.append(f"cat >{filename} <<'KEYEOF'\n{private}\nKEYEOF")
+            script.append(f"chmod 600 {filename}")
+            script.append(f"echo '{public}' >{filename}.pub")
+        script.append("systemctl disable regenerate_ssh_host_keys")
+        return '\n'.join(script)
+
+    def _get_ssh_backup_script(self):
+        """
+        Keeps a copy of the original sshd_config, unless the image is
+        customized
+        """
+        if self.customized:
+            return ""
+        return "cp /etc/ssh/sshd_config /etc/ssh/sshd_config.orig"
+
+    def _get_ssh_script(self):
+        """
+        Disables the password login and enables ssh, unless the image is
+        customized
+        """
+        if self.customized:
+            return ""
+        script = []
+        script.append("echo 'PasswordAuthentication no' >>/etc/ssh/sshd_config")
+        script.append("systemctl enable ssh")
+        return '\n'.join(script)
+
+    def _get_settings_script(self):
+        """
+        Sets the timezone and the keyboard and removes the setup wizard,
+        unless the image is customized
+        """
+        if self.customized:
+            return ""
+        script = f"""
+            rm -f /etc/xdg/autostart/piwiz.desktop
+            rm -f /etc/localtime
+            echo \\"{self.timezone}\\" >/etc/timezone
+            dpkg-reconfigure -f noninteractive tzdata
+            cat >/etc/default/keyboard <<KBEOF
+            XKBMODEL="pc105"
+            XKBLAYOUT="{self.country_lower}"
+            XKBVARIANT=""
+            XKBOPTIONS=""
+            KBEOF
+            dpkg-reconfigure -f noninteractive keyboard-configuration"""
+        return dedent(script)
+
     def _get_wifi_config(self, encrypted=True):
         # we assume the password is encrypted so the password has no " "
         # if encrypted is set to false the password will be e,bedded in " "
@@ -301,18 +424,15 @@ class Runfirst:
         if self.script is None:
             raise Exception("no script found. Did you run .get() first?")
 
-        tmp_location = path_expand('~/.cloudmesh/cmburn/firstrun.sh.tmp')
         if os_is_windows():
             filename = path_expand(filename)
             # WindowsSDCard.writefile(tmp_location, self.script, sync=True)
             # Shell.run(f'cat {tmp_location} | tee {filename}')
             # os.system(f'cp {tmp_location} {filename}')
             WindowsSDCard.writefile(filename, self.script, sync=True)
+            os.system(f"chmod a+x {filename}")
         else:
-            writefile(tmp_location, self.script)
-            Shell.run(f'cat {tmp_location} | sudo tee {filename}')
-            os.system("rm -f {tmp_location}")
-        os.system(f"chmod a+x {filename}")
+            Helper.write(filename, self.script, mode=0o755)
 
     def get(self, verbose=False):
         # NEEDS TO BE INDENTED THIS WAY
@@ -324,34 +444,26 @@ set +e
 CURRENT_HOSTNAME=`cat /etc/hostname | tr -d " \\t\\n\\r"`
 echo {self.hostname} >/etc/hostname
 sed -i "s/127.0.1.1.*$CURRENT_HOSTNAME/127.0.1.1\\t{self.hostname}/g" /etc/hosts
-{self._get_etc_hosts_script()}
+{Runfirst.HOSTS_MARKER}
 {self._get_static_ip_script()}
 FIRSTUSER=`getent passwd 1000 | cut -d: -f1`
 FIRSTUSERHOME=`getent passwd 1000 | cut -d: -f6`
 install -o "$FIRSTUSER" -m 700 -d "$FIRSTUSERHOME/.ssh"
 install -o "$FIRSTUSER" -m 600 <(echo "{self.key}") "$FIRSTUSERHOME/.ssh/authorized_keys"
-cp /etc/ssh/sshd_config /etc/ssh/sshd_config.orig
-echo 'PasswordAuthentication no' >>/etc/ssh/sshd_config
-systemctl enable ssh
+{self._get_ssh_backup_script()}
+{self._get_host_keys_script()}
+{self._get_ssh_script()}
 {self._get_password_script()}
 {self._get_wifi_config()}
 {self._get_bridge_script_nftables()}
-rm -f /etc/xdg/autostart/piwiz.desktop
-rm -f /etc/localtime
-echo \\"{self.timezone}\\" >/etc/timezone
-dpkg-reconfigure -f noninteractive tzdata
-cat >/etc/default/keyboard <<KBEOF
-XKBMODEL="pc105"
-XKBLAYOUT="{self.country_lower}"
-XKBVARIANT=""
-XKBOPTIONS=""
-KBEOF
-dpkg-reconfigure -f noninteractive keyboard-configuration
+{self._get_settings_script()}
 rm -f /boot/{Runfirst.SCRIPT_NAME}
 sed -i 's| systemd.run.*||g' /boot/cmdline.txt
 exit 0
 #
 ''')
+        # the hosts table can be large, so it is inserted after dedent
+        self.script = self.script.replace(Runfirst.HOSTS_MARKER, self._get_etc_hosts_script(), 1)
         self.script = self.script.strip().splitlines()
         self.script = "\n".join(self.script) + "\n"
 
@@ -0,0 +1,194 @@
+"""
+A bundle of the rendered configuration files of the hosts of an inventory.
+
+The files of all hosts, e.g. firstrun.sh or user-data and network-config,
+are rendered before the cards are burned, so burning a card only copies
+the prepared bytes. Each host is stored with the digest of the inputs it
+was rendered from. Rendering again only renders the hosts whose inputs
+changed. If the bundle has a directory, it is kept on disk:
+
+    <directory>/manifest.yaml
+    <directory>/<host>/<file>
+
+The manifest lists for each host the digest of the inputs and the sha256
+of each file. The files of a host that contain private keys, e.g. the SSH
+host keys or the key of the Ubuntu manager, are only kept in memory and
+never written to the directory. Such a host is rendered again with new
+keys when it is burned.
+
+Example:
+
+    bundle = Bundle("~/.cloudmesh/cmburn/bundles/red")
+    if not bundle.current("red01", Bundle.digest(inputs)):
+        bundle.store("red01", Bundle.digest(inputs), {"firstrun.sh": script})
+    bundle.save()
+    files = bundle.load("red01")
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import yaml
+
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+
+
+class Bundle(object):
+
+    MANIFEST = "manifest.yaml"
+
+    def __init__(self, directory=None):
+        """
+        Opens the bundle
+
+        :param directory: the directory of the bundle. If None the bundle
+                          is only kept in memory.
+        :type directory: str
+        """
+        self.directory = path_expand(directory) if directory else None
+        self.manifest = {}
+        self.files = {}
+        self.rendered = []
+        if self.directory:
+            filename = os.path.join(self.directory, Bundle.MANIFEST)
+            if os.path.exists(filename):
+                with open(filename) as f:
+                    self.manifest = yaml.safe_load(f) or {}
+
+    def __contains__(self, name):
+        return name in self.manifest
+
+    @staticmethod
+    def digest(inputs):
+        """
+        Returns the digest of the inputs a host is rendered from
+
+        :param inputs: the inputs, e.g. the inventory entry and the options
+        :type inputs: dict
+        :return: the sha256 of the inputs
+        :rtype: str
+        """
+        data = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def sha256(content):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return hashlib.sha256(content).hexdigest()
+
+    def _path(self, name, filename=None):
+        if filename is None:
+            return os.path.join(self.directory, name)
+        return os.path.join(self.directory, name, filename)
+
+    def current(self, name, digest):
+        """
+        Checks if the host was rendered from the inputs with the digest and
+        its files are unchanged
+
+        :param name: the host
+        :type name: str
+        :param digest: the digest of the inputs
+        :type digest: str
+        :rtype: bool
+        """
+        entry = self.manifest.get(name)
+        if entry is None or entry["input"] != digest:
+            return False
+        if self.directory is None or entry.get("secret"):
+            return name in self.files
+        for filename, sha in entry["files"].items():
+            path = self._path(name, filename)
+            if not os.path.exists(path):
+                return False
+            with open(path, "rb") as f:
+                if Bundle.sha256(f.read()) != sha:
+                    return False
+        return True
+
+    def store(self, name, digest, files, secret=False):
+        """
+        Stores the rendered files of the host
+
+        :param name: the host
+        :type name: str
+        :param digest: the digest of the inputs the files are rendered from
+        :type digest: str
+        :param files: the file names and contents
+        :type files: dict
+        :param secret: if True the files contain private keys and are only
+                       kept in memory
+        :type secret: bool
+        """
+        self.manifest[name] = {
+            "input": digest,
+            "files": {filename: Bundle.sha256(content) for filename, content in files.items()}
+        }
+        self.rendered.append(name)
+        if self.directory is None or secret:
+            self.files[name] = dict(files)
+        if self.directory is None:
+            return
+        directory = self._path(name)
+        if secret:
+            self.manifest[name]["secret"] = True
+            # remove the files of an earlier render without private keys
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        for filename in os.listdir(directory):
+            if filename not in files:
+                os.remove(os.path.join(directory, filename))
+        for filename, content in files.items():
+            path = self._path(name, filename)
+            # the files contain keys and password hashes
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(content.encode("utf-8") if isinstance(content, str) else content)
+
+    def load(self, name):
+        """
+        Returns the rendered files of the host
+
+        :param name: the host
+        :type name: str
+        :return: the file names and contents
+        :rtype: dict
+        """
+        if name not in self.manifest:
+            raise ValueError(f"{name} is not rendered")
+        if self.directory is None or self.manifest[name].get("secret"):
+            return dict(self.files[name])
+        files = {}
+        for filename, sha in self.manifest[name]["files"].items():
+            with open(self._path(name, filename), "rb") as f:
+                content = f.read()
+            if Bundle.sha256(content) != sha:
+                raise ValueError(f"{filename} of {name} was modified after rendering")
+            files[filename] = content.decode("utf-8")
+        return files
+
+    def save(self):
+        """
+        Writes the manifest
+        """
+        if self.directory is None:
+            return
+        manifest = {name: entry for name, entry in self.manifest.items() if not entry.get("secret")}
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        with open(os.path.join(self.directory, Bundle.MANIFEST), "w") as f:
+            yaml.safe_dump(manifest, f, default_flow_style=False)
+
+    def info(self):
+        """
+        Prints how many hosts were rendered
+        """
+        unchanged = len(self.manifest) - len(self.rendered)
+        Console.info(f"Rendered {len(self.rendered)} host(s), {unchanged} unchanged")
+        secret = [name for name, entry in self.manifest.items() if entry.get("secret")]
+        if self.directory and secret:
+            Console.info(f"The files of {', '.join(secret)} contain private keys and are "
+                         f"not written to {self.directory}, they are rendered again when burned")
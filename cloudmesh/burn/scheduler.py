@@ -0,0 +1,180 @@
+"""
+Burns the cards of a cluster on several devices in parallel.
+
+The hosts are distributed across the devices with one worker per device.
+Each worker takes the next host from the queue as soon as its device is
+free, asks for the card of the host, or detects when a new card is
+inserted, and burns it. With a reader that has 4 slots, 4 cards are
+burned at the same time.
+
+Example:
+
+    scheduler = Scheduler(devices=["/dev/sdb", "/dev/sdc"])
+    results = scheduler.run(["red", "red01", "red02"], burn)
+    Scheduler.print(results)
+
+where burn(name, device, progress) burns the card for name on the device
+and returns True on success.
+"""
+import os
+import queue
+import threading
+import time
+
+from tqdm import tqdm
+
+from cloudmesh.burn.trace import Trace
+from cloudmesh.common.StopWatch import StopWatch
+from cloudmesh.common.Tabulate import Printer
+from cloudmesh.common.console import Console
+from cloudmesh.common.systeminfo import os_is_linux
+from cloudmesh.common.systeminfo import os_is_pi
+from cloudmesh.common.util import yn_choice
+
+
+class Scheduler(object):
+
+    def __init__(self, devices=None, auto=False, interval=1.0):
+        """
+        Creates the scheduler
+
+        :param devices: the devices, e.g. ["/dev/sdb", "/dev/sdc"]
+        :type devices: list
+        :param auto: if True the insertion of a card is detected, otherwise
+                     the user is asked for each card
+        :type auto: bool
+        :param interval: the interval in seconds in which the devices are
+                         checked for a card
+        :type interval: float
+        """
+        self.devices = list(devices or [])
+        self.auto = auto and (os_is_linux() or os_is_pi())
+        self.interval = interval
+        # prompts of the workers are asked one after the other
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def size(device):
+        """
+        Returns the size of the card in the device in bytes, 0 if the
+        device has no card
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :return: the size
+        :rtype: int
+        """
+        name = os.path.basename(os.path.realpath(device))
+        try:
+            with open(f"/sys/block/{name}/size") as f:
+                return int(f.read().strip()) * 512
+        except (OSError, ValueError):
+            return 0
+
+    def wait(self, name, device, first=True):
+        """
+        Waits until the card for the host is inserted into the device
+
+        :param name: the host
+        :type name: str
+        :param device: the device
+        :type device: str
+        :param first: True if this is the first card of the device. If a
+                      card is already inserted it is used.
+        :type first: bool
+        :return: True if the card is inserted, False if the user stops
+        :rtype: bool
+        """
+        if not self.auto:
+            with self.lock:
+                return yn_choice(f'Is the card to be burned for {name} inserted in {device}?')
+
+        if not first:
+            Console.info(f"Please remove the card from {device}")
+            while self.size(device) > 0:
+                time.sleep(self.interval)
+        if self.size(device) == 0:
+            Console.info(f"Please insert the card for {name} into {device}")
+            while self.size(device) == 0:
+                time.sleep(self.interval)
+            # give the kernel time to read the partition table
+            time.sleep(self.interval)
+        return True
+
+    def run(self, names, burn):
+        """
+        Burns the cards for the hosts
+
+        :param names: the hosts
+        :type names: list
+        :param burn: the function that burns the card for the host on the
+                     device. It is called with the name, the device and a
+                     progress function and returns True on success.
+        :type burn: function(str, str, function(int, int))
+        :return: the host, device, time and outcome of each card in the
+                 order of the names
+        :rtype: list
+        """
+        jobs = queue.Queue()
+        for name in names:
+            jobs.put(name)
+        results = {}
+
+        def worker(slot, device):
+            first = True
+            while True:
+                try:
+                    name = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                result = {"host": name, "device": device, "time": "", "outcome": "skipped"}
+                results[name] = result
+                if not self.wait(name, device, first=first):
+                    Console.warning(f"Stopped burning on {device}")
+                    return
+                first = False
+
+                bar = tqdm(total=0, unit="B", unit_scale=True, ncols=80,
+                           position=slot, desc=f"{name} {device}", leave=True)
+
+                def progress(written, total):
+                    bar.total = total
+                    bar.update(written - bar.n)
+
+                timer = f"burn {name}"
+                StopWatch.start(timer)
+                try:
+                    with Trace.span(f"burn {name}", host=name, device=device):
+                        success = burn(name, device, progress)
+                    result["outcome"] = "ok" if success else "failed"
+                except Exception as e:
+                    Console.error(f"Burning {name} on {device} failed: {e}")
+                    result["outcome"] = "failed"
+                StopWatch.stop(timer)
+                bar.close()
+                result["time"] = f"{StopWatch.get(timer)} s"
+                os.system('tput bel')  # ring the terminal bell to notify user
+
+        threads = [threading.Thread(target=worker, args=(slot, device), daemon=True)
+                   for slot, device in enumerate(self.devices)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return [results.get(name, {"host": name, "device": "", "time": "", "outcome": "skipped"})
+                for name in names]
+
+    @staticmethod
+    def print(results):
+        """
+        Prints the summary of the burned cards
+
+        :param results: the results of run
+        :type results: list
+        """
+        print(Printer.write(
+            results,
+            order=["host", "device", "time", "outcome"],
+            header=["Host", "Device", "Time", "Outcome"]
+        ))
@@ -1,13 +1,23 @@
 import os
 import pprint
+import subprocess
 import sys
 import textwrap
 import time
 
 import humanize
 import oyaml as yaml
-
+from tqdm import tqdm
+
+from cloudmesh.burn.backup import Backup
+from cloudmesh.burn.blockdevice import MemoryDevice
+from cloudmesh.burn.chunkstore import ChunkStore
+from cloudmesh.burn.expand import Expand
+from cloudmesh.burn.fat32 import Fat32
+from cloudmesh.burn.helper import Helper
 from cloudmesh.burn.image import Image
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.trace import Trace
 from cloudmesh.burn.usb import USB
 from cloudmesh.common.systeminfo import os_is_linux
 from cloudmesh.common.systeminfo import os_is_mac
@@ -41,7 +51,51 @@ def _execute(msg, command):
         # but ignore error
 
 
-def location(host_os=None, card_os="raspberry", volume="boot", drive=None):
+def device_id(device):
+    """
+    Returns a stable name for the device that can be used as part of a path.
+    On Linux the name of the device in /dev/disk/by-id is used, so that the
+    name identifies the slot of the reader and does not change if the kernel
+    assigns a different device name. If no such name exists the base name of
+    the device is used, e.g. sdb.
+
+    :param device: the device, e.g. /dev/sdb
+    :type device: str
+    :return: the name of the device
+    :rtype: str
+    """
+    real = os.path.realpath(device)
+    by_id = "/dev/disk/by-id"
+    try:
+        for name in sorted(os.listdir(by_id)):
+            if "-part" in name:
+                continue
+            if os.path.realpath(os.path.join(by_id, name)) == real:
+                return name
+    except OSError:
+        pass
+    return os.path.basename(real)
+
+
+def partition(device, number):
+    """
+    Returns the name of the partition on the device. Devices whose name ends
+    with a digit, such as /dev/mmcblk0, /dev/nvme0n1 or /dev/loop0, use a p
+    before the partition number.
+
+    :param device: the device, e.g. /dev/sdb
+    :type device: str
+    :param number: the number of the partition
+    :type number: int
+    :return: the partition, e.g. /dev/sdb1 or /dev/mmcblk0p1
+    :rtype: str
+    """
+    if device[-1].isdigit():
+        return f"{device}p{number}"
+    return f"{device}{number}"
+
+
+def location(host_os=None, card_os="raspberry", volume="boot", drive=None, device=None):
     """
     Returns the location of the specific volume after mounting
 
@@ -55,6 +109,11 @@ def location(host_os=None, card_os="raspberry", volume="boot", drive=None):
     @type card_os: str
     @param drive: the drive letter in windows, only used for windows
     @type drive: str
+    @param device: if specified on Linux and the PI the volume is located in
+                   a directory named after the device, so that several
+                   cards can be mounted at the same time, e.g.
+                   /media/{user}/usb-Generic_Reader-0:1/boot
+    @type device: str
     @return:
     @rtype:
     """
@@ -107,15 +166,18 @@ def location(host_os=None, card_os="raspberry", volume="boot", drive=None):
                 boot: /{drive}/system-boot
             """))
     try:
-        return where[host_os][card_os][volume]
+        path = where[host_os][card_os][volume]
     except Exception as e:
         print(e)
         return "os_undefined_in_location"
+    if device is not None and host_os in ["raspberry", "ubuntu"]:
+        path = os.path.join(os.path.dirname(path), device_id(device), os.path.basename(path))
+    return path
 
 
 class SDCard:
 
-    def __init__(self, card_os=None, host_os=None):
+    def __init__(self, card_os=None, host_os=None, device=None):
         """
         Creates mount point strings based on OS and the host where it is executed
 
@@ -123,9 +185,15 @@ class SDCard:
         :type card_os: str
         :param host_os: the host on which we execute the command
         :type host_os: possible values: raspberry, macos, linux
+        :param device: if specified the card is bound to the device and the
+                       volumes are mounted on mount points specific to the
+                       device. This allows to configure several cards at
+                       the same time.
+        :type device: str
         """
         self.card_os = card_os or "raspberry"
         self.host_os = host_os or get_platform()
+        self.device = device
         self.drive = None
         self.volume = None
         self.devName = None
@@ -180,7 +248,7 @@ class SDCard:
         if os_is_windows():
             return location(volume="root", card_os=self.card_os, host_os=self.host_os, drive=self.drive)
         else:
-            return location(volume="root", card_os=self.card_os, host_os=self.host_os)
+            return location(volume="root", card_os=self.card_os, host_os=self.host_os, device=self.device)
 
     # Works when drive is set
     @property
@@ -195,7 +263,7 @@ class SDCard:
         if os_is_windows():
             return location(volume="boot", card_os=self.card_os, host_os=self.host_os, drive=self.drive)
         else:
-            return location(volume="boot", card_os=self.card_os, host_os=self.host_os)
+            return location(volume="boot", card_os=self.card_os, host_os=self.host_os, device=self.device)
 
     # Unsure of how to list the filesystems on the SDCard on windows
     def ls(self):
@@ -259,8 +327,6 @@ class SDCard:
             return content
 
         else:
-            Sudo.execute("sync")
-
             if os_is_mac():
                 if decode:
                     mode = "r"
@@ -268,16 +334,13 @@ class SDCard:
                     mode = "rb"
                 content = common_readfile(filename, mode=mode)
             else:
-                Sudo.password()
-                result = Sudo.execute(f"cat {filename}", decode=decode)
-                content = result.stdout
+                content = Helper.read(filename, decode=decode)
 
             if trim:
                 content = content.rstrip()
 
             if split:
                 content = content.splitlines()
-            Sudo.execute("sync")
 
         return content
 
@@ -333,14 +396,12 @@ class SDCard:
             # we had some issues on linux and osx and the trick with the pipe worked ...
             # please implement
         else:
-            os.system("sync")
             if append:
-                content = Sudo.readfile(filename, split=False, decode=True) + content
-            command = f"echo '{content}' | sudo cp /dev/stdin {filename}"
-            if os_is_mac() and "\0" in command:
-                command = command.replace("\0", "")
-            os.system(command)
-            os.system("sync")
+                content = Helper.read(filename) + content
+            data = content + "\n"
+            if os_is_mac():
+                data = data.replace("\0", "")
+            Helper.write(filename, data)
 
         return content
 
@@ -369,12 +430,13 @@ class SDCard:
         elif os_is_linux():
             try:
                 result = Shell.run(f"sudo blockdev --getsize64 {device}").strip()
-                result = int(result)
+                size = int(result)
             except Exception as e:  # noqa: F841
                 Console.error(f"Could not determine size of the device {device}")
                 sys.exit()
         return size
 
+    @Trace.traced("format", "device")
     def format_device(self,
                       device='dev/sdX',
                       unmount=True,
@@ -417,8 +479,8 @@ class SDCard:
                 for line in result.splitlines():
                     line = line.split()
                     if device_basename in line[0] and len(line) > 6:
-                        Console.ok(f'sudo umount {line[6]}')
-                        os.system(f'sudo umount {line[6]}')
+                        Console.ok(f'umount {line[6]}')
+                        Helper.umount(line[6])
                 return True
             else:
                 Console.error("SD Card not detected. Please reinsert "
@@ -496,11 +558,10 @@ class SDCard:
                 for line in script:
                     _execute(line, line)
 
-                os.system("sudo sync")
+                Helper.sync()
                 if unmount:
                     self.unmount(device=device)  # without dev we unmount but do not eject. If
                     # we completely eject, burn will fail to detect the device.
-                    os.system("sudo sync")
 
                 Console.ok("Formatted SD Card")
 
@@ -566,6 +627,7 @@ class SDCard:
             return "unkown"
 
     # TODO Gregor verify the default arg for card_os is ok
+    @Trace.traced("mount", "device")
     def mount(self, volume=None, device=None, card_os="raspberry"):
         """
         Mounts the current SD card
@@ -594,6 +656,9 @@ class SDCard:
                     #       'Size', 'Status', 'Info', "dev"]
                 ))
 
+        elif self.device is not None and (os_is_linux() or os_is_pi()):
+            self.mount_partitions(device=device or self.device)
+
         elif os_is_linux():
             Sudo.password()
             dmesg = USB.get_from_dmesg()
@@ -607,9 +672,8 @@ class SDCard:
                 print(f"Mounting filesystems on {dev}")
                 try:
                     Console.ok(f"mounting {device}")
-                    os.system('sudo sync')  # flush any pending/in-process writes
+                    Helper.sync()  # flush any pending/in-process writes
                     os.system(f"sudo eject -t {device}")
-                    os.system('sudo sync')  # flush any pending/in-process writes
 
                     # ensure the card is mounted before returning
                     device_basename = os.path.basename(device)
@@ -648,7 +712,7 @@ class SDCard:
             # TODO Need a better way to identify which sd card to use for mounting
             # instead of iterating over all of them
 
-            os.system('sudo sync')  # flush any pending/in-process writes
+            Helper.sync()  # flush any pending/in-process writes
 
             for usbcard in dmesg:
 
@@ -659,15 +723,13 @@ class SDCard:
                 try:
                     if os.path.exists(sd1):
                         Console.ok(f"mounting {sd1} {self.boot_volume}")
-                        os.system(f"sudo mkdir -p {self.boot_volume}")
-                        os.system(f"sudo mount -t vfat {sd1} {self.boot_volume}")
+                        Helper.mount(sd1, self.boot_volume, fstype="vfat")
                 except Exception as e:
                     print(e)
                 try:
                     if os.path.exists(sd2):
                         Console.ok(f"mounting {sd2} {self.root_volume}")
-                        os.system(f"sudo mkdir -p {self.root_volume}")
-                        os.system(f"sudo mount -t ext4 {sd2} {self.root_volume}")
+                        Helper.mount(sd2, self.root_volume, fstype="ext4")
                 except Exception as e:
                     print(e)
 
@@ -683,9 +745,43 @@ class SDCard:
         if os_is_windows():
             pass
         else:
-            Sudo.execute("sync")
+            Helper.sync()
         return ""
 
+    @windows_not_supported
+    def mount_partitions(self, device=None):
+        """
+        Mounts the boot and root partition of the device on the mount points
+        of this card. The mount points are derived from the device, so cards
+        in different slots do not conflict with each other.
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :return: True if both partitions are mounted
+        :rtype: bool
+        """
+        device = device or self.device
+        Sudo.password()
+        os.system(f"sudo eject -t {device}")
+
+        boot = partition(device, 1)
+        root = partition(device, 2)
+
+        # wait till the kernel has read the partition table
+        for i in range(20):
+            if os.path.exists(boot) and os.path.exists(root):
+                break
+            time.sleep(0.5)
+
+        Console.ok(f"mounting {boot} {self.boot_volume}")
+        success = Helper.mount(boot, self.boot_volume, fstype="vfat")
+        Console.ok(f"mounting {root} {self.root_volume}")
+        success = Helper.mount(root, self.root_volume, fstype="ext4") and success
+        if not success:
+            Console.error(f"card in {device} failed to mount both partitions")
+        return success
+
+    @Trace.traced("unmount", "device")
     def unmount(self, device=None, card_os="raspberry", full=False):
         """
         Unmounts the current SD card. param full indicates whether to use -t flag
@@ -708,10 +804,27 @@ class SDCard:
 
         else:
 
-            os.system('sudo sync')  # flush any pending/in-process writes
+            Helper.sync()  # flush any pending/in-process writes
 
-            os.system("sync")
-            if os_is_linux() or os_is_pi():
+            if self.device is not None and (os_is_linux() or os_is_pi()):
+                device = device or self.device
+                for volume in [self.boot_volume, self.root_volume]:
+                    if os.path.ismount(volume):
+                        Console.ok(f'umount {volume}')
+                        Helper.umount(volume)
+                if full:
+                    _execute(f"eject {device}", f"sudo eject {device}")
+                else:
+                    # the card may also be automounted by the desktop
+                    device_basename = os.path.basename(device)
+                    result = Shell.run('lsblk')
+                    for line in result.splitlines():
+                        line = line.split()
+                        if device_basename in line[0] and len(line) > 6:
+                            Console.ok(f'umount {line[6]}')
+                            Helper.umount(line[6])
+
+            elif os_is_linux() or os_is_pi():
                 Sudo.password()
                 if full:
                     _execute(f"eject {device}", f"sudo eject {device}")
@@ -723,8 +836,8 @@ class SDCard:
                         for line in result.splitlines():
                             line = line.split()
                             if device_basename in line[0] and len(line) > 6:
-                                Console.ok(f'sudo umount {line[6]}')
-                                os.system(f'sudo umount {line[6]}')
+                                Console.ok(f'umount {line[6]}')
+                                Helper.umount(line[6])
                 # _execute(f"unmounting {self.boot_volume}", f"sudo umount {self.boot_volume}")
                 # _execute(f"unmounting  {self.root_volume}", f"sudo umount {self.root_volume}")
             elif os_is_mac():
@@ -734,7 +847,6 @@ class SDCard:
             else:
                 Console.error("Not yet implemented for your OS")
                 return ""
-            os.system("sync")
             # rm = [f"sudo rmdir {self.boot_volume}",
             #      f"sudo rmdir {self.root_volume}"]
 
@@ -763,11 +875,31 @@ class SDCard:
             raise Console.error("Not implemented for this OS")
 
     @windows_not_supported
-    def backup(self, device=None, to_file=None, blocksize="4m"):
+    def backup(self, device=None, to_file=None, blocksize="4m", compress=False, store=None):
+        """
+        Backs up the card to a file
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param to_file: the backup file
+        :type to_file: str
+        :param blocksize: the blocksize used when reading, default 4m
+        :type blocksize: str
+        :param compress: if True only the used blocks are read and stored
+                         compressed, see Backup
+        :type compress: bool
+        :param store: the chunk store of an incremental backup. If given,
+                      to_file is the manifest of the backup, see ChunkStore
+        :type store: str
+        """
         if device is None:
             Console.error("Device must have a value")
         if to_file is None:
             Console.error("To file must have a value")
+        elif store:
+            ChunkStore(store).backup(device, to_file)
+        elif compress:
+            Backup.create(device, to_file)
         else:
             Sudo.password()
 
@@ -793,16 +925,25 @@ class SDCard:
 
             os.system(command)
 
+    @Trace.traced("burn_sdcard", "name", "device")
     def burn_sdcard(self,
                     image=None,
                     tag=None,
                     device=None,
                     blocksize="4M",
                     name="the inserted card",
-                    yes=False):
+                    yes=False,
+                    patch=None,
+                    progress=None):
         """
         Burns the SD Card with an image
 
+        If patch is specified, the boot partition of the image is loaded into
+        memory and patch is called with it as Fat32 object. While the image is
+        streamed to the card the blocks of the boot partition are replaced
+        with the patched ones, so that the card is complete after a single
+        pass without mounting it.
+
         :param image: Image object to use for burning (used by copy)
         :type image: str
         :param name:
@@ -815,52 +956,28 @@ class SDCard:
         :type blocksize: str
         :param yes:
         :type yes: str
-
+        :param patch: a function that modifies the boot partition
+        :type patch: function(Fat32)
+        :param progress: a function called with the number of written bytes
+                         and the size of the image. Only used with patch.
+        :type progress: function(int, int)
+        :return: True if the card was written with the patched boot
+                 partition, False if it was written without it
+        :rtype: bool
+        :raises ValueError: if the card was not written, e.g. the image is
+                            not found or the user declined
+        :raises OSError: if writing the image failed
         """
-        print("OOOO", name, tag)
         if image and tag:
-            Console.error("Implementation error, burn_sdcard can't have image "
-                          "and tag.")
-            return ""
+            raise ValueError("Implementation error, burn_sdcard can't have image and tag.")
 
         Console.info(f"Burning {name} ...")
         if image is not None:
             image_path = image
         else:
-            image = Image().find(tag=tag)
-
-            if image is None:
-                Console.error("No matching image found.")
-                return ""
-            elif len(image) > 1:
-                Console.error("Too many images found. You may have forgotten to specify a tag in your command.")
-                print(Printer.write(image,
-                                    order=["tag", "version"],
-                                    header=["Tag", "Version"]))
-                return ""
-
-            image = image[0]
-
-            url = os.path.basename(Image.get_name(image["url"]))
-            if "ubuntu" in image["url"]:
-                _name = url
-                _name = _name.replace(".xz", "")
-            elif ".img" in url:
-                _name = url
-            else:
-                _name = os.path.basename(Image.get_name(image["url"])) + ".img"
-
-            image_path = Image().directory + "/" + _name
-
-            print(image_path)
-
-            if not os.path.isfile(image_path):
-                print()
-                Console.error(f"Image with tag '{tag}' not found. To download use")
-                print()
-                Console.blue(f"    cms burn image get {tag}")
-                print()
-                raise ValueError("image not found")
+            image_path = SDCard.image_path(tag)
+            if image_path is None:
+                raise ValueError(f"The image with the tag {tag} is not found")
 
         orig_size = size = humanize.naturalsize(os.path.getsize(image_path))
 
@@ -893,8 +1010,7 @@ class SDCard:
             Sudo.password()
 
         if device is None:
-            Console.error("Please specify a device")
-            return
+            raise ValueError("Please specify a device")
 
         #
         # speedup burn for MacOS
@@ -913,7 +1029,7 @@ class SDCard:
 
         if not (yes or yn_choice(f"\nDo you like to write {name} on {device} with the image\n"
                                  f" * {image_path}\n\nContinue")):
-            return ""
+            raise ValueError(f"{name} was not written, the user declined")
 
         # TODO Gregor verify this is ok commenting out this line
         # self.mount(device=device)
@@ -925,9 +1041,24 @@ class SDCard:
                            image_path=image_path,
                            blocksize=blocksize,
                            size=size)
-            return ""
+            return False
 
         else:
+            if patch is not None:
+                try:
+                    boot = SDCard.patch_boot(image_path, patch)
+                except (ValueError, OSError) as e:
+                    Console.warning(f"Could not patch the boot partition of the image: {e}")
+                    boot = None
+                if boot is not None:
+                    SDCard.stream(image_path, device, blocksize=blocksize,
+                                  boot=boot, progress=progress)
+                    if os_is_linux():
+                        self.unmount(device=device, full=True)
+                    else:
+                        self.unmount(device=device)
+                    return True
+
             if os_is_mac():
                 command = f"sudo dd if={image_path} bs={blocksize} |" \
                           f' tqdm --bytes --total {size} --ncols 80 |' \
@@ -939,18 +1070,190 @@ class SDCard:
                           f" sudo dd of={device} bs={blocksize} iflag=fullblock " \
                           f"oflag=direct conv=fsync"
             print(command)
-            os.system(command)
+            if os.system(command) != 0:
+                raise OSError(f"writing {image_path} to {device} failed")
 
-            Sudo.execute("sync")
+            Helper.sync()
             if os_is_linux():
                 self.unmount(device=device, full=True)
             else:
                 self.unmount(device=device)
+            return False
+
+    @staticmethod
+    def image_path(tag=None):
+        """
+        Returns the location of the downloaded image with the tag
+
+        :param tag: tag of the image
+        :type tag: str
+        :return: the image file, None if no single image matches the tag
+                 or the image is not downloaded
+        :rtype: str
+        """
+        image = Image().find(tag=tag)
+
+        if image is None:
+            Console.error("No matching image found.")
+            return None
+        elif len(image) > 1:
+            Console.error("Too many images found. You may have forgotten to specify a tag in your command.")
+            print(Printer.write(image,
+                                order=["tag", "version"],
+                                header=["Tag", "Version"]))
+            return None
+
+        image = image[0]
+
+        url = os.path.basename(Image.get_name(image["url"]))
+        if "ubuntu" in image["url"]:
+            _name = url
+            _name = _name.replace(".xz", "")
+        elif ".img" in url:
+            _name = url
+        else:
+            _name = os.path.basename(Image.get_name(image["url"])) + ".img"
+
+        image_path = Image().directory + "/" + _name
+
+        print(image_path)
+
+        if not os.path.isfile(image_path):
+            print()
+            Console.error(f"Image with tag '{tag}' not found. To download use")
+            print()
+            Console.blue(f"    cms burn image get {tag}")
+            print()
+            return None
+        return image_path
+
+    @staticmethod
+    @Trace.traced("patch boot")
+    def patch_boot(image_path, patch):
+        """
+        Reads the boot partition of the image into memory and applies the
+        patch to it
+
+        :param image_path: the image
+        :type image_path: str
+        :param patch: a function that modifies the boot partition
+        :type patch: function(Fat32)
+        :return: the offset of the boot partition in the image and its
+                 patched content
+        :rtype: tuple
+        """
+        partition = MBR.partition(image_path, 1)
+        with open(image_path, "rb") as f:
+            f.seek(partition["offset"])
+            device = MemoryDevice(f.read(partition["size"]))
+        with Fat32(device, offset=0) as boot:
+            patch(boot)
+        return partition["offset"], device.data
+
+    @staticmethod
+    @Trace.traced("write image", "device")
+    def stream(image_path, device, blocksize="4M", boot=None, progress=None):
+        """
+        Writes the image to the device in a single sequential pass. The
+        blocks of the boot partition are replaced with the given content.
+
+        :param image_path: the image
+        :type image_path: str
+        :param device: the device, e.g. /dev/sdb, or a file
+        :type device: str
+        :param blocksize: the blocksize used when writing, default 4M
+        :type blocksize: str
+        :param boot: the offset and the content of the boot partition
+        :type boot: tuple
+        :param progress: a function called with the number of written bytes
+                         and the size of the image
+        :type progress: function(int, int)
+        """
+        units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+        blocksize = str(blocksize).lower()
+        if blocksize[-1] in units:
+            blocksize = int(blocksize[:-1]) * units[blocksize[-1]]
+        else:
+            blocksize = int(blocksize)
+
+        start, content = boot or (0, b"")
+        end = start + len(content)
+        total = os.path.getsize(image_path)
 
-    def copy(self, device=None, from_file="latest"):
+        bar = None
+        if progress is None:
+            bar = tqdm(total=total, unit="B", unit_scale=True, ncols=80)
+
+            def progress(written, size):
+                bar.update(written - bar.n)
+
+        if os.access(device, os.W_OK):
+            process = None
+            out = open(device, "r+b")
+        else:
+            process = subprocess.Popen(["sudo", "dd", f"of={device}", f"bs={blocksize}"] +
+                                       ([] if os_is_mac() else
+                                        ["iflag=fullblock", "oflag=direct", "conv=fsync"]),
+                                       stdin=subprocess.PIPE)
+            out = process.stdin
+
+        written = 0
+        try:
+            with open(image_path, "rb") as f:
+                while True:
+                    block = f.read(blocksize)
+                    if not block:
+                        break
+                    if written < end and written + len(block) > start:
+                        block = bytearray(block)
+                        a = max(start, written)
+                        b = min(end, written + len(block))
+                        block[a - written:b - written] = content[a - start:b - start]
+                    out.write(block)
+                    written += len(block)
+                    progress(written, total)
+        finally:
+            if process is None:
+                out.flush()
+                os.fsync(out.fileno())
+                out.close()
+            else:
+                out.close()
+                process.wait()
+            if bar is not None:
+                bar.close()
+        if process is not None and process.returncode != 0:
+            raise OSError(f"writing {image_path} to {device} failed")
+
+    def copy(self, device=None, from_file="latest", expand=False):
+        """
+        Writes a backup or an image to the card
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param from_file: the image, a compressed backup or the manifest of
+                          an incremental backup
+        :type from_file: str
+        :param expand: if True the root partition of the image is expanded
+                       to the size of the card, e.g. of an image shrunk
+                       with Shrink.image
+        :type expand: bool
+        """
         if device is None:
             Console.error("Device must have a value")
+        if Backup.is_backup(from_file):
+            Backup.restore(from_file, device)
+            return
+        if ChunkStore.is_manifest(from_file):
+            ChunkStore.restore(from_file, device)
+            return
         self.burn_sdcard(image=from_file, device=device)
+        if not expand or os_is_windows():
+            return
+        try:
+            Expand.device(device)
+        except (ValueError, OSError) as e:
+            Console.warning(f"Could not expand the root partition of {device}: {e}")
 
     def info(self,
              print_os=True,
@@ -0,0 +1,263 @@
+"""
+Shrinks an image file, e.g. a backup of a card, to the space used by its
+root file system.
+
+The ext4 root partition is shrunk to its minimal size plus some free
+space, the partition table is adapted and the file is truncated after the
+root partition. The free blocks of the file system are discarded, so the
+image stays sparse and only uses the space of the data.
+
+resize2fs can not move the blocks of a file system at an offset in a file,
+so on Linux the root partition is attached to a loop device and shrunk in
+place. On other systems it is shrunk in a sparse temporary copy. A shrunk image is
+burned and copied faster. The shrunk image does not resize itself at first
+boot, its root partition is grown to the size of the card when the image
+is written with
+
+    cms burn copy --device=/dev/sdb --from=red.img --expand
+    cms burn raspberry ... --expand
+
+Example:
+
+    Shrink.image("~/.cloudmesh/cmburn/images/red.img")
+"""
+import contextlib
+import os
+import re
+import shutil
+import struct
+import subprocess
+
+from cloudmesh.burn.blockdevice import BlockDevice
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.mbr import SECTOR_SIZE
+from cloudmesh.common.console import Console
+from cloudmesh.common.systeminfo import os_is_linux
+from cloudmesh.common.systeminfo import os_is_pi
+from cloudmesh.common.util import path_expand
+
+
+class Shrink(object):
+
+    @staticmethod
+    def _run(command, filesystem, arguments=None, output=False):
+        """
+        Runs the e2fsprogs command on the file system, with sudo if the
+        user can not write it
+
+        :param command: the command, e.g. ["resize2fs", "-P"]
+        :type command: list
+        :param filesystem: the file system, e.g. /dev/loop0
+        :type filesystem: str
+        :param arguments: the arguments after the image
+        :type arguments: list
+        :param output: if True the output of the command is shown
+        :type output: bool
+        :return: the result
+        :rtype: subprocess.CompletedProcess
+        """
+        program = shutil.which(command[0]) or shutil.which(f"/sbin/{command[0]}")
+        if program is None:
+            raise OSError(f"{command[0]} not found, please install e2fsprogs")
+        sudo = [] if os.access(filesystem, os.W_OK) else ["sudo"]
+        return subprocess.run(sudo + [program] + command[1:] + [filesystem] + (arguments or []),
+                              stdout=None if output else subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True)
+
+    @staticmethod
+    def check(filesystem, discard=False):
+        """
+        Checks the file system and repairs it if needed
+
+        :param filesystem: the file system, e.g. /dev/loop0
+        :type filesystem: str
+        :param discard: if True the free blocks are discarded, so they do
+                        not use space in the image
+        :type discard: bool
+        """
+        options = ["-fy"] + (["-E", "discard"] if discard else [])
+        result = Shrink._run(["e2fsck"] + options, filesystem)
+        # 1 and 2 mean that errors were corrected
+        if result.returncode > 2:
+            raise OSError(f"the file system {filesystem} has errors: {result.stderr.strip()}")
+
+    @staticmethod
+    def minimum(filesystem):
+        """
+        Returns the minimal size of the file system
+
+        :param filesystem: the file system, e.g. /dev/loop0
+        :type filesystem: str
+        :return: the number of blocks
+        :rtype: int
+        """
+        result = Shrink._run(["resize2fs", "-P"], filesystem)
+        found = re.search(r"minimum size of the filesystem:\s*(\d+)", result.stdout)
+        if result.returncode != 0 or found is None:
+            raise OSError(f"could not determine the minimal size of {filesystem}: {result.stderr.strip()}")
+        return int(found.group(1))
+
+    @staticmethod
+    def target(blocks, minimum):
+        """
+        Returns the size of the shrunk file system. Some free blocks are
+        kept, so the system can boot before the partition is grown.
+
+        :param blocks: the current number of blocks
+        :type blocks: int
+        :param minimum: the minimal number of blocks
+        :type minimum: int
+        :return: the number of blocks
+        :rtype: int
+        """
+        free = blocks - minimum
+        for space in [5000, 1000, 100]:
+            if free > space:
+                return minimum + space
+        return blocks
+
+    @staticmethod
+    def _copy(source, out, offset, size, blocksize=4 * 1024 ** 2):
+        """
+        Copies size bytes at the offset of the source to the current
+        position of out. Blocks of zeros are skipped, so they stay holes.
+        """
+        zeros = bytes(blocksize)
+        with open(source, "rb") as f:
+            f.seek(offset)
+            while size > 0:
+                block = f.read(min(blocksize, size))
+                if not block:
+                    break
+                if block == zeros[:len(block)]:
+                    out.seek(len(block), os.SEEK_CUR)
+                else:
+                    out.write(block)
+                size -= len(block)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def loop(image, partition):
+        """
+        Attaches the partition of the image to a loop device
+
+        :param image: the image
+        :type image: str
+        :param partition: the partition, see MBR.partition
+        :type partition: dict
+        :return: the loop device, e.g. /dev/loop0
+        :rtype: str
+        """
+        sudo = [] if os.geteuid() == 0 else ["sudo"]
+        result = subprocess.run(sudo + ["losetup", "--find", "--show",
+                                        "--offset", str(partition["offset"]),
+                                        "--sizelimit", str(partition["size"]), image],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise OSError(f"could not attach {image} to a loop device: {result.stderr.strip()}")
+        device = result.stdout.strip()
+        try:
+            yield device
+        finally:
+            subprocess.run(sudo + ["losetup", "--detach", device])
+
+    @staticmethod
+    @contextlib.contextmanager
+    def copy(image, partition):
+        """
+        Copies the partition of the image into a sparse temporary file. If
+        no error occurs, the image is replaced with the boot area of the
+        image followed by the temporary file.
+
+        :param image: the image
+        :type image: str
+        :param partition: the partition, see MBR.partition
+        :type partition: dict
+        :return: the temporary file
+        :rtype: str
+        """
+        filesystem = f"{image}.root"
+        partial = f"{image}.partial"
+        try:
+            with open(filesystem, "wb") as out:
+                Shrink._copy(image, out, partition["offset"], partition["size"])
+                out.truncate(partition["size"])
+            yield filesystem
+            with open(partial, "wb") as out:
+                Shrink._copy(image, out, 0, partition["offset"])
+                Shrink._copy(filesystem, out, 0, os.path.getsize(filesystem))
+                out.truncate()
+            shutil.copymode(image, partial)
+            os.replace(partial, image)
+        finally:
+            for filename in [filesystem, partial]:
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+    @staticmethod
+    def image(image, extra=None, loop=None):
+        """
+        Shrinks the image in place
+
+        :param image: the image file
+        :type image: str
+        :param extra: the number of free blocks that are kept, by default
+                      5000, 1000 or 100 depending on the free space
+        :type extra: int
+        :param loop: if True the root partition is shrunk on a loop device,
+                     if False in a temporary copy. By default a loop device
+                     is used on Linux.
+        :type loop: bool
+        :return: the size of the image before and after in bytes
+        :rtype: tuple of int
+        """
+        image = path_expand(image)
+        if not os.path.isfile(image):
+            raise ValueError(f"{image} is not an image file")
+        if loop is None:
+            loop = (os_is_linux() or os_is_pi()) and shutil.which("losetup") is not None
+        before = os.path.getsize(image)
+
+        partitions = MBR.read(image)
+        partition = MBR.partition(image, 2)
+        if any(entry["start"] > partition["start"] for entry in partitions):
+            raise ValueError("the root partition is not the last partition")
+        offset = partition["offset"]
+
+        with Ext4(image, offset=offset) as root:
+            blocks = root.blocks_count
+            block_size = root.block_size
+
+        with (Shrink.loop if loop else Shrink.copy)(image, partition) as filesystem:
+            Console.info(f"Checking the file system of {image}")
+            Shrink.check(filesystem)
+            minimum = Shrink.minimum(filesystem)
+            target = Shrink.target(blocks, minimum) if extra is None else min(minimum + extra, blocks)
+
+            if target < blocks:
+                Console.info(f"Shrinking the file system from {blocks} to {target} blocks")
+                result = Shrink._run(["resize2fs", "-p"], filesystem,
+                                     arguments=[str(target)], output=True)
+                if result.returncode != 0:
+                    raise OSError(f"shrinking the file system of {image} failed: {result.stderr.strip()}")
+            else:
+                Console.info("The file system is already at its minimal size")
+
+            Console.info("Discarding the free blocks")
+            Shrink.check(filesystem, discard=True)
+            if not loop:
+                with open(filesystem, "r+b") as f:
+                    f.truncate(target * block_size)
+
+        sectors = target * block_size // SECTOR_SIZE
+        with BlockDevice(image) as disk:
+            mbr = bytearray(disk.read(0, SECTOR_SIZE))
+            struct.pack_into("<I", mbr, 446 + 16 * (partition["number"] - 1) + 12, sectors)
+            disk.write(0, mbr)
+
+        after = offset + sectors * SECTOR_SIZE
+        with open(image, "r+b") as f:
+            f.truncate(after)
+        Console.ok(f"Shrunk {image} from {before // 1024 ** 2} MiB to {after // 1024 ** 2} MiB")
+        return before, after
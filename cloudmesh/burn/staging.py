@@ -0,0 +1,198 @@
+"""
+Collects the configuration edits for a single card in memory and applies
+them in one transaction.
+
+Each edit of a file on the mounted card is recorded in the stage instead of
+being written immediately. Reads of a staged file return the staged content
+so that a sequence of edits on the same file (e.g. /etc/hosts) behaves as if
+the writes had been done. Only the final content of each file is written.
+On commit all writes are send to the privileged helper in a single batch
+followed by one sync for each filesystem that was touched.
+
+Example:
+
+    stage = Stage()
+    stage.write("/media/root/etc/hostname", "red\\n")
+    stage.rm("/media/root/etc/xdg/autostart/piwiz.desktop")
+    stage.commit()
+"""
+import os
+from collections import OrderedDict
+
+from cloudmesh.burn.helper import Helper
+from cloudmesh.common.console import Console
+
+
+class Stage(object):
+
+    def __init__(self):
+        """
+        Initializes an empty stage
+        """
+        self.files = OrderedDict()
+        self.directories = []
+        self.removed = []
+        self.writes = 0
+        self.committed = None
+
+    def __len__(self):
+        return len(self.files) + len(self.removed)
+
+    def mkdir(self, path):
+        """
+        Stages the creation of the directory
+
+        :param path: the directory
+        :type path: str
+        """
+        path = os.path.normpath(path)
+        if path not in self.directories:
+            self.directories.append(path)
+
+    def write(self, path, content, mode=None):
+        """
+        Stages the content of a file. A later write of the same file
+        replaces the earlier one.
+
+        :param path: the file name
+        :type path: str
+        :param content: the content of the file
+        :type content: str or bytes
+        :param mode: the permission of the file
+        :type mode: int
+        """
+        path = os.path.normpath(path)
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if path in self.removed:
+            self.removed.remove(path)
+        self.files[path] = {"data": content, "mode": mode}
+        self.writes += 1
+
+    def rm(self, path):
+        """
+        Stages the removal of a file
+
+        :param path: the file name
+        :type path: str
+        """
+        path = os.path.normpath(path)
+        self.files.pop(path, None)
+        if path not in self.removed:
+            self.removed.append(path)
+
+    def staged(self, path):
+        """
+        Returns true if the file has staged content
+
+        :param path: the file name
+        :type path: str
+        :rtype: bool
+        """
+        return os.path.normpath(path) in self.files
+
+    def read(self, path, decode=True):
+        """
+        Reads the file. If the file is staged the staged content is returned,
+        otherwise the content is read from the card.
+
+        :param path: the file name
+        :type path: str
+        :param decode: if true the content is returned as str
+        :type decode: bool
+        :return: the content
+        :rtype: str or bytes
+        """
+        path = os.path.normpath(path)
+        if path in self.removed:
+            raise FileNotFoundError(path)
+        if path in self.files:
+            content = self.files[path]["data"]
+        else:
+            content = Helper.read(path, decode=False)
+        if decode:
+            content = content.decode("utf-8")
+        return content
+
+    @staticmethod
+    def _device(path):
+        """
+        Returns the device id of the filesystem the path is located on. If the
+        path does not exist yet the nearest existing parent is used.
+        """
+        while path and not os.path.exists(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        try:
+            return os.stat(path).st_dev, path
+        except OSError:
+            return None, path
+
+    def operations(self):
+        """
+        Returns the list of helper operations that apply the stage. The list
+        ends with one sync for each filesystem that is modified.
+
+        :return: the operations
+        :rtype: list
+        """
+        ops = []
+        for path in self.directories:
+            ops.append({"op": "mkdir", "path": path})
+        for path, entry in self.files.items():
+            ops.append({"op": "write",
+                        "path": path,
+                        "data": entry["data"],
+                        "mode": entry["mode"],
+                        "parents": True})
+        for path in self.removed:
+            ops.append({"op": "rm", "path": path})
+
+        filesystems = OrderedDict()
+        for path in list(self.files) + self.removed + self.directories:
+            device, existing = self._device(os.path.dirname(path))
+            filesystems.setdefault(device, existing)
+        for existing in filesystems.values():
+            ops.append({"op": "sync", "path": existing})
+        return ops
+
+    def commit(self, verbose=True):
+        """
+        Writes all staged edits with a single batch and syncs each modified
+        filesystem once. Afterwards the stage is empty.
+
+        :param verbose: if true a summary is printed
+        :type verbose: bool
+        :return: the number of files and bytes written, the number of removed
+                 files, the number of writes that were saved and the
+                 number of synced filesystems
+        :rtype: dict
+        """
+        ops = self.operations()
+        report = {
+            "files": len(self.files),
+            "bytes": sum(len(entry["data"]) for entry in self.files.values()),
+            "removed": len(self.removed),
+            "saved": self.writes - len(self.files),
+            "syncs": len([op for op in ops if op["op"] == "sync"])
+        }
+        if ops:
+            Helper.batch(ops)
+        if verbose:
+            Console.info(f"Wrote {report['files']} files ({report['bytes']} bytes), "
+                         f"removed {report['removed']} files, "
+                         f"synced {report['syncs']} filesystems")
+        self.discard()
+        self.committed = report
+        return report
+
+    def discard(self):
+        """
+        Removes all staged edits without writing them
+        """
+        self.files = OrderedDict()
+        self.directories = []
+        self.removed = []
+        self.writes = 0
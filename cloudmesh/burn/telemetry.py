@@ -0,0 +1,404 @@
+"""
+Records the stages of each burn in a local SQLite database.
+
+A burn of a card consists of the stages format, write, verify, configure
+and unmount. For each stage the time, the written bytes, the throughput
+and whether it failed are stored together with the identity of the card
+and the reader and the digest of the image in
+~/.cloudmesh/cmburn/telemetry.db. The percentiles of the stages grouped by
+reader, card model or image show the bottlenecks of a burn farm.
+
+The reader and the card are read from /sys/block. A card in a built-in
+reader (mmcblk) reports its name, manufacturer and serial number, a USB
+reader only reports its own vendor and model, so the model of the card is
+its capacity.
+
+Example:
+
+    telemetry = Telemetry()
+    run = telemetry.run("red01", "/dev/sdb", image="2021-01-11-raspios-buster-armhf-lite.img")
+    with run.stage("format"):
+        ...
+    with run.stage("write") as stage:
+        ...
+        stage["bytes"] = written
+    print(Telemetry.table(telemetry.stats(by="reader")))
+"""
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from cloudmesh.common.Tabulate import Printer
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+
+COLUMNS = [
+    ("run", "TEXT"),
+    ("date", "REAL"),
+    ("host", "TEXT"),
+    ("stage", "TEXT"),
+    ("device", "TEXT"),
+    ("reader", "TEXT"),
+    ("model", "TEXT"),
+    ("serial", "TEXT"),
+    ("capacity", "INTEGER"),
+    ("image", "TEXT"),
+    ("digest", "TEXT"),
+    ("bytes", "INTEGER"),
+    ("seconds", "REAL"),
+    ("throughput", "REAL"),
+    ("success", "INTEGER"),
+    ("error", "TEXT"),
+]
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+class Telemetry(object):
+
+    DATABASE = "~/.cloudmesh/cmburn/telemetry.db"
+
+    STAGES = ["format", "write", "verify", "configure", "unmount"]
+
+    # the attributes by which the stages can be grouped
+    GROUPS = ["reader", "model", "image", "host", "device"]
+
+    # the digests computed in this process
+    digests = {}
+    lock = threading.Lock()
+
+    def __init__(self, filename=None):
+        """
+        Opens the database and creates its tables
+
+        :param filename: the database, by default
+                         ~/.cloudmesh/cmburn/telemetry.db
+        :type filename: str
+        """
+        self.filename = path_expand(filename or Telemetry.DATABASE)
+        columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS)
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with self.connect() as db:
+                db.execute(f"CREATE TABLE IF NOT EXISTS stages ({columns})")
+                db.execute("CREATE TABLE IF NOT EXISTS digests "
+                           "(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, digest TEXT)")
+        except (OSError, sqlite3.Error) as e:
+            Console.warning(f"Could not open the telemetry database {self.filename}: {e}")
+
+    def connect(self):
+        """
+        Returns a new connection to the database. The burns of several
+        devices run in threads, each record uses its own connection.
+
+        :rtype: sqlite3.Connection
+        """
+        return sqlite3.connect(self.filename, timeout=30)
+
+    @staticmethod
+    def identity(device):
+        """
+        Returns the reader and the card in the device
+
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :return: the reader, the model, the serial and the capacity in
+                 bytes of the card, empty if they are not known
+        :rtype: dict
+        """
+        name = os.path.basename(os.path.realpath(device or ""))
+        block = f"/sys/block/{name}"
+        sectors = _read(f"{block}/size")
+        capacity = int(sectors) * 512 if sectors.isdigit() else 0
+        if name.startswith("mmcblk"):
+            reader = "mmc"
+            model = " ".join(part for part in [_read(f"{block}/device/manfid"),
+                                               _read(f"{block}/device/name")] if part)
+            serial = _read(f"{block}/device/serial")
+        else:
+            reader = " ".join(part for part in [_read(f"{block}/device/vendor"),
+                                                _read(f"{block}/device/model")] if part)
+            model = ""
+            serial = ""
+        if not model and capacity:
+            model = f"{round(capacity / 1000 ** 3)} GB"
+        return {
+            "reader": reader or "unknown",
+            "model": model or "unknown",
+            "serial": serial,
+            "capacity": capacity
+        }
+
+    def digest(self, path):
+        """
+        Returns the sha256 of the image. It is computed once and cached
+        with the size and the modification time of the image. Threads that
+        ask for the digest at the same time wait for a single computation.
+
+        :param path: the image
+        :type path: str
+        :return: the digest, empty if the image can not be read
+        :rtype: str
+        """
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return ""
+        path = os.path.abspath(path)
+        key = (path, stat.st_size, stat.st_mtime)
+        with Telemetry.lock:
+            if key not in Telemetry.digests:
+                Telemetry.digests[key] = self._digest(key)
+            return Telemetry.digests[key]
+
+    def _digest(self, key):
+        path = key[0]
+        try:
+            with self.connect() as db:
+                row = db.execute("SELECT digest FROM digests WHERE path=? AND size=? AND mtime=?",
+                                 key).fetchone()
+            if row is not None:
+                return row[0]
+        except sqlite3.Error:
+            pass
+        h = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(4 * 1024 ** 2), b""):
+                    h.update(block)
+        except OSError:
+            return ""
+        digest = h.hexdigest()
+        try:
+            with self.connect() as db:
+                db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)", key + (digest,))
+        except sqlite3.Error:
+            pass
+        return digest
+
+    def run(self, host, device, image=None, digest=None):
+        """
+        Starts the record of a burn
+
+        :param host: the host
+        :type host: str
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param image: the image
+        :type image: str
+        :param digest: the digest of the image, computed once before
+                       parallel burns
+        :type digest: str
+        :rtype: Run
+        """
+        return Run(self, host, device, image=image, digest=digest)
+
+    def record(self, **record):
+        """
+        Stores the record of a stage. A failure is only reported, it never
+        stops a burn.
+
+        :param record: the values of the columns
+        :type record: dict
+        """
+        names = [name for name, kind in COLUMNS]
+        values = [record.get(name) for name in names]
+        try:
+            with self.connect() as db:
+                db.execute(f"INSERT INTO stages ({', '.join(names)}) "
+                           f"VALUES ({', '.join('?' * len(names))})", values)
+        except sqlite3.Error as e:
+            Console.warning(f"Could not record the telemetry of the burn: {e}")
+
+    def records(self, stage=None):
+        """
+        Returns the records of the stages
+
+        :param stage: only the records of this stage
+        :type stage: str
+        :rtype: list
+        """
+        query = "SELECT * FROM stages"
+        parameters = ()
+        if stage:
+            query += " WHERE stage=?"
+            parameters = (stage,)
+        with self.connect() as db:
+            db.row_factory = sqlite3.Row
+            return [dict(row) for row in db.execute(query + " ORDER BY date", parameters)]
+
+    @staticmethod
+    def percentile(values, p):
+        """
+        Returns the percentile of the values, interpolated between the
+        closest ranks
+
+        :param values: the values
+        :type values: list
+        :param p: the percentile between 0 and 100
+        :type p: float
+        :return: the percentile, None if there are no values
+        :rtype: float
+        """
+        values = sorted(values)
+        if not values:
+            return None
+        k = (len(values) - 1) * p / 100
+        i = int(k)
+        if i + 1 >= len(values):
+            return values[-1]
+        return values[i] + (values[i + 1] - values[i]) * (k - i)
+
+    def stats(self, by="reader", stage=None):
+        """
+        Returns the percentiles of the time and the median throughput of
+        each stage grouped by an attribute
+
+        :param by: reader, model, image, host or device
+        :type by: str
+        :param stage: only this stage
+        :type stage: str
+        :return: a dict for each group and stage
+        :rtype: list
+        """
+        if by not in Telemetry.GROUPS:
+            raise ValueError(f"stats can only be grouped by {', '.join(Telemetry.GROUPS)}")
+        groups = {}
+        for record in self.records(stage=stage):
+            groups.setdefault((record[by] or "unknown", record["stage"]), []).append(record)
+
+        def order(key):
+            group, name = key
+            rank = Telemetry.STAGES.index(name) if name in Telemetry.STAGES else len(Telemetry.STAGES)
+            return group, rank, name
+
+        result = []
+        for (group, name) in sorted(groups, key=order):
+            records = groups[(group, name)]
+            passed = [record for record in records if record["success"]]
+            seconds = [record["seconds"] for record in passed]
+            throughput = [record["throughput"] for record in passed if record["throughput"]]
+            median = Telemetry.percentile(throughput, 50)
+            result.append({
+                by: group,
+                "stage": name,
+                "count": len(records),
+                "failed": len(records) - len(passed),
+                "p50": Telemetry.percentile(seconds, 50),
+                "p90": Telemetry.percentile(seconds, 90),
+                "p99": Telemetry.percentile(seconds, 99),
+                "mbs": None if median is None else median / 1000 ** 2
+            })
+        return result
+
+    @staticmethod
+    def table(stats, by="reader"):
+        """
+        Returns the statistics as table
+
+        :param stats: the result of stats
+        :type stats: list
+        :param by: the attribute by which the stages are grouped
+        :type by: str
+        :rtype: str
+        """
+        rows = [dict(row, **{key: "" if row[key] is None else f"{row[key]:.1f}"
+                             for key in ["p50", "p90", "p99", "mbs"]})
+                for row in stats]
+        return Printer.write(rows,
+                             order=[by, "stage", "count", "failed", "p50", "p90", "p99", "mbs"],
+                             header=[by.capitalize(), "Stage", "Count", "Failed",
+                                     "p50 s", "p90 s", "p99 s", "MB/s"])
+
+
+class Run(object):
+
+    def __init__(self, telemetry, host, device, image=None, digest=None):
+        """
+        Creates the record of the burn of a card
+
+        :param telemetry: the database
+        :type telemetry: Telemetry
+        :param host: the host
+        :type host: str
+        :param device: the device, e.g. /dev/sdb
+        :type device: str
+        :param image: the image
+        :type image: str
+        :param digest: the digest of the image, computed once before
+                       parallel burns
+        :type digest: str
+        """
+        self.telemetry = telemetry
+        self.id = uuid.uuid4().hex
+        self.host = host
+        self.device = device
+        self.identity = Telemetry.identity(device)
+        self.image = ""
+        self.digest = ""
+        if image:
+            self.set_image(image, digest=digest)
+
+    def set_image(self, image, digest=None):
+        """
+        Sets the image of the burn and its digest
+
+        :param image: the image
+        :type image: str
+        :param digest: the digest of the image, by default it is read from
+                       the cache or computed
+        :type digest: str
+        """
+        self.image = os.path.basename(image)
+        self.digest = digest or self.telemetry.digest(image)
+
+    @contextlib.contextmanager
+    def stage(self, name, bytes=None):
+        """
+        Measures a stage of the burn and records it when it is finished.
+        The number of written bytes can be set in the yielded dict.
+
+        :param name: the stage, e.g. write
+        :type name: str
+        :param bytes: the number of written bytes
+        :type bytes: int
+        """
+        record = {"bytes": bytes}
+        date = time.time()
+        start = time.monotonic()
+        error = None
+        try:
+            yield record
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            seconds = time.monotonic() - start
+            success = error is None and record.get("success", True) is not False
+            throughput = None
+            if record["bytes"] and seconds > 0:
+                throughput = record["bytes"] / seconds
+            self.telemetry.record(
+                run=self.id,
+                date=date,
+                host=self.host,
+                stage=name,
+                device=self.device,
+                image=self.image,
+                digest=self.digest,
+                bytes=record["bytes"],
+                seconds=seconds,
+                throughput=throughput,
+                success=int(bool(success)),
+                error=error or record.get("error"),
+                **self.identity)
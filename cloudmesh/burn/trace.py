@@ -0,0 +1,265 @@
+"""
+Records the stages of a burn session as hierarchical spans.
+
+When several cards are burned in parallel, the download, the extraction,
+the write and the configuration of the cards overlap. A span records the
+start and the end of a stage, its attributes, e.g. the device, and the
+span in which it was started. The spans of a session can be written as
+Chrome trace, which is shown as timeline with one row per thread in
+chrome://tracing or https://ui.perfetto.dev, or sent as OTLP/HTTP JSON to
+an OpenTelemetry collector, e.g. http://localhost:4318/v1/traces.
+
+Spans are only recorded while a session is active, otherwise a traced
+function is called directly. cms burn starts a session if the environment
+variable CMBURN_TRACE is set to a file or the URL of a collector.
+
+Example:
+
+    class SDCard(object):
+
+        @Trace.traced("format", "device")
+        def format_device(self, device=None, ...):
+            ...
+
+    with Trace.session("burn raspberry red0[1-4]", export="~/burn.json"):
+        with Trace.span("burn red01", device="/dev/sdb"):
+            ...
+"""
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+
+
+class Trace(object):
+
+    enabled = False
+    spans = []
+    trace_id = None
+    root = None
+    lock = threading.Lock()
+    local = threading.local()
+
+    @classmethod
+    def clear(cls):
+        """
+        Removes the recorded spans and starts a new trace
+        """
+        with cls.lock:
+            cls.spans = []
+            cls.trace_id = uuid.uuid4().hex
+            cls.root = None
+
+    @classmethod
+    def _stack(cls):
+        if not hasattr(cls.local, "stack"):
+            cls.local.stack = []
+        return cls.local.stack
+
+    @classmethod
+    @contextlib.contextmanager
+    def span(cls, name, **attributes):
+        """
+        Records the enclosed code as span. The parent is the innermost
+        span of the thread, in a new thread it is the span of the session.
+
+        :param name: the name of the span, e.g. burn red01
+        :type name: str
+        :param attributes: the attributes of the span, e.g. device
+        :type attributes: dict
+        """
+        if not cls.enabled:
+            yield None
+            return
+        stack = cls._stack()
+        thread = threading.current_thread()
+        span = {
+            "id": uuid.uuid4().hex[:16],
+            "parent": stack[-1]["id"] if stack else cls.root,
+            "name": name,
+            "attributes": {key: str(value) for key, value in attributes.items() if value is not None},
+            "thread": thread.ident,
+            "thread_name": thread.name,
+            "start": time.time_ns(),
+            "end": None,
+            "error": None
+        }
+        stack.append(span)
+        counter = time.perf_counter_ns()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            span["end"] = span["start"] + time.perf_counter_ns() - counter
+            stack.pop()
+            with cls.lock:
+                cls.spans.append(span)
+
+    @classmethod
+    def traced(cls, name=None, *keys):
+        """
+        Returns a decorator that records each call of the function as span
+
+        :param name: the name of the span, by default the name of the
+                     function
+        :type name: str
+        :param keys: the parameters of the function that are recorded as
+                     attributes, e.g. device
+        :type keys: str
+        :rtype: function
+        """
+        def decorator(function):
+            signature = inspect.signature(function)
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not cls.enabled:
+                    return function(*args, **kwargs)
+                arguments = signature.bind_partial(*args, **kwargs).arguments
+                attributes = {key: arguments.get(key) for key in keys}
+                with cls.span(name or function.__qualname__, **attributes):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @classmethod
+    @contextlib.contextmanager
+    def session(cls, name, export=None):
+        """
+        Records the spans of the enclosed code under a root span and
+        exports them at the end
+
+        :param name: the name of the root span, e.g. the command
+        :type name: str
+        :param export: a file to which the Chrome trace is written or the
+                       URL of an OTLP/HTTP collector
+        :type export: str
+        """
+        cls.clear()
+        cls.enabled = True
+        try:
+            with cls.span(name) as root:
+                cls.root = root["id"]
+                yield root
+        finally:
+            cls.enabled = False
+            cls.root = None
+            if export and export.startswith(("http://", "https://")):
+                cls.send(export)
+            elif export:
+                cls.write(export)
+
+    @classmethod
+    def chrome(cls):
+        """
+        Returns the spans in the Chrome trace event format
+
+        :rtype: dict
+        """
+        with cls.lock:
+            spans = sorted(cls.spans, key=lambda span: span["start"])
+        pid = os.getpid()
+        start = spans[0]["start"] if spans else 0
+        events = []
+        threads = {}
+        for span in spans:
+            threads.setdefault(span["thread"], span["thread_name"])
+            args = dict(span["attributes"])
+            if span["error"] is not None:
+                args["error"] = span["error"]
+            events.append({
+                "name": span["name"],
+                "cat": "burn",
+                "ph": "X",
+                "ts": (span["start"] - start) / 1000,
+                "dur": (span["end"] - span["start"]) / 1000,
+                "pid": pid,
+                "tid": span["thread"],
+                "args": args
+            })
+        for tid, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": thread_name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    @classmethod
+    def otlp(cls, service="cm-burn"):
+        """
+        Returns the spans in the OTLP/HTTP JSON format of OpenTelemetry
+
+        :param service: the service.name of the resource
+        :type service: str
+        :rtype: dict
+        """
+        def attributes(values):
+            return [{"key": key, "value": {"stringValue": value}} for key, value in values.items()]
+
+        with cls.lock:
+            spans = sorted(cls.spans, key=lambda span: span["start"])
+        result = []
+        for span in spans:
+            item = {
+                "traceId": cls.trace_id,
+                "spanId": span["id"],
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(span["start"]),
+                "endTimeUnixNano": str(span["end"]),
+                "attributes": attributes(dict(span["attributes"], **{"thread.name": span["thread_name"]})),
+                "status": {"code": 1} if span["error"] is None else {"code": 2, "message": span["error"]}
+            }
+            if span["parent"] is not None:
+                item["parentSpanId"] = span["parent"]
+            result.append(item)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": attributes({"service.name": service})},
+                "scopeSpans": [{"scope": {"name": "cloudmesh.burn"}, "spans": result}]
+            }]
+        }
+
+    @classmethod
+    def write(cls, filename):
+        """
+        Writes the spans as Chrome trace
+
+        :param filename: the file, e.g. ~/burn.json
+        :type filename: str
+        """
+        filename = path_expand(filename)
+        try:
+            with open(filename, "w") as f:
+                json.dump(cls.chrome(), f)
+        except OSError as e:
+            Console.error(f"Could not write the trace to {filename}: {e}")
+            return
+        Console.ok(f"Wrote the trace to {filename}")
+
+    @classmethod
+    def send(cls, url="http://localhost:4318/v1/traces"):
+        """
+        Sends the spans to an OpenTelemetry collector with OTLP/HTTP JSON
+
+        :param url: the traces endpoint of the collector
+        :type url: str
+        """
+        import requests
+
+        try:
+            response = requests.post(url, json=cls.otlp(), timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            Console.error(f"Could not send the trace to {url}: {e}")
+            return
+        Console.ok(f"Sent the trace to {url}")
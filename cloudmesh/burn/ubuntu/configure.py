@@ -1,10 +1,12 @@
+from cloudmesh.burn.hosts import Hosts
+from cloudmesh.burn.keys import Keys
+from cloudmesh.burn.render import Bundle
+from cloudmesh.burn.trace import Trace
 from cloudmesh.burn.ubuntu.userdata import Userdata
 from cloudmesh.burn.ubuntu.networkdata import Networkdata
 from cloudmesh.common.console import Console
 from cloudmesh.common.util import readfile
 from cloudmesh.inventory.inventory import Inventory
-from cloudmesh.common.Shell import Shell
-from cloudmesh.common.util import path_expand
 
 
 class Configure:
@@ -27,7 +29,6 @@ class Configure:
     Configure.build_user_data(name=NAME) returns a Userdata builder object
     where NAME is the hostname of an entry in inventory.yaml with corresponding config options
     """
-    KEY_DIR = path_expand('~/.cloudmesh/cmburn')
 
     def __init__(self, inventory=None, cluster=None, debug=False):
         self.debug = debug
@@ -43,12 +44,23 @@ class Configure:
         else:
             self.nodes = self.inventory.find(service='manager') + self.inventory.find(service='worker')
 
+        # The /etc/hosts table is the same for all nodes, so it is created once
+        self.hosts = Hosts(self.nodes)
+
         self.manager_public_key = None
 
     def build_user_data(self, name=None, with_defaults=True, country=None,
-                        add_manager_key=False, upgrade=False, with_bridge=False):
+                        add_manager_key=False, upgrade=False, with_bridge=False,
+                        shared_hosts=False, host_keys=None):
         """
         Given a name, get its config from self.inventory and create a Userdata object
+
+        If shared_hosts is True, the hosts of the cluster are not embedded,
+        but read at first boot from the hosts file in the boot partition,
+        which has to be written with the content of self.hosts.
+
+        host_keys are the pregenerated SSH host keys of the host, see
+        Keys.host_keys.
         """
         if name is None:
             raise Exception('name arg supplied is None')
@@ -89,7 +101,11 @@ class Configure:
         else:
             user_data.with_default_user().with_ssh_password_login()
         # Add known hosts
-        user_data.with_hosts(hosts=self.get_hosts_for(name=name))
+        if shared_hosts:
+            user_data.with_hosts(hosts=[f'127.0.0.1:{name}'])
+            user_data.with_runcmd(cmd=Hosts.command(name, f'/boot/firmware/{Hosts.FILENAME}'))
+        else:
+            user_data.with_hosts(hosts=self.get_hosts_for(name=name))
         if country:
             user_data.with_set_wifi_country(country=country)
         if service == 'manager' and self.manager_public_key:
@@ -102,6 +118,8 @@ class Configure:
                 .with_runcmd(cmd='sudo rm /boot/firmware/id_rsa')
         if with_bridge:
             user_data.with_access_point_bridge()
+        if host_keys:
+            user_data.with_ssh_host_keys(keys=host_keys)
 
         if self.debug:
             Console.info(f'User data for {name}:\n' + str(user_data))
@@ -174,20 +192,124 @@ class Configure:
         if not self.inventory.has_host(name):
             raise Exception(f'{name} could not be found in {self.inventory.filename}')
 
-        result = [f'127.0.0.1:{name}']
-        for node in self.nodes:
-            if node['ip'] and name != node['host']:
-                host = node['host']
-                ip = node['ip']
-                result += [f'{ip}:{host}']
-        return result
+        names, ips = self.hosts.get(name)
+        return [f'127.0.0.1:{name}'] + [f'{ip}:{host}' for host, ip in zip(names, ips)]
 
     def generate_ssh_key(self, hostname):
-        Shell.execute('mkdir', f'-p {Configure.KEY_DIR}')
-        Shell.run(f'ssh-keygen -q -N "" -C "ubuntu@{hostname}" -f ' f'{Configure.KEY_DIR}/id_rsa')
-        priv_key = readfile(f'{Configure.KEY_DIR}/id_rsa').strip()
-        pub_key = readfile(f'{Configure.KEY_DIR}/id_rsa.pub').strip()
+        """
+        Generates the key pair of the manager in memory
+
+        :param hostname: the hostname used in the comment of the key
+        :type hostname: str
+        :return: the private and the public key
+        :rtype: tuple
+        """
+        priv_key, pub_key = Keys.generate(kind="rsa", comment=f"ubuntu@{hostname}")
         self.manager_public_key = pub_key
-        Shell.execute('rm', path_expand(f'{Configure.KEY_DIR}/id_rsa'))
-        Shell.execute('rm', path_expand(f'{Configure.KEY_DIR}/id_rsa.pub'))
         return priv_key, pub_key
+
+    def _inputs(self, name, ssid=None, password=None, country=None,
+                upgrade=False, shared_hosts=False, host_keys=False):
+        """
+        Returns the inputs the files of the host are rendered from
+        """
+        keyfile = self.inventory.get(name=name, attribute='keyfile')
+        inputs = {
+            "os": "ubuntu",
+            "config": self.inventory.data[name],
+            "key": readfile(keyfile).strip() if keyfile else None,
+            "country": country,
+            "upgrade": upgrade,
+            "shared_hosts": shared_hosts,
+            "hosts": self.hosts.content if shared_hosts else sorted(self.get_hosts_for(name=name)),
+            "host_keys": host_keys
+        }
+        if self.inventory.get(name=name, attribute='service') == 'manager':
+            inputs["ssid"] = ssid
+            inputs["password"] = password
+        else:
+            inputs["manager"] = self.manager_public_key
+        return inputs
+
+    @Trace.traced("render")
+    def render(self, names=None, bundle=None, ssid=None, password=None,
+               country=None, upgrade=False, shared_hosts=False, host_keys=False):
+        """
+        Renders user-data and network-config of the hosts into the bundle.
+        If host_keys is True, the SSH host keys of the hosts are generated
+        in parallel and included in user-data.
+
+        The key of the manager is generated first, so the files of all hosts
+        exist before any card is written and the cards can be burned in any
+        order. Hosts whose inputs did not change since they were rendered
+        are skipped, the key of an unchanged manager is reused. The manager
+        and the hosts with host keys are not written to the directory of
+        the bundle, so a new key of the manager is generated when the cards
+        are burned and the workers are rendered again with it.
+
+        :param names: the hosts
+        :type names: list
+        :param bundle: the bundle, by default a bundle in memory
+        :type bundle: Bundle
+        :return: the bundle
+        :rtype: Bundle
+        """
+        bundle = bundle or Bundle()
+        options = dict(ssid=ssid, password=password, country=country,
+                       upgrade=upgrade, shared_hosts=shared_hosts, host_keys=host_keys)
+
+        managers = [name for name in names
+                    if self.inventory.get(name=name, attribute='service') == 'manager']
+        if len(managers) > 1:
+            raise Exception('More than one manager detected in NAMES')
+
+        manager_keys = None
+        for name in managers:
+            digest = Bundle.digest(self._inputs(name, **options))
+            if bundle.current(name, digest):
+                self.manager_public_key = bundle.load(name)['id_rsa.pub'].strip()
+            else:
+                # Generate a private public key pair for the manager that will be persistently used
+                manager_keys = self.generate_ssh_key(name)
+
+        pending = []
+        for name in names:
+            digest = Bundle.digest(self._inputs(name, **options))
+            if not bundle.current(name, digest):
+                pending.append((name, digest))
+
+        keys = {}
+        if host_keys and pending:
+            keys = Keys.host_keys([name for name, digest in pending])
+
+        for name, digest in pending:
+            files = {}
+            if name in managers:
+                priv_key, pub_key = manager_keys
+                # Write priv_key and pub_key to /boot/id_rsa and /boot/id_rsa.pub
+                files['id_rsa'] = priv_key + "\n"
+                files['id_rsa.pub'] = pub_key + "\n"
+                services = self.inventory.get(name=name, attribute='services') or []
+                files['user-data'] = str(self.build_user_data(name=name,
+                                                              country=country,
+                                                              upgrade=upgrade,
+                                                              with_bridge='bridge' in services,
+                                                              shared_hosts=shared_hosts,
+                                                              host_keys=keys.get(name)))
+                files['network-config'] = str(self.build_network_data(name=name,
+                                                                      ssid=ssid,
+                                                                      password=password))
+            else:
+                files['user-data'] = str(self.build_user_data(name=name,
+                                                              add_manager_key=bool(self.manager_public_key),
+                                                              upgrade=upgrade,
+                                                              shared_hosts=shared_hosts,
+                                                              host_keys=keys.get(name)))
+                files['network-config'] = str(self.build_network_data(name=name))
+            if shared_hosts:
+                files[Hosts.FILENAME] = self.hosts.content
+            # the private keys are only kept in memory
+            bundle.store(name, digest, files, secret=name in managers or name in keys)
+        bundle.save()
+        bundle.info()
+        return bundle
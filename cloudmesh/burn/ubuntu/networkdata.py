@@ -1,8 +1,7 @@
 import yaml
 
+from cloudmesh.burn.helper import Helper
 from cloudmesh.common.console import Console
-from cloudmesh.common.Shell import Shell
-from cloudmesh.common.util import path_expand, writefile
 
 
 class Networkdata:
@@ -59,10 +58,8 @@ class Networkdata:
         """
         if filename is None:
             raise Exception('filename arg supplied is None')
-        tmp_location = path_expand('~/.cloudmesh/network-data.tmp')
-        writefile(tmp_location, str(self))
         Console.info(f'Writing to {filename}')
-        Shell.run(f'cat {tmp_location} | sudo tee {filename}')
+        Helper.write(filename, str(self))
 
     def with_ip(self, interfaces='ethernets', interface='eth0', ip=None):
         if ip is None:
@@ -1,8 +1,7 @@
 import oyaml as yaml
 
+from cloudmesh.burn.helper import Helper
 from cloudmesh.common.console import Console
-from cloudmesh.common.Shell import Shell
-from cloudmesh.common.util import path_expand, writefile
 
 
 class Userdata:
@@ -89,16 +88,30 @@ class Userdata:
             self.content['ssh_authorized_keys'] += keys
         return self
 
+    def with_ssh_host_keys(self, keys=None):
+        """
+        Sets the SSH host keys, so they are not generated at first boot.
+        keys is a dict of the key type, e.g. ed25519 or rsa, and the pair of
+        private and public key.
+        """
+        if keys is None:
+            raise Exception('keys arg supplied is None')
+
+        self.content['ssh_keys'] = {}
+        for kind, (private, public) in keys.items():
+            self.content['ssh_keys'][f'{kind}_private'] = private + '\n'
+            self.content['ssh_keys'][f'{kind}_public'] = public
+        self.content['ssh_genkeytypes'] = []
+        return self
+
     def write(self, filename=None):
         """
         Writes a file to a location. Safe write for files on mounted partitions
         """
         if filename is None:
             raise Exception('filename arg supplied is None')
-        tmp_location = path_expand('~/.cloudmesh/user-data.tmp')
-        writefile(tmp_location, str(self))
         Console.info(f'Writing to {filename}')
-        Shell.run(f'cat {tmp_location} | sudo tee {filename}')
+        Helper.write(filename, str(self))
 
     def with_ssh_password_login(self, ssh_pwauth=True):
         if ssh_pwauth is None:
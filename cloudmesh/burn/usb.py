@@ -5,7 +5,6 @@ import subprocess
 import humanize
 import requests
 
-import usb as usb_device
 from cloudmesh.common.systeminfo import os_is_mac
 from cloudmesh.common.Tabulate import Printer
 from cloudmesh.common.console import Console
@@ -177,6 +176,9 @@ class USB(object):
         if len(lsusb) == 0:
             Console.warning("We could not find your USB reader in the list of known readers")
             return None
+        # pyusb is only needed here
+        import usb as usb_device
+
         busses = usb_device.busses()
 
         details = []
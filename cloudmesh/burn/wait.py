@@ -0,0 +1,347 @@
+"""
+Waits until the burned hosts of a cluster have booted.
+
+All hosts are probed concurrently with asyncio in rounds of about a
+second. For each host the time after the start is recorded when
+
+* its name.local is answered by avahi-daemon with multicast DNS,
+* it answers a TCP connection to the ssh port (up) and
+* sshd sends its banner (ssh).
+
+If the inventory has no ip for a host, the address from multicast DNS is
+used. The times are shown in a table that is updated while the hosts
+boot and are appended to ~/.cloudmesh/cmburn/boot.jsonl.
+
+Example:
+
+    wait = Wait({"red": "10.1.1.1", "red01": "10.1.1.2"})
+    results = wait.run(timeout=600)
+"""
+import asyncio
+import datetime
+import json
+import os
+import socket
+import statistics
+import struct
+import sys
+import time
+
+from cloudmesh.burn.network import Network
+from cloudmesh.common.Tabulate import Printer
+from cloudmesh.common.console import Console
+from cloudmesh.common.util import path_expand
+
+MDNS_ADDRESS = "224.0.0.251"
+MDNS_PORT = 5353
+
+TYPE_A = 1
+CLASS_IN = 1
+
+
+class MulticastDNS(object):
+
+    @staticmethod
+    def query(name, identifier=0):
+        """
+        Returns a query for the A record of the name
+
+        :param name: the name, e.g. red01.local
+        :type name: str
+        :param identifier: the id of the query
+        :type identifier: int
+        :rtype: bytes
+        """
+        question = b"".join(bytes([len(label)]) + label.encode("ascii")
+                            for label in name.rstrip(".").split("."))
+        return struct.pack(">HHHHHH", identifier, 0, 1, 0, 0, 0) + \
+            question + b"\0" + struct.pack(">HH", TYPE_A, CLASS_IN)
+
+    @staticmethod
+    def _name(packet, position):
+        """
+        Reads a possibly compressed name and returns it with the position
+        after the name
+        """
+        labels = []
+        end = None
+        for _ in range(128):
+            length = packet[position]
+            if length & 0xC0 == 0xC0:
+                if end is None:
+                    end = position + 2
+                position = struct.unpack_from(">H", packet, position)[0] & 0x3FFF
+                continue
+            position += 1
+            if length == 0:
+                break
+            labels.append(packet[position:position + length].decode("ascii", errors="replace"))
+            position += length
+        return ".".join(labels), end if end is not None else position
+
+    @staticmethod
+    def addresses(packet, name):
+        """
+        Returns the IPv4 addresses of the name in the response
+
+        :param packet: the response
+        :type packet: bytes
+        :param name: the name, e.g. red01.local
+        :type name: str
+        :rtype: list
+        """
+        name = name.rstrip(".").lower()
+        try:
+            _, flags, questions, answers, authorities, additional = \
+                struct.unpack_from(">HHHHHH", packet, 0)
+            if not flags & 0x8000:
+                return []
+            position = 12
+            for _ in range(questions):
+                _, position = MulticastDNS._name(packet, position)
+                position += 4
+            found = []
+            for _ in range(answers + authorities + additional):
+                owner, position = MulticastDNS._name(packet, position)
+                kind, _, _, length = struct.unpack_from(">HHIH", packet, position)
+                position += 10
+                if kind == TYPE_A and length == 4 and owner.lower() == name:
+                    found.append(socket.inet_ntoa(packet[position:position + 4]))
+                position += length
+            return found
+        except (IndexError, struct.error):
+            return []
+
+    @staticmethod
+    async def resolve(name, timeout=1.0):
+        """
+        Resolves the name with a multicast DNS query. As the query is not
+        sent from port 5353, the responder answers directly to the sender.
+
+        :param name: the name, e.g. red01.local
+        :type name: str
+        :param timeout: the time in seconds to wait for the answer
+        :type timeout: float
+        :return: the address, None if there is no answer
+        :rtype: str
+        """
+        loop = asyncio.get_running_loop()
+        answer = loop.create_future()
+
+        class Protocol(asyncio.DatagramProtocol):
+
+            def datagram_received(self, data, address):
+                found = MulticastDNS.addresses(data, name)
+                if found and not answer.done():
+                    answer.set_result(found[0])
+
+            def error_received(self, exc):
+                pass
+
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                Protocol, local_addr=("0.0.0.0", 0), family=socket.AF_INET)
+        except OSError:
+            return None
+        try:
+            sock = transport.get_extra_info("socket")
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+            transport.sendto(MulticastDNS.query(name, identifier=os.getpid() & 0xFFFF),
+                             (MDNS_ADDRESS, MDNS_PORT))
+            return await asyncio.wait_for(answer, timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            transport.close()
+
+
+class Wait(object):
+
+    LOG = "~/.cloudmesh/cmburn/boot.jsonl"
+
+    def __init__(self, hosts, port=22, mdns=True):
+        """
+        Creates the tracker
+
+        :param hosts: the ip of each host, None if it is not known
+        :type hosts: dict
+        :param port: the ssh port
+        :type port: int
+        :param mdns: if True the hosts are also resolved with multicast DNS
+        :type mdns: bool
+        """
+        self.port = port
+        self.mdns = mdns
+        self.start = None
+        self.results = {name: {
+            "host": name,
+            "ip": ip,
+            "mdns": None,
+            "up": None,
+            "ssh": None,
+            "banner": ""
+        } for name, ip in hosts.items()}
+
+    @staticmethod
+    async def banner(ip, port=22, timeout=1.0):
+        """
+        Reads the banner of sshd
+
+        :param ip: the address of the host
+        :type ip: str
+        :param port: the ssh port
+        :type port: int
+        :param timeout: the time in seconds to wait for the banner
+        :type timeout: float
+        :return: the banner, e.g. SSH-2.0-OpenSSH_7.9p1 Raspbian-10+deb10u2,
+                 None if sshd does not answer
+        :rtype: str
+        """
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        except (OSError, asyncio.TimeoutError):
+            line = b""
+        finally:
+            writer.close()
+        line = line.decode("utf-8", errors="replace").strip()
+        return line if line.startswith("SSH-") else None
+
+    def elapsed(self):
+        return round(time.monotonic() - self.start, 1)
+
+    async def _probe(self, result, timeout):
+        """
+        Probes the host once and records the times that are reached
+        """
+        if self.mdns and result["mdns"] is None:
+            address = await MulticastDNS.resolve(f"{result['host']}.local", timeout=timeout)
+            if address:
+                result["mdns"] = self.elapsed()
+                result["ip"] = result["ip"] or address
+        if not result["ip"]:
+            return
+        if result["up"] is None:
+            status, _ = await Network.probe(result["ip"], port=self.port, timeout=timeout)
+            if status == "down":
+                return
+            result["up"] = self.elapsed()
+        banner = await Wait.banner(result["ip"], port=self.port, timeout=timeout)
+        if banner:
+            result["ssh"] = self.elapsed()
+            result["banner"] = banner
+
+    def pending(self):
+        """
+        Returns the hosts that do not accept ssh connections yet
+
+        :rtype: list
+        """
+        return [result for result in self.results.values() if result["ssh"] is None]
+
+    async def _run(self, timeout, interval, probe_timeout, show):
+        while True:
+            started = time.monotonic()
+            await asyncio.gather(*[self._probe(result, probe_timeout) for result in self.pending()])
+            show()
+            if not self.pending() or time.monotonic() - self.start >= timeout:
+                return
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def table(self):
+        """
+        Returns the table of the results
+
+        :rtype: str
+        """
+        def seconds(value):
+            return "" if value is None else f"{value} s"
+
+        rows = {name: {
+            "host": name,
+            "ip": result["ip"] or "",
+            "mdns": seconds(result["mdns"]),
+            "up": seconds(result["up"]),
+            "ssh": seconds(result["ssh"]),
+            "banner": result["banner"]
+        } for name, result in self.results.items()}
+        return Printer.write(rows,
+                             order=["host", "ip", "mdns", "up", "ssh", "banner"],
+                             header=["Host", "IP", "mDNS", "Up", "SSH", "Banner"])
+
+    def run(self, timeout=600, interval=1.0, probe_timeout=1.0, live=None):
+        """
+        Probes the hosts until all accept ssh connections or the timeout
+        is reached
+
+        :param timeout: the time in seconds after which the waiting stops
+        :type timeout: float
+        :param interval: the time in seconds between two rounds of probes
+        :type interval: float
+        :param probe_timeout: the time in seconds to wait for an answer
+        :type probe_timeout: float
+        :param live: if True the table is updated in place after each
+                     round, by default if the output is a terminal
+        :type live: bool
+        :return: the results of each host with the times in seconds
+        :rtype: dict
+        """
+        if live is None:
+            live = sys.stdout.isatty()
+        lines = 0
+
+        def show():
+            nonlocal lines
+            if not live:
+                return
+            table = self.table()
+            if lines:
+                # move the cursor up and clear the previous table
+                print(f"\033[{lines}A\033[J", end="")
+            print(table)
+            lines = table.count("\n") + 1
+
+        self.start = time.monotonic()
+        asyncio.run(self._run(timeout, interval, probe_timeout, show))
+        if not live:
+            print(self.table())
+        pending = [result["host"] for result in self.pending()]
+        if pending:
+            Console.warning(f"The hosts {', '.join(pending)} are not ready after {timeout} s")
+        else:
+            Console.ok(f"All hosts are ready after {self.elapsed()} s")
+        return self.results
+
+    def statistics(self):
+        """
+        Returns the minimum, median and maximum of the time to ssh
+
+        :rtype: dict
+        """
+        times = [result["ssh"] for result in self.results.values() if result["ssh"] is not None]
+        if not times:
+            return {"ready": 0, "total": len(self.results)}
+        return {
+            "ready": len(times),
+            "total": len(self.results),
+            "min": min(times),
+            "median": statistics.median(times),
+            "max": max(times)
+        }
+
+    def record(self, filename=None):
+        """
+        Appends the results to the log of boot times
+
+        :param filename: the log, by default ~/.cloudmesh/cmburn/boot.jsonl
+        :type filename: str
+        """
+        filename = path_expand(filename or Wait.LOG)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        date = datetime.datetime.now().isoformat(timespec="seconds")
+        with open(filename, "a") as f:
+            for result in self.results.values():
+                f.write(json.dumps(dict(result, date=date)) + "\n")
@@ -4,9 +4,9 @@ This function is primarily developed for a Raspberry PI
 """
 import textwrap
 
+from cloudmesh.burn.helper import Helper
 from cloudmesh.common.console import Console
 from cloudmesh.common.util import writefile
-from cloudmesh.common.sudo import Sudo
 
 
 class Wifi:
@@ -53,7 +53,8 @@ class Wifi:
             country="US",
             psk=True,
             location=location,
-            sudo=False):
+            sudo=False,
+            stage=None):
         """
         Sets the wifi. Only works for psk based wifi
 
@@ -69,6 +70,8 @@ class Wifi:
         :type location: str
         :param sudo: If tru the write will be done with sudo
         :type sudo: bool
+        :param stage: If set the configuration is written to the stage
+        :type stage: cloudmesh.burn.staging.Stage
         :return: True if success
         :rtype: bool
         """
@@ -82,8 +85,10 @@ class Wifi:
         else:
             config = Wifi.template_key.format(**locals())
         try:
-            if sudo:
-                Sudo.writefile(location, config)
+            if stage is not None:
+                stage.write(location, config + "\n")
+            elif sudo:
+                Helper.write(location, config + "\n")
             else:
                 writefile(location, config)
 
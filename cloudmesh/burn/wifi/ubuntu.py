@@ -4,8 +4,8 @@ This function is primarily developed for a Raspberry PI
 """
 import textwrap
 
+from cloudmesh.burn.helper import Helper
 from cloudmesh.common.console import Console
-from cloudmesh.common.sudo import Sudo
 from cloudmesh.common.util import writefile
 
 
@@ -38,7 +38,8 @@ class Wifi:
             country="US",
             psk=True,
             location=location,
-            sudo=False):
+            sudo=False,
+            stage=None):
         """
         Sets the wifi. Only works for psk based wifi
 
@@ -54,6 +55,8 @@ class Wifi:
         :type location: str
         :param sudo: If tru the write will be done with sudo
         :type sudo: bool
+        :param stage: If set the configuration is written to the stage
+        :type stage: cloudmesh.burn.staging.Stage
         :return: True if success
         :rtype: bool
         """
@@ -65,8 +68,10 @@ class Wifi:
         config = Wifi.template.format(**locals())
 
         try:
-            if sudo:
-                Sudo.writefile(location, config)
+            if stage is not None:
+                stage.write(location, config + "\n")
+            elif sudo:
+                Helper.write(location, config + "\n")
             else:
                 writefile(location, config)
 
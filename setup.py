@@ -47,6 +47,7 @@ pyusb
 tqdm
 PySimpleGUI
 passlib
+cryptography
 bcrypt;sys_platform=='win32'
 pywin32;sys_platform=='win32'
 """.split("\n")
@@ -0,0 +1,102 @@
+###############################################################
+# pytest -v --capture=no tests/test_07_helper.py
+# pytest -v  tests/test_07_helper.py
+# pytest -v --capture=no tests/test_07_helper.py::Test_helper::test_write
+###############################################################
+
+import os
+import subprocess
+import threading
+
+import pytest
+
+from cloudmesh.burn.helper import Helper
+from cloudmesh.common.util import HEADING
+
+
+@pytest.mark.incremental
+class Test_helper:
+
+    def test_start(self):
+        HEADING()
+        assert Helper.start(sudo=False)
+
+    def test_write(self, tmp_path):
+        HEADING()
+        filename = str(tmp_path / "a" / "file.txt")
+        Helper.write(filename, "hello\n", mode=0o755, parents=True)
+        assert Helper.read(filename) == "hello\n"
+        assert oct(os.stat(filename).st_mode & 0o777) == oct(0o755)
+        Helper.write(filename, "world\n", append=True)
+        assert Helper.read(filename) == "hello\nworld\n"
+
+    def test_batch(self, tmp_path):
+        HEADING()
+        directory = str(tmp_path / "b")
+        results = Helper.batch([
+            {"op": "mkdir", "path": directory},
+            {"op": "write", "path": f"{directory}/x", "data": b"\x00\x01"},
+            {"op": "read", "path": f"{directory}/x"},
+            {"op": "rm", "path": f"{directory}/x"},
+            {"op": "sync", "path": directory},
+        ])
+        assert results[2] == b"\x00\x01"
+        assert not Helper.exists(f"{directory}/x")
+
+    def test_error(self, tmp_path):
+        HEADING()
+        with pytest.raises(OSError):
+            Helper.read(str(tmp_path / "missing"))
+
+    def test_threads(self, tmp_path):
+        HEADING()
+        Helper.stop()
+        processes = []
+        popen = subprocess.Popen
+
+        def spawn(*args, **kwargs):
+            processes.append(popen(*args, **kwargs))
+            return processes[-1]
+
+        def write(i):
+            Helper.write(str(tmp_path / f"{i}.txt"), str(i))
+
+        subprocess.Popen = spawn
+        try:
+            threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            subprocess.Popen = popen
+        # the workers of parallel burns share a single helper
+        assert len(processes) == 1
+        assert sorted(os.listdir(tmp_path)) == [f"{i}.txt" for i in range(8)]
+
+    def test_windows(self, tmp_path, monkeypatch):
+        HEADING()
+        from cloudmesh.burn import helper
+
+        def shell(*args, **kwargs):
+            raise AssertionError("a command is run on Windows")
+
+        monkeypatch.setattr(helper, "os_is_windows", lambda: True)
+        monkeypatch.setattr(os, "system", shell)
+        monkeypatch.setattr(subprocess, "run", shell)
+
+        filename = str(tmp_path / "boot" / "firstrun.sh")
+        Helper._fallback({"op": "write", "path": filename, "data": "#!/bin/bash\n",
+                          "parents": True, "mode": 0o755})
+        Helper._fallback({"op": "chmod", "path": filename, "mode": 0o755})
+        with open(filename) as f:
+            assert f.read() == "#!/bin/bash\n"
+        Helper._fallback({"op": "rm", "path": filename})
+        assert not os.path.exists(filename)
+        Helper._fallback({"op": "mkdir", "path": str(tmp_path / "etc"), "mode": 0o700})
+        assert os.path.isdir(tmp_path / "etc")
+
+    def test_stop(self):
+        HEADING()
+        Helper.stop()
+        assert Helper.process is None
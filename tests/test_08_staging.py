@@ -0,0 +1,81 @@
+###############################################################
+# pytest -v --capture=no tests/test_08_staging.py
+# pytest -v  tests/test_08_staging.py
+# pytest -v --capture=no tests/test_08_staging.py::Test_staging::test_commit
+###############################################################
+
+import os
+
+import pytest
+
+from cloudmesh.burn.helper import Helper
+from cloudmesh.burn.staging import Stage
+from cloudmesh.common.util import HEADING
+
+
+@pytest.mark.incremental
+class Test_staging:
+
+    def test_overwrite(self, tmp_path):
+        HEADING()
+        Helper.start(sudo=False)
+        filename = str(tmp_path / "etc" / "hostname")
+        stage = Stage()
+        for i in range(0, 3):
+            stage.write(filename, f"red{i}\n")
+        assert len(stage) == 1
+        assert stage.read(filename) == "red2\n"
+        assert not os.path.exists(filename)
+
+    def test_commit(self, tmp_path):
+        HEADING()
+        existing = tmp_path / "keyboard"
+        existing.write_text("XKBLAYOUT=us\n")
+        stage = Stage()
+        stage.write(str(tmp_path / "etc" / "hostname"), "red")
+        stage.write(str(tmp_path / "etc" / "hostname"), "red01\n")
+        stage.mkdir(str(tmp_path / "ssh"))
+        stage.write(str(existing), stage.read(str(existing)).replace("us", "de"))
+        stage.rm(str(tmp_path / "piwiz.desktop"))
+        report = stage.commit(verbose=False)
+        assert report["files"] == 2
+        assert report["bytes"] == len("red01\n") + len("XKBLAYOUT=de\n")
+        assert report["saved"] == 1
+        assert report["syncs"] == 1
+        assert (tmp_path / "etc" / "hostname").read_text() == "red01\n"
+        assert existing.read_text() == "XKBLAYOUT=de\n"
+        assert (tmp_path / "ssh").is_dir()
+        assert len(stage) == 0
+
+    def test_rm(self, tmp_path):
+        HEADING()
+        filename = str(tmp_path / "ssh")
+        stage = Stage()
+        stage.write(filename, "")
+        stage.rm(filename)
+        with pytest.raises(FileNotFoundError):
+            stage.read(filename)
+        stage.commit(verbose=False)
+        assert not os.path.exists(filename)
+        Helper.stop()
+
+    def test_burn(self, monkeypatch):
+        HEADING()
+        pytest.importorskip("cloudmesh.bridge")
+        from cloudmesh.burn.burner import raspberryos
+        from cloudmesh.common.StopWatch import StopWatch
+
+        def decline(self, **kwargs):
+            raise ValueError("Terminating: User Break")
+
+        def mount(self, **kwargs):
+            raise AssertionError("a card that is not written is configured")
+
+        monkeypatch.setattr(raspberryos.SDCard, "format_device", lambda self, **kwargs: True)
+        monkeypatch.setattr(raspberryos.SDCard, "unmount", lambda self, **kwargs: True)
+        monkeypatch.setattr(raspberryos.SDCard, "burn_sdcard", decline)
+        monkeypatch.setattr(raspberryos.SDCard, "mount", mount)
+
+        # a declined or failed write skips the host and burns the next one
+        raspberryos.MultiBurner().burn(device="/dev/sdx", hostname="red01", yes=True)
+        assert StopWatch.get_status("write image /dev/sdx red01") is False
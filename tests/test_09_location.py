@@ -0,0 +1,62 @@
+###############################################################
+# pytest -v --capture=no tests/test_09_location.py
+# pytest -v  tests/test_09_location.py
+# pytest -v --capture=no tests/test_09_location.py::Test_location::test_device
+###############################################################
+
+import os
+
+import pytest
+
+from cloudmesh.burn.image import Image
+from cloudmesh.burn.sdcard import SDCard
+from cloudmesh.burn.sdcard import device_id
+from cloudmesh.burn.sdcard import location
+from cloudmesh.burn.sdcard import partition
+from cloudmesh.common.util import HEADING
+
+
+@pytest.mark.incremental
+class Test_location:
+
+    def test_partition(self):
+        HEADING()
+        assert partition("/dev/sdb", 1) == "/dev/sdb1"
+        assert partition("/dev/mmcblk0", 2) == "/dev/mmcblk0p2"
+        assert partition("/dev/nvme0n1", 1) == "/dev/nvme0n1p1"
+        assert partition("/dev/loop3", 2) == "/dev/loop3p2"
+
+    def test_default(self):
+        HEADING()
+        user = os.environ.get('USER')
+        assert location(host_os="linux", volume="boot") == f"/media/{user}/boot"
+        assert location(host_os="macos", volume="root", device="/dev/disk4") == "/Volumes/rootfs"
+
+    def test_device(self):
+        HEADING()
+        user = os.environ.get('USER')
+        name = device_id("/dev/sdzz")
+        assert name == "sdzz"
+        boot = location(host_os="linux", volume="boot", device="/dev/sdzz")
+        root = location(host_os="linux", card_os="ubuntu", volume="root", device="/dev/sdzz")
+        assert boot == f"/media/{user}/sdzz/boot"
+        assert root == f"/media/{user}/sdzz/writable"
+
+    def test_cards(self):
+        HEADING()
+        a = SDCard(host_os="linux", device="/dev/sdzy")
+        b = SDCard(host_os="linux", device="/dev/sdzz")
+        assert a.boot_volume != b.boot_volume
+        assert a.root_volume != b.root_volume
+
+    def test_image_path(self, tmp_path, monkeypatch):
+        HEADING()
+        url = "https://downloads.raspberrypi.org/raspios_lite_armhf/images/2021-01-11-raspios-buster-armhf-lite.zip"
+        monkeypatch.setattr(Image, "find", staticmethod(lambda tag=None: [{"tag": tag, "url": url}]))
+        monkeypatch.setattr(Image, "__init__", lambda self: setattr(self, "directory", str(tmp_path)))
+        # an image that is not downloaded is reported as None
+        assert SDCard.image_path("latest-lite") is None
+
+        image = tmp_path / "2021-01-11-raspios-buster-armhf-lite.img"
+        image.write_bytes(b"")
+        assert SDCard.image_path("latest-lite") == str(image)
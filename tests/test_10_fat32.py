@@ -0,0 +1,184 @@
+###############################################################
+# pytest -v --capture=no tests/test_10_fat32.py
+# pytest -v  tests/test_10_fat32.py
+# pytest -v --capture=no tests/test_10_fat32.py::Test_fat32::test_write
+###############################################################
+
+import struct
+
+import pytest
+
+from cloudmesh.burn.fat32 import Fat32
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.sdcard import SDCard
+from cloudmesh.common.util import HEADING
+
+START = 8192
+SECTORS = 140000
+
+
+def create_image(filename):
+    """
+    Creates an image with an MBR and an empty FAT32 partition with
+    1 sector per cluster
+    """
+    reserved = 32
+    fat_sectors = (SECTORS * 4 + 511) // 512
+    with open(filename, "wb") as f:
+        f.truncate((START + SECTORS) * 512)
+
+        mbr = bytearray(512)
+        struct.pack_into("<I", mbr, 440, 0x9730496b)
+        struct.pack_into("<B3sB3sII", mbr, 446, 0x80, b"", 0x0c, b"", START, SECTORS)
+        mbr[510:512] = b"\x55\xaa"
+        f.write(mbr)
+
+        boot = bytearray(512)
+        boot[0:3] = b"\xeb\x58\x90"
+        boot[3:11] = b"mkfs.fat"
+        struct.pack_into("<HBHBHHBHHHII", boot, 11,
+                         512, 1, reserved, 2, 0, 0, 0xF8, 0, 32, 64, START, SECTORS)
+        struct.pack_into("<IHHIHH", boot, 36, fat_sectors, 0, 0, 2, 1, 6)
+        boot[510:512] = b"\x55\xaa"
+        fsinfo = bytearray(512)
+        struct.pack_into("<I", fsinfo, 0, 0x41615252)
+        struct.pack_into("<III", fsinfo, 484, 0x61417272, 0xFFFFFFFF, 3)
+        fsinfo[510:512] = b"\x55\xaa"
+        f.seek(START * 512)
+        f.write(boot + fsinfo)
+
+        # cluster 0 and 1 are reserved, cluster 2 is the root directory
+        table = struct.pack("<III", 0x0FFFFFF8, 0x0FFFFFFF, 0x0FFFFFFF)
+        for i in range(2):
+            f.seek((START + reserved + i * fat_sectors) * 512)
+            f.write(table)
+
+
+@pytest.mark.incremental
+class Test_fat32:
+
+    def test_mbr(self, tmp_path):
+        HEADING()
+        image = str(tmp_path / "card.img")
+        create_image(image)
+        partitions = MBR.read(image)
+        assert len(partitions) == 1
+        assert partitions[0]["offset"] == START * 512
+        assert partitions[0]["type"] == 0x0c
+        assert MBR.disk_id(image) == "9730496b"
+
+    def test_write(self, tmp_path):
+        HEADING()
+        image = str(tmp_path / "card.img")
+        create_image(image)
+        script = "#!/bin/bash\n" + "echo hello\n" * 200
+        with Fat32(image) as boot:
+            boot.write("cmdline.txt", "console=tty1 root=PARTUUID=9730496b-02")
+            boot.write("firstrun.sh", script)
+            boot.write("network-config", "version: 2\n")
+            boot.write("SSH", "")
+
+        with Fat32(image) as boot:
+            assert sorted(boot.listdir()) == ["SSH", "cmdline.txt", "firstrun.sh", "network-config"]
+            assert boot.read("firstrun.sh").decode() == script
+            assert boot.read("NETWORK-CONFIG") == b"version: 2\n"
+            assert boot.read("ssh") == b""
+            assert boot.exists("cmdline.txt")
+            assert not boot.exists("user-data")
+
+    def test_overwrite(self, tmp_path):
+        HEADING()
+        image = str(tmp_path / "card.img")
+        create_image(image)
+        with Fat32(image) as boot:
+            boot.write("user-data", "a" * 5000)
+            boot.write("user-data", "b" * 100)
+            assert boot.read("user-data") == b"b" * 100
+            assert boot.listdir() == ["user-data"]
+            for i in range(40):
+                boot.write(f"a rather long file name number {i}.txt", str(i))
+
+        with Fat32(image) as boot:
+            assert len(boot.listdir()) == 41
+            assert boot.read("a rather long file name number 39.txt") == b"39"
+            used = [c for c in range(2, boot.clusters + 2) if boot._get(c) != 0]
+            # root directory, user-data and 40 files
+            assert len(used) == len(boot._chain(boot.root_cluster)) + 1 + 40
+
+    def test_rm(self, tmp_path):
+        HEADING()
+        image = str(tmp_path / "card.img")
+        create_image(image)
+        with Fat32(image) as boot:
+            boot.write("id_rsa.pub", "ssh-rsa AAAA")
+            boot.write("ssh", "")
+        with Fat32(image) as boot:
+            boot.rm("id_rsa.pub")
+            boot.rm("missing")
+        with Fat32(image) as boot:
+            assert boot.listdir() == ["ssh"]
+            assert all(boot._get(c) == 0 for c in range(3, boot.clusters + 2))
+
+    def test_not_fat32(self, tmp_path):
+        HEADING()
+        image = str(tmp_path / "empty.img")
+        with open(image, "wb") as f:
+            f.truncate(1024 * 1024)
+        with pytest.raises(ValueError):
+            Fat32(image, offset=0)
+
+    def test_stream(self, tmp_path):
+        HEADING()
+        image = str(tmp_path / "card.img")
+        card = str(tmp_path / "sdb")
+        create_image(image)
+        with Fat32(image) as boot:
+            boot.write("cmdline.txt", "console=tty1")
+        with open(image, "r+b") as f:
+            f.seek((START + SECTORS) * 512 - 4)
+            f.write(b"root")
+        open(card, "wb").close()
+
+        def patch(boot):
+            content = boot.read("cmdline.txt").decode()
+            boot.write("cmdline.txt", content + " quiet")
+            boot.write("user-data", "#cloud-config\n")
+
+        updates = []
+        boot = SDCard.patch_boot(image, patch)
+        SDCard.stream(image, card, blocksize="1M", boot=boot,
+                      progress=lambda written, total: updates.append(written))
+
+        assert updates[-1] == (START + SECTORS) * 512
+        with Fat32(card) as boot:
+            assert boot.read("cmdline.txt") == b"console=tty1 quiet"
+            assert boot.read("user-data") == b"#cloud-config\n"
+        with Fat32(image) as boot:
+            assert not boot.exists("user-data")
+        with open(card, "rb") as f:
+            f.seek((START + SECTORS) * 512 - 4)
+            assert f.read() == b"root"
+
+    def test_burn(self, tmp_path, monkeypatch):
+        HEADING()
+        from cloudmesh.burn import sdcard
+
+        image = str(tmp_path / "card.img")
+        card = str(tmp_path / "sdc")
+        create_image(image)
+        open(card, "wb").close()
+        monkeypatch.setattr(sdcard.Sudo, "password", staticmethod(lambda *args: None))
+        monkeypatch.setattr(SDCard, "unmount", lambda self, **kwargs: True)
+        monkeypatch.setattr(sdcard, "yn_choice", lambda message: False)
+
+        burned = SDCard().burn_sdcard(image=image, device=card, yes=True,
+                                      patch=lambda boot: boot.write("ssh", ""))
+        assert burned is True
+        with Fat32(card) as boot:
+            assert boot.exists("ssh")
+
+        # a card that is not written is reported with an error
+        with pytest.raises(ValueError):
+            SDCard().burn_sdcard(image=image, device=card, yes=False)
+        with pytest.raises(ValueError):
+            SDCard().burn_sdcard(image=image, device=None, yes=True)
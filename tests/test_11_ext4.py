@@ -0,0 +1,97 @@
+###############################################################
+# pytest -v --capture=no tests/test_11_ext4.py
+# pytest -v  tests/test_11_ext4.py
+# pytest -v --capture=no tests/test_11_ext4.py::Test_ext4::test_read
+###############################################################
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.common.util import HEADING
+
+pytestmark = pytest.mark.skipif(shutil.which("mkfs.ext4") is None,
+                                reason="mkfs.ext4 is not installed")
+
+
+def create_image(tmp_path, options=None):
+    """
+    Creates an ext4 image with the files of a configured card
+    """
+    root = tmp_path / "root"
+    os.makedirs(root / "etc/systemd/system")
+    os.makedirs(root / "home/pi/.ssh")
+    os.makedirs(root / "lib/systemd/system")
+    os.makedirs(root / "many")
+    (root / "etc/hostname").write_text("red01\n")
+    (root / "etc/dhcpcd.conf").write_text("interface eth0\nstatic ip_address=10.1.1.1/24\n")
+    (root / "home/pi/.ssh/authorized_keys").write_text("ssh-rsa AAAA pi@red\n")
+    (root / "lib/systemd/system/ssh.service").write_text("[Unit]\n")
+    os.symlink("/lib/systemd/system/ssh.service", root / "etc/systemd/system/sshd.service")
+    os.symlink("../etc/hostname", root / "many/hostname")
+    for i in range(300):
+        (root / f"many/file-{i}").write_text(str(i))
+    (root / "large").write_bytes(bytes(range(256)) * 8192)
+
+    image = str(tmp_path / "root.img")
+    command = ["mkfs.ext4", "-q", "-F"] + (options or []) + ["-d", str(root), image, "16M"]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return image
+
+
+@pytest.mark.incremental
+class Test_ext4:
+
+    def test_read(self, tmp_path):
+        HEADING()
+        image = create_image(tmp_path)
+        with Ext4(image, offset=0) as root:
+            assert root.read("/etc/hostname") == b"red01\n"
+            assert b"static ip_address=10.1.1.1/24" in root.read("/etc/dhcpcd.conf")
+            assert root.read("/home/pi/.ssh/authorized_keys").split()[-1] == b"pi@red"
+            assert root.read("/large") == bytes(range(256)) * 8192
+
+    def test_listdir(self, tmp_path):
+        HEADING()
+        image = create_image(tmp_path)
+        with Ext4(image, offset=0) as root:
+            assert "etc" in root.listdir("/")
+            assert len(root.listdir("/many")) == 301
+            assert root.read("/many/file-299") == b"299"
+
+    def test_symlink(self, tmp_path):
+        HEADING()
+        image = create_image(tmp_path)
+        with Ext4(image, offset=0) as root:
+            assert root.readlink("/etc/systemd/system/sshd.service") == \
+                "/lib/systemd/system/ssh.service"
+            assert root.read("/etc/systemd/system/sshd.service") == b"[Unit]\n"
+            assert root.read("/many/hostname") == b"red01\n"
+
+    def test_exists(self, tmp_path):
+        HEADING()
+        image = create_image(tmp_path)
+        with Ext4(image, offset=0) as root:
+            assert root.exists("/etc/hostname")
+            assert not root.exists("/etc/wpa_supplicant.conf")
+            assert not root.exists("/etc/hostname/x")
+            with pytest.raises(FileNotFoundError):
+                root.read("/boot/ssh")
+
+    def test_block_map(self, tmp_path):
+        HEADING()
+        image = create_image(tmp_path, ["-O", "^extent,^64bit", "-t", "ext2"])
+        with Ext4(image, offset=0) as root:
+            assert root.read("/large") == bytes(range(256)) * 8192
+            assert root.read("/etc/systemd/system/sshd.service") == b"[Unit]\n"
+
+    def test_not_ext4(self, tmp_path):
+        HEADING()
+        image = str(tmp_path / "empty.img")
+        with open(image, "wb") as f:
+            f.truncate(1024 * 1024)
+        with pytest.raises(ValueError):
+            Ext4(image, offset=0)
@@ -0,0 +1,112 @@
+###############################################################
+# pytest -v --capture=no tests/test_12_hosts.py
+# pytest -v  tests/test_12_hosts.py
+# pytest -v --capture=no tests/test_12_hosts.py::Test_hosts::test_benchmark
+###############################################################
+
+import os
+
+import pytest
+
+from cloudmesh.burn.hosts import Hosts
+from cloudmesh.burn.raspberryos.runfirst import Runfirst
+from cloudmesh.burn.ubuntu.configure import Configure
+from cloudmesh.common.Benchmark import Benchmark
+from cloudmesh.common.StopWatch import StopWatch
+from cloudmesh.common.util import HEADING
+from cloudmesh.inventory.inventory import Inventory
+
+Benchmark.debug()
+
+
+def cluster(n):
+    return [{"host": f"red{i:04d}", "ip": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}"}
+            for i in range(n)]
+
+
+def script(hosts, name, shared=False):
+    runfirst = Runfirst()
+    runfirst.set_hostname(name)
+    runfirst.set_hosts(hosts=hosts, shared=shared)
+    runfirst.set_key(key="ssh-rsa AAAA pi@red")
+    runfirst.set_locale()
+    return runfirst.get()
+
+
+@pytest.mark.incremental
+class Test_hosts:
+
+    def test_table(self):
+        HEADING()
+        hosts = Hosts(cluster(4) + [{"host": "red9999", "ip": ""}])
+        assert len(hosts) == 4
+        assert "red9999" not in hosts
+        names, ips = hosts.get("red0001")
+        assert names == ["red0000", "red0002", "red0003"]
+        assert ips == ["10.0.0.0", "10.0.0.2", "10.0.0.3"]
+        assert hosts.render(exclude="red0001") == \
+            "10.0.0.0\tred0000\n10.0.0.2\tred0002\n10.0.0.3\tred0003\n"
+        assert hosts.render(exclude="red0003").count("\n") == 3
+        assert hosts.render() == hosts.content
+
+    def test_runfirst(self):
+        HEADING()
+        hosts = Hosts(cluster(3))
+        embedded = script(hosts, "red0000")
+        assert "10.0.0.1\tred0001\n10.0.0.2\tred0002\nHOSTSEOF" in embedded
+        assert "\tred0000\n" not in embedded
+
+        shared = script(hosts, "red0000", shared=True)
+        assert "red0001" not in shared
+        assert "awk -v host=red0000 '$2 != host' /boot/hosts >> /etc/hosts" in shared
+
+        runfirst = Runfirst()
+        runfirst.set_hostname("red0000")
+        runfirst.set_hosts(hosts=hosts, shared=True)
+        runfirst.set_key(key="ssh-rsa AAAA pi@red")
+        runfirst.set_locale()
+        runfirst.get()
+        assert runfirst.files() == {"firstrun.sh": runfirst.script, "hosts": hosts.content}
+
+    def test_configure(self, tmp_path):
+        HEADING()
+        filename = str(tmp_path / "inventory.yaml")
+        inventory = Inventory(filename)
+        inventory.add(host="red", service="manager", ip="10.1.1.1")
+        inventory.add(host="red01", service="worker", ip="10.1.1.2")
+        inventory.save()
+
+        c = Configure(inventory=filename)
+        assert sorted(c.get_hosts_for(name="red01")) == ["10.1.1.1:red", "127.0.0.1:red01"]
+
+        user_data = c.build_user_data(name="red01", shared_hosts=True)
+        assert user_data.content["bootcmd"] == ["echo 127.0.0.1 red01 >> /etc/hosts"]
+        assert user_data.content["runcmd"] == \
+            ["awk -v host=red01 '$2 != host' /boot/firmware/hosts >> /etc/hosts"]
+        assert c.hosts.content == "10.1.1.1\tred\n10.1.1.2\tred01\n"
+
+    @pytest.mark.parametrize("n", [1000, 5000])
+    def test_benchmark(self, n):
+        HEADING()
+        nodes = cluster(n)
+
+        StopWatch.start(f"hosts table {n}")
+        hosts = Hosts(nodes)
+        StopWatch.stop(f"hosts table {n}")
+
+        StopWatch.start(f"hosts embedded {n}")
+        embedded = sum(len(script(hosts, node["host"])) for node in nodes)
+        StopWatch.stop(f"hosts embedded {n}")
+
+        StopWatch.start(f"hosts shared {n}")
+        shared = sum(len(script(hosts, node["host"], shared=True)) for node in nodes)
+        StopWatch.stop(f"hosts shared {n}")
+
+        # each embedded script contains all other hosts, the shared
+        # scripts only a constant command
+        assert embedded - shared >= n * (len(hosts.content) - 100)
+        assert shared < n * 2000
+
+    def test_print(self):
+        HEADING()
+        Benchmark.print(sysinfo=False, csv=True, tag=os.uname().sysname)
@@ -0,0 +1,95 @@
+###############################################################
+# pytest -v --capture=no tests/test_13_scheduler.py
+# pytest -v  tests/test_13_scheduler.py
+# pytest -v --capture=no tests/test_13_scheduler.py::Test_scheduler::test_parallel
+###############################################################
+
+import threading
+import time
+
+import pytest
+
+from cloudmesh.burn.scheduler import Scheduler
+from cloudmesh.common.util import HEADING
+
+
+class Reader(Scheduler):
+    """
+    A scheduler that burns without asking for the cards
+    """
+
+    def wait(self, name, device, first=True):
+        return True
+
+
+@pytest.mark.incremental
+class Test_scheduler:
+
+    def test_parallel(self):
+        HEADING()
+        names = [f"red{i:02d}" for i in range(8)]
+        devices = ["/dev/sdb", "/dev/sdc", "/dev/sdd", "/dev/sde"]
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def burn(name, device, progress):
+            with lock:
+                running.append(device)
+                peak.append(len(running))
+            progress(50, 100)
+            time.sleep(0.2)
+            progress(100, 100)
+            with lock:
+                running.remove(device)
+            return True
+
+        start = time.time()
+        results = Reader(devices=devices).run(names, burn)
+        elapsed = time.time() - start
+
+        assert [result["host"] for result in results] == names
+        assert all(result["outcome"] == "ok" for result in results)
+        assert {result["device"] for result in results} == set(devices)
+        assert max(peak) == 4
+        # 8 cards on 4 devices take 2 rounds instead of 8
+        assert elapsed < 0.2 * 8 / 2
+        Scheduler.print(results)
+
+    def test_failure(self):
+        HEADING()
+
+        def burn(name, device, progress):
+            if name == "red01":
+                raise ValueError("card is write protected")
+            return name != "red02"
+
+        results = Reader(devices=["/dev/sdb"]).run(["red", "red01", "red02"], burn)
+        assert [result["outcome"] for result in results] == ["ok", "failed", "failed"]
+
+    def test_stop(self):
+        HEADING()
+
+        class Stop(Scheduler):
+            def wait(self, name, device, first=True):
+                return name != "red01"
+
+        results = Stop(devices=["/dev/sdb"]).run(["red", "red01", "red02"],
+                                                 lambda name, device, progress: True)
+        assert [result["outcome"] for result in results] == ["ok", "skipped", "skipped"]
+
+    def test_detect(self):
+        HEADING()
+        # the card of the first host is removed and the next one inserted
+        sizes = iter([0, 0, 8, 8, 8, 0, 0, 8])
+
+        class Detect(Scheduler):
+            @staticmethod
+            def size(device):
+                return next(sizes)
+
+        scheduler = Detect(devices=["/dev/sdb"], auto=True, interval=0.01)
+        scheduler.auto = True
+        assert scheduler.wait("red", "/dev/sdb", first=True)
+        assert scheduler.wait("red01", "/dev/sdb", first=False)
+        assert next(sizes, None) is None
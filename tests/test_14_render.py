@@ -0,0 +1,152 @@
+###############################################################
+# pytest -v --capture=no tests/test_14_render.py
+# pytest -v  tests/test_14_render.py
+# pytest -v --capture=no tests/test_14_render.py::Test_render::test_raspberry
+###############################################################
+
+import shutil
+
+import pytest
+import yaml
+
+from cloudmesh.burn.burner.RaspberryBurner import Burner as RaspberryBurner
+from cloudmesh.burn.render import Bundle
+from cloudmesh.burn.ubuntu.configure import Configure
+from cloudmesh.common.util import HEADING
+from cloudmesh.inventory.inventory import Inventory
+
+
+def create_inventory(tmp_path, tag="latest-lite"):
+    keyfile = tmp_path / "id_rsa.pub"
+    keyfile.write_text("ssh-rsa AAAA user@host\n")
+    filename = str(tmp_path / "inventory-red.yaml")
+    inventory = Inventory(filename)
+    for i, name in enumerate(["red", "red01", "red02"]):
+        inventory.add(host=name,
+                      service="manager" if i == 0 else "worker",
+                      ip=f"10.1.1.{i + 1}",
+                      tag=tag,
+                      keyfile=str(keyfile),
+                      timezone="America/Indiana/Indianapolis",
+                      locale="us")
+    inventory.save()
+    return filename
+
+
+@pytest.mark.incremental
+class Test_render:
+
+    def test_bundle(self, tmp_path):
+        HEADING()
+        bundle = Bundle(str(tmp_path / "bundle"))
+        digest = Bundle.digest({"host": "red01"})
+        assert not bundle.current("red01", digest)
+        bundle.store("red01", digest, {"firstrun.sh": "#!/bin/bash\n"})
+        bundle.save()
+
+        bundle = Bundle(str(tmp_path / "bundle"))
+        assert "red01" in bundle
+        assert bundle.current("red01", digest)
+        assert not bundle.current("red01", Bundle.digest({"host": "red02"}))
+        assert bundle.load("red01") == {"firstrun.sh": "#!/bin/bash\n"}
+
+        (tmp_path / "bundle" / "red01" / "firstrun.sh").write_text("modified")
+        assert not bundle.current("red01", digest)
+        with pytest.raises(ValueError):
+            bundle.load("red01")
+
+    def test_secret(self, tmp_path):
+        HEADING()
+        directory = tmp_path / "bundle"
+        bundle = Bundle(str(directory))
+        digest = Bundle.digest({"host": "red01"})
+        bundle.store("red01", digest, {"firstrun.sh": "#!/bin/bash\n"})
+        bundle.store("red01", digest, {"firstrun.sh": "PRIVATE KEY"}, secret=True)
+        bundle.save()
+        assert bundle.current("red01", digest)
+        assert bundle.load("red01") == {"firstrun.sh": "PRIVATE KEY"}
+
+        # the private keys never touch the disk
+        assert not (directory / "red01").exists()
+        assert "PRIVATE KEY" not in (directory / Bundle.MANIFEST).read_text()
+        assert not Bundle(str(directory)).current("red01", digest)
+
+    def test_raspberry(self, tmp_path):
+        HEADING()
+        inventory = create_inventory(tmp_path)
+        directory = str(tmp_path / "bundle")
+
+        burner = RaspberryBurner(inventory=inventory)
+        bundle = burner.render(names="red,red0[1-2]", bundle=Bundle(directory),
+                               ssid="cluster", wifipasswd="secret", shared_hosts=True)
+        assert sorted(bundle.rendered) == ["red", "red01", "red02"]
+        files = bundle.load("red01")
+        assert sorted(files) == ["firstrun.sh", "hosts"]
+        assert "echo red01 >/etc/hostname" in files["firstrun.sh"]
+        assert files["hosts"] == "10.1.1.1\tred\n10.1.1.2\tred01\n10.1.1.3\tred02\n"
+
+        bundle = burner.render(names="red,red0[1-2]", bundle=Bundle(directory),
+                               ssid="cluster", wifipasswd="secret", shared_hosts=True)
+        assert bundle.rendered == []
+        assert bundle.load("red01") == files
+
+        # changing one host only renders this host
+        inv = Inventory(inventory)
+        inv.set("red02", "timezone", "Europe/Berlin")
+        inv.save()
+        burner = RaspberryBurner(inventory=inventory)
+        bundle = burner.render(names="red,red0[1-2]", bundle=Bundle(directory),
+                               ssid="cluster", wifipasswd="secret", shared_hosts=True)
+        assert bundle.rendered == ["red02"]
+        assert "Europe/Berlin" in bundle.load("red02")["firstrun.sh"]
+
+    @pytest.mark.skipif(shutil.which("ssh-keygen") is None, reason="ssh-keygen is not installed")
+    def test_ubuntu(self, tmp_path):
+        HEADING()
+        inventory = create_inventory(tmp_path, tag="ubuntu-20.10-64-bit")
+        directory = str(tmp_path / "bundle")
+
+        bundle = Configure(inventory=inventory).render(names=["red01", "red", "red02"],
+                                                       bundle=Bundle(directory))
+        assert sorted(bundle.rendered) == ["red", "red01", "red02"]
+        key = bundle.load("red")["id_rsa.pub"].strip()
+        user_data = yaml.safe_load(bundle.load("red02")["user-data"])
+        assert key in user_data["ssh_authorized_keys"]
+
+        # the private key of the manager is not written to the bundle
+        assert not (tmp_path / "bundle" / "red").exists()
+        assert "red" not in Bundle(directory)
+
+        # the manager is kept in memory
+        rendered = list(bundle.rendered)
+        bundle = Configure(inventory=inventory).render(names=["red", "red01", "red02"],
+                                                       bundle=bundle)
+        assert bundle.rendered == rendered
+        assert bundle.load("red")["id_rsa.pub"].strip() == key
+
+        # a new manager key is generated and the workers get it
+        bundle = Configure(inventory=inventory).render(names=["red", "red01", "red02"],
+                                                       bundle=Bundle(directory))
+        assert sorted(bundle.rendered) == ["red", "red01", "red02"]
+        key = bundle.load("red")["id_rsa.pub"].strip()
+        user_data = yaml.safe_load(bundle.load("red02")["user-data"])
+        assert key in user_data["ssh_authorized_keys"]
+
+    @pytest.mark.skipif(shutil.which("ssh-keygen") is None, reason="ssh-keygen is not installed")
+    def test_ubuntu_order(self, tmp_path):
+        HEADING()
+        inventory = create_inventory(tmp_path, tag="ubuntu-20.10-64-bit")
+
+        # the workers get the key of the manager even if they come first
+        bundle = Configure(inventory=inventory).render(names=["red02", "red01", "red"])
+        assert bundle.rendered == ["red02", "red01", "red"]
+        key = bundle.load("red")["id_rsa.pub"].strip()
+        for name in ["red01", "red02"]:
+            user_data = yaml.safe_load(bundle.load(name)["user-data"])
+            assert key in user_data["ssh_authorized_keys"]
+
+        inv = Inventory(inventory)
+        inv.set("red01", "service", "manager")
+        inv.save()
+        with pytest.raises(Exception):
+            Configure(inventory=inventory).render(names=["red", "red01"])
@@ -0,0 +1,115 @@
+###############################################################
+# pytest -v --capture=no tests/test_16_customize.py
+# pytest -v  tests/test_16_customize.py
+# pytest -v --capture=no tests/test_16_customize.py::Test_customize::test_image
+###############################################################
+
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from cloudmesh.burn.customize import Customize
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.raspberryos.runfirst import Runfirst
+from cloudmesh.common.util import HEADING
+
+START = 2048
+
+
+def create_image(tmp_path):
+    """
+    Creates an image with an MBR, an empty boot partition and an ext4 root
+    partition with the files of a Raspberry OS image
+    """
+    root = tmp_path / "root"
+    os.makedirs(root / "etc/ssh")
+    os.makedirs(root / "etc/default")
+    os.makedirs(root / "etc/xdg/autostart")
+    os.makedirs(root / "etc/systemd/system/multi-user.target.wants")
+    os.makedirs(root / "lib/systemd/system")
+    (root / "etc/ssh/sshd_config").write_text("Include /etc/ssh/sshd_config.d/*.conf\n")
+    (root / "etc/default/keyboard").write_text('XKBLAYOUT="gb"\n')
+    (root / "etc/timezone").write_text("Europe/London\n")
+    (root / "etc/xdg/autostart/piwiz.desktop").write_text("[Desktop Entry]\n")
+    (root / "lib/systemd/system/ssh.service").write_text("[Unit]\n")
+    os.symlink("/usr/share/zoneinfo/Europe/London", root / "etc/localtime")
+
+    filesystem = str(tmp_path / "root.fs")
+    subprocess.run(["mkfs.ext4", "-q", "-F", "-d", str(root), filesystem, "16M"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    image = str(tmp_path / "raspios.img")
+    boot_sectors = 2048
+    root_start = START + boot_sectors
+    with open(filesystem, "rb") as f:
+        data = f.read()
+    with open(image, "wb") as f:
+        f.truncate(root_start * 512 + len(data))
+        mbr = bytearray(512)
+        struct.pack_into("<B3sB3sII", mbr, 446, 0, b"", 0x0c, b"", START, boot_sectors)
+        struct.pack_into("<B3sB3sII", mbr, 462, 0, b"", 0x83, b"", root_start, len(data) // 512)
+        mbr[510:512] = b"\x55\xaa"
+        f.write(mbr)
+        f.seek(root_start * 512)
+        f.write(data)
+    return image
+
+
+@pytest.mark.incremental
+class Test_customize:
+
+    @pytest.mark.skipif(shutil.which("mkfs.ext4") is None or shutil.which("debugfs") is None,
+                        reason="e2fsprogs is not installed")
+    def test_image(self, tmp_path):
+        HEADING()
+        base = create_image(tmp_path)
+        customize = Customize(timezone="America/Indiana/Indianapolis", country="US",
+                              directory=str(tmp_path / "custom"))
+        image = customize.image(base)
+        assert image == customize.path(base)
+        assert os.path.getsize(image) == os.path.getsize(base)
+
+        offset = MBR.partition(image, 2)["offset"]
+        with Ext4(image, offset=offset) as root:
+            assert root.read("/etc/ssh/sshd_config").endswith(b"\nPasswordAuthentication no\n")
+            assert root.read("/etc/ssh/sshd_config.orig") == b"Include /etc/ssh/sshd_config.d/*.conf\n"
+            assert root.read("/etc/timezone") == b"America/Indiana/Indianapolis\n"
+            assert root.readlink("/etc/localtime") == "/usr/share/zoneinfo/America/Indiana/Indianapolis"
+            assert b'XKBLAYOUT="us"' in root.read("/etc/default/keyboard")
+            assert root.readlink("/etc/systemd/system/multi-user.target.wants/ssh.service") == \
+                "/lib/systemd/system/ssh.service"
+            assert not root.exists("/etc/xdg/autostart/piwiz.desktop")
+
+        check = subprocess.run(["e2fsck", "-fn", f"{image}?offset={offset}"],
+                               capture_output=True)
+        assert check.returncode == 0
+
+        # the base image is unchanged and the customized image is reused
+        with Ext4(base, offset=offset) as root:
+            assert root.read("/etc/timezone") == b"Europe/London\n"
+        mtime = os.path.getmtime(image)
+        assert customize.image(base) == image
+        assert os.path.getmtime(image) == mtime
+        other = Customize(timezone="Europe/Berlin", directory=str(tmp_path / "custom"))
+        assert other.path(base) != image
+
+    def test_runfirst(self):
+        HEADING()
+        runfirst = Runfirst()
+        runfirst.set_hostname("red01")
+        runfirst.set_key(key="ssh-rsa AAAA pi@red")
+        runfirst.set_locale()
+        script = runfirst.get()
+        assert "dpkg-reconfigure -f noninteractive tzdata" in script
+        assert "systemctl enable ssh" in script
+
+        runfirst.set_customized()
+        script = runfirst.get()
+        assert "dpkg-reconfigure" not in script
+        assert "PasswordAuthentication" not in script
+        assert "echo red01 >/etc/hostname" in script
+        assert "ssh-rsa AAAA pi@red" in script
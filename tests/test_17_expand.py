@@ -0,0 +1,152 @@
+###############################################################
+# pytest -v --capture=no tests/test_17_expand.py
+# pytest -v  tests/test_17_expand.py
+# pytest -v --capture=no tests/test_17_expand.py::Test_expand::test_device
+###############################################################
+
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from cloudmesh.burn.expand import Expand
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.raspberryos.cmdline import Cmdline
+from cloudmesh.burn.sdcard import SDCard
+from cloudmesh.common.util import HEADING
+
+START = 2048
+CARD = 64 * 1024 ** 2
+
+
+def create_card(tmp_path):
+    """
+    Creates a card of 64 MiB on which an image with an MBR, an empty boot
+    partition and a root partition of 16 MiB is burned
+    """
+    root = tmp_path / "root"
+    os.makedirs(root / "etc/init.d")
+    os.makedirs(root / "etc/rc3.d")
+    (root / "etc/hostname").write_text("raspberrypi\n")
+    (root / "etc/init.d/resize2fs_once").write_text("#!/bin/sh\n")
+    os.symlink("../init.d/resize2fs_once", root / "etc/rc3.d/S01resize2fs_once")
+
+    filesystem = str(tmp_path / "root.fs")
+    subprocess.run(["mkfs.ext4", "-q", "-F", "-b", "4096", "-d", str(root), filesystem, "16M"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    card = str(tmp_path / "card.img")
+    boot_sectors = 2048
+    root_start = START + boot_sectors
+    with open(filesystem, "rb") as f:
+        data = f.read()
+    with open(card, "wb") as f:
+        f.truncate(CARD)
+        mbr = bytearray(512)
+        struct.pack_into("<B3sB3sII", mbr, 446, 0, b"", 0x0c, b"", START, boot_sectors)
+        struct.pack_into("<B3sB3sII", mbr, 462, 0, b"", 0x83, b"", root_start, len(data) // 512)
+        mbr[510:512] = b"\x55\xaa"
+        f.write(mbr)
+        f.seek(root_start * 512)
+        f.write(data)
+    return card
+
+
+@pytest.mark.incremental
+class Test_expand:
+
+    @pytest.mark.skipif(shutil.which("mkfs.ext4") is None or shutil.which("resize2fs") is None
+                        or shutil.which("debugfs") is None,
+                        reason="e2fsprogs is not installed")
+    def test_device(self, tmp_path):
+        HEADING()
+        card = create_card(tmp_path)
+        assert Expand.device(card)
+
+        partition = MBR.partition(card, 2)
+        assert partition["offset"] + partition["size"] == CARD
+        assert MBR.partition(card, 1)["sectors"] == 2048
+
+        with Ext4(card, offset=partition["offset"]) as root:
+            assert root.blocks_count * root.block_size == partition["size"]
+            assert root.read("/etc/hostname") == b"raspberrypi\n"
+            assert not root.exists("/etc/init.d/resize2fs_once")
+            assert not root.exists("/etc/rc3.d/S01resize2fs_once", follow=False)
+
+        check = subprocess.run(["e2fsck", "-fn", f"{card}?offset={partition['offset']}"],
+                               capture_output=True)
+        assert check.returncode == 0
+
+        # a second expansion does not change the card
+        assert Expand.layout(card) is None
+        assert Expand.device(card)
+
+    @pytest.mark.skipif(shutil.which("mkfs.ext4") is None, reason="e2fsprogs is not installed")
+    def test_layout(self, tmp_path, monkeypatch):
+        HEADING()
+        card = create_card(tmp_path)
+        with open(card, "rb") as f:
+            mbr = f.read(512)
+
+        # the file system is not grown, so the partition keeps its size
+        def fail(device, partition):
+            raise OSError("resize2fs failed")
+
+        monkeypatch.setattr(Expand, "resize", staticmethod(fail))
+        with pytest.raises(OSError):
+            Expand.device(card)
+        with open(card, "rb") as f:
+            assert f.read(512) == mbr
+
+        # a partition after the root partition is not overwritten
+        root = MBR.partition(card, 2)
+        with open(card, "r+b") as f:
+            entry = bytearray(mbr)
+            struct.pack_into("<B3sB3sII", entry, 478, 0, b"", 0x83, b"",
+                             root["start"] + root["sectors"], 2048)
+            f.write(entry)
+        with pytest.raises(ValueError):
+            Expand.layout(card)
+        assert MBR.partition(card, 2)["sectors"] == root["sectors"]
+
+        # the root partition must be an ext4 file system
+        card = create_card(tmp_path / "fat")
+        root = MBR.partition(card, 2)
+        with open(card, "r+b") as f:
+            f.seek(root["offset"])
+            f.write(bytes(4096))
+        with pytest.raises(ValueError):
+            Expand.layout(card)
+        assert MBR.partition(card, 2)["sectors"] == root["sectors"]
+
+    def test_copy(self, tmp_path, monkeypatch):
+        HEADING()
+        from cloudmesh.burn import sdcard
+
+        burned = []
+        expanded = []
+        monkeypatch.setattr(SDCard, "burn_sdcard", lambda self, **kwargs: burned.append(kwargs))
+        monkeypatch.setattr(sdcard.Expand, "device", staticmethod(lambda device: expanded.append(device)))
+
+        image = tmp_path / "red.img"
+        image.write_bytes(b"\0" * 1024)
+        SDCard().copy(device="/dev/sdb", from_file=str(image))
+        assert burned == [{"image": str(image), "device": "/dev/sdb"}]
+        assert expanded == []
+
+        # a shrunk image grows to the size of the card if asked for
+        SDCard().copy(device="/dev/sdb", from_file=str(image), expand=True)
+        assert expanded == ["/dev/sdb"]
+
+    def test_cmdline(self):
+        HEADING()
+        content = "console=tty1 root=PARTUUID=9730496b-02 rootfstype=ext4 rootwait"
+        cmdline = Cmdline()
+        assert "init=/usr/lib/raspi-config/init_resize.sh" in cmdline.build(content)
+        script = cmdline.build(content, resize=False)
+        assert "init_resize" not in script
+        assert "root=PARTUUID=9730496b-02" in script
+        assert "systemd.run=/boot/firstrun.sh" in script
@@ -0,0 +1,110 @@
+###############################################################
+# pytest -v --capture=no tests/test_18_shrink.py
+# pytest -v  tests/test_18_shrink.py
+# pytest -v --capture=no tests/test_18_shrink.py::Test_shrink::test_image
+###############################################################
+
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from cloudmesh.burn.expand import Expand
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.mbr import MBR
+from cloudmesh.burn.shrink import Shrink
+from cloudmesh.common.util import HEADING
+
+START = 2048
+
+pytestmark = pytest.mark.skipif(
+    any(shutil.which(program) is None for program in ["mkfs.ext4", "resize2fs", "e2fsck"]),
+    reason="e2fsprogs is not installed")
+
+
+def create_backup(tmp_path):
+    """
+    Creates a backup of a card of 96 MiB with a few files in the root
+    partition that fills the card
+    """
+    root = tmp_path / "root"
+    os.makedirs(root / "etc")
+    (root / "etc/hostname").write_text("red01\n")
+    (root / "data").write_bytes(os.urandom(2 * 1024 ** 2))
+
+    size = 96 * 1024 ** 2
+    root_start = START + 2048
+    filesystem = str(tmp_path / "root.fs")
+    subprocess.run(["mkfs.ext4", "-q", "-F", "-b", "4096", "-d", str(root), filesystem,
+                    f"{(size - root_start * 512) // 1024}K"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    backup = str(tmp_path / "backup.img")
+    with open(filesystem, "rb") as f:
+        data = f.read()
+    with open(backup, "wb") as f:
+        f.truncate(size)
+        mbr = bytearray(512)
+        struct.pack_into("<B3sB3sII", mbr, 446, 0, b"", 0x0c, b"", START, 2048)
+        struct.pack_into("<B3sB3sII", mbr, 462, 0, b"", 0x83, b"", root_start, len(data) // 512)
+        mbr[510:512] = b"\x55\xaa"
+        f.write(mbr)
+        f.seek(root_start * 512)
+        f.write(data)
+    return backup
+
+
+@pytest.mark.incremental
+class Test_shrink:
+
+    def test_target(self):
+        HEADING()
+        assert Shrink.target(100000, 20000) == 25000
+        assert Shrink.target(22000, 20000) == 21000
+        assert Shrink.target(20050, 20000) == 20050
+
+    @pytest.mark.parametrize("loop", [False, True])
+    def test_image(self, tmp_path, loop):
+        HEADING()
+        if loop and (os.geteuid() != 0 or shutil.which("losetup") is None):
+            pytest.skip("loop devices need root")
+        backup = create_backup(tmp_path)
+        with Ext4(backup) as root:
+            data = root.read("/data")
+        try:
+            before, after = Shrink.image(backup, extra=256, loop=loop)
+        except OSError as e:
+            if loop:
+                pytest.skip(f"loop devices are not available: {e}")
+            raise
+        assert before == 96 * 1024 ** 2
+        assert after == os.path.getsize(backup)
+        assert after < before // 2
+
+        partition = MBR.partition(backup, 2)
+        assert partition["offset"] + partition["size"] == after
+        with Ext4(backup, offset=partition["offset"]) as root:
+            assert root.blocks_count * root.block_size == partition["size"]
+            assert root.read("/etc/hostname") == b"red01\n"
+            assert root.read("/data") == data
+
+        check = subprocess.run(["e2fsck", "-fn", f"{backup}?offset={partition['offset']}"],
+                               capture_output=True)
+        assert check.returncode == 0
+
+        # the image stays sparse
+        assert os.stat(backup).st_blocks * 512 < after
+
+    def test_expand(self, tmp_path):
+        HEADING()
+        backup = create_backup(tmp_path)
+        Shrink.image(backup, loop=False)
+        card = str(tmp_path / "card.img")
+        shutil.copyfile(backup, card)
+        with open(card, "r+b") as f:
+            f.truncate(128 * 1024 ** 2)
+        assert Expand.device(card)
+        partition = MBR.partition(card, 2)
+        assert partition["offset"] + partition["size"] == 128 * 1024 ** 2
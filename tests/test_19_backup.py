@@ -0,0 +1,228 @@
+###############################################################
+# pytest -v --capture=no tests/test_19_backup.py
+# pytest -v  tests/test_19_backup.py
+# pytest -v --capture=no tests/test_19_backup.py::Test_backup::test_restore
+# pytest -v --capture=no tests/test_19_backup.py::Test_chunkstore::test_incremental
+###############################################################
+
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from cloudmesh.burn.backup import Backup
+from cloudmesh.burn.backup import CHUNK
+from cloudmesh.burn.chunkstore import ChunkStore
+from cloudmesh.burn.ext4 import Ext4
+from cloudmesh.burn.fat32 import Fat32
+from cloudmesh.common.util import HEADING
+
+BOOT_START = 8192
+BOOT_SECTORS = 140000
+ROOT_START = BOOT_START + BOOT_SECTORS
+SIZE = 256 * 1024 ** 2
+
+pytestmark = pytest.mark.skipif(shutil.which("mkfs.ext4") is None,
+                                reason="e2fsprogs is not installed")
+
+
+def create_card(tmp_path, block_size=4096):
+    """
+    Creates the image of a card of 256 MiB with a FAT32 boot partition and
+    an ext4 root partition that fills the card
+    """
+    root = tmp_path / "root"
+    os.makedirs(root / "etc")
+    (root / "etc/hostname").write_text("red01\n")
+    (root / "data").write_bytes(os.urandom(3 * 1024 ** 2))
+
+    filesystem = str(tmp_path / "root.fs")
+    subprocess.run(["mkfs.ext4", "-q", "-F", "-b", str(block_size), "-d", str(root), filesystem,
+                    f"{(SIZE - ROOT_START * 512) // 1024}K"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    card = str(tmp_path / "card.img")
+    reserved = 32
+    fat_sectors = (BOOT_SECTORS * 4 + 511) // 512
+    with open(card, "wb") as f:
+        f.truncate(SIZE)
+
+        mbr = bytearray(512)
+        struct.pack_into("<B3sB3sII", mbr, 446, 0x80, b"", 0x0c, b"", BOOT_START, BOOT_SECTORS)
+        struct.pack_into("<B3sB3sII", mbr, 462, 0, b"", 0x83, b"", ROOT_START,
+                         SIZE // 512 - ROOT_START)
+        mbr[510:512] = b"\x55\xaa"
+        f.write(mbr)
+
+        boot = bytearray(512)
+        boot[0:3] = b"\xeb\x58\x90"
+        struct.pack_into("<HBHBHHBHHHII", boot, 11,
+                         512, 1, reserved, 2, 0, 0, 0xF8, 0, 32, 64, BOOT_START, BOOT_SECTORS)
+        struct.pack_into("<IHHIHH", boot, 36, fat_sectors, 0, 0, 2, 1, 6)
+        boot[510:512] = b"\x55\xaa"
+        f.seek(BOOT_START * 512)
+        f.write(boot)
+        table = struct.pack("<III", 0x0FFFFFF8, 0x0FFFFFFF, 0x0FFFFFFF)
+        for i in range(2):
+            f.seek((BOOT_START + reserved + i * fat_sectors) * 512)
+            f.write(table)
+
+        with open(filesystem, "rb") as fs:
+            f.seek(ROOT_START * 512)
+            shutil.copyfileobj(fs, f)
+
+    with Fat32(card) as boot:
+        boot.write("cmdline.txt", "console=serial0,115200 root=PARTUUID=9730496b-02\n")
+        boot.write("kernel.img", os.urandom(300 * 1024))
+    return card
+
+
+def check_card(card, original):
+    with Fat32(original) as boot:
+        kernel = boot.read("kernel.img")
+    with Ext4(original) as root:
+        data = root.read("/data")
+    with Fat32(card) as boot:
+        assert boot.read("kernel.img") == kernel
+        assert boot.read("cmdline.txt").startswith(b"console=serial0")
+    with Ext4(card) as root:
+        assert root.read("/etc/hostname") == b"red01\n"
+        assert root.read("/data") == data
+    if shutil.which("e2fsck"):
+        result = subprocess.run(["e2fsck", "-fn", f"{card}?offset={ROOT_START * 512}"],
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+
+
+@pytest.mark.incremental
+class Test_backup:
+
+    def test_merge(self):
+        HEADING()
+        assert Backup._merge([(100, 10), (0, 50), (40, 20), (200, 100)], 250) == \
+            [(0, 60), (100, 10), (200, 50)]
+        assert Backup._merge([(0, 50), (60, 10)], 1000, gap=10) == [(0, 70)]
+
+    @pytest.mark.parametrize("block_size", [1024, 4096])
+    def test_ranges(self, tmp_path, block_size):
+        HEADING()
+        card = create_card(tmp_path, block_size=block_size)
+        ranges = Backup.ranges(card)
+        used = sum(length for _, length in ranges)
+        assert ranges[0][0] == 0
+        assert used < SIZE // 4
+        with Fat32(card) as boot:
+            assert all(any(offset <= start and start + length <= offset + size
+                           for offset, size in ranges)
+                       for start, length in boot.allocated())
+
+    @pytest.mark.parametrize("block_size", [1024, 4096])
+    def test_restore(self, tmp_path, block_size):
+        HEADING()
+        card = create_card(tmp_path, block_size=block_size)
+        backup = str(tmp_path / "card.cmburn")
+        index = Backup.create(card, backup, progress=lambda read, total: None)
+        assert Backup.is_backup(backup)
+        assert not Backup.is_backup(card)
+        assert Backup.index(backup)["chunks"] == index["chunks"]
+        assert index["size"] == SIZE
+        assert os.path.getsize(backup) < SIZE // 10
+
+        image = str(tmp_path / "new.img")
+        Backup.restore(backup, image, progress=lambda written, total: None)
+        assert os.path.getsize(image) == SIZE
+        check_card(image, card)
+
+    def test_restore_card(self, tmp_path):
+        HEADING()
+        if os.geteuid() != 0 or shutil.which("losetup") is None:
+            pytest.skip("loop devices need root")
+        card = create_card(tmp_path)
+        backup = str(tmp_path / "card.cmburn")
+        Backup.create(card, backup, progress=lambda read, total: None)
+
+        # a card with old content in the blocks that are not in the backup
+        restored = str(tmp_path / "restored.img")
+        with open(restored, "wb") as f:
+            for i in range(SIZE // 1024 ** 2):
+                f.write(os.urandom(1024 ** 2))
+        result = subprocess.run(["losetup", "--find", "--show", restored],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            pytest.skip(f"loop devices are not available: {result.stderr.strip()}")
+        device = result.stdout.strip()
+        try:
+            Backup.restore(backup, device, progress=lambda written, total: None)
+        finally:
+            subprocess.run(["losetup", "--detach", device])
+        check_card(restored, card)
+
+    def test_corrupted(self, tmp_path):
+        HEADING()
+        card = create_card(tmp_path)
+        backup = str(tmp_path / "card.cmburn")
+        index = Backup.create(card, backup, progress=lambda read, total: None)
+        offset, length, position, stored, crc = index["chunks"][-1]
+        with open(backup, "r+b") as f:
+            f.seek(position + stored // 2)
+            byte = f.read(1)
+            f.seek(position + stored // 2)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        with pytest.raises(Exception):
+            Backup.restore(backup, str(tmp_path / "new.img"), progress=lambda written, total: None)
+
+
+@pytest.mark.incremental
+class Test_chunkstore:
+
+    def test_chunks(self):
+        HEADING()
+        assert ChunkStore.chunks([(0, 512), (CHUNK - 10, 20), (3 * CHUNK + 5, 10)], 3 * CHUNK + 100) == \
+            [(0, CHUNK), (CHUNK, CHUNK), (3 * CHUNK, 100)]
+
+    def test_incremental(self, tmp_path):
+        HEADING()
+        card = create_card(tmp_path)
+        store = ChunkStore(str(tmp_path / "chunks"))
+        first = str(tmp_path / "first.json")
+        manifest = store.backup(card, first, progress=lambda read, total: None)
+        assert manifest["new"] > 0
+        assert ChunkStore.is_manifest(first)
+        assert not ChunkStore.is_manifest(card)
+        assert not Backup.is_backup(first)
+
+        again = store.backup(card, str(tmp_path / "again.json"), progress=lambda read, total: None)
+        assert again["new"] == 0
+        assert again["chunks"] == manifest["chunks"]
+
+        with Fat32(card) as boot:
+            boot.write("cmdline.txt", "console=serial0,115200 console=tty1 root=PARTUUID=9730496b-02\n")
+        second = str(tmp_path / "second.json")
+        changed = store.backup(card, second, progress=lambda read, total: None)
+        assert 0 < changed["new"] <= 2
+        assert changed["written"] < manifest["written"]
+
+        image = str(tmp_path / "second.img")
+        ChunkStore.restore(second, image, progress=lambda written, total: None)
+        check_card(image, card)
+        with Fat32(image) as boot:
+            assert b"console=tty1" in boot.read("cmdline.txt")
+
+        image = str(tmp_path / "first.img")
+        ChunkStore.restore(first, image, progress=lambda written, total: None)
+        with Fat32(image) as boot:
+            assert b"console=tty1" not in boot.read("cmdline.txt")
+
+    def test_missing(self, tmp_path):
+        HEADING()
+        card = create_card(tmp_path)
+        store = ChunkStore(str(tmp_path / "chunks"))
+        manifest = str(tmp_path / "card.json")
+        digest = store.backup(card, manifest, progress=lambda read, total: None)["chunks"][-1][2]
+        os.remove(store.path(digest))
+        image = str(tmp_path / "card.img.restored")
+        with pytest.raises(ValueError):
+            ChunkStore.restore(manifest, image, progress=lambda written, total: None)
+        assert not os.path.exists(image)
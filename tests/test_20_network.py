@@ -0,0 +1,94 @@
+###############################################################
+# pytest -v --capture=no tests/test_20_network.py
+# pytest -v  tests/test_20_network.py
+# pytest -v --capture=no tests/test_20_network.py::Test_network::test_scan
+###############################################################
+
+import socket
+import time
+
+import pytest
+
+from cloudmesh.burn.network import Network
+from cloudmesh.common.util import HEADING
+
+PROC_ARP = """IP address       HW type     Flags       HW address            Mask     Device
+192.168.1.1      0x1         0x2         aa:bb:cc:dd:ee:01     *        eth0
+192.168.1.7      0x1         0x0         00:00:00:00:00:00     *        eth0
+192.168.1.46     0x1         0x2         DC:A6:32:00:00:46     *        eth0
+"""
+
+BSD_ARP = """? (192.168.1.1) at aa:bb:cc:dd:ee:1 on en0 ifscope [ethernet]
+? (192.168.1.7) at (incomplete) on en0 ifscope [ethernet]
+"""
+
+
+@pytest.mark.incremental
+class Test_network:
+
+    def test_hosts(self):
+        HEADING()
+        hosts = Network.hosts("192.168.1.12")
+        assert len(hosts) == 254
+        assert hosts[0] == "192.168.1.1"
+        assert hosts[-1] == "192.168.1.254"
+        assert Network.hosts("10.1.0.5/30") == ["10.1.0.5", "10.1.0.6"]
+
+    def test_hosts_default(self, monkeypatch):
+        HEADING()
+        # a /16 interface only scans its /24 unless the prefix is given
+        monkeypatch.setattr(Network, "address",
+                            staticmethod(lambda: [{"ifname": "eth0", "local": "10.1.2.3", "prefixlen": 16}]))
+        hosts = Network.hosts()
+        assert len(hosts) == 254
+        assert hosts[0] == "10.1.2.1"
+        assert len(Network.hosts("10.1.2.3/22")) == 1022
+
+    def test_arp(self):
+        HEADING()
+        assert Network.arp(PROC_ARP) == {
+            "192.168.1.1": "aa:bb:cc:dd:ee:01",
+            "192.168.1.46": "dc:a6:32:00:00:46"
+        }
+        assert Network.arp(BSD_ARP) == {"192.168.1.1": "aa:bb:cc:dd:ee:1"}
+
+    def test_scan(self):
+        HEADING()
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(16)
+        port = server.getsockname()[1]
+        try:
+            start = time.time()
+            details = Network.scan(["127.0.0.1"], port=port, timeout=0.5)
+            assert time.time() - start < 2
+        finally:
+            server.close()
+        assert details[0]["ip"] == "127.0.0.1"
+        assert details[0]["status"] == "up"
+        assert details[0]["ssh"]
+        assert details[0]["latency"] < 0.5
+
+        # a refused connection shows that the host is up
+        details = Network.scan(["127.0.0.1"], port=port, timeout=0.5, names=False)
+        assert details[0]["status"] == "up"
+        assert not details[0]["ssh"]
+
+    def test_down(self, monkeypatch):
+        HEADING()
+
+        async def probe(ip, port=22, timeout=1.0):
+            return "down", None
+
+        monkeypatch.setattr(Network, "probe", probe)
+        monkeypatch.setattr(Network, "arp", lambda: {"10.0.0.2": "dc:a6:32:00:00:02"})
+        details = Network.scan(["10.0.0.1", "10.0.0.2"], names=False)
+        assert details == [{
+            "name": "unknown",
+            "ip": "10.0.0.2",
+            "status": "up",
+            "ssh": False,
+            "latency": None,
+            "mac": "dc:a6:32:00:00:02",
+            "method": "arp"
+        }]
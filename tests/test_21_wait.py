@@ -0,0 +1,101 @@
+###############################################################
+# pytest -v --capture=no tests/test_21_wait.py
+# pytest -v  tests/test_21_wait.py
+# pytest -v --capture=no tests/test_21_wait.py::Test_wait::test_run
+###############################################################
+
+import json
+import socket
+import struct
+import threading
+
+import pytest
+
+from cloudmesh.burn.wait import MulticastDNS
+from cloudmesh.burn.wait import Wait
+from cloudmesh.common.util import HEADING
+
+
+def response(query, address):
+    """
+    Returns the response of a responder to the query with a compressed
+    name in the answer
+    """
+    header = struct.pack(">HHHHHH", 0, 0x8400, 1, 1, 0, 0)
+    answer = struct.pack(">HHHIH", 0xC00C, 1, 1, 120, 4) + socket.inet_aton(address)
+    return header + query[12:] + answer
+
+
+def ssh_server(banner):
+    """
+    Starts a server that sends the banner to each connection
+    """
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            connection.sendall(banner)
+            connection.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+@pytest.mark.incremental
+class Test_wait:
+
+    def test_mdns(self):
+        HEADING()
+        query = MulticastDNS.query("red01.local", identifier=7)
+        assert query[:2] == b"\x00\x07"
+        assert b"\x05red01\x05local\x00" in query
+        packet = response(query, "10.1.1.2")
+        assert MulticastDNS.addresses(packet, "red01.local") == ["10.1.1.2"]
+        assert MulticastDNS.addresses(packet, "red02.local") == []
+        # a query is not an answer
+        assert MulticastDNS.addresses(query, "red01.local") == []
+        assert MulticastDNS.addresses(packet[:20], "red01.local") == []
+
+    def test_run(self, tmp_path):
+        HEADING()
+        server = ssh_server(b"SSH-2.0-OpenSSH_7.9p1 Raspbian-10+deb10u2\r\n")
+        port = server.getsockname()[1]
+        try:
+            wait = Wait({"red": "127.0.0.1", "red01": None}, port=port, mdns=False)
+            results = wait.run(timeout=1, interval=0.2, probe_timeout=0.2, live=False)
+        finally:
+            server.close()
+        assert results["red"]["up"] is not None
+        assert results["red"]["ssh"] is not None
+        assert results["red"]["banner"].startswith("SSH-2.0-OpenSSH")
+        assert results["red01"]["ssh"] is None
+        assert [result["host"] for result in wait.pending()] == ["red01"]
+        assert "red01" in wait.table()
+
+        stats = wait.statistics()
+        assert stats["ready"] == 1
+        assert stats["total"] == 2
+
+        log = tmp_path / "boot.jsonl"
+        wait.record(str(log))
+        lines = [json.loads(line) for line in log.read_text().splitlines()]
+        assert [line["host"] for line in lines] == ["red", "red01"]
+        assert "date" in lines[0]
+
+    def test_no_banner(self):
+        HEADING()
+        server = ssh_server(b"HTTP/1.0 400 Bad Request\r\n")
+        port = server.getsockname()[1]
+        try:
+            wait = Wait({"red": "127.0.0.1"}, port=port, mdns=False)
+            results = wait.run(timeout=0.5, interval=0.2, probe_timeout=0.2, live=False)
+        finally:
+            server.close()
+        assert results["red"]["up"] is not None
+        assert results["red"]["ssh"] is None
@@ -0,0 +1,116 @@
+###############################################################
+# pytest -v --capture=no tests/test_22_interfaces.py
+# pytest -v  tests/test_22_interfaces.py
+# pytest -v --capture=no tests/test_22_interfaces.py::Test_interfaces::test_cache
+###############################################################
+
+import shutil
+import socket
+import struct
+import sys
+
+import pytest
+
+from cloudmesh.burn.hardware import Hardware
+from cloudmesh.burn.interfaces import Interfaces
+from cloudmesh.burn.interfaces import NLMSG_DONE
+from cloudmesh.burn.interfaces import RTM_NEWADDR
+from cloudmesh.burn.network import Network
+from cloudmesh.common.util import HEADING
+
+
+def attribute(kind, value):
+    data = struct.pack("=HH", 4 + len(value), kind) + value
+    return data + b"\0" * (-len(data) % 4)
+
+
+def message(kind, payload):
+    return struct.pack("=IHHII", 16 + len(payload), kind, 2, 1, 0) + payload
+
+
+@pytest.mark.incremental
+class Test_interfaces:
+
+    def test_parse(self):
+        HEADING()
+        payload = struct.pack("=BBBBI", socket.AF_INET, 24, 0, 0, 3) + \
+            attribute(1, socket.inet_aton("10.1.1.1")) + \
+            attribute(2, socket.inet_aton("10.1.1.1")) + \
+            attribute(4, socket.inet_aton("10.1.1.255")) + \
+            attribute(3, b"eth0\0")
+        data = message(RTM_NEWADDR, payload) + message(NLMSG_DONE, struct.pack("=i", 0))
+        addresses, done = Interfaces.parse(data, names={3: "eth0"})
+        assert done
+        assert addresses == [{
+            "ifindex": 3,
+            "ifname": "eth0",
+            "family": "inet",
+            "local": "10.1.1.1",
+            "prefixlen": 24,
+            "scope": "global",
+            "broadcast": "10.1.1.255",
+            "label": "eth0"
+        }]
+
+        # IPv6 addresses are skipped
+        payload = struct.pack("=BBBBI", socket.AF_INET6, 64, 0, 253, 3) + attribute(1, bytes(16))
+        addresses, done = Interfaces.parse(message(RTM_NEWADDR, payload))
+        assert addresses == []
+        assert not done
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="netlink needs Linux")
+    def test_netlink(self):
+        HEADING()
+        try:
+            addresses = Interfaces.netlink()
+        except OSError as e:
+            pytest.skip(f"netlink is not available: {e}")
+        loopback = [address for address in addresses if address["ifname"] == "lo"]
+        assert loopback[0]["local"] == "127.0.0.1"
+        assert loopback[0]["scope"] == "host"
+        if shutil.which("ip"):
+            assert sorted(address["local"] for address in addresses) == \
+                sorted(address["local"] for address in Interfaces.ip())
+
+    def test_cache(self, monkeypatch):
+        HEADING()
+        calls = []
+
+        def read():
+            calls.append(1)
+            return [{"ifindex": 3, "ifname": "eth0", "family": "inet", "local": "10.1.1.1",
+                     "prefixlen": 24, "broadcast": "10.1.1.255", "scope": "global"},
+                    {"ifindex": 1, "ifname": "lo", "family": "inet", "local": "127.0.0.1",
+                     "prefixlen": 8, "scope": "host"}]
+
+        monkeypatch.setattr(Interfaces, "netlink", read)
+        monkeypatch.setattr(Interfaces, "ip", read)
+        monkeypatch.setattr(Interfaces, "_changed", classmethod(lambda cls: False))
+        Interfaces.invalidate()
+        try:
+            assert Interfaces.addresses() == read()[:2]
+            Interfaces.addresses()
+            host = Interfaces.host()
+            assert host["hostname"] == socket.gethostname()
+            assert len(calls) == 2
+
+            details = Network.address()
+            assert [entry["ifname"] for entry in details] == ["eth0"]
+            assert details[0]["local"] == "10.1.1.1"
+            assert details[0]["hostname"] == host["hostname"]
+            assert len(calls) == 2
+
+            Interfaces.invalidate()
+            Interfaces.addresses()
+            assert len(calls) == 3
+
+            # the hostname is not resolved with the DNS
+            def resolve(*args):
+                raise AssertionError("the DNS is queried")
+
+            Interfaces.invalidate()
+            monkeypatch.setattr(socket, "gethostbyname", resolve)
+            monkeypatch.setattr(socket, "getfqdn", resolve)
+            assert Hardware.hostname() == socket.gethostname()
+        finally:
+            Interfaces.invalidate()
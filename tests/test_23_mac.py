@@ -0,0 +1,93 @@
+###############################################################
+# pytest -v --capture=no tests/test_23_mac.py
+# pytest -v  tests/test_23_mac.py
+# pytest -v --capture=no tests/test_23_mac.py::Test_mac::test_run
+###############################################################
+
+import asyncio
+import time
+
+import pytest
+
+from cloudmesh.burn.mac import Mac
+from cloudmesh.burn.network import Network
+from cloudmesh.common.util import HEADING
+from cloudmesh.inventory.inventory import Inventory
+
+
+@pytest.mark.incremental
+class Test_mac:
+
+    def test_normalize(self):
+        HEADING()
+        assert Mac.normalize("DC:A6:32:0:0:1\n") == "dc:a6:32:00:00:01"
+        assert Mac.normalize("00:00:00:00:00:00") is None
+        assert Mac.normalize("cat: /sys/class/net/eth0/address: No such file") is None
+        assert Mac.normalize(None) is None
+
+    def test_run(self, monkeypatch):
+        HEADING()
+        table = {}
+
+        async def probe(ip, port=22, timeout=1.0):
+            # the connection fills the neighbor table of the hosts on the network
+            if ip.startswith("10.1.1."):
+                table[ip] = "dc:a6:32:00:00:" + ip.split(".")[-1].zfill(2)
+            return "open", 0.001
+
+        async def ssh(self, ip, timeout):
+            if ip == "10.2.1.3":
+                return "dc:a6:32:00:01:03"
+            await asyncio.sleep(5)
+
+        monkeypatch.setattr(Network, "probe", probe)
+        monkeypatch.setattr(Network, "arp", lambda: dict(table))
+        monkeypatch.setattr(Mac, "ssh", ssh)
+
+        mac = Mac({
+            "red": "10.1.1.1",
+            "red01": "10.1.1.2",
+            "red02": "10.2.1.3",
+            "red03": "10.2.1.4",
+            "red04": None
+        }, mdns=False)
+        start = time.time()
+        results = mac.run(timeout=0.5)
+        # the hosts are queried in parallel, the slow host only times out once
+        assert time.time() - start < 2
+
+        assert results["red"]["mac"] == "dc:a6:32:00:00:01"
+        assert results["red"]["method"] == "arp"
+        assert results["red01"]["mac"] == "dc:a6:32:00:00:02"
+        assert results["red02"]["mac"] == "dc:a6:32:00:01:03"
+        assert results["red02"]["method"] == "ssh"
+        assert results["red03"]["mac"] is None
+        assert results["red03"]["error"] == "timeout"
+        assert results["red03"]["time"] >= 0.4
+        assert results["red04"]["error"] == "unknown address"
+        assert [result["host"] for result in mac.missing()] == ["red03", "red04"]
+        assert "dc:a6:32:00:01:03" in mac.table()
+
+    def test_write(self, tmp_path, monkeypatch):
+        HEADING()
+        filename = str(tmp_path / "inventory.yaml")
+        inventory = Inventory(filename)
+        inventory.add(host="red", ip="10.1.1.1")
+        inventory.add(host="red01")
+        inventory.save()
+
+        saves = []
+        save = Inventory.save
+        monkeypatch.setattr(Inventory, "save", lambda self, *args, **kwargs:
+                            saves.append(1) or save(self, *args, **kwargs))
+
+        mac = Mac({"red": "10.1.1.1", "red01": None}, mdns=False)
+        mac.results["red"].update(mac="dc:a6:32:00:00:01", method="arp")
+        mac.results["red01"].update(ip="10.1.1.2", mac="dc:a6:32:00:00:02", method="ssh")
+        assert mac.write(Inventory(filename)) == 2
+        assert len(saves) == 1
+
+        inventory = Inventory(filename)
+        assert inventory.get("red", "mac") == "dc:a6:32:00:00:01"
+        assert inventory.get("red01", "mac") == "dc:a6:32:00:00:02"
+        assert inventory.get("red01", "ip") == "10.1.1.2"
@@ -0,0 +1,109 @@
+###############################################################
+# pytest -v --capture=no tests/test_24_progress.py
+# pytest -v  tests/test_24_progress.py
+# pytest -v --capture=no tests/test_24_progress.py::Test_progress::test_workers
+###############################################################
+
+import queue
+import time
+
+import pytest
+
+from cloudmesh.burn.progress import Progress
+from cloudmesh.burn.progress import Worker
+from cloudmesh.common.util import HEADING
+
+MB = 1000 ** 2
+
+
+@pytest.mark.incremental
+class Test_progress:
+
+    def test_rate(self):
+        HEADING()
+        now = [0.0]
+        progress = Progress(total=100 * MB, window=5.0, clock=lambda: now[0])
+        assert progress.rate == 0.0
+        assert progress.eta is None
+        assert progress.text() == "0.0 MB/s"
+
+        for second in range(1, 5):
+            now[0] = second
+            progress.update(second * 10 * MB)
+        assert progress.rate == pytest.approx(10 * MB)
+        assert progress.percent == 40
+        assert progress.eta == pytest.approx(6.0)
+        assert progress.text() == "10.0 MB/s ETA 0:06"
+
+        # only the last seconds are measured
+        for second in range(5, 11):
+            now[0] = second
+            progress.update(40 * MB + (second - 4) * 5 * MB)
+        assert progress.rate == pytest.approx(5 * MB)
+        assert progress.details()["size"] == "70 of 100 MB"
+
+    def test_workers(self):
+        HEADING()
+        events = queue.Queue()
+
+        def burn(name, device, progress):
+            for written in range(0, 10 * MB + 1, MB):
+                time.sleep(0.02)
+                progress(written, 10 * MB)
+            if name == "red02":
+                raise OSError("no card")
+            return True
+
+        start = time.time()
+        workers = [Worker(name, device, burn, lambda event, value: events.put((event, value)),
+                          interval=0.05)
+                   for name, device in [("red01", "/dev/sdb"), ("red02", "/dev/sdc")]]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # the burns run at the same time
+        assert time.time() - start < 0.4
+
+        received = []
+        while not events.empty():
+            received.append(events.get())
+        done = {value["host"]: value for (kind, device), value in received if kind == "done"}
+        assert done["red01"]["success"]
+        assert done["red01"]["device"] == "/dev/sdb"
+        assert not done["red02"]["success"]
+        assert done["red02"]["error"] == "no card"
+
+        progress = [value for (kind, device), value in received
+                    if kind == "progress" and device == "/dev/sdb"]
+        # the events are throttled, but the last one is always posted
+        assert 1 < len(progress) < 11
+        assert progress[-1]["percent"] == 100
+        assert "MB/s" in progress[-1]["text"]
+
+    def test_gui_burn(self, monkeypatch):
+        HEADING()
+        gui = pytest.importorskip("cloudmesh.burn.gui")
+        from cloudmesh.burn.burner import RaspberryBurner
+
+        calls = []
+
+        def burn(self, **kwargs):
+            calls.append(kwargs)
+            kwargs["progress"](MB, MB)
+            return True
+
+        monkeypatch.setattr(RaspberryBurner.Burner, "__init__", lambda self, inventory=None: None)
+        monkeypatch.setattr(RaspberryBurner.Burner, "burn", burn)
+
+        window = gui.Gui.__new__(gui.Gui)
+        window.dryrun = False
+        events = queue.Queue()
+        worker = Worker("red01", "/dev/sdb", window.burn, lambda event, value: events.put((event, value)))
+        worker.start()
+        worker.join()
+
+        received = dict(events.get() for _ in range(events.qsize()))
+        assert received[("done", "/dev/sdb")]["success"], received[("done", "/dev/sdb")]["error"]
+        # the worker neither checks the device nor prompts
+        assert calls[0]["yes"] and not calls[0]["check"] and calls[0]["quiet"]
@@ -0,0 +1,92 @@
+###############################################################
+# pytest -v --capture=no tests/test_25_diagrams.py
+# pytest -v  tests/test_25_diagrams.py
+# pytest -v --capture=no tests/test_25_diagrams.py::Test_diagrams::test_update
+###############################################################
+
+import os
+import queue
+
+import pytest
+
+from cloudmesh.common.util import HEADING
+
+pytest.importorskip("cloudmesh.diagram.diagram")
+
+from cloudmesh.burn.diagrams import Diagrams  # noqa: E402
+from cloudmesh.diagram.diagram import Diagram  # noqa: E402
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """
+    Replaces rackdiag and nwdiag and records the rendered diagrams
+    """
+    calls = []
+
+    def saveas(self, name, kind="rack", output="svg"):
+        calls.append((kind, self.diag))
+        with open(f"{name}.{output}", "w") as f:
+            f.write(self.diag)
+
+    monkeypatch.setattr(Diagram, "saveas", saveas)
+    return calls
+
+
+@pytest.mark.incremental
+class Test_diagrams:
+
+    def test_cache(self, tmp_path, rendered):
+        HEADING()
+        diagrams = Diagrams(["red", "red01", "red02"], directory=str(tmp_path))
+        assert diagrams.cached("rack") is None
+
+        rack = diagrams.render("rack")
+        assert rack == diagrams.cached("rack")
+        assert 'description = "red"' in open(rack).read()
+        assert diagrams.render("rack") == rack
+        assert len(rendered) == 1
+
+        # the same hosts are cached in a new instance
+        again = Diagrams(["red", "red01", "red02"], directory=str(tmp_path))
+        assert again.cached("rack") == rack
+
+        # the colors are part of the key
+        again.diagram.data["red01"]["rack.color"] = "green"
+        assert again.cached("rack") is None
+        # the net diagram does not show the rack color
+        assert again.path("net") == diagrams.path("net")
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".diag")]
+
+    def test_update(self, tmp_path, rendered):
+        HEADING()
+        events = queue.Queue()
+        diagrams = Diagrams(["red", "red01"], directory=str(tmp_path),
+                            post=lambda event, value: events.put((event, value)))
+        diagrams.update()
+        diagrams.wait()
+        assert sorted(events.get()[0] for _ in range(2)) == [("diagram", "net"), ("diagram", "rack")]
+        assert len(rendered) == 2
+
+        diagrams.set("red01", "blue")
+        diagrams.wait()
+        received = dict(events.get() for _ in range(2))
+        assert received[("diagram", "rack")] == diagrams.cached("rack")
+        assert 'color="blue"' in open(received[("diagram", "net")]).read()
+
+        # the diagrams of a state that was rendered before are not rendered
+        # again
+        diagrams.set("red01", "white")
+        diagrams.wait()
+        assert len(rendered) == 4
+        assert events.qsize() == 2
+
+    def test_prune(self, tmp_path, rendered, monkeypatch):
+        HEADING()
+        monkeypatch.setattr(Diagrams, "LIMIT", 2)
+        diagrams = Diagrams(["red", "red01"], directory=str(tmp_path))
+        for color in ["blue", "green", "orange"]:
+            diagrams.diagram.data["red01"]["rack.color"] = color
+            diagrams.render("rack")
+        assert len(os.listdir(tmp_path)) == 2
+        assert diagrams.cached("rack")
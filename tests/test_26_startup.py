@@ -0,0 +1,88 @@
+###############################################################
+# pytest -v --capture=no tests/test_26_startup.py
+# pytest -v  tests/test_26_startup.py
+# pytest -v --capture=no tests/test_26_startup.py::Test_startup::test_time
+###############################################################
+
+import json
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+from cloudmesh.common.util import HEADING
+
+# cms imports the burn plugin on each start, it may add at most this time
+TARGET = 0.05
+
+# the modules of the subcommands and their dependencies, none of them is
+# imported with the plugin
+HEAVY = [
+    "cloudmesh.burn.sdcard",
+    "cloudmesh.burn.usb",
+    "cloudmesh.burn.image",
+    "cloudmesh.burn.gui",
+    "cloudmesh.burn.burner.Burner",
+    "cloudmesh.burn.burner.RaspberryBurner",
+    "cloudmesh.burn.burner.raspberryos",
+    "cloudmesh.burn.raspberryos.Locale",
+    "cloudmesh.burn.raspberryos.passwd",
+    "cloudmesh.inventory.inventory",
+    "cloudmesh.common.Shell",
+    "cloudmesh.common.StopWatch",
+    "PySimpleGUI",
+    "humanize",
+    "requests",
+    "usb",
+    "yaml",
+]
+
+SCRIPT = """
+import json
+import sys
+import time
+
+# the shell has loaded these modules before it loads the plugins
+import cloudmesh.shell.command
+import cloudmesh.common.console
+
+before = set(sys.modules)
+start = time.perf_counter()
+import cloudmesh.burn.command.burn
+print(json.dumps({
+    "time": time.perf_counter() - start,
+    "modules": sorted(set(sys.modules) - before)
+}))
+"""
+
+
+def load():
+    """
+    Imports the plugin in a new interpreter
+
+    :return: the time of the import and the modules it loaded
+    :rtype: dict
+    """
+    result = subprocess.run([sys.executable, "-c", SCRIPT], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.mark.incremental
+class Test_startup:
+
+    def test_modules(self):
+        HEADING()
+        modules = load()["modules"]
+        print("Modules:", ", ".join(modules))
+        assert [module for module in HEAVY if module in modules] == []
+
+    def test_time(self):
+        HEADING()
+        # the first run compiles the module
+        load()
+        times = [load()["time"] for _ in range(5)]
+        median = statistics.median(times)
+        print(f"Import of the burn plugin: {median * 1000:.1f} ms (target {TARGET * 1000:.0f} ms)")
+        assert median < TARGET
@@ -0,0 +1,118 @@
+###############################################################
+# pytest -v --capture=no tests/test_27_telemetry.py
+# pytest -v  tests/test_27_telemetry.py
+# pytest -v --capture=no tests/test_27_telemetry.py::Test_telemetry::test_stats
+###############################################################
+
+import hashlib
+import threading
+import time
+
+import pytest
+
+from cloudmesh.burn.telemetry import Telemetry
+from cloudmesh.common.util import HEADING
+
+MB = 1000 ** 2
+
+
+@pytest.mark.incremental
+class Test_telemetry:
+
+    def test_stage(self, tmp_path):
+        HEADING()
+        image = tmp_path / "lite.img"
+        image.write_bytes(b"\0" * 1024)
+        telemetry = Telemetry(filename=str(tmp_path / "telemetry.db"))
+        run = telemetry.run("red01", "/dev/nonexistent", image=str(image))
+        assert run.digest == hashlib.sha256(b"\0" * 1024).hexdigest()
+        assert run.identity["reader"] == "unknown"
+
+        with run.stage("write", bytes=4 * MB):
+            pass
+        with pytest.raises(OSError):
+            with run.stage("configure"):
+                raise OSError("no boot partition")
+
+        write, configure = telemetry.records()
+        assert write["host"] == "red01"
+        assert write["image"] == "lite.img"
+        assert write["success"] == 1
+        assert write["throughput"] == pytest.approx(4 * MB / write["seconds"])
+        assert configure["success"] == 0
+        assert configure["error"] == "no boot partition"
+        assert write["run"] == configure["run"]
+
+    def test_digest(self, tmp_path, monkeypatch):
+        HEADING()
+        image = tmp_path / "lite.img"
+        image.write_bytes(b"image")
+        telemetry = Telemetry(filename=str(tmp_path / "telemetry.db"))
+        digest = telemetry.digest(str(image))
+
+        # the digest is read from the cache
+        monkeypatch.setattr(hashlib, "sha256", None)
+        assert telemetry.digest(str(image)) == digest
+        assert telemetry.digest(str(tmp_path / "missing.img")) == ""
+
+    def test_threads(self, tmp_path, monkeypatch):
+        HEADING()
+        image = tmp_path / "full.img"
+        image.write_bytes(b"\1" * 1024)
+        telemetry = Telemetry(filename=str(tmp_path / "telemetry.db"))
+        calls = []
+        sha256 = hashlib.sha256
+
+        def counted(*args):
+            calls.append(args)
+            time.sleep(0.1)
+            return sha256(*args)
+
+        monkeypatch.setattr(hashlib, "sha256", counted)
+        # the workers of parallel burns hash the image only once
+        runs = []
+        threads = [threading.Thread(target=lambda: runs.append(telemetry.run("red", "/dev/sdb", image=str(image))))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert len({run.digest for run in runs}) == 1
+
+        # a digest that is passed in is not computed
+        run = telemetry.run("red", "/dev/sdb", image=str(tmp_path / "other.img"), digest="abc")
+        assert run.digest == "abc"
+        assert len(calls) == 1
+
+    def test_percentile(self):
+        HEADING()
+        values = list(range(1, 101))
+        assert Telemetry.percentile(values, 50) == pytest.approx(50.5)
+        assert Telemetry.percentile(values, 99) == pytest.approx(99.01)
+        assert Telemetry.percentile([3.0], 90) == 3.0
+        assert Telemetry.percentile([], 50) is None
+
+    def test_stats(self, tmp_path):
+        HEADING()
+        telemetry = Telemetry(filename=str(tmp_path / "telemetry.db"))
+        for reader, seconds in [("slow", 100), ("slow", 120), ("fast", 20), ("fast", 30)]:
+            telemetry.record(run=reader, host="red01", stage="write", reader=reader,
+                             bytes=2000 * MB, seconds=seconds,
+                             throughput=2000 * MB / seconds, success=1)
+        telemetry.record(run="slow", host="red01", stage="format", reader="slow",
+                         seconds=5, success=0, error="busy")
+
+        stats = telemetry.stats(by="reader")
+        assert [(row["reader"], row["stage"]) for row in stats] == \
+            [("fast", "write"), ("slow", "format"), ("slow", "write")]
+        fast, failed, slow = stats
+        assert fast["p50"] == pytest.approx(25)
+        assert slow["p99"] == pytest.approx(119.8)
+        assert fast["mbs"] > slow["mbs"]
+        assert failed["failed"] == 1 and failed["p50"] is None
+
+        assert len(telemetry.stats(by="reader", stage="write")) == 2
+        assert "slow" in Telemetry.table(stats)
+        with pytest.raises(ValueError):
+            telemetry.stats(by="color")
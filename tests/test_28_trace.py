@@ -0,0 +1,90 @@
+###############################################################
+# pytest -v --capture=no tests/test_28_trace.py
+# pytest -v  tests/test_28_trace.py
+# pytest -v --capture=no tests/test_28_trace.py::Test_trace::test_session
+###############################################################
+
+import json
+import threading
+
+import pytest
+
+from cloudmesh.burn.trace import Trace
+from cloudmesh.common.util import HEADING
+
+
+class Card(object):
+
+    @Trace.traced("format", "device")
+    def format_device(self, device=None, yes=False):
+        return device
+
+    @staticmethod
+    @Trace.traced("write image", "device")
+    def stream(image, device):
+        if device == "/dev/sdc":
+            raise OSError("no card")
+
+
+@pytest.mark.incremental
+class Test_trace:
+
+    def test_disabled(self):
+        HEADING()
+        Trace.clear()
+        assert Card().format_device("/dev/sdb") == "/dev/sdb"
+        assert Trace.spans == []
+
+    def test_session(self, tmp_path):
+        HEADING()
+        filename = tmp_path / "trace.json"
+
+        def burn(device):
+            with Trace.span(f"burn {device}", device=device):
+                Card().format_device(device=device)
+                try:
+                    Card.stream("lite.img", device)
+                except OSError:
+                    pass
+
+        with Trace.session("burn raspberry red0[1-2]", export=str(filename)):
+            threads = [threading.Thread(target=burn, args=(device,))
+                       for device in ["/dev/sdb", "/dev/sdc"]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert not Trace.enabled
+        spans = {(span["name"], span["attributes"].get("device")): span for span in Trace.spans}
+        assert len(spans) == 7
+        root = spans[("burn raspberry red0[1-2]", None)]
+        assert root["parent"] is None
+        for device in ["/dev/sdb", "/dev/sdc"]:
+            burn = spans[(f"burn {device}", device)]
+            # the spans of the threads are children of the session
+            assert burn["parent"] == root["id"]
+            assert spans[("format", device)]["parent"] == burn["id"]
+            assert spans[("write image", device)]["parent"] == burn["id"]
+            assert burn["start"] <= spans[("format", device)]["start"] <= burn["end"]
+        assert spans[("write image", "/dev/sdc")]["error"] == "no card"
+        assert spans[("write image", "/dev/sdb")]["error"] is None
+
+        events = json.load(open(filename))["traceEvents"]
+        complete = [event for event in events if event["ph"] == "X"]
+        assert len(complete) == 7
+        assert min(event["ts"] for event in complete) == 0
+        assert all(event["dur"] >= 0 for event in complete)
+        assert len([event for event in events if event["ph"] == "M"]) == 3
+
+    def test_otlp(self):
+        HEADING()
+        data = Trace.otlp()
+        spans = data["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert len(spans) == 7
+        assert {span["traceId"] for span in spans} == {Trace.trace_id}
+        assert len(Trace.trace_id) == 32
+        assert len([span for span in spans if "parentSpanId" not in span]) == 1
+        failed = [span for span in spans if span["status"]["code"] == 2]
+        assert [span["name"] for span in failed] == ["write image"]
+        assert int(spans[0]["endTimeUnixNano"]) >= int(spans[0]["startTimeUnixNano"])